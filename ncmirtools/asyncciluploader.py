@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+"""asyncio version of `CILUploader`, requires python 3.5 or newer
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from ncmirtools.kiosk.progress import get_clock
+from ncmirtools.ciluploader import CILUploaderResult
+from ncmirtools.ciluploader import CILUploaderBatchResult
+from ncmirtools.ciljobqueue import CILJobQueue
+from ncmirtools.config import with_log_context
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+
+logger = logging.getLogger(__name__)
+
+
+def _get_running_loop():
+    """Gets event loop of running coroutine with
+       `asyncio.get_running_loop()`, falling back to
+       `asyncio.get_event_loop()` on python older then 3.7
+    """
+    get_running_loop = getattr(asyncio, 'get_running_loop', None)
+    if get_running_loop is None:  # pragma: no cover
+        return asyncio.get_event_loop()
+    return get_running_loop()
+
+
+async def _run_in_executor(executor, func, *args):
+    """Runs `func` with `args` in `executor`, see
+       `loop.run_in_executor()`, with log context of calling thread
+    """
+    loop = _get_running_loop()
+    return await loop.run_in_executor(executor, with_log_context(func),
+                                      *args)
+
+
+class AsyncCILUploader(object):
+    """Uploads and registers data with Cell Image Library from asyncio
+       code using transfer and REST settings of a `CILUploader`.
+
+       Transfers run one at a time in a dedicated thread over the single
+       connection of the transfer object. REST requests are made with
+       aiohttp if installed, otherwise with the pooled `requests.Session`
+       of the `CILUploader` in a thread pool sized to the concurrency.
+       State of each file is recorded in `CILJobQueue` of the
+       `CILUploader`, if it has one, so `CILUploader.resume_jobs()` can
+       continue an interrupted run.
+       Use as an async context manager or call `close()` when done
+    """
+    DEFAULT_CONCURRENCY = 8
+
+    def __init__(self, uploader, concurrency=None, use_aiohttp=None):
+        """Constructor
+        :param uploader: `CILUploader` supplying transfer object and
+                         REST service information
+        :param concurrency: maximum files being uploaded or registered
+                            at once, if None `DEFAULT_CONCURRENCY`
+        :param use_aiohttp: if True use aiohttp for REST requests, if
+                            False use requests in a thread pool. If None
+                            aiohttp is used if it is installed
+        :raises ValueError: if `use_aiohttp` is True and aiohttp is not
+                            installed
+        """
+        self._uploader = uploader
+        if concurrency is None or concurrency < 1:
+            self._concurrency = AsyncCILUploader.DEFAULT_CONCURRENCY
+        else:
+            self._concurrency = concurrency
+        if use_aiohttp is None:
+            use_aiohttp = aiohttp is not None
+        if use_aiohttp is True and aiohttp is None:
+            raise ValueError('aiohttp is not installed')
+        self._use_aiohttp = use_aiohttp
+        self._transfer_executor = ThreadPoolExecutor(max_workers=1)
+        self._rest_executor = None
+        self._http_session = None
+
+    def get_uploader(self):
+        """Gets wrapped `CILUploader`
+        """
+        return self._uploader
+
+    def get_concurrency(self):
+        """Gets maximum files being uploaded or registered at once
+        """
+        return self._concurrency
+
+    def is_using_aiohttp(self):
+        """Denotes if REST requests are made with aiohttp
+        """
+        return self._use_aiohttp
+
+    async def __aenter__(self):
+        """Returns this object
+        """
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        """Calls `close()`
+        """
+        await self.close()
+        return False
+
+    async def close(self):
+        """Closes HTTP session and shuts down thread pools
+        """
+        if self._http_session is not None:
+            await self._http_session.close()
+            self._http_session = None
+        if self._rest_executor is not None:
+            self._rest_executor.shutdown(wait=False)
+            self._rest_executor = None
+        self._transfer_executor.shutdown(wait=False)
+        self._uploader.close()
+
+    async def _run_transfer(self, func, *args):
+        """Runs `func` with `args` in transfer thread
+        """
+        return await _run_in_executor(self._transfer_executor, func, *args)
+
+    async def _set_job_state(self, path, state, result=None):
+        """Sets state of `path` in job queue of uploader, in
+           default executor since job queue writes to disk
+        """
+        if self._uploader.get_job_queue() is None:
+            return
+        await _run_in_executor(None, self._uploader.set_job_state,
+                               path, state, result)
+
+    async def _finish_job(self, path, result):
+        """Sets state of `path` to done or failed, see
+           `CILUploader.finish_job()`
+        """
+        if result.get_success_status() is True:
+            await self._set_job_state(path, CILJobQueue.DONE, result)
+        else:
+            await self._set_job_state(path, CILJobQueue.FAILED, result)
+
+    async def upload_and_register(self, data, force=False):
+        """Uploads and registers `data`, connecting and disconnecting
+           transfer object
+        :param force: see `upload_and_register_many()`
+        :returns: `CILUploaderResult`
+        """
+        res = await self.upload_and_register_many([data], force=force)
+        return res.get_results()[0][1]
+
+    async def upload_and_register_many(self, paths, force=False):
+        """Uploads files in `paths` over a single connection and
+           registers each one as soon as it is uploaded with up to
+           `get_concurrency()` files in progress at once. If this
+           coroutine is cancelled, files not yet started are skipped,
+           the transfer object is disconnected and
+           `asyncio.CancelledError` is raised
+        :param paths: list of file paths
+        :param force: if True files are uploaded and registered even if
+                      `CILRegistry` of uploader says they are already
+                      registered
+        :returns: `CILUploaderBatchResult`
+        """
+        clock = get_clock()
+        start_time = clock()
+        errmsg = self._uploader.check_parameters()
+        if errmsg is None and paths is None:
+            errmsg = 'Files to transfer is None'
+        if errmsg is not None:
+            return CILUploaderBatchResult([(None,
+                                            CILUploaderResult(False,
+                                                              errmsg=errmsg))],
+                                          duration=clock() - start_time)
+        if self._uploader.get_job_queue() is not None:
+            await _run_in_executor(None, self._uploader.add_jobs, paths)
+        transfer = self._uploader.get_transfer()
+        try:
+            await self._run_transfer(transfer.connect)
+        except Exception as e:
+            logger.exception('Unable to connect')
+            errmsg = ('Unable to connect: ' + str(e.__class__.__name__) +
+                      ' : ' + str(e))
+            results = [(p, CILUploaderResult(False, errmsg=errmsg))
+                       for p in paths]
+            return CILUploaderBatchResult(results,
+                                          duration=clock() - start_time)
+
+        semaphore = asyncio.Semaphore(self._concurrency)
+        tasks = [asyncio.ensure_future(self._upload_and_register(p,
+                                                                 semaphore,
+                                                                 force))
+                 for p in paths]
+        try:
+            results = await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await self._run_transfer(transfer.disconnect)
+
+        return CILUploaderBatchResult(list(zip(paths, results)),
+                                      duration=clock() - start_time)
+
+    async def _upload_and_register(self, path, semaphore, force):
+        """Uploads and registers `path` once `semaphore` is acquired
+        :returns: `CILUploaderResult`
+        """
+        async with semaphore:
+            if force is False:
+                res = await self._run_transfer(self._uploader.
+                                               get_registered_result, path)
+                if res is not None:
+                    await self._set_job_state(path, CILJobQueue.DONE, res)
+                    return res
+            await self._set_job_state(path, CILJobQueue.UPLOADING)
+            try:
+                res = await self._run_transfer(self._uploader.transfer_data,
+                                               path)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception('Caught exception uploading ' + path)
+                res = CILUploaderResult(False, errmsg=(
+                    'Error trying to upload: ' +
+                    str(e.__class__.__name__) + ' : ' + str(e)))
+            if res.get_success_status() is False:
+                await self._set_job_state(path, CILJobQueue.FAILED, res)
+                return res
+            await self._set_job_state(path, CILJobQueue.UPLOADED, res)
+            await self._set_job_state(path, CILJobQueue.REGISTERING)
+            try:
+                res = await self._register_data(res)
+                await self._run_transfer(self._uploader.record_registration,
+                                         path, res)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception('Caught exception registering ' + path)
+                res.set_success_status(False)
+                res.set_error_message('Error trying to register: ' +
+                                      str(e.__class__.__name__) +
+                                      ' : ' + str(e))
+            await self._finish_job(path, res)
+            return res
+
+    async def _register_data(self, result):
+        """Registers uploaded data with REST service
+        :returns: `result` updated by
+                  `CILUploader.process_registration_response()`
+        """
+        if self._use_aiohttp is False:
+            if self._rest_executor is None:
+                self._rest_executor = ThreadPoolExecutor(max_workers=self.
+                                                         _concurrency)
+            return await _run_in_executor(self._rest_executor,
+                                          self._uploader.register_data,
+                                          result)
+
+        if self._http_session is None:
+            connector = aiohttp.TCPConnector(limit=self._concurrency)
+            self._http_session = aiohttp.ClientSession(connector=connector)
+        user, password = self._uploader.get_rest_credentials()
+        async with self._http_session.post(self._uploader.
+                                           get_registration_url(),
+                                           json=self._uploader.
+                                           get_registration_entry(result),
+                                           auth=aiohttp.BasicAuth(user,
+                                                                  password)
+                                           ) as resp:
+            text = await resp.text()
+            return self._uploader.process_registration_response(result,
+                                                                resp.status,
+                                                                text)
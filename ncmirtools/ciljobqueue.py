@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'churas'
+
+import os
+import time
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class CILJob(object):
+    """State of upload and registration of one file in `CILJobQueue`
+    """
+    def __init__(self, path, state, dest_path=None, bytes_transferred=None,
+                 duration=None, checksum=None, checksum_algorithm=None,
+                 compression=None, raw_bytes=None, cil_id=None,
+                 errmsg=None, updated=None):
+        """Constructor
+        """
+        self._path = path
+        self._state = state
+        self._dest_path = dest_path
+        self._bytes_transferred = bytes_transferred
+        self._duration = duration
+        self._checksum = checksum
+        self._checksum_algorithm = checksum_algorithm
+        self._compression = compression
+        self._raw_bytes = raw_bytes
+        self._cil_id = cil_id
+        self._errmsg = errmsg
+        self._updated = updated
+
+    def get_path(self):
+        """Gets absolute path of local file
+        """
+        return self._path
+
+    def get_state(self):
+        """Gets state, one of `CILJobQueue.STATES`
+        """
+        return self._state
+
+    def get_destination_path(self):
+        """Gets path on remote server, set once file is uploaded
+        """
+        return self._dest_path
+
+    def get_bytes_transferred(self):
+        """Gets bytes transferred by upload
+        """
+        return self._bytes_transferred
+
+    def get_duration(self):
+        """Gets seconds upload took
+        """
+        return self._duration
+
+    def get_checksum(self):
+        """Gets checksum computed during upload
+        """
+        return self._checksum
+
+    def get_checksum_algorithm(self):
+        """Gets algorithm of checksum
+        """
+        return self._checksum_algorithm
+
+    def get_compression(self):
+        """Gets compression applied to uploaded file
+        """
+        return self._compression
+
+    def get_raw_bytes(self):
+        """Gets size of file before compression
+        """
+        return self._raw_bytes
+
+    def get_id(self):
+        """Gets CIL ID, set once file is registered
+        """
+        return self._cil_id
+
+    def get_error_message(self):
+        """Gets error message of last failure
+        """
+        return self._errmsg
+
+    def get_updated(self):
+        """Gets time, in seconds since epoch, of last state change
+        """
+        return self._updated
+
+    def is_uploaded(self):
+        """Denotes if file is on remote server and only needs to be
+           registered
+        """
+        return self._dest_path is not None and \
+            self._state != CILJobQueue.DONE
+
+
+class CILJobQueue(object):
+    """Persistent queue of files to upload and register with the Cell
+       Image Library stored in a SQLite database in write ahead log
+       mode. Each file moves through states
+       pending -> uploading -> uploaded -> registering -> done
+       or to failed. State is committed before and after every stage
+       so a run that crashes can be resumed without redoing completed
+       stages. Safe to use from multiple threads
+    """
+    PENDING = 'pending'
+    UPLOADING = 'uploading'
+    UPLOADED = 'uploaded'
+    REGISTERING = 'registering'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATES = [PENDING, UPLOADING, UPLOADED, REGISTERING, DONE, FAILED]
+
+    DEFAULT_FILE = '.ncmirtools_ciljobs.sqlite'
+
+    COLUMNS = ['path', 'state', 'dest_path', 'bytes_transferred',
+               'duration', 'checksum', 'checksum_algorithm',
+               'compression', 'raw_bytes', 'cil_id', 'errmsg', 'updated']
+
+    def __init__(self, path):
+        """Constructor, database is opened and created on first use
+        :param path: path to SQLite database file
+        """
+        self._path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def get_path(self):
+        """Gets path to SQLite database file
+        """
+        return self._path
+
+    def _get_connection(self):
+        """Gets connection to database creating table if needed.
+           Caller must hold lock
+        """
+        if self._conn is None:
+            import sqlite3
+            conn = sqlite3.connect(self._path, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                         'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                         'path TEXT NOT NULL UNIQUE, '
+                         'state TEXT NOT NULL, '
+                         'dest_path TEXT, '
+                         'bytes_transferred INTEGER, '
+                         'duration REAL, '
+                         'checksum TEXT, '
+                         'checksum_algorithm TEXT, '
+                         'compression TEXT, '
+                         'raw_bytes INTEGER, '
+                         'cil_id TEXT, '
+                         'errmsg TEXT, '
+                         'updated REAL NOT NULL)')
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        """Closes database, it is reopened if this object is used again
+        """
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def add(self, paths):
+        """Adds `paths` to queue in pending state. Paths already in
+           queue are reset to pending
+        :param paths: list of local file paths
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._get_connection()
+            with conn:
+                for path in paths:
+                    conn.execute('DELETE FROM jobs WHERE path = ?',
+                                 (os.path.abspath(path),))
+                    conn.execute('INSERT INTO jobs (path, state, updated) '
+                                 'VALUES (?, ?, ?)',
+                                 (os.path.abspath(path),
+                                  CILJobQueue.PENDING, now))
+
+    def set_state(self, path, state, result=None):
+        """Sets state of job for `path` adding it if needed
+        :param path: local file path
+        :param state: one of `STATES`
+        :param result: if set, `CILUploaderResult` whose destination
+                       path, checksum, id, error message etc are stored
+                       with job
+        """
+        if state not in CILJobQueue.STATES:
+            raise ValueError('Invalid job state: ' + str(state))
+        values = {'state': state, 'updated': time.time()}
+        if result is not None:
+            values.update({'dest_path': result.get_destination_path(),
+                           'bytes_transferred':
+                               result.get_bytes_transferred(),
+                           'duration': result.get_duration(),
+                           'checksum': result.get_checksum(),
+                           'checksum_algorithm':
+                               result.get_checksum_algorithm(),
+                           'compression': result.get_compression(),
+                           'raw_bytes': result.get_raw_bytes(),
+                           'errmsg': result.get_error_message()})
+            if result.get_id() is not None:
+                values['cil_id'] = str(result.get_id())
+        columns = sorted(values.keys())
+        with self._lock:
+            conn = self._get_connection()
+            with conn:
+                cursor = conn.execute('UPDATE jobs SET ' +
+                                      ', '.join([c + ' = ?'
+                                                 for c in columns]) +
+                                      ' WHERE path = ?',
+                                      [values[c] for c in columns] +
+                                      [os.path.abspath(path)])
+                if cursor.rowcount == 0:
+                    columns.append('path')
+                    values['path'] = os.path.abspath(path)
+                    conn.execute('INSERT INTO jobs (' + ', '.join(columns) +
+                                 ') VALUES (' +
+                                 ', '.join(['?'] * len(columns)) + ')',
+                                 [values[c] for c in columns])
+
+    def get_job(self, path):
+        """Gets job for `path`
+        :returns: `CILJob` or None if `path` is not in queue
+        """
+        jobs = self._get_jobs('WHERE path = ?', (os.path.abspath(path),))
+        if len(jobs) == 0:
+            return None
+        return jobs[0]
+
+    def get_jobs(self, states=None):
+        """Gets jobs in order they were added
+        :param states: if set, only jobs in these states are returned
+        :returns: list of `CILJob`
+        """
+        if states is None:
+            return self._get_jobs('', ())
+        return self._get_jobs('WHERE state IN (' +
+                              ', '.join(['?'] * len(states)) + ')',
+                              tuple(states))
+
+    def get_unfinished_jobs(self):
+        """Gets jobs that are not done, ie those a crashed or failed
+           run did not complete
+        :returns: list of `CILJob`
+        """
+        return self.get_jobs([s for s in CILJobQueue.STATES
+                              if s != CILJobQueue.DONE])
+
+    def _get_jobs(self, where, args):
+        """Gets jobs matching `where` clause
+        """
+        with self._lock:
+            rows = self._get_connection().execute(
+                'SELECT ' + ', '.join(CILJobQueue.COLUMNS) +
+                ' FROM jobs ' + where + ' ORDER BY id', args).fetchall()
+        return [CILJob(*row) for row in rows]
+
+    def remove_done_jobs(self):
+        """Removes jobs that are done
+        :returns: number of jobs removed
+        """
+        return self._remove_jobs(CILJobQueue.DONE)
+
+    def remove_failed_jobs(self):
+        """Removes jobs that failed so they are no longer resumed
+        :returns: number of jobs removed
+        """
+        return self._remove_jobs(CILJobQueue.FAILED)
+
+    def _remove_jobs(self, state):
+        """Removes jobs in `state`
+        :returns: number of jobs removed
+        """
+        with self._lock:
+            conn = self._get_connection()
+            with conn:
+                cursor = conn.execute('DELETE FROM jobs WHERE state = ?',
+                                      (state,))
+                return cursor.rowcount
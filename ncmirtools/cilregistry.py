@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'churas'
+
+import os
+import time
+import logging
+import threading
+
+from ncmirtools.kiosk.transfer import compute_checksum
+
+
+logger = logging.getLogger(__name__)
+
+
+class CILRegistry(object):
+    """Local record of files registered with the Cell Image Library
+       stored in a SQLite database. Entries are keyed by absolute path,
+       size, modification time and checksum of the file and map to the
+       ID returned by the CIL REST service. Checksums are only computed
+       for files whose path, size and modification time match an entry
+       so looking up new files is cheap. Safe to use from multiple
+       threads
+    """
+    DEFAULT_FILE = '.ncmirtools_cilregistry.sqlite'
+    DEFAULT_CHECKSUM_ALGORITHM = 'sha256'
+
+    def __init__(self, path, checksum_algorithm=None):
+        """Constructor, database is opened and created on first use
+        :param path: path to SQLite database file
+        :param checksum_algorithm: algorithm used to compute checksum
+                                   of files when one is not passed to
+                                   `add()`. If None
+                                   `DEFAULT_CHECKSUM_ALGORITHM`
+        """
+        self._path = path
+        if checksum_algorithm is None:
+            self._algorithm = CILRegistry.DEFAULT_CHECKSUM_ALGORITHM
+        else:
+            self._algorithm = checksum_algorithm
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def get_path(self):
+        """Gets path to SQLite database file
+        """
+        return self._path
+
+    def get_checksum_algorithm(self):
+        """Gets default checksum algorithm
+        """
+        return self._algorithm
+
+    def _get_connection(self):
+        """Gets connection to database creating table if needed.
+           Caller must hold lock
+        """
+        if self._conn is None:
+            import sqlite3
+            conn = sqlite3.connect(self._path, check_same_thread=False)
+            conn.execute('CREATE TABLE IF NOT EXISTS registrations ('
+                         'path TEXT NOT NULL, '
+                         'size INTEGER NOT NULL, '
+                         'mtime REAL NOT NULL, '
+                         'checksum TEXT NOT NULL, '
+                         'checksum_algorithm TEXT NOT NULL, '
+                         'cil_id TEXT NOT NULL, '
+                         'dest_path TEXT, '
+                         'registered REAL NOT NULL, '
+                         'PRIMARY KEY (path, size, mtime, checksum))')
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        """Closes database, it is reopened if this object is used again
+        """
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def lookup(self, filepath):
+        """Looks up `filepath` in registry
+        :param filepath: path to local file
+        :returns: tuple (CIL ID, remote path) of matching entry or None
+                  if file is not registered or has changed since
+        """
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        abspath = os.path.abspath(filepath)
+        with self._lock:
+            rows = self._get_connection().execute(
+                'SELECT checksum, checksum_algorithm, cil_id, dest_path '
+                'FROM registrations WHERE path = ? AND size = ? AND '
+                'mtime = ? ORDER BY registered DESC',
+                (abspath, stat.st_size, stat.st_mtime)).fetchall()
+        checksums = {}
+        for checksum, algorithm, cil_id, dest_path in rows:
+            if algorithm not in checksums:
+                try:
+                    checksums[algorithm] = compute_checksum(filepath,
+                                                            algorithm)
+                except (ValueError, EnvironmentError) as e:
+                    logger.warning('Unable to compute ' + algorithm +
+                                   ' checksum of ' + filepath + ' : ' +
+                                   str(e))
+                    checksums[algorithm] = None
+            if checksums[algorithm] == checksum:
+                return cil_id, dest_path
+        return None
+
+    def add(self, filepath, cil_id, dest_path=None, checksum=None,
+            checksum_algorithm=None):
+        """Records `filepath` as registered with `cil_id`
+        :param filepath: path to local file
+        :param cil_id: ID returned by CIL REST service
+        :param dest_path: path of file on remote server
+        :param checksum: checksum of file, if None it is computed with
+                         `get_checksum_algorithm()`
+        :param checksum_algorithm: algorithm of `checksum`
+        """
+        stat = os.stat(filepath)
+        if checksum is None or checksum_algorithm is None:
+            checksum_algorithm = self._algorithm
+            checksum = compute_checksum(filepath, checksum_algorithm)
+        with self._lock:
+            conn = self._get_connection()
+            conn.execute('INSERT OR REPLACE INTO registrations (path, '
+                         'size, mtime, checksum, checksum_algorithm, '
+                         'cil_id, dest_path, registered) VALUES '
+                         '(?, ?, ?, ?, ?, ?, ?, ?)',
+                         (os.path.abspath(filepath), stat.st_size,
+                          stat.st_mtime, checksum, checksum_algorithm,
+                          str(cil_id), dest_path, time.time()))
+            conn.commit()
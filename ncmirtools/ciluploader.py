@@ -2,23 +2,56 @@
 
 import os
 import sys
+import glob
 import logging
+import threading
 import argparse
-import requests
 import json
-from requests.auth import HTTPBasicAuth
-
 
+from ncmirtools.kiosk.transfer import Transfer
 from ncmirtools.kiosk.transfer import SftpTransfer
+from ncmirtools.kiosk.progress import ProgressLinePrinter
+from ncmirtools.kiosk.progress import format_summary
+from ncmirtools.kiosk.progress import get_clock
+from ncmirtools.kiosk.retry import RetryingTransfer
+from ncmirtools.kiosk.retry import RetryPolicyFromConfigFactory
+from ncmirtools.cilregistry import CILRegistry
+from ncmirtools.ciljobqueue import CILJobQueue
 from ncmirtools.config import NcmirToolsConfig
 from ncmirtools.config import ConfigMissingError
+from ncmirtools.config import with_log_context
+from ncmirtools import output
+from ncmirtools import metrics
 
 
 # create logger
 logger = logging.getLogger(__name__)
 
+_UPLOAD_SECONDS = metrics.histogram('ncmirtools_cil_upload_seconds',
+                                    'Time to connect, upload a file and '
+                                    'disconnect')
+_REGISTER_SECONDS = metrics.histogram('ncmirtools_cil_register_seconds',
+                                      'Time of registration request to '
+                                      'CIL REST service')
+_REGISTRATIONS = metrics.counter('ncmirtools_cil_registrations_total',
+                                 'Files registered with CIL REST service')
+_REGISTRATION_FAILURES = metrics.counter('ncmirtools_cil_registration_'
+                                         'failures_total',
+                                         'Failed registration requests')
+
 
 HOMEDIR_ARG = '--homedir'
+PROGRESS_ARG = '--progress'
+MAX_WORKERS_ARG = '--max_workers'
+FORCE_ARG = '--force'
+RESUME_ARG = '--resume'
+CLEAR_FAILED_ARG = '--clear_failed'
+UPLOAD_WORKERS_ARG = '--upload_workers'
+
+try:
+    import queue
+except ImportError:  # pragma: no cover
+    import Queue as queue
 
 
 def get_argument_parser(subparsers):
@@ -26,8 +59,9 @@ def get_argument_parser(subparsers):
     """
     con = NcmirToolsConfig()
     desc = """
-         This tool uploads a file to the Cell Image Library (CIL).
-         This tool then outputs an ID registered with the CIL upon success.
+         This tool uploads one or more files to the Cell Image Library
+         (CIL). This tool then outputs an ID registered with the CIL upon
+         success.
 
          When run this script will output the following to standard out
          for a successful run with a zero exit code:
@@ -39,13 +73,50 @@ def get_argument_parser(subparsers):
          Duration in seconds: <Number of seconds transfer took>
          Error Message: <'None' upon success otherwise an error message>
 
+         If more then one file is passed in, or a directory or glob
+         pattern such as '/data/*.tif', every file is uploaded with
+         up to {upload_workers} files sent at once, each over its own
+         connection. Each file is registered, while the next file is
+         uploaded, with up to {max_workers} concurrent requests
+         to the REST service. The above is output
+         for each file prefixed by a 'File: <path>' line and followed by
+         a summary:
+
+         Files: <Number of files>
+         Succeeded: <Number of files uploaded and registered>
+         Failed: <Number of files that failed>
+         Bytes transferred: <Total bytes transferred>
+         Duration in seconds: <Number of seconds for entire batch>
+
+         If {progress} flag is set, a progress line is output to
+         standard error while the file is transferred, followed by:
+
+         Sent <bytes> bytes in <seconds> seconds (<rate> MB/s)
+
          Upon failure a non-zero exit code will be returned and log
          messages will be output at ERROR level denoting the problems along
          with an Exception.
 
-         WARNING: This implementation does not check if file has been uploaded
-                  already and will proceed to overwrite the file on the remote
-                  server and request a new CIL id via the REST service.
+         Files successfully registered are recorded in a local registry
+         along with their size, modification time and checksum. If this
+         tool is run again on an unchanged file, it is neither uploaded
+         nor registered again and the recorded id is output with an
+         additional line:
+
+         Previously registered: True
+
+         Use {force} flag to upload and register such files anyway.
+         WARNING: Doing so overwrites the file on the remote server and
+                  requests a new CIL id via the REST service.
+
+         The state of every file (pending, uploading, uploaded,
+         registering, done or failed) is also recorded in a job queue.
+         If a run is interrupted or some files fail, run this tool with
+         {resume} flag and no files to continue every file that is not
+         done. Files already uploaded are only registered. Files that
+         are done are removed from the job queue once every file in a
+         run succeeds. Use {clear_failed} flag to remove failed files
+         from the job queue so they are no longer resumed.
 
          NOTE:
 
@@ -70,6 +141,22 @@ def get_argument_parser(subparsers):
          {resturl}                 = <REST url service>
          {restuser}            = <user login for rest service>
          {restpass}            = <user password for rest service>
+         {max_attempts}      = <optional, attempts to connect and
+                                  upload before giving up, waiting
+                                  exponentially longer between them>
+         {pool_size}          = <optional, maximum connections kept
+                                  open to REST service (default {def_pool})>
+         {keep_alive}         = <optional, false closes connection to
+                                  REST service after each request>
+         {rest_retries}            = <optional, times a REST request is
+                                  retried if service cannot be reached
+                                  (default {def_retries})>
+         {registry}           = <optional, path to registry of
+                                  registered files, leave empty to
+                                  disable (default ~/{def_registry})>
+         {job_queue}          = <optional, path to job queue, leave
+                                  empty to disable
+                                  (default ~/{def_job_queue})>
 
          NOTE: If private key does not need a password just comment out
                or omit {pkpass} parameter from configuration.
@@ -96,6 +183,12 @@ def get_argument_parser(subparsers):
 
     """.format(config_file=', '.join(con.get_config_files()),
                homedir=HOMEDIR_ARG,
+               progress=PROGRESS_ARG,
+               force=FORCE_ARG,
+               resume=RESUME_ARG,
+               clear_failed=CLEAR_FAILED_ARG,
+               max_workers=MAX_WORKERS_ARG,
+               upload_workers=UPLOAD_WORKERS_ARG,
                config_sect=CILUploaderFromConfigFactory.CONFIG_SECTION,
                user=CILUploaderFromConfigFactory.USERNAME,
                host=CILUploaderFromConfigFactory.HOST,
@@ -104,7 +197,17 @@ def get_argument_parser(subparsers):
                pkpass=CILUploaderFromConfigFactory.PRIVATE_KEY_PASS,
                resturl=CILUploaderFromConfigFactory.REST_URL,
                restuser=CILUploaderFromConfigFactory.REST_USER,
-               restpass=CILUploaderFromConfigFactory.REST_PASS)
+               restpass=CILUploaderFromConfigFactory.REST_PASS,
+               max_attempts=RetryPolicyFromConfigFactory.MAX_ATTEMPTS,
+               pool_size=CILUploaderFromConfigFactory.REST_POOL_SIZE,
+               def_pool=CILUploader.DEFAULT_POOL_SIZE,
+               keep_alive=CILUploaderFromConfigFactory.REST_KEEP_ALIVE,
+               rest_retries=CILUploaderFromConfigFactory.REST_RETRIES,
+               def_retries=CILUploader.DEFAULT_HTTP_RETRIES,
+               registry=CILUploaderFromConfigFactory.REGISTRY_FILE,
+               def_registry=CILRegistry.DEFAULT_FILE,
+               job_queue=CILUploaderFromConfigFactory.JOB_QUEUE_FILE,
+               def_job_queue=CILJobQueue.DEFAULT_FILE)
     help_formatter = argparse.RawDescriptionHelpFormatter
 
     parser = subparsers.add_parser('cilupload',
@@ -113,15 +216,82 @@ def get_argument_parser(subparsers):
                                    description=desc,
                                    formatter_class=help_formatter)
 
-    parser.add_argument("data", help='Data file to upload, can be any file')
+    parser.add_argument("data", nargs='*',
+                        help='Data files to upload, can be any file, '
+                             'directory or glob pattern. Directories '
+                             'are searched recursively for files')
     parser.add_argument("--homedir", help='Sets alternate home directory '
                                           'under which the ' +
                                           NcmirToolsConfig.UCONFIG_FILE +
                                           ' is loaded (default ~)',
                         default='~')
+    parser.add_argument(PROGRESS_ARG, action='store_true',
+                        help='Output progress of transfer to standard '
+                             'error and a throughput summary once '
+                             'transfer completes. Ignored when upload '
+                             'is run by ncmirtool serve daemon since '
+                             'its output is only returned once upload '
+                             'finishes')
+    parser.add_argument(FORCE_ARG, action='store_true',
+                        help='Upload and register files even if they '
+                             'were already registered')
+    parser.add_argument(RESUME_ARG, action='store_true',
+                        help='Continue files in job queue that were not '
+                             'done by an earlier run')
+    parser.add_argument(CLEAR_FAILED_ARG, action='store_true',
+                        help='Remove files that failed from job queue '
+                             'so they are not continued by ' +
+                             RESUME_ARG + '. Can be combined with ' +
+                             RESUME_ARG + ' or files to upload')
+    parser.add_argument(MAX_WORKERS_ARG, type=int,
+                        default=CILUploader.DEFAULT_MAX_WORKERS,
+                        help='Maximum number of concurrent registration '
+                             'requests when uploading more then one '
+                             'file (default ' +
+                             str(CILUploader.DEFAULT_MAX_WORKERS) + ')')
+    parser.add_argument(UPLOAD_WORKERS_ARG, type=int,
+                        default=CILUploader.DEFAULT_UPLOAD_WORKERS,
+                        help='Maximum number of files uploaded at once, '
+                             'each over its own connection, when '
+                             'uploading more then one file (default ' +
+                             str(CILUploader.DEFAULT_UPLOAD_WORKERS) + ')')
+    output.add_format_argument(parser)
     return parser
 
 
+def expand_data_paths(paths):
+    """Expands `paths` into list of files. Directories are searched
+       recursively and glob patterns are expanded. Paths that match
+       nothing are kept as is so the failure is reported for them
+    :param paths: list of file paths, directories or glob patterns
+    :returns: list of file paths in order with duplicates removed
+    """
+    files = []
+    seen = set()
+    for path in paths:
+        if os.path.exists(path):
+            matches = [path]
+        else:
+            matches = sorted(glob.glob(path))
+            if len(matches) == 0:
+                matches = [path]
+        for match in matches:
+            if os.path.isdir(match):
+                candidates = []
+                for root, dirs, filenames in os.walk(match):
+                    dirs.sort()
+                    for entry in sorted(filenames):
+                        candidates.append(os.path.join(root, entry))
+            else:
+                candidates = [match]
+            for entry in candidates:
+                if entry in seen:
+                    continue
+                seen.add(entry)
+                files.append(entry)
+    return files
+
+
 def _get_run_help_string(theargs):
     """Generates humanreadable string telling user how to run
        program with -h flag to display help information
@@ -173,10 +343,26 @@ def _get_and_verifyconfigparserconfig(theargs, altconfig=None):
 class CILUploaderResult(object):
     """Contains result from upload of data by CILUploaderResult
     """
+    __slots__ = ['_success_status', '_errmsg', '_id', '_duration',
+                 '_dest_path', '_bytes_transferred', '_checksum',
+                 '_checksum_algorithm', '_compression', '_raw_bytes',
+                 '_previously_registered']
+
+    # names of values returned by as_row()
+    FIELDS = ['success', 'id', 'dest_path', 'bytes_transferred',
+              'duration', 'error', 'checksum', 'checksum_algorithm',
+              'compression', 'raw_bytes', 'previously_registered']
+
     def __init__(self, success_status, errmsg=None,
                  id=None, bytes_transferred=None,
-                 duration=None, dest_path=None):
+                 duration=None, dest_path=None,
+                 checksum=None, checksum_algorithm=None,
+                 compression=None, raw_bytes=None,
+                 previously_registered=False):
         """Constructor
+        :param previously_registered: True if data was found in
+                                      `CILRegistry` and was neither
+                                      uploaded nor registered again
         """
         self._success_status = success_status
         self._errmsg = errmsg
@@ -184,6 +370,11 @@ class CILUploaderResult(object):
         self._duration = duration
         self._dest_path = dest_path
         self._bytes_transferred = bytes_transferred
+        self._checksum = checksum
+        self._checksum_algorithm = checksum_algorithm
+        self._compression = compression
+        self._raw_bytes = raw_bytes
+        self._previously_registered = previously_registered
 
     def get_bytes_transferred(self):
         """Gets bytes transferred
@@ -225,6 +416,42 @@ class CILUploaderResult(object):
         """Gets duration"""
         return self._duration
 
+    def get_checksum(self):
+        """Gets checksum of data computed during transfer or None
+        """
+        return self._checksum
+
+    def get_checksum_algorithm(self):
+        """Gets algorithm used to compute checksum or None
+        """
+        return self._checksum_algorithm
+
+    def get_compression(self):
+        """Gets compression applied to uploaded file or None
+        """
+        return self._compression
+
+    def get_raw_bytes(self):
+        """Gets size of data before compression or None
+        """
+        return self._raw_bytes
+
+    def get_previously_registered(self):
+        """Gets True if data was already registered and was skipped
+        """
+        return self._previously_registered
+
+    def as_row(self):
+        """Gets values of result in order of `FIELDS` for structured
+           output
+        :returns: tuple
+        """
+        return (self._success_status, self._id, self._dest_path,
+                self._bytes_transferred, self._duration, self._errmsg,
+                self._checksum, self._checksum_algorithm,
+                self._compression, self._raw_bytes,
+                self._previously_registered)
+
     def as_string(self):
         """Gets string representation of object
         """
@@ -234,60 +461,710 @@ class CILUploaderResult(object):
         val += 'Bytes transferred: ' + str(self._bytes_transferred) + '\n'
         val += 'Duration in seconds: ' + str(self._duration) + '\n'
         val += 'Error Message: ' + str(self._errmsg) + '\n'
+        if self._checksum is not None:
+            val += ('Checksum: ' + str(self._checksum_algorithm) + ':' +
+                    str(self._checksum) + '\n')
+        if self._compression is not None:
+            val += 'Compression: ' + str(self._compression) + '\n'
+            val += 'Uncompressed bytes: ' + str(self._raw_bytes) + '\n'
+        if self._previously_registered is True:
+            val += 'Previously registered: True\n'
         return val
 
 
+class CILUploaderBatchResult(object):
+    """Contains results from upload of many files by
+       `CILUploader.upload_and_register_many()`
+    """
+    def __init__(self, results=None, duration=None):
+        """Constructor
+        :param results: list of tuples (file path, `CILUploaderResult`)
+        :param duration: seconds entire batch took
+        """
+        if results is None:
+            self._results = []
+        else:
+            self._results = results
+        self._duration = duration
+
+    def get_results(self):
+        """Gets list of tuples (file path, `CILUploaderResult`) in
+           order files were passed in
+        """
+        return self._results
+
+    def get_duration(self):
+        """Gets seconds entire batch took
+        """
+        return self._duration
+
+    def get_success_count(self):
+        """Gets number of files uploaded and registered
+        """
+        return len([r for p, r in self._results
+                    if r.get_success_status() is True])
+
+    def get_failure_count(self):
+        """Gets number of files that failed
+        """
+        return len(self._results) - self.get_success_count()
+
+    def get_success_status(self):
+        """Gets True if every file succeeded otherwise False
+        """
+        return self.get_failure_count() == 0
+
+    def get_bytes_transferred(self):
+        """Gets sum of bytes transferred for all files
+        """
+        total = 0
+        for path, res in self._results:
+            if res.get_bytes_transferred() is not None:
+                total += res.get_bytes_transferred()
+        return total
+
+    def summary_as_string(self):
+        """Gets aggregate summary of batch as string
+        """
+        val = 'Files: ' + str(len(self._results)) + '\n'
+        val += 'Succeeded: ' + str(self.get_success_count()) + '\n'
+        val += 'Failed: ' + str(self.get_failure_count()) + '\n'
+        val += 'Bytes transferred: ' + str(self.get_bytes_transferred()) + '\n'
+        val += 'Duration in seconds: ' + str(self._duration) + '\n'
+        return val
+
+    def as_string(self):
+        """Gets string representation of every result followed by
+           summary
+        """
+        val = ''
+        for path, res in self._results:
+            val += 'File: ' + str(path) + '\n'
+            val += res.as_string() + '\n'
+        return val + self.summary_as_string()
+
+
 class CILUploader(object):
-    """Uploads and registers data with Cell Image Library"""
+    """Uploads and registers data with Cell Image Library.
+       REST requests share a pooled `requests.Session` owned by this
+       object which is released by `close()` or by using this object
+       as a context manager
+    """
+    DEFAULT_MAX_WORKERS = 4
+    DEFAULT_UPLOAD_WORKERS = 1
+    DEFAULT_POOL_SIZE = 10
+    DEFAULT_HTTP_RETRIES = 2
+    HTTP_RETRY_BACKOFF = 0.2
+
     def __init__(self, transfer_obj, resturl=None, restuser=None,
-                 restpassword=None):
+                 restpassword=None, pool_size=None, keep_alive=True,
+                 http_retries=None, registry=None, job_queue=None,
+                 transfer_factory=None):
         """Constructor
+        :param pool_size: maximum connections kept open to REST
+                          service, if None `DEFAULT_POOL_SIZE`
+        :param keep_alive: if False connections to REST service are
+                           closed after each request
+        :param http_retries: times a REST request is retried if a
+                             connection cannot be made, if None
+                             `DEFAULT_HTTP_RETRIES`. Requests that
+                             reached the service are never retried
+                             so data is not registered twice
+        :param registry: `CILRegistry` used to skip data already
+                         registered, if None every file is uploaded
+                         and registered
+        :param job_queue: `CILJobQueue` where state of each file is
+                          recorded so an interrupted run can be
+                          continued with `resume_jobs()`
+        :param transfer_factory: function that takes no arguments and
+                                 returns a new `Transfer` like
+                                 `transfer_obj`. Used to create a
+                                 transfer for each additional upload
+                                 worker in batch uploads, or None
+                                 if one cannot be created. If None
+                                 files are uploaded one at a time
         """
         self._transfer = transfer_obj
+        self._transfer_factory = transfer_factory
         self._url = resturl
         self._user = restuser
         self._pass = restpassword
+        if pool_size is None:
+            self._pool_size = CILUploader.DEFAULT_POOL_SIZE
+        else:
+            self._pool_size = pool_size
+        self._keep_alive = keep_alive
+        if http_retries is None:
+            self._http_retries = CILUploader.DEFAULT_HTTP_RETRIES
+        else:
+            self._http_retries = http_retries
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._registry = registry
+        self._job_queue = job_queue
+
+    def __enter__(self):
+        """Returns this object
+        """
+        return self
 
-    def upload_and_register_data(self, data,
-                                 session=None):
-        """Uploads and registers data to CIL
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Calls `close()`
         """
-        if self._transfer is None:
-            return CILUploaderResult(False,
-                                     errmsg='Transfer object was none, '
-                                     'cannot complete transfer')
+        self.close()
+        return False
 
-        if self._url is None:
-            return CILUploaderResult(False,
-                                     errmsg='REST url is None')
+    def get_transfer_factory(self):
+        """Gets function that creates transfers for additional
+           upload workers
+        """
+        return self._transfer_factory
 
-        if self._user is None:
-            return CILUploaderResult(False,
-                                     errmsg='REST username is None')
+    def get_pool_size(self):
+        """Gets maximum connections kept open to REST service
+        """
+        return self._pool_size
 
-        if self._pass is None:
-            return CILUploaderResult(False,
-                                     errmsg='REST password is None')
+    def get_keep_alive(self):
+        """Gets if connections to REST service are kept open
+        """
+        return self._keep_alive
+
+    def get_http_retries(self):
+        """Gets times REST request is retried upon connection errors
+        """
+        return self._http_retries
+
+    def get_session(self):
+        """Gets pooled `requests.Session` used for REST requests
+           creating it on first call
+        """
+        with self._session_lock:
+            if self._session is None:
+                self._session = self._create_session()
+            return self._session
+
+    def _create_session(self):
+        """Creates `requests.Session` with connection pool and
+           retry configured from values passed to constructor.
+           requests is imported here, not when module is loaded
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+        try:
+            from urllib3.util.retry import Retry
+        except ImportError:  # pragma: no cover
+            from requests.packages.urllib3.util.retry import Retry
+
+        session = requests.Session()
+        retry = Retry(total=self._http_retries,
+                      connect=self._http_retries,
+                      read=0, redirect=0, status=0,
+                      backoff_factor=CILUploader.HTTP_RETRY_BACKOFF)
+        adapter = HTTPAdapter(pool_connections=1,
+                              pool_maxsize=self._pool_size,
+                              max_retries=retry)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if self._keep_alive is False:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def close(self):
+        """Closes pooled `requests.Session` if one was created, along
+           with `CILRegistry`. They are reopened if this object is
+           used again
+        """
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+        if self._registry is not None:
+            self._registry.close()
+        if self._job_queue is not None:
+            self._job_queue.close()
+
+    def get_job_queue(self):
+        """Gets `CILJobQueue` or None
+        """
+        return self._job_queue
+
+    def add_jobs(self, paths):
+        """Adds `paths` to `CILJobQueue` if set
+        """
+        if self._job_queue is None:
+            return
+        try:
+            self._job_queue.add(paths)
+        except Exception:
+            logger.exception('Unable to add files to job queue')
+
+    def set_job_state(self, path, state, result=None):
+        """Sets state of `path` in `CILJobQueue` if set
+        """
+        if self._job_queue is None:
+            return
+        try:
+            self._job_queue.set_state(path, state, result=result)
+        except Exception:
+            logger.exception('Unable to set state of ' + str(path) +
+                             ' to ' + state + ' in job queue')
+
+    def get_registry(self):
+        """Gets `CILRegistry` or None
+        """
+        return self._registry
+
+    def get_registered_result(self, data):
+        """Looks up `data` in `CILRegistry`
+        :param data: path to local file
+        :returns: `CILUploaderResult` with previously registered id
+                  or None if there is no registry or `data` is not
+                  registered
+        """
+        if self._registry is None:
+            return None
+        try:
+            entry = self._registry.lookup(data)
+        except Exception:
+            logger.exception('Unable to look up ' + str(data) +
+                             ' in registry')
+            return None
+        if entry is None:
+            return None
+        logger.info(str(data) + ' already registered with id ' +
+                    str(entry[0]) + ', skipping')
+        return CILUploaderResult(True, id=entry[0], dest_path=entry[1],
+                                 bytes_transferred=0, duration=0,
+                                 previously_registered=True)
+
+    def record_registration(self, data, result):
+        """Adds `data` to `CILRegistry` if `result` is a successful
+           registration. Errors are logged, not raised, since data is
+           already registered
+        :param data: path to local file
+        :param result: `CILUploaderResult` from `register_data()`
+        """
+        if self._registry is None or \
+                result.get_success_status() is not True or \
+                result.get_id() is None:
+            return
+        try:
+            self._registry.add(data, result.get_id(),
+                               dest_path=result.get_destination_path(),
+                               checksum=result.get_checksum(),
+                               checksum_algorithm=result.
+                               get_checksum_algorithm())
+        except Exception:
+            logger.exception('Unable to add ' + str(data) + ' to registry')
+
+    def get_transfer(self):
+        """Gets `Transfer` object used to upload data
+        """
+        return self._transfer
+
+    def set_progress_callback(self, callback):
+        """Sets progress callback on transfer object, see
+           `Transfer.set_progress_callback()`
+        """
+        if self._transfer is None:
+            return
+        self._transfer.set_progress_callback(callback)
+
+    def upload_and_register_data(self, data,
+                                 session=None, force=False):
+        """Uploads and registers data to CIL
+        :param force: if True upload and register `data` even if
+                      `CILRegistry` says it is already registered
+        """
+        errmsg = self.check_parameters()
+        if errmsg is not None:
+            return CILUploaderResult(False, errmsg=errmsg)
 
         if data is None:
             return CILUploaderResult(False,
                                      errmsg='File to transfer is None')
 
+        self.add_jobs([data])
+        if force is False:
+            result = self.get_registered_result(data)
+            if result is not None:
+                self.set_job_state(data, CILJobQueue.DONE, result)
+                return result
+
+        self.set_job_state(data, CILJobQueue.UPLOADING)
         result = self._upload(data)
 
         if result.get_success_status() is False:
+            self.set_job_state(data, CILJobQueue.FAILED, result)
             return result
 
-        return self._register_data(result, session=session)
+        self.set_job_state(data, CILJobQueue.UPLOADED, result)
+        self.set_job_state(data, CILJobQueue.REGISTERING)
+        try:
+            result = self.register_data(result, session=session)
+        except Exception as e:
+            logger.exception('Caught exception registering ' + str(data))
+            result.set_success_status(False)
+            result.set_error_message('Error trying to register: ' +
+                                     str(e.__class__.__name__) +
+                                     ' : ' + str(e))
+            self.finish_job(data, result)
+            raise
+        self.finish_job(data, result)
+        self.record_registration(data, result)
+        return result
+
+    def finish_job(self, path, result):
+        """Sets state of `path` to done or failed depending on
+           success of registration `result`
+        """
+        if result.get_success_status() is True:
+            self.set_job_state(path, CILJobQueue.DONE, result)
+        else:
+            self.set_job_state(path, CILJobQueue.FAILED, result)
+
+    def check_parameters(self):
+        """Checks transfer object and REST parameters are set
+        :returns: error message as str or None if all are set
+        """
+        if self._transfer is None:
+            return 'Transfer object was none, cannot complete transfer'
+        if self._url is None:
+            return 'REST url is None'
+        if self._user is None:
+            return 'REST username is None'
+        if self._pass is None:
+            return 'REST password is None'
+        return None
+
+    def upload_and_register_many(self, paths, max_workers=None,
+                                 session=None, pipelined=True,
+                                 force=False, upload_workers=None):
+        """Uploads files in `paths` with up to `upload_workers`
+           concurrent uploads, each over its own connection, and
+           registers them with the CIL REST service using up to
+           `max_workers` concurrent requests over one `requests.Session`
+        :param paths: list of file paths
+        :param max_workers: maximum concurrent registration requests, if
+                            None `DEFAULT_MAX_WORKERS` is used
+        :param session: `requests.Session` to use, if None
+                        `get_session()` is used
+        :param pipelined: if True each file is queued for registration
+                          as soon as it is uploaded so registration
+                          overlaps upload of the next file. If False
+                          registration starts once all files are
+                          uploaded
+        :param force: if True files are uploaded and registered even if
+                      `CILRegistry` says they are already registered
+        :param upload_workers: maximum concurrent uploads, if None
+                               `DEFAULT_UPLOAD_WORKERS` is used. Only
+                               one upload is done at a time if no
+                               transfer factory was passed to
+                               constructor
+        :returns: `CILUploaderBatchResult`
+        """
+        clock = get_clock()
+        start_time = clock()
+        if max_workers is None or max_workers < 1:
+            max_workers = CILUploader.DEFAULT_MAX_WORKERS
+
+        errmsg = self.check_parameters()
+        if errmsg is None and paths is None:
+            errmsg = 'Files to transfer is None'
+        if errmsg is not None:
+            return CILUploaderBatchResult([(None,
+                                            CILUploaderResult(False,
+                                                              errmsg=errmsg))],
+                                          duration=clock() - start_time)
+
+        self.add_jobs(paths)
+        return self._run_batch(paths, {}, max_workers, session, pipelined,
+                               force, clock, start_time,
+                               upload_workers=upload_workers)
+
+    def resume_jobs(self, max_workers=None, session=None, pipelined=True,
+                    upload_workers=None):
+        """Continues files in `CILJobQueue` that are not done. Files
+           already uploaded are only registered, the rest are uploaded
+           and registered. Files whose registration was in progress are
+           registered again unless `CILRegistry` has them, since there
+           is no way to know if the service received the request
+        :param max_workers: see `upload_and_register_many()`
+        :param session: see `upload_and_register_many()`
+        :param pipelined: see `upload_and_register_many()`
+        :param upload_workers: see `upload_and_register_many()`
+        :returns: `CILUploaderBatchResult`
+        """
+        clock = get_clock()
+        start_time = clock()
+        if max_workers is None or max_workers < 1:
+            max_workers = CILUploader.DEFAULT_MAX_WORKERS
+
+        errmsg = self.check_parameters()
+        if errmsg is None and self._job_queue is None:
+            errmsg = 'No job queue to resume'
+        if errmsg is not None:
+            return CILUploaderBatchResult([(None,
+                                            CILUploaderResult(False,
+                                                              errmsg=errmsg))],
+                                          duration=clock() - start_time)
+        paths = []
+        uploaded = {}
+        for job in self._job_queue.get_unfinished_jobs():
+            paths.append(job.get_path())
+            if job.is_uploaded():
+                uploaded[job.get_path()] = CILUploader.\
+                    _get_result_from_job(job)
+        logger.info('Resuming ' + str(len(paths)) + ' jobs, ' +
+                    str(len(uploaded)) + ' of which only need registration')
+        return self._run_batch(paths, uploaded, max_workers, session,
+                               pipelined, False, clock, start_time,
+                               upload_workers=upload_workers)
+
+    @staticmethod
+    def _get_result_from_job(job):
+        """Creates `CILUploaderResult` for upload recorded in `job`
+        """
+        return CILUploaderResult(True,
+                                 bytes_transferred=job.get_bytes_transferred(),
+                                 duration=job.get_duration(),
+                                 dest_path=job.get_destination_path(),
+                                 checksum=job.get_checksum(),
+                                 checksum_algorithm=job.
+                                 get_checksum_algorithm(),
+                                 compression=job.get_compression(),
+                                 raw_bytes=job.get_raw_bytes())
+
+    def _run_batch(self, paths, uploaded, max_workers, session, pipelined,
+                   force, clock, start_time, upload_workers=None):
+        """Uploads and registers `paths`, see `upload_and_register_many()`
+        :param uploaded: dict of file path to `CILUploaderResult` for
+                         files in `paths` already uploaded that only
+                         need registration
+        :returns: `CILUploaderBatchResult`
+        """
+        if session is None and len(paths) > 0:
+            session = self.get_session()
+
+        work = queue.Queue()
+        num_workers = min(max_workers, len(paths))
+        to_upload = []
+        results = {}
+        for path in paths:
+            if path not in uploaded:
+                to_upload.append(path)
+                continue
+            res = None
+            if force is False:
+                res = self.get_registered_result(path)
+            if res is None:
+                res = uploaded[path]
+                work.put((path, res))
+            else:
+                self.set_job_state(path, CILJobQueue.DONE, res)
+            results[path] = res
 
+        threads = []
+        try:
+            if pipelined is True:
+                threads = self._start_registration_workers(work,
+                                                           num_workers,
+                                                           session)
+            results.update(self._upload_many(to_upload, uploaded_queue=work,
+                                             force=force,
+                                             upload_workers=upload_workers))
+            if pipelined is False:
+                threads = self._start_registration_workers(work,
+                                                           num_workers,
+                                                           session)
+        finally:
+            for t in threads:
+                work.put(None)
+            for t in threads:
+                t.join()
+
+        return CILUploaderBatchResult([(p, results[p]) for p in paths],
+                                      duration=clock() - start_time)
+
+    def _upload_many(self, paths, uploaded_queue=None, force=False,
+                     upload_workers=None):
+        """Uploads files in `paths` skipping those already registered
+           unless `force` is True. Up to `upload_workers` files are
+           uploaded at once, each worker using its own transfer
+           from `_get_upload_transfers()` over its own connection
+        :param uploaded_queue: if set, tuple (file path,
+                               `CILUploaderResult`) of each successful
+                               upload is put on this queue
+        :returns: list of tuples (file path, `CILUploaderResult`)
+        """
+        results = []
+        to_upload = queue.Queue()
+        for path in paths:
+            res = None
+            if force is False:
+                res = self.get_registered_result(path)
+                if res is not None:
+                    self.set_job_state(path, CILJobQueue.DONE, res)
+            results.append((path, res))
+            if res is None:
+                to_upload.put(len(results) - 1)
+        if to_upload.qsize() == 0:
+            return results
+
+        transfers = self._get_upload_transfers(upload_workers,
+                                               to_upload.qsize())
+        errors = []
+        if len(transfers) == 1:
+            self._upload_worker(transfers[0], to_upload, results,
+                                uploaded_queue, errors)
+        else:
+            threads = []
+            for transfer in transfers:
+                t = threading.Thread(target=with_log_context(
+                                     self._upload_worker),
+                                     args=(transfer, to_upload, results,
+                                           uploaded_queue, errors))
+                t.daemon = True
+                t.start()
+                threads.append(t)
+            for t in threads:
+                t.join()
+
+        # files left if no worker could connect
+        if len(errors) > 0:
+            errmsg = errors[0]
+            results = [(p, r or CILUploaderResult(False, errmsg=errmsg))
+                       for p, r in results]
+        return results
+
+    def _get_upload_transfers(self, upload_workers, num_files):
+        """Gets transfers for upload workers, the first being transfer
+           passed to constructor and the rest created by transfer
+           factory
+        :param upload_workers: maximum concurrent uploads, if None
+                               `DEFAULT_UPLOAD_WORKERS` is used
+        :param num_files: number of files to upload
+        :returns: list of `Transfer` objects
+        """
+        if upload_workers is None or upload_workers < 1:
+            upload_workers = CILUploader.DEFAULT_UPLOAD_WORKERS
+        transfers = [self._transfer]
+        if self._transfer_factory is None:
+            if upload_workers > 1:
+                logger.warning('No transfer factory, uploading one file '
+                               'at a time')
+            return transfers
+        callback = self._transfer.get_progress_callback()
+        for i in range(min(upload_workers, num_files) - 1):
+            transfer = self._transfer_factory()
+            if transfer is None:
+                logger.error('Unable to create transfer for upload '
+                             'worker, using ' + str(len(transfers)) +
+                             ' upload worker(s)')
+                break
+            transfer.set_progress_callback(callback)
+            transfers.append(transfer)
+        return transfers
+
+    def _upload_worker(self, transfer, to_upload, results, uploaded_queue,
+                       errors):
+        """Connects `transfer` and uploads files whose index in `results`
+           is taken from `to_upload` queue until it is empty, replacing
+           their entry in `results` with (file path, `CILUploaderResult`).
+           If `transfer` cannot connect the error is appended to `errors`
+           and no files are taken from queue
+        """
+        try:
+            transfer.connect()
+        except Exception as e:
+            logger.exception('Unable to connect')
+            errors.append('Unable to connect: ' +
+                          str(e.__class__.__name__) + ' : ' + str(e))
+            return
+        try:
+            while True:
+                try:
+                    index = to_upload.get_nowait()
+                except queue.Empty:
+                    return
+                path = results[index][0]
+                self.set_job_state(path, CILJobQueue.UPLOADING)
+                try:
+                    res = self.transfer_data(path, transfer=transfer)
+                except Exception as e:
+                    logger.exception('Caught exception uploading ' + path)
+                    res = CILUploaderResult(False, errmsg=(
+                        'Error trying to upload: ' +
+                        str(e.__class__.__name__) + ' : ' + str(e)))
+                results[index] = (path, res)
+                if res.get_success_status() is False:
+                    self.set_job_state(path, CILJobQueue.FAILED, res)
+                    continue
+                self.set_job_state(path, CILJobQueue.UPLOADED, res)
+                if uploaded_queue is not None:
+                    uploaded_queue.put((path, res))
+        finally:
+            transfer.disconnect()
+
+    def _start_registration_workers(self, work, num_workers, session):
+        """Starts `num_workers` threads that register tuples
+           (file path, `CILUploaderResult`) taken from `work` queue
+           using `session` until they get None from the queue
+        :returns: list of started threads
+        """
+        def worker():
+            while True:
+                entry = work.get()
+                if entry is None:
+                    return
+                path, res = entry
+                self.set_job_state(path, CILJobQueue.REGISTERING)
+                try:
+                    self.register_data(res, session=session)
+                    self.record_registration(path, res)
+                except Exception as e:
+                    logger.exception('Caught exception registering ' + path)
+                    res.set_success_status(False)
+                    res.set_error_message('Error trying to register: ' +
+                                          str(e.__class__.__name__) +
+                                          ' : ' + str(e))
+                self.finish_job(path, res)
+
+        threads = []
+        for i in range(num_workers):
+            t = threading.Thread(target=with_log_context(worker))
+            t.daemon = True
+            t.start()
+            threads.append(t)
+        return threads
+
+    @_UPLOAD_SECONDS.timed
     def _upload(self, data):
         """Uploads data to remote server
         :returns CILUploaderResult object with success set to True
         """
         self._transfer.connect()
+        try:
+            return self.transfer_data(data)
+        finally:
+            self._transfer.disconnect()
+
+    def transfer_data(self, data, transfer=None):
+        """Uploads data to remote server over already connected transfer
+        :param transfer: `Transfer` to use, if None transfer passed
+                         to constructor is used
+        :returns CILUploaderResult object with success set to True
+        """
+        if transfer is None:
+            transfer = self._transfer
         (transfer_err_msg, duration,
-         bytes_transferred) = self._transfer.transfer_file(data)
-        self._transfer.disconnect()
+         bytes_transferred) = transfer.transfer_file(data)
+
+        if transfer_err_msg == Transfer.SKIPPED:
+            logger.info(data + ' already on remote server, '
+                        'skipped transfer')
+            transfer_err_msg = None
 
         if transfer_err_msg is not None:
             return CILUploaderResult(False,
@@ -297,43 +1174,96 @@ class CILUploader(object):
         logger.info(data + ' file took ' +
                     str(duration) + ' seconds to transfer ' +
                     str(bytes_transferred) + ' bytes')
-        dest_f = (self._transfer.get_destination_directory() + '/' +
-                  os.path.basename(data))
+        dest_f = None
+        checksum = None
+        algorithm = None
+        compression = None
+        raw_bytes = None
+        try:
+            dest_f = transfer.get_last_remote_path()
+            checksum = transfer.get_last_checksum()
+            if checksum is not None:
+                algorithm = transfer.get_checksum_algorithm()
+            compression = transfer.get_compression()
+            if compression is not None:
+                raw_bytes = transfer.get_last_raw_bytes()
+        except AttributeError:
+            logger.debug('Transfer object does not support checksums, '
+                         'or compression')
+
+        if dest_f is None:
+            dest_f = (transfer.get_destination_directory() + '/' +
+                      os.path.basename(data))
 
         return CILUploaderResult(True, bytes_transferred=bytes_transferred,
                                  duration=duration,
-                                 dest_path=dest_f)
+                                 dest_path=dest_f,
+                                 checksum=checksum,
+                                 checksum_algorithm=algorithm,
+                                 compression=compression,
+                                 raw_bytes=raw_bytes)
+
+    def register_data(self, result,
+                      session=None):
+        """Registers uploaded data with REST service
+        :param session: `requests.Session` to use, if None
+                        `get_session()` is used
+        """
+        if session is None:
+            session = self.get_session()
+        with _REGISTER_SECONDS.time():
+            r = session.post(self.get_registration_url(),
+                             json=self.get_registration_entry(result),
+                             auth=(self._user, self._pass))
+        return self.process_registration_response(result, r.status_code,
+                                                  r.text)
+
+    def get_registration_url(self):
+        """Gets url of REST endpoint data is registered with
+        """
+        return self._url + '/upload_rest/upload_entry'
 
-    def _register_data(self, result,
-                       session=None):
+    def get_rest_credentials(self):
+        """Gets tuple (REST username, REST password)
+        """
+        return self._user, self._pass
 
-        close_session = False
-        if session is None:
-            close_session = True
-            session = requests.Session()
-        try:
-            r = session.post(self._url + '/upload_rest/upload_entry',
-                             json={'File_path': result.get_destination_path()},
-                             auth=HTTPBasicAuth(self._user, self._pass))
-            success = False
-            if r.status_code is 200:
-                success = True
-                res_dict = json.loads(r.text)
-                if res_dict['success'] is True:
-                    result.set_success_status(True)
-                    result.set_id(res_dict['ID'])
-                else:
-                    result.set_success_status(False)
-                    result.set_error_message('REST response: ' + r.text)
+    def get_registration_entry(self, result):
+        """Gets dict posted as JSON to register uploaded data
+        :param result: `CILUploaderResult` from upload
+        """
+        entry = {'File_path': result.get_destination_path()}
+        if result.get_checksum() is not None:
+            entry['Checksum'] = result.get_checksum()
+            entry['Checksum_type'] = result.get_checksum_algorithm()
+        if result.get_compression() is not None:
+            entry['Compression'] = result.get_compression()
+        return entry
+
+    def process_registration_response(self, result, status_code, text):
+        """Updates `result` with response from registration request
+        :param result: `CILUploaderResult` from upload
+        :param status_code: HTTP status code of response
+        :param text: body of response
+        :returns: `result`
+        """
+        success = False
+        if status_code == 200:
+            res_dict = json.loads(text)
+            success = res_dict['success'] is True
+            if success is True:
+                result.set_id(res_dict['ID'])
             else:
-                result.set_error_message('REST returned error status code: ' +
-                                         str(r.status_code))
-            result.set_success_status(success)
-            return result
-
-        finally:
-            if close_session is True:
-                session.close()
+                result.set_error_message('REST response: ' + text)
+        else:
+            result.set_error_message('REST returned error status code: ' +
+                                     str(status_code))
+        result.set_success_status(success)
+        if success is True:
+            _REGISTRATIONS.inc()
+        else:
+            _REGISTRATION_FAILURES.inc()
+        return result
 
 
 class CILUploaderFromConfigFactory(object):
@@ -350,6 +1280,20 @@ class CILUploaderFromConfigFactory(object):
     REST_URL = 'resturl'
     REST_USER = 'restusername'
     REST_PASS = 'restpassword'
+    WINDOW_SIZE = 'window_size'
+    MAX_PACKET_SIZE = 'max_packet_size'
+    BUFFER_SIZE = 'buffer_size'
+    PIPELINED = 'pipelined'
+    CHECKSUM_ALGORITHM = 'checksum_algorithm'
+    COMPRESSION = 'compression'
+    COMPRESSION_LEVEL = 'compression_level'
+    COMPRESSION_THREADS = 'compression_threads'
+    ALLOW_AGENT = 'allow_agent'
+    REST_POOL_SIZE = 'rest_pool_size'
+    REST_KEEP_ALIVE = 'rest_keep_alive'
+    REST_RETRIES = 'rest_retries'
+    REGISTRY_FILE = 'registry_file'
+    JOB_QUEUE_FILE = 'job_queue_file'
 
     def __init__(self, con):
         """Constructor
@@ -375,8 +1319,84 @@ class CILUploaderFromConfigFactory(object):
             logger.error('Unable to get rest info from config: ' + errmsg)
             return None
 
+        rfac = RetryPolicyFromConfigFactory(self._config,
+                                            CILUploaderFromConfigFactory.
+                                            CONFIG_SECTION)
+        policy, errmsg = rfac.get_retrypolicy()
+        if policy is None:
+            logger.error('Unable to get retry policy from config: ' +
+                         errmsg)
+            return None
+        uploader = RetryingTransfer(uploader, retry_policy=policy)
+
+        def transfer_factory():
+            transfer, err = self._get_sftptransfer_from_config()
+            if transfer is None:
+                logger.error('Unable to initialize transfer: ' + str(err))
+                return None
+            return RetryingTransfer(transfer, retry_policy=policy)
+
+        try:
+            pool_size = self._get_int_option(CILUploaderFromConfigFactory.
+                                             REST_POOL_SIZE)
+            http_retries = self._get_int_option(CILUploaderFromConfigFactory.
+                                                REST_RETRIES)
+            keep_alive = True
+            if self._config.has_option(CILUploaderFromConfigFactory.
+                                       CONFIG_SECTION,
+                                       CILUploaderFromConfigFactory.
+                                       REST_KEEP_ALIVE) is True:
+                keep_alive = self._config.getboolean(
+                    CILUploaderFromConfigFactory.CONFIG_SECTION,
+                    CILUploaderFromConfigFactory.REST_KEEP_ALIVE)
+        except ValueError as e:
+            logger.error('Invalid REST connection option: ' + str(e))
+            return None
+
         return CILUploader(uploader, resturl=resturl, restuser=restuser,
-                           restpassword=restpass)
+                           restpassword=restpass, pool_size=pool_size,
+                           keep_alive=keep_alive,
+                           http_retries=http_retries,
+                           registry=self._get_registry_from_config(),
+                           job_queue=self._get_job_queue_from_config(),
+                           transfer_factory=transfer_factory)
+
+    def _get_file_option(self, option, default_file):
+        """Gets path set by `option` or `default_file` under home
+           directory if not set
+        :returns: path or None if `option` is set to empty string
+        """
+        if self._config.has_option(CILUploaderFromConfigFactory.
+                                   CONFIG_SECTION, option) is True:
+            path = self._config.get(CILUploaderFromConfigFactory.
+                                    CONFIG_SECTION, option).strip()
+            if path == '':
+                return None
+            return os.path.expanduser(path)
+        return os.path.join(os.path.expanduser('~'), default_file)
+
+    def _get_registry_from_config(self):
+        """Gets `CILRegistry` using path set in configuration or
+           default path under home directory
+        :returns: `CILRegistry` or None if disabled with empty path
+        """
+        path = self._get_file_option(CILUploaderFromConfigFactory.
+                                     REGISTRY_FILE, CILRegistry.DEFAULT_FILE)
+        if path is None:
+            return None
+        return CILRegistry(path)
+
+    def _get_job_queue_from_config(self):
+        """Gets `CILJobQueue` using path set in configuration or
+           default path under home directory
+        :returns: `CILJobQueue` or None if disabled with empty path
+        """
+        path = self._get_file_option(CILUploaderFromConfigFactory.
+                                     JOB_QUEUE_FILE,
+                                     CILJobQueue.DEFAULT_FILE)
+        if path is None:
+            return None
+        return CILJobQueue(path)
 
     def _get_rest_info_from_config(self):
         """Gets rest configuration information
@@ -450,8 +1470,8 @@ class CILUploaderFromConfigFactory(object):
 
         if con.has_option(CILUploaderFromConfigFactory.CONFIG_SECTION,
                           CILUploaderFromConfigFactory.PORT) is True:
-            port = int(con.get(CILUploaderFromConfigFactory.CONFIG_SECTION,
-                               CILUploaderFromConfigFactory.PORT))
+            port = con.getint(CILUploaderFromConfigFactory.CONFIG_SECTION,
+                              CILUploaderFromConfigFactory.PORT)
         else:
             port = None
 
@@ -464,8 +1484,9 @@ class CILUploaderFromConfigFactory(object):
 
         if con.has_option(CILUploaderFromConfigFactory.CONFIG_SECTION,
                           CILUploaderFromConfigFactory.CON_TIMEOUT) is True:
-            con_time = int(con.get(CILUploaderFromConfigFactory.CONFIG_SECTION,
-                                   CILUploaderFromConfigFactory.CON_TIMEOUT))
+            con_time = con.getint(CILUploaderFromConfigFactory.
+                                  CONFIG_SECTION,
+                                  CILUploaderFromConfigFactory.CON_TIMEOUT)
         else:
             con_time = None
 
@@ -477,10 +1498,208 @@ class CILUploaderFromConfigFactory(object):
         else:
             passk = None
 
-        return SftpTransfer(host, destdir, username=user,
-                            port=port, privatekeyfile=pkey,
-                            connect_timeout=con_time,
-                            passphrase=passk), None
+        window_size = self._get_int_option(CILUploaderFromConfigFactory.
+                                           WINDOW_SIZE)
+        packet_size = self._get_int_option(CILUploaderFromConfigFactory.
+                                           MAX_PACKET_SIZE)
+        buffer_size = self._get_int_option(CILUploaderFromConfigFactory.
+                                           BUFFER_SIZE)
+
+        if con.has_option(CILUploaderFromConfigFactory.CONFIG_SECTION,
+                          CILUploaderFromConfigFactory.PIPELINED) is True:
+            pipelined = con.getboolean(CILUploaderFromConfigFactory.
+                                       CONFIG_SECTION,
+                                       CILUploaderFromConfigFactory.
+                                       PIPELINED)
+        else:
+            pipelined = None
+
+        if con.has_option(CILUploaderFromConfigFactory.CONFIG_SECTION,
+                          CILUploaderFromConfigFactory.
+                          CHECKSUM_ALGORITHM) is True:
+            algorithm = con.get(CILUploaderFromConfigFactory.CONFIG_SECTION,
+                                CILUploaderFromConfigFactory.
+                                CHECKSUM_ALGORITHM)
+        else:
+            algorithm = None
+
+        if con.has_option(CILUploaderFromConfigFactory.CONFIG_SECTION,
+                          CILUploaderFromConfigFactory.COMPRESSION) is True:
+            compression = con.get(CILUploaderFromConfigFactory.
+                                  CONFIG_SECTION,
+                                  CILUploaderFromConfigFactory.COMPRESSION)
+        else:
+            compression = None
+
+        if con.has_option(CILUploaderFromConfigFactory.CONFIG_SECTION,
+                          CILUploaderFromConfigFactory.ALLOW_AGENT) is True:
+            allow_agent = con.getboolean(CILUploaderFromConfigFactory.
+                                         CONFIG_SECTION,
+                                         CILUploaderFromConfigFactory.
+                                         ALLOW_AGENT)
+        else:
+            allow_agent = None
+
+        level = self._get_int_option(CILUploaderFromConfigFactory.
+                                     COMPRESSION_LEVEL)
+        threads = self._get_int_option(CILUploaderFromConfigFactory.
+                                       COMPRESSION_THREADS)
+
+        try:
+            return SftpTransfer(host, destdir, username=user,
+                                port=port, privatekeyfile=pkey,
+                                connect_timeout=con_time,
+                                passphrase=passk,
+                                window_size=window_size,
+                                max_packet_size=packet_size,
+                                buffer_size=buffer_size,
+                                pipelined=pipelined,
+                                checksum_algorithm=algorithm,
+                                compression=compression,
+                                compression_level=level,
+                                compression_threads=threads,
+                                allow_agent=allow_agent), None
+        except ValueError as e:
+            return None, str(e)
+
+    def _get_int_option(self, option):
+        """Gets `option` from configuration section as an int
+        :param option: name of option
+        :returns: value of option as int or None if not set
+        """
+        if self._config.has_option(CILUploaderFromConfigFactory.
+                                   CONFIG_SECTION, option) is False:
+            return None
+        return self._config.getint(CILUploaderFromConfigFactory.
+                                   CONFIG_SECTION, option)
+
+
+def _write_results(results, fmt, out_stream):
+    """Writes `results` in structured format `fmt`
+    :param results: list of tuples (file path, `CILUploaderResult`)
+    """
+    with output.RecordWriter(out_stream, fmt,
+                             ['path'] + CILUploaderResult.FIELDS) as writer:
+        for path, res in results:
+            writer.write((path,) + res.as_row())
+
+
+def _run_batch(uploader, paths, theargs, show_progress, out_stream,
+               err_stream):
+    """Uploads and registers `paths` with `uploader`, or if `paths`
+       is None resumes jobs in job queue of `uploader`, writing result
+       of each file and a summary to `out_stream`. If all files
+       succeeded done jobs are removed from the job queue
+    :returns: 0 if all files succeeded otherwise 2
+    """
+    max_workers = getattr(theargs, 'max_workers', None)
+    upload_workers = getattr(theargs, 'upload_workers', None)
+    if paths is None:
+        if uploader.get_job_queue() is None:
+            logger.error('Job queue is disabled, nothing to resume')
+            return 2
+        batch = uploader.resume_jobs(max_workers=max_workers,
+                                     upload_workers=upload_workers)
+    elif len(paths) == 0:
+        logger.error('No files found to upload')
+        return 2
+    else:
+        force = getattr(theargs, 'force', False)
+        batch = uploader.\
+            upload_and_register_many(paths, max_workers=max_workers,
+                                     force=force,
+                                     upload_workers=upload_workers)
+    for path, res in batch.get_results():
+        if res.get_error_message() is not None:
+            logger.error(str(path) + ' : ' + res.get_error_message())
+    fmt = output.get_format(theargs)
+    if fmt == output.TEXT_FORMAT:
+        out_stream.write(batch.as_string())
+    else:
+        _write_results(batch.get_results(), fmt, out_stream)
+    if show_progress is True:
+        err_stream.write(format_summary(batch.get_bytes_transferred(),
+                                        batch.get_duration()) + '\n')
+    if batch.get_success_status() is False:
+        return 2
+    _remove_jobs(uploader, CILJobQueue.DONE)
+    return 0
+
+
+def _remove_jobs(uploader, state):
+    """Removes jobs in `state`, either `CILJobQueue.DONE` or
+       `CILJobQueue.FAILED`, from job queue of `uploader` if it has one
+    """
+    job_queue = uploader.get_job_queue()
+    if job_queue is None:
+        return
+    if state == CILJobQueue.DONE:
+        count = job_queue.remove_done_jobs()
+    else:
+        count = job_queue.remove_failed_jobs()
+    logger.info('Removed ' + str(count) + ' ' + state + ' jobs from ' +
+                str(job_queue.get_path()))
+
+
+def run_with_uploader(uploader, theargs, out_stream=None, err_stream=None):
+    """Uploads and registers files in `theargs` with `uploader`
+       without closing it, so it can be reused
+    :param uploader: `CILUploader`
+    :param theargs: parsed arguments of cilupload command
+    :param out_stream: stream results are written to, if None
+                       `sys.stdout`
+    :param err_stream: stream progress is written to, if None
+                       `sys.stderr`
+    :returns: exit code
+    """
+    if out_stream is None:
+        out_stream = sys.stdout
+    if err_stream is None:
+        err_stream = sys.stderr
+    show_progress = getattr(theargs, 'progress', False) is True
+    if show_progress is True:
+        uploader.set_progress_callback(ProgressLinePrinter(err_stream))
+    else:
+        uploader.set_progress_callback(None)
+    data = theargs.data
+    resume = getattr(theargs, 'resume', False) is True
+    if resume is True and data:
+        logger.error(RESUME_ARG + ' does not take any files')
+        return 2
+    if getattr(theargs, 'clear_failed', False) is True:
+        if uploader.get_job_queue() is None:
+            logger.error('Job queue is disabled, nothing to clear')
+            return 2
+        _remove_jobs(uploader, CILJobQueue.FAILED)
+        if resume is False and not data:
+            return 0
+    if resume is True:
+        return _run_batch(uploader, None, theargs, show_progress,
+                          out_stream, err_stream)
+    if isinstance(data, list):
+        paths = expand_data_paths(data)
+        if paths != data or len(paths) != 1:
+            return _run_batch(uploader, paths, theargs, show_progress,
+                              out_stream, err_stream)
+        data = paths[0]
+    res = uploader.upload_and_register_data(data,
+                                            force=getattr(theargs,
+                                                          'force',
+                                                          False))
+    if res.get_error_message() is not None:
+        logger.error(res.get_error_message())
+    fmt = output.get_format(theargs)
+    if fmt != output.TEXT_FORMAT:
+        _write_results([(data, res)], fmt, out_stream)
+    if res.get_success_status() is False:
+        return 2
+    if fmt == output.TEXT_FORMAT:
+        out_stream.write(res.as_string() + '\n')
+    if show_progress is True:
+        err_stream.write(format_summary(res.get_bytes_transferred(),
+                                        res.get_duration()) + '\n')
+    _remove_jobs(uploader, CILJobQueue.DONE)
+    return 0
 
 
 def run(theargs):
@@ -492,12 +1711,11 @@ def run(theargs):
         return 1
     fac = CILUploaderFromConfigFactory(con)
     uploader = fac.get_ciluploader()
-    if uploader is not None:
-        res = uploader.upload_and_register_data(theargs.data)
-        if res.get_error_message() is not None:
-            logger.error(res.get_error_message())
-        if res.get_success_status() is False:
-            return 2
-        sys.stdout.write(res.as_string() + '\n')
-        return 0
-    return 3
+    if uploader is None:
+        return 3
+    exporters = metrics.start_exporters(con, program='cilupload')
+    try:
+        with uploader:
+            return run_with_uploader(uploader, theargs)
+    finally:
+        metrics.stop_exporters(exporters)
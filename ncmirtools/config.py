@@ -4,10 +4,16 @@ __author__ = 'churas'
 import os
 import configparser
 import logging
+import threading
 
 
 logger = logging.getLogger(__name__)
 
+_config_cache = {}
+_config_cache_lock = threading.Lock()
+
+_log_context = threading.local()
+
 
 def setup_logging(thelogger,
                   log_format='%(asctime)-15s %(levelname)s %(name)s '
@@ -37,15 +43,199 @@ def setup_logging(thelogger,
     logging.getLogger('ncmirtools.kiosk.transfer').setLevel(numericloglevel)
     logging.getLogger('ncmirtools.kiosk.datafinder').setLevel(numericloglevel)
     logging.getLogger('ncmirtools.ciluploader').setLevel(numericloglevel)
+    logging.getLogger('ncmirtools.cilregistry').setLevel(numericloglevel)
+    logging.getLogger('ncmirtools.ciljobqueue').setLevel(numericloglevel)
+    logging.getLogger('ncmirtools.daemon').setLevel(numericloglevel)
     logging.getLogger('ncmirtools.ncmirtool').setLevel(numericloglevel)
 
 
+def get_log_context():
+    """Gets log context of the current thread, used by the daemon to
+       send log messages of a request to the client that made it
+    :returns: value passed to `set_log_context()` in this thread, or
+              in the thread that wrapped the running function with
+              `with_log_context()`, or None if not set
+    """
+    return getattr(_log_context, 'value', None)
+
+
+def set_log_context(value):
+    """Sets log context of the current thread
+    :param value: any object or None to clear it
+    """
+    _log_context.value = value
+
+
+def with_log_context(func):
+    """Wraps `func` so it runs with the log context of the calling
+       thread. Targets of worker threads should be wrapped with this
+       since threads do not inherit the context of the thread that
+       started them
+    :returns: wrapped function
+    """
+    value = get_log_context()
+
+    def wrapper(*args, **kwargs):
+        prev_value = get_log_context()
+        set_log_context(value)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            set_log_context(prev_value)
+    return wrapper
+
+
 class ConfigMissingError(Exception):
     """Raised if configuration file is missing
     """
     pass
 
 
+def clear_config_cache():
+    """Removes all configurations cached by
+       `NcmirToolsConfig.get_config()`
+    """
+    with _config_cache_lock:
+        _config_cache.clear()
+
+
+def get_list(con, section, option, separator=','):
+    """Gets `option` in `section` split on `separator`. Uses
+       `NcmirToolsConfigParser.getlist()` if `con` has it so the
+       list is only computed once
+    :param con: configparser object
+    :returns: list of str
+    """
+    if isinstance(con, NcmirToolsConfigParser):
+        return con.getlist(section, option, separator=separator)
+    return con.get(section, option).split(separator)
+
+
+class NcmirToolsConfigParser(configparser.ConfigParser):
+    """ConfigParser returned by `NcmirToolsConfig.get_config()`.
+       Values converted by `getint()`, `getfloat()`, `getboolean()`
+       and `getlist()` are cached so each option is only converted
+       once. Every method that changes the configuration clears the
+       cache. Objects are shared between callers while the
+       configuration files are unchanged so changes are seen by all
+       of them
+    """
+    def __init__(self, *args, **kwargs):
+        """Constructor
+        """
+        self._typed_cache = {}
+        configparser.ConfigParser.__init__(self, *args, **kwargs)
+
+    def set(self, section, option, value=None):
+        """Sets option clearing cache of converted values
+        """
+        self._typed_cache = {}
+        return configparser.ConfigParser.set(self, section, option, value)
+
+    def remove_option(self, section, option):
+        """Removes option clearing cache of converted values
+        """
+        self._typed_cache = {}
+        return configparser.ConfigParser.remove_option(self, section,
+                                                       option)
+
+    def remove_section(self, section):
+        """Removes section clearing cache of converted values
+        """
+        self._typed_cache = {}
+        return configparser.ConfigParser.remove_section(self, section)
+
+    def read(self, *args, **kwargs):
+        """Reads files clearing cache of converted values
+        """
+        self._typed_cache = {}
+        return configparser.ConfigParser.read(self, *args, **kwargs)
+
+    def read_file(self, *args, **kwargs):
+        """Reads file object clearing cache of converted values
+        """
+        self._typed_cache = {}
+        return configparser.ConfigParser.read_file(self, *args, **kwargs)
+
+    def read_string(self, *args, **kwargs):
+        """Reads string clearing cache of converted values
+        """
+        self._typed_cache = {}
+        return configparser.ConfigParser.read_string(self, *args,
+                                                     **kwargs)
+
+    def read_dict(self, *args, **kwargs):
+        """Reads dict clearing cache of converted values
+        """
+        self._typed_cache = {}
+        return configparser.ConfigParser.read_dict(self, *args, **kwargs)
+
+    def __setitem__(self, key, value):
+        """Replaces section clearing cache of converted values
+        """
+        self._typed_cache = {}
+        return configparser.ConfigParser.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        """Removes section clearing cache of converted values
+        """
+        self._typed_cache = {}
+        return configparser.ConfigParser.__delitem__(self, key)
+
+    def _get_cached(self, kind, convert, section, option):
+        """Gets value of `option` in `section` converted by `convert`
+           computing it only on first call
+        """
+        key = (kind, section, option)
+        if key not in self._typed_cache:
+            self._typed_cache[key] = convert()
+        return self._typed_cache[key]
+
+    def getint(self, section, option, **kwargs):
+        """Same as `configparser.ConfigParser.getint()` with result
+           cached when no keyword arguments are passed
+        """
+        if kwargs:
+            return configparser.ConfigParser.getint(self, section, option,
+                                                    **kwargs)
+        return self._get_cached('int', lambda: configparser.ConfigParser.
+                                getint(self, section, option),
+                                section, option)
+
+    def getfloat(self, section, option, **kwargs):
+        """Same as `configparser.ConfigParser.getfloat()` with result
+           cached when no keyword arguments are passed
+        """
+        if kwargs:
+            return configparser.ConfigParser.getfloat(self, section,
+                                                      option, **kwargs)
+        return self._get_cached('float', lambda: configparser.ConfigParser.
+                                getfloat(self, section, option),
+                                section, option)
+
+    def getboolean(self, section, option, **kwargs):
+        """Same as `configparser.ConfigParser.getboolean()` with result
+           cached when no keyword arguments are passed
+        """
+        if kwargs:
+            return configparser.ConfigParser.getboolean(self, section,
+                                                        option, **kwargs)
+        return self._get_cached('boolean', lambda: configparser.
+                                ConfigParser.getboolean(self, section,
+                                                        option),
+                                section, option)
+
+    def getlist(self, section, option, separator=','):
+        """Gets `option` in `section` split on `separator`
+        :returns: list of str, a new list on every call so callers
+                  can modify it
+        """
+        return list(self._get_cached('list' + separator,
+                                     lambda: self.get(section, option).
+                                     split(separator),
+                                     section, option))
+
+
 class NcmirToolsConfig(object):
     """Class provides access to ncmirtools configuration
     file which is stored in the user's home directory
@@ -115,21 +305,48 @@ class NcmirToolsConfig(object):
                 os.path.join(self._homedir,
                              NcmirToolsConfig.UCONFIG_FILE)]
 
-    def get_config(self):
-        """Gets configparser object loaded with configuration
-        :returns output of configparser.ConfigParser() after it has been
-                 loaded with configuration from `get_config_file()`
-        :raises ConfigMissingError: If no configuration file is found
+    def _get_config_files_signature(self):
+        """Gets modification time and size of each configuration file
+        :returns: tuple with tuple (mtime, size) per file from
+                  `get_config_files()` or None if file does not exist
         """
-        config_exists = False
+        sig = []
         for path in self.get_config_files():
-            if os.path.isfile(path):
-                config_exists = True
+            try:
+                st = os.stat(path)
+            except OSError:
+                sig.append(None)
+                continue
+            if not os.path.isfile(path):
+                sig.append(None)
+                continue
+            sig.append((getattr(st, 'st_mtime_ns', st.st_mtime),
+                        st.st_size))
+        return tuple(sig)
 
-        if config_exists is False:
+    def get_config(self):
+        """Gets configparser object loaded with configuration.
+           Parsed configuration is cached per process and only
+           re-read when one of the files from `get_config_files()`
+           is added, removed or modified
+        :returns `NcmirToolsConfigParser` loaded with configuration
+                 from `get_config_file()`
+        :raises ConfigMissingError: If no configuration file is found
+        """
+        files = tuple(self.get_config_files())
+        sig = self._get_config_files_signature()
+        if all(entry is None for entry in sig):
             raise ConfigMissingError('No configuration file found in paths: ' +
-                                     ', '.join(self.get_config_files()))
+                                     ', '.join(files))
+
+        with _config_cache_lock:
+            cached = _config_cache.get(files)
+        if cached is not None and cached[0] == sig:
+            logger.debug('Using cached configuration')
+            return cached[1]
 
-        parser = configparser.ConfigParser()
-        parser.read(self.get_config_files())
+        parser = NcmirToolsConfigParser()
+        parser.read(files)
+        with _config_cache_lock:
+            _config_cache[files] = (sig, parser)
         return parser
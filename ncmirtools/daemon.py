@@ -0,0 +1,562 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'churas'
+
+import os
+import sys
+import json
+import errno
+import socket
+import signal
+import logging
+import argparse
+import threading
+
+from ncmirtools import config
+from ncmirtools import metrics
+from ncmirtools.metrics import MetricsExporterFromConfigFactory
+
+try:
+    import socketserver
+except ImportError:  # pragma: no cover
+    import SocketServer as socketserver
+
+try:
+    from StringIO import StringIO
+except ImportError:  # pragma: no cover
+    from io import StringIO
+
+
+logger = logging.getLogger(__name__)
+
+SOCKET_ENV = 'NCMIRTOOLS_SOCKET'
+"""Environment variable that overrides location of daemon socket
+"""
+
+DEFAULT_SOCKET_FILE = '.ncmirtools.sock'
+"""Name of daemon socket file in home directory
+"""
+
+SOCKET_ARG = '--socket'
+
+COMMAND_KEY = 'command'
+ARGS_KEY = 'args'
+EXIT_CODE_KEY = 'exit_code'
+STDOUT_KEY = 'stdout'
+STDERR_KEY = 'stderr'
+
+DEFAULT_CONNECT_TIMEOUT = 5
+"""Seconds clients wait to connect to daemon before running command
+   themselves
+"""
+
+LOST_DAEMON_EXIT_CODE = 2
+"""Exit code of forwarded command when connection to daemon is lost
+   after request was sent
+"""
+
+
+class DaemonNotRunningError(EnvironmentError):
+    """Raised when connection to daemon socket cannot be made, in
+       which case no request was sent
+    """
+    pass
+
+
+def get_socket_path(socket_path=None):
+    """Gets path to daemon socket
+    :param socket_path: if set this value is returned
+    :returns: `socket_path` if set, otherwise value of `SOCKET_ENV`
+              environment variable or `DEFAULT_SOCKET_FILE` in home
+              directory
+    """
+    if socket_path is not None:
+        return socket_path
+    env_path = os.environ.get(SOCKET_ENV)
+    if env_path:
+        return env_path
+    return os.path.join(os.path.expanduser('~'), DEFAULT_SOCKET_FILE)
+
+
+def send_request(command, args, socket_path=None, timeout=None,
+                 connect_timeout=None):
+    """Sends `command` to daemon and waits for response
+    :param command: name of command ie mpidir
+    :param args: dict of arguments for command
+    :param socket_path: path to daemon socket, if None
+                        `get_socket_path()` is used
+    :param timeout: seconds to wait for daemon, None means wait forever
+    :param connect_timeout: seconds to wait for connection to daemon,
+                            if None `timeout` is used
+    :raises DaemonNotRunningError: if daemon cannot be reached
+    :raises EnvironmentError: if connection fails after request was
+                              sent
+    :raises ValueError: if response from daemon is not valid
+    :returns: dict with `EXIT_CODE_KEY`, `STDOUT_KEY` and
+              `STDERR_KEY` entries
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        if connect_timeout is None:
+            sock.settimeout(timeout)
+        else:
+            sock.settimeout(connect_timeout)
+        try:
+            sock.connect(get_socket_path(socket_path))
+        except EnvironmentError as e:
+            raise DaemonNotRunningError(e.errno, str(e))
+        sock.settimeout(timeout)
+        req = json.dumps({COMMAND_KEY: command, ARGS_KEY: args})
+        sock.sendall((req + '\n').encode('utf-8'))
+        reader = sock.makefile('rb')
+        try:
+            line = reader.readline()
+        finally:
+            reader.close()
+    finally:
+        sock.close()
+    if not line:
+        raise ValueError('No response from daemon')
+    resp = json.loads(line.decode('utf-8'))
+    if not isinstance(resp, dict) or EXIT_CODE_KEY not in resp:
+        raise ValueError('Invalid response from daemon: ' + str(resp))
+    return resp
+
+
+def forward_to_daemon(command, args, socket_path=None,
+                      out_stream=None, err_stream=None):
+    """Runs `command` in daemon if one is running, writing its output
+       to `out_stream` and `err_stream`
+    :param command: name of command ie mpidir
+    :param args: dict of arguments for command
+    :param socket_path: path to daemon socket, if None
+                        `get_socket_path()` is used
+    :param out_stream: if None `sys.stdout`
+    :param err_stream: if None `sys.stderr`
+    :returns: exit code of command or None if no daemon is running
+              in which case caller should run command itself. If
+              connection is lost after request was sent the command
+              may have run, so an error is written to `err_stream`
+              and `LOST_DAEMON_EXIT_CODE` is returned instead of None
+              to avoid running it twice
+    """
+    path = get_socket_path(socket_path)
+    if not os.path.exists(path):
+        return None
+    if out_stream is None:
+        out_stream = sys.stdout
+    if err_stream is None:
+        err_stream = sys.stderr
+    try:
+        resp = send_request(command, args, socket_path=path,
+                            connect_timeout=DEFAULT_CONNECT_TIMEOUT)
+    except DaemonNotRunningError as e:
+        logger.debug('Unable to use daemon at ' + path + ' : ' + str(e))
+        return None
+    except (EnvironmentError, ValueError) as e:
+        err_stream.write('Lost connection to daemon at ' + path +
+                         ' while running ' + str(command) + ', it may '
+                         'have partially completed : ' + str(e) + '\n')
+        return LOST_DAEMON_EXIT_CODE
+    out_stream.write(resp.get(STDOUT_KEY) or '')
+    err_stream.write(resp.get(STDERR_KEY) or '')
+    return resp[EXIT_CODE_KEY]
+
+
+def is_daemon_running(socket_path=None):
+    """Checks if a daemon is accepting connections on socket
+    :param socket_path: path to daemon socket, if None
+                        `get_socket_path()` is used
+    :returns: True if daemon is running otherwise False
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(get_socket_path(socket_path))
+        return True
+    except EnvironmentError:
+        return False
+    finally:
+        sock.close()
+
+
+class Parameters(object):
+    """Placeholder class for parameters
+    """
+    pass
+
+
+class _RequestLogHandler(logging.Handler):
+    """Writes errors logged by ncmirtools modules while running a
+       request to the error stream of that request, so clients see
+       the messages they would see running the command themselves.
+       Only records logged in threads whose log context, see
+       `config.get_log_context()`, is this handler are written, which
+       includes worker threads started with `config.with_log_context()`
+    """
+    def __init__(self, err_stream):
+        """Constructor
+        :param err_stream: stream errors are written to
+        """
+        logging.Handler.__init__(self, level=logging.ERROR)
+        self._err_stream = err_stream
+        self.setFormatter(logging.Formatter('%(levelname)s %(name)s '
+                                            '%(message)s'))
+
+    def emit(self, record):
+        if config.get_log_context() is not self:
+            return
+        try:
+            self._err_stream.write(self.format(record) + '\n')
+        except Exception:
+            self.handleError(record)
+
+
+def _run_ping(server, args, out_stream, err_stream):
+    """Lets clients check daemon is alive
+    """
+    out_stream.write('pong\n')
+    return 0
+
+
+def _run_mpidir(server, args, out_stream, err_stream):
+    """Runs mpidir lookup
+    """
+    from ncmirtools import mpidir
+    from ncmirtools.lookup import DirectoryForId
+    return mpidir._run_lookup(args.get('prefixdir',
+                                       DirectoryForId.PROJECT_DIR),
+                              args.get('mpid'), out_stream, err_stream,
+                              fmt=args.get('format'))
+
+
+def _run_projectdir(server, args, out_stream, err_stream):
+    """Runs projectdir lookup
+    """
+    from ncmirtools import projectdir
+    from ncmirtools.lookup import DirectoryForId
+    return projectdir._run_lookup(args.get('prefixdir',
+                                           DirectoryForId.PROJECT_DIR),
+                                  args.get('projectid'), out_stream,
+                                  err_stream, fmt=args.get('format'))
+
+
+def _run_projectsearch(server, args, out_stream, err_stream):
+    """Runs projectsearch database query
+    """
+    from ncmirtools import projectsearch
+    return projectsearch._run_search_database(args.get('keyword'),
+                                              args.get('homedir', '~'),
+                                              out_stream, err_stream,
+                                              fmt=args.get('format'))
+
+
+def _run_mpidinfo(server, args, out_stream, err_stream):
+    """Runs mpidinfo database query
+    """
+    from ncmirtools import mpidinfo
+    return mpidinfo._run_search_database(args.get('mpid'),
+                                         args.get('homedir', '~'),
+                                         out_stream, err_stream,
+                                         fmt=args.get('format'))
+
+
+def _run_cilupload(server, args, out_stream, err_stream):
+    """Runs cilupload with uploader kept open by daemon
+    """
+    from ncmirtools import ciluploader
+    theargs = Parameters()
+    theargs.data = args.get('data', [])
+    theargs.homedir = args.get('homedir', '~')
+    # progress would only be seen once upload finishes
+    theargs.progress = False
+    theargs.force = args.get('force', False)
+    theargs.resume = args.get('resume', False)
+    theargs.clear_failed = args.get('clear_failed', False)
+    theargs.format = args.get('format')
+    theargs.max_workers = args.get('max_workers',
+                                   ciluploader.CILUploader.
+                                   DEFAULT_MAX_WORKERS)
+    theargs.upload_workers = args.get('upload_workers',
+                                      ciluploader.CILUploader.
+                                      DEFAULT_UPLOAD_WORKERS)
+    uploader, lock, exit_code = server.get_ciluploader(theargs)
+    if uploader is None:
+        return exit_code
+    with lock:
+        return ciluploader.run_with_uploader(uploader, theargs,
+                                             out_stream=out_stream,
+                                             err_stream=err_stream)
+
+
+class NcmirToolsRequestHandler(socketserver.StreamRequestHandler):
+    """Reads JSON line requests from client and writes a JSON line
+       response for each one
+    """
+    def handle(self):
+        """Handles requests until client closes connection
+        """
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            resp = self.server.handle_request_line(line)
+            self.wfile.write((json.dumps(resp) + '\n').encode('utf-8'))
+            self.wfile.flush()
+
+
+class NcmirToolsServer(socketserver.ThreadingMixIn,
+                       socketserver.UnixStreamServer):
+    """Long running server that runs ncmirtools commands sent over a
+       Unix domain socket. Each request is one line of JSON of form
+       {"command": <name>, "args": {<arguments>}} and each response
+       is one line of JSON of form
+       {"exit_code": <int>, "stdout": <str>, "stderr": <str>}
+       Modules, configuration and `CILUploader` objects with their
+       HTTP connection pools, registry and job queue are kept between
+       requests. Requests run in their own thread, uploads with the
+       same configuration are run one at a time
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path):
+        """Constructor, binds to `socket_path` which is made readable
+           and writable by owner only
+        :param socket_path: path to Unix domain socket
+        :raises EnvironmentError: if another daemon is already using
+                                  `socket_path`
+        """
+        self._socket_path = socket_path
+        self._handlers = {'ping': _run_ping,
+                          'mpidir': _run_mpidir,
+                          'projectdir': _run_projectdir,
+                          'projectsearch': _run_projectsearch,
+                          'mpidinfo': _run_mpidinfo,
+                          'cilupload': _run_cilupload}
+        self._uploaders = {}
+        self._uploaders_lock = threading.Lock()
+        if os.path.exists(socket_path):
+            if is_daemon_running(socket_path):
+                raise EnvironmentError(errno.EADDRINUSE,
+                                       'Daemon already running on ' +
+                                       socket_path)
+            logger.info('Removing stale socket ' + socket_path)
+            os.unlink(socket_path)
+        oldmask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.__init__(self, socket_path,
+                                                   NcmirToolsRequestHandler)
+        finally:
+            os.umask(oldmask)
+
+    def get_socket_path(self):
+        """Gets path to Unix domain socket
+        """
+        return self._socket_path
+
+    def add_handler(self, command, handler):
+        """Adds or replaces handler for `command`
+        :param command: name of command
+        :param handler: function taking (server, args dict, out_stream,
+                        err_stream) that returns exit code
+        """
+        self._handlers[command] = handler
+
+    def get_commands(self):
+        """Gets sorted list of commands this server handles
+        """
+        return sorted(self._handlers.keys())
+
+    def handle_request_line(self, line):
+        """Runs request in `line`
+        :param line: JSON encoded request as bytes or str
+        :returns: dict response
+        """
+        try:
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            req = json.loads(line)
+            command = req[COMMAND_KEY]
+            args = req.get(ARGS_KEY) or {}
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            return {EXIT_CODE_KEY: 2, STDOUT_KEY: '',
+                    STDERR_KEY: 'Invalid request: ' + str(e) + '\n'}
+        return self.handle_command(command, args)
+
+    def handle_command(self, command, args):
+        """Runs `command` capturing its output
+        :param command: name of command
+        :param args: dict of arguments
+        :returns: dict response
+        """
+        handler = self._handlers.get(command)
+        if handler is None:
+            return {EXIT_CODE_KEY: 2, STDOUT_KEY: '',
+                    STDERR_KEY: 'Unknown command: ' + str(command) + '\n'}
+        out_stream = StringIO()
+        err_stream = StringIO()
+        logger.debug('Running ' + str(command) + ' ' + str(args))
+        log_handler = _RequestLogHandler(err_stream)
+        ncmirtools_logger = logging.getLogger('ncmirtools')
+        ncmirtools_logger.addHandler(log_handler)
+        prev_context = config.get_log_context()
+        config.set_log_context(log_handler)
+        try:
+            exit_code = handler(self, args, out_stream, err_stream)
+        except Exception as e:
+            config.set_log_context(prev_context)
+            logger.exception('Error running ' + str(command))
+            err_stream.write('Error running ' + str(command) + ' : ' +
+                             str(e) + '\n')
+            exit_code = 2
+        finally:
+            config.set_log_context(prev_context)
+            ncmirtools_logger.removeHandler(log_handler)
+        return {EXIT_CODE_KEY: exit_code,
+                STDOUT_KEY: out_stream.getvalue(),
+                STDERR_KEY: err_stream.getvalue()}
+
+    def get_ciluploader(self, theargs):
+        """Gets `CILUploader` for configuration in home directory
+           `theargs.homedir` creating it on first use. The uploader is
+           recreated, and the old one closed once no longer in use,
+           when the configuration files change, which is when
+           `NcmirToolsConfig.get_config()` returns a new parser
+        :param theargs: cilupload parameters
+        :returns: tuple (`CILUploader` or None, lock to hold while
+                  using uploader, exit code if uploader is None)
+        """
+        from ncmirtools import ciluploader
+        key = os.path.expanduser(theargs.homedir)
+        with self._uploaders_lock:
+            con, err = ciluploader._get_and_verifyconfigparserconfig(theargs)
+            if con is None:
+                logger.error('No configuration: ' + str(err))
+                return None, None, 1
+            old = self._uploaders.get(key)
+            if old is not None and old[0] is con:
+                return old[1:] + (0,)
+            fac = ciluploader.CILUploaderFromConfigFactory(con)
+            uploader = fac.get_ciluploader()
+            if uploader is None:
+                return None, None, 3
+            self._uploaders[key] = (con, uploader, threading.Lock())
+            res = self._uploaders[key][1:] + (0,)
+        if old is not None:
+            logger.info('Configuration in ' + key + ' changed, closing '
+                        'previous uploader')
+            with old[2]:
+                old[1].close()
+        return res
+
+    def server_close(self):
+        """Closes socket, removes socket file and closes uploaders
+        """
+        socketserver.UnixStreamServer.server_close(self)
+        try:
+            os.unlink(self._socket_path)
+        except OSError:
+            pass
+        with self._uploaders_lock:
+            for con, uploader, lock in self._uploaders.values():
+                uploader.close()
+            self._uploaders = {}
+
+
+def get_argument_parser(subparsers):
+    """Adds serve command to `subparsers`
+    :param subparsers: argparse subparsers object
+    :returns: parser for serve command
+    """
+    desc = """
+
+    Starts a long running daemon that runs lookup, search and
+    upload commands sent by mpidir.py, projectdir.py, projectsearch.py,
+    mpidinfo.py and ncmirtool.py cilupload. While the daemon is running
+    these commands forward their work to it which avoids paying the
+    startup cost of Python, imports, configuration loading and
+    connection setup on every invocation.
+
+    The daemon listens on a Unix domain socket that only the owner can
+    use. The socket is {default} unless set
+    via the {env} environment variable or the {socket} flag. Clients
+    look for the socket in the same place. If no daemon is running the
+    commands run as normal. Output is returned once a command finishes
+    so --progress is ignored for uploads run by the daemon.
+
+    If a [{metrics}] section is set in configuration under ~, metrics
+    of every command run by the daemon are exported every
+    {interval} seconds (default {def_interval}) with _serve inserted
+    before the extension of files.
+
+    The daemon runs until interrupted with Ctrl-C or sent SIGTERM.
+    """.format(default='~/' + DEFAULT_SOCKET_FILE,
+               env=SOCKET_ENV, socket=SOCKET_ARG,
+               metrics=MetricsExporterFromConfigFactory.SECTION,
+               interval=MetricsExporterFromConfigFactory.EXPORT_INTERVAL,
+               def_interval=MetricsExporterFromConfigFactory.
+               DEFAULT_EXPORT_INTERVAL)
+    help_formatter = argparse.RawDescriptionHelpFormatter
+    parser = subparsers.add_parser('serve',
+                                   help='Runs daemon that keeps '
+                                        'connections and configuration '
+                                        'warm for other commands',
+                                   description=desc,
+                                   formatter_class=help_formatter)
+    parser.add_argument(SOCKET_ARG, default=None,
+                        help='Path to Unix domain socket (default $' +
+                             SOCKET_ENV + ' or ~/' + DEFAULT_SOCKET_FILE +
+                             ')')
+    return parser
+
+
+def _raise_keyboard_interrupt(signum, frame):
+    """Signal handler that stops `serve_forever()`
+    """
+    raise KeyboardInterrupt()
+
+
+def _start_metrics_export(con=None):
+    """Starts exporters set in configuration, or default configuration
+       if `con` is None, and a thread that exports metrics periodically
+    :returns: tuple (list of `MetricsExporter`,
+              `MetricsExportThread` or None if there are no exporters)
+    """
+    if con is None:
+        con = metrics.get_config_or_none()
+    exporters = metrics.start_exporters(con, program='serve')
+    if len(exporters) == 0:
+        return exporters, None
+    interval, errmsg = MetricsExporterFromConfigFactory(con).\
+        get_export_interval()
+    if interval is None:
+        logger.error('Metrics will only be exported on exit: ' + errmsg)
+        return exporters, None
+    export_thread = metrics.MetricsExportThread(exporters, interval)
+    export_thread.start()
+    return exporters, export_thread
+
+
+def run(theargs):
+    """Runs daemon until interrupted
+    :param theargs: parsed arguments with socket attribute
+    :returns: exit code
+    """
+    socket_path = get_socket_path(getattr(theargs, 'socket', None))
+    try:
+        server = NcmirToolsServer(socket_path)
+    except EnvironmentError as e:
+        logger.error('Unable to start daemon: ' + str(e))
+        return 1
+    signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+    exporters, export_thread = _start_metrics_export()
+    logger.info('Listening on ' + socket_path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info('Shutting down')
+    finally:
+        server.server_close()
+        if export_thread is not None:
+            export_thread.stop()
+        metrics.stop_exporters(exporters)
+    return 0
@@ -9,14 +9,23 @@ import logging
 from ncmirtools.config import NcmirToolsConfig
 from ncmirtools.config import ConfigMissingError
 from ncmirtools import config
+from ncmirtools.kiosk.transfer import Transfer
 from ncmirtools.kiosk.transfer import SftpTransferFromConfigFactory
+from ncmirtools.kiosk.transfer import TransferFromConfigFactory
 from ncmirtools.kiosk.datafinder import SecondYoungestFromConfigFactory
+from ncmirtools.kiosk.progress import ProgressLinePrinter
+from ncmirtools.kiosk.retry import RetryPolicy
+from ncmirtools.kiosk.retry import RetryingTransfer
+from ncmirtools.kiosk.retry import RetryPolicyFromConfigFactory
+from ncmirtools.kiosk.progress import format_summary
+from ncmirtools import metrics
 
 
 # create logger
 logger = logging.getLogger('ncmirtools.imagetokiosk')
 
 HOMEDIR_ARG = '--homedir'
+PROGRESS_ARG = '--progress'
 RUN_MODE = 'run'
 DRYRUN_MODE = 'dryrun'
 
@@ -50,6 +59,10 @@ def _parse_arguments(desc, args):
                                           'under which the ' +
                                           NcmirToolsConfig.UCONFIG_FILE +
                                           ' is loaded (default ~)')
+    parser.add_argument(PROGRESS_ARG, action='store_true',
+                        help='Output progress line, updated as file is '
+                             'transferred, and throughput summary once '
+                             'transfer completes')
     parser.add_argument('--version', action='version',
                         version=('%(prog)s ' + ncmirtools.__version__))
 
@@ -83,13 +96,16 @@ def _get_last_transferred_file(con):
         f.close()
 
 
-def _update_last_transferred_file(thefile, con):
+def _update_last_transferred_file(thefile, con, checksum=None):
     """Updates last transferred file with new file
     :param thefile: path of file to update transfer log file
     :param con: ConfigParser object which should have a value for
                 `NcmirToolsConfig.DATASERVER_SECTION`,
                 `NcmirToolsConfig.DATASERVER_TRANSFERLOG`
                 that contains path to transfer log file
+    :param checksum: if not None, written to second line of
+                     transfer log file. Should be in format
+                     <algorithm>:<hex digest>
     """
     if con is None:
         logger.error('configuration object passed in is None')
@@ -100,6 +116,8 @@ def _update_last_transferred_file(thefile, con):
     try:
         f = open(tlog, 'w')
         f.write(thefile + '\n')
+        if checksum is not None:
+            f.write(checksum + '\n')
         f.flush()
         f.close()
     except IOError:
@@ -108,6 +126,33 @@ def _update_last_transferred_file(thefile, con):
         logger.exception('Problems writing data to logfile: ' + str(thefile))
 
 
+def _get_checksum_from_transfer(transfer):
+    """Gets checksum of last file sent by `transfer`
+    :param transfer: `Transfer` object
+    :returns: str in format <algorithm>:<hex digest> or None if
+              `transfer` did not compute a checksum
+    """
+    try:
+        checksum = transfer.get_last_checksum()
+        if checksum is None:
+            return None
+        return str(transfer.get_checksum_algorithm()) + ':' + checksum
+    except AttributeError:
+        logger.debug('Transfer object does not support checksums')
+    return None
+
+
+def _is_progress_enabled(theargs):
+    """Denotes if progress output was requested via `PROGRESS_ARG`
+    :param theargs: Object with parameters set from _parse_arguments()
+    :returns: True if progress output is enabled otherwise False
+    """
+    try:
+        return theargs.progress is True
+    except AttributeError:
+        return False
+
+
 def _upload_image_file(theargs, thefile, con, alt_transfer=None):
     """Uploads image file and logs it so we don't try to upload
        the same file twice
@@ -115,12 +160,19 @@ def _upload_image_file(theargs, thefile, con, alt_transfer=None):
     last_file = _get_last_transferred_file(con)
     if last_file is None or last_file != thefile:
         if alt_transfer is None:
-            logger.debug('Creating SftpTransfer object')
-            fac = SftpTransferFromConfigFactory(con)
-            transfer, errmsg = fac.get_sftptransfer()
+            logger.debug('Creating Transfer object')
+            fac = TransferFromConfigFactory(con)
+            transfer, errmsg = fac.get_transfer()
             if transfer is None:
                 sys.stderr.write(errmsg + _get_run_help_string(theargs) + '\n')
                 return 4
+            rfac = RetryPolicyFromConfigFactory(con, TransferFromConfigFactory.
+                                                SECTION)
+            policy, errmsg = rfac.get_retrypolicy()
+            if policy is None:
+                sys.stderr.write(errmsg + _get_run_help_string(theargs) + '\n')
+                return 4
+            transfer = RetryingTransfer(transfer, retry_policy=policy)
         else:
             logger.debug('Using alternate transfer object passed in')
             transfer = alt_transfer
@@ -136,6 +188,9 @@ def _upload_image_file(theargs, thefile, con, alt_transfer=None):
                         ' bytes')
 
             if theargs.mode == RUN_MODE:
+                show_progress = _is_progress_enabled(theargs)
+                if show_progress is True:
+                    transfer.set_progress_callback(ProgressLinePrinter())
                 (status, duration,
                  bytes_transferred) = transfer.transfer_file(thefile)
                 logger.info('Status (None means success): ' + str(status) +
@@ -144,13 +199,33 @@ def _upload_image_file(theargs, thefile, con, alt_transfer=None):
                             str(bytes_transferred))
 
                 if status is None:
-                    sys.stdout.write('After ' + str(duration) +
+                    sys.stdout.write('After ' + '%.3f' % duration +
                                      ' seconds. Transfer succeeded.\n')
+                    if show_progress is True:
+                        sys.stdout.write(format_summary(bytes_transferred,
+                                                        duration) + '\n')
+                    logger.debug('Updating transferred file')
+                    if transfer.get_compression() is not None:
+                        sys.stdout.write('Sent ' + str(bytes_transferred) +
+                                         ' bytes ' +
+                                         transfer.get_compression() +
+                                         ' compressed from ' +
+                                         str(transfer.get_last_raw_bytes()) +
+                                         ' bytes\n')
+                    checksum = _get_checksum_from_transfer(transfer)
+                    if checksum is not None:
+                        sys.stdout.write('Checksum: ' + checksum + '\n')
+                    _update_last_transferred_file(thefile, con,
+                                                  checksum=checksum)
+                    return 0
+                elif status == Transfer.SKIPPED:
+                    sys.stdout.write('Identical file already on remote '
+                                     'server. Transfer skipped.\n')
                     logger.debug('Updating transferred file')
                     _update_last_transferred_file(thefile, con)
                     return 0
                 else:
-                    sys.stdout.write('After ' + str(duration) +
+                    sys.stdout.write('After ' + '%.3f' % duration +
                                      ' seconds. Transfer failed: ' +
                                      str(status) + '\n')
                     return 1
@@ -202,12 +277,16 @@ def _check_and_transfer_image(theargs):
         sys.stderr.write(errmsg + '\n')
         return 3
 
-    thefile = filefinder.get_next_file()
-    if thefile is None:
-        sys.stdout.write('Did not find a file to transfer\n')
-        return 0
+    exporters = metrics.start_exporters(con, program='imagetokiosk')
+    try:
+        thefile = filefinder.get_next_file()
+        if thefile is None:
+            sys.stdout.write('Did not find a file to transfer\n')
+            return 0
 
-    return _upload_image_file(theargs, thefile, con)
+        return _upload_image_file(theargs, thefile, con)
+    finally:
+        metrics.stop_exporters(exporters)
 
 
 def _get_run_help_string(theargs):
@@ -274,6 +353,16 @@ def main(arglist):
 
               After X seconds. Transfer succeeded.
 
+              If {progress} flag is set a progress line is updated
+              while the file is sent, followed by this line upon success:
+
+              Sent X bytes in Y seconds (Z MB/s)
+
+              Or if {skip} is enabled and an identical file
+              already exists on the remote server:
+
+              Identical file already on remote server. Transfer skipped.
+
               Upon failure:
 
               After X seconds. Transfer failed: (reason for failure):
@@ -325,6 +414,27 @@ def main(arglist):
               {ssh_user}         = <ssh username>
               {kioskserver}             = <remote kiosk server>
               {kioskdir}  = <remote kiosk directory>
+              {backend}          = <optional, one of {backends}
+                                 (default {sftp}). {local} copies to
+                                 {kioskdir} on a mounted file system>
+              {max_attempts} = <optional, attempts to connect and
+                                    transfer before giving up, waiting
+                                    exponentially longer between them
+                                    (default {default_attempts})>
+
+              [{metrics}]
+
+              {prom_file} = <optional, file scan time, files
+                                     examined, bytes/s and other metrics
+                                     are written to in Prometheus text
+                                     format after each run. _imagetokiosk
+                                     is inserted before the extension>
+              {json_file}           = <optional, file metrics are written
+                                     to as JSON after each run.
+                                     _imagetokiosk is inserted before
+                                     the extension>
+              {statsd_host}         = <optional, StatsD server metrics
+                                     are sent to over UDP>
 
 
               Example configuration file:
@@ -351,10 +461,29 @@ def main(arglist):
                          kioskdir=SftpTransferFromConfigFactory.DEST_DIR,
                          kioskserver=SftpTransferFromConfigFactory.HOST,
                          homedir=HOMEDIR_ARG,
+                         progress=PROGRESS_ARG,
                          transferlog=NcmirToolsConfig.DATASERVER_TRANSFERLOG,
                          ds_ssh=SftpTransferFromConfigFactory.SECTION,
                          ssh_key=SftpTransferFromConfigFactory.KEY,
                          ssh_user=SftpTransferFromConfigFactory.USER,
+                         skip=SftpTransferFromConfigFactory.
+                         SKIP_IF_IDENTICAL,
+                         backend=TransferFromConfigFactory.BACKEND,
+                         backends=', '.join(TransferFromConfigFactory.
+                                            BACKENDS),
+                         sftp=TransferFromConfigFactory.SFTP_BACKEND,
+                         local=TransferFromConfigFactory.LOCAL_BACKEND,
+                         max_attempts=RetryPolicyFromConfigFactory.
+                         MAX_ATTEMPTS,
+                         default_attempts=RetryPolicy.DEFAULT_MAX_ATTEMPTS,
+                         metrics=metrics.MetricsExporterFromConfigFactory.
+                         SECTION,
+                         prom_file=metrics.MetricsExporterFromConfigFactory.
+                         PROMETHEUS_TEXTFILE,
+                         json_file=metrics.MetricsExporterFromConfigFactory.
+                         JSON_FILE,
+                         statsd_host=metrics.MetricsExporterFromConfigFactory.
+                         STATSD_HOST,
                          run=RUN_MODE,
                          dryrun=DRYRUN_MODE,
                          dryrunupper=DRYRUN_MODE.upper(),
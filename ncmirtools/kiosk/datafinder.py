@@ -3,13 +3,25 @@
 __author__ = 'churas'
 
 import os
-import time
 import logging
 
 from ncmirtools.config import NcmirToolsConfig
+from ncmirtools.config import get_list
+from ncmirtools.kiosk.progress import get_clock
+from ncmirtools import metrics
 
 logger = logging.getLogger(__name__)
 
+_SCAN_SECONDS = metrics.histogram('ncmirtools_datafinder_scan_seconds',
+                                  'Time to search data directory for '
+                                  'next file')
+_FILES_EXAMINED = metrics.counter('ncmirtools_datafinder_files_examined_'
+                                  'total',
+                                  'Files examined searching for next file')
+_FILES_ELIGIBLE = metrics.counter('ncmirtools_datafinder_files_eligible_'
+                                  'total',
+                                  'Examined files with matching suffix')
+
 
 def _get_files_in_directory_generator(path,
                                       list_of_dirs_to_exclude):
@@ -111,7 +123,8 @@ class SecondYoungest(FileFinder):
         # Also exclude any paths
         file_count = 0
         files_wrong_suffix_count = 0
-        start_time = int(time.time())
+        clock = get_clock()
+        start_time = clock()
         ex_list = self._list_of_dirs_to_exclude
         for img_file in _get_files_in_directory_generator(self._searchdir,
                                                           ex_list):
@@ -131,8 +144,11 @@ class SecondYoungest(FileFinder):
                 curyoungest_file = img_file
                 curyoungest_file_mtime = file_mtime
 
-        duration = int(time.time()) - start_time
-        logger.info('Search took ' + str(duration) + ' seconds. Found ' +
+        duration = clock() - start_time
+        _SCAN_SECONDS.observe(duration)
+        _FILES_EXAMINED.inc(file_count + files_wrong_suffix_count)
+        _FILES_ELIGIBLE.inc(file_count)
+        logger.info('Search took ' + '%.3f' % duration + ' seconds. Found ' +
                     str(file_count) + ' eligible files and ' +
                     str(files_wrong_suffix_count) +
                     ' files with invalid suffix')
@@ -195,9 +211,10 @@ class SecondYoungestFromConfigFactory(object):
                           NcmirToolsConfig.DATASERVER_DIRSTOEXCLUDE) is False:
             d_to_exclude_list = None
         else:
-            d_exclude = con.get(NcmirToolsConfig.DATASERVER_SECTION,
-                                NcmirToolsConfig.DATASERVER_DIRSTOEXCLUDE)
-            d_to_exclude_list = d_exclude.split(',')
+            d_to_exclude_list = get_list(con,
+                                         NcmirToolsConfig.DATASERVER_SECTION,
+                                         NcmirToolsConfig.
+                                         DATASERVER_DIRSTOEXCLUDE)
 
         secondyoungests = SecondYoungest(searchdir, suffix,
                                          d_to_exclude_list)
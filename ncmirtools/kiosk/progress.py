@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'churas'
+
+import sys
+import time
+import threading
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+MEGABYTE = 1024 * 1024
+
+
+def get_clock():
+    """Gets monotonic high resolution clock function, falling back to
+       `time.time` on versions of python that lack `time.perf_counter`
+    :returns: function that returns seconds as float
+    """
+    return getattr(time, 'perf_counter', time.time)
+
+
+def format_rate(bytes_per_sec):
+    """Formats rate as megabytes per second
+    :param bytes_per_sec: rate in bytes per second or None
+    :returns: str ie 1.25 MB/s or '? MB/s' if `bytes_per_sec` is None
+    """
+    if bytes_per_sec is None:
+        return '? MB/s'
+    return '%.2f MB/s' % (float(bytes_per_sec) / MEGABYTE)
+
+
+def format_seconds(secs):
+    """Formats duration as H:MM:SS
+    :param secs: seconds or None
+    :returns: str ie 0:01:05 or '?' if `secs` is None
+    """
+    if secs is None:
+        return '?'
+    secs = int(round(secs))
+    return '%d:%02d:%02d' % (secs // 3600, (secs % 3600) // 60, secs % 60)
+
+
+def format_progress(progress):
+    """Formats `TransferProgress` as a single line
+    :returns: str ie
+              12.00 of 100.00 MB (12%) 3.20 MB/s, avg 3.00 MB/s, ETA 0:00:29
+    """
+    sent = float(progress.get_bytes_sent()) / MEGABYTE
+    total = progress.get_total_bytes()
+    if total is None:
+        val = '%.2f MB' % sent
+    else:
+        val = '%.2f of %.2f MB' % (sent, float(total) / MEGABYTE)
+        if total > 0:
+            val += ' (%d%%)' % (100 * progress.get_bytes_sent() // total)
+    return (val + ' ' + format_rate(progress.get_instant_rate()) +
+            ', avg ' + format_rate(progress.get_average_rate()) +
+            ', ETA ' + format_seconds(progress.get_eta()))
+
+
+def format_summary(bytes_transferred, duration):
+    """Formats throughput summary of a transfer
+    :param bytes_transferred: bytes sent
+    :param duration: seconds transfer took
+    :returns: str ie Sent 1048576 bytes in 0.500 seconds (2.00 MB/s)
+    """
+    if duration is not None and duration > 0:
+        rate = float(bytes_transferred) / duration
+    else:
+        rate = None
+    return ('Sent ' + str(bytes_transferred) + ' bytes in ' +
+            '%.3f' % (duration or 0) + ' seconds (' + format_rate(rate) + ')')
+
+
+class TransferProgress(object):
+    """Tracks bytes sent for a file and periodically passes itself to
+       a callback that can query bytes sent, instantaneous and average
+       rate and estimated time remaining. Safe to update from multiple
+       threads
+    """
+    DEFAULT_INTERVAL = 0.5
+
+    def __init__(self, filepath, total_bytes, callback=None,
+                 interval=DEFAULT_INTERVAL, clock=None):
+        """Constructor
+        :param filepath: path of file being sent
+        :param total_bytes: bytes that will be sent or None if unknown
+        :param callback: function called with this object at most every
+                         `interval` seconds and once more by `finish()`
+        :param interval: minimum seconds between calls to `callback`,
+                         also the window used to compute instantaneous
+                         rate
+        :param clock: function returning seconds as float, if None
+                      `get_clock()` is used
+        """
+        if clock is None:
+            clock = get_clock()
+        self._filepath = filepath
+        self._total_bytes = total_bytes
+        self._callback = callback
+        self._interval = interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._bytes_sent = 0
+        self._start_time = clock()
+        self._now = self._start_time
+        self._window_time = self._start_time
+        self._window_bytes = 0
+        self._instant_rate = None
+        self._done = False
+
+    def get_filepath(self):
+        """Gets path of file being sent
+        """
+        return self._filepath
+
+    def get_total_bytes(self):
+        """Gets bytes that will be sent or None if unknown
+        """
+        return self._total_bytes
+
+    def set_total_bytes(self, total_bytes):
+        """Sets bytes that will be sent
+        """
+        self._total_bytes = total_bytes
+
+    def get_bytes_sent(self):
+        """Gets bytes sent so far
+        """
+        return self._bytes_sent
+
+    def get_elapsed(self):
+        """Gets seconds since this object was created as of last update
+        """
+        return self._now - self._start_time
+
+    def get_average_rate(self):
+        """Gets bytes per second since this object was created
+        :returns: rate or None if no time has elapsed
+        """
+        elapsed = self.get_elapsed()
+        if elapsed <= 0:
+            return None
+        return self._bytes_sent / elapsed
+
+    def get_instant_rate(self):
+        """Gets bytes per second over last interval
+        :returns: rate or None if an interval has not elapsed
+        """
+        return self._instant_rate
+
+    def get_eta(self):
+        """Gets estimated seconds until transfer completes based on
+           average rate
+        :returns: seconds or None if total bytes or rate is unknown
+        """
+        if self._done is True:
+            return 0
+        rate = self.get_average_rate()
+        if self._total_bytes is None or not rate:
+            return None
+        return max(self._total_bytes - self._bytes_sent, 0) / rate
+
+    def is_done(self):
+        """Denotes if `finish()` was called
+        """
+        return self._done
+
+    def add(self, nbytes):
+        """Adds `nbytes` to bytes sent
+        """
+        with self._lock:
+            self._bytes_sent += nbytes
+            self._update()
+
+    def set_bytes_sent(self, bytes_sent, total_bytes=None):
+        """Sets bytes sent, signature matches paramiko put callback
+        :param bytes_sent: bytes sent so far
+        :param total_bytes: ignored
+        """
+        with self._lock:
+            self._bytes_sent = bytes_sent
+            self._update()
+
+    def finish(self):
+        """Marks transfer complete and calls callback
+        """
+        with self._lock:
+            self._done = True
+            self._update(force=True)
+
+    def _update(self, force=False):
+        """Updates rates and calls callback if interval has elapsed
+           or `force` is True. Caller must hold lock
+        """
+        self._now = self._clock()
+        window = self._now - self._window_time
+        if window < self._interval and force is False:
+            return
+        if window > 0:
+            self._instant_rate = ((self._bytes_sent - self._window_bytes) /
+                                  window)
+        self._window_time = self._now
+        self._window_bytes = self._bytes_sent
+        if self._callback is None:
+            return
+        try:
+            self._callback(self)
+        except Exception:
+            logger.exception('Caught exception from progress callback')
+
+
+class ProgressLinePrinter(object):
+    """Progress callback that rewrites a single line on a stream
+       with output of `format_progress()`
+    """
+    def __init__(self, stream=None):
+        """Constructor
+        :param stream: stream to write to, if None `sys.stdout`
+        """
+        self._stream = stream
+
+    def __call__(self, progress):
+        """Writes progress line, ending it with newline if
+           `progress` is done
+        """
+        stream = self._stream
+        if stream is None:
+            stream = sys.stdout
+        stream.write('\r' + format_progress(progress))
+        if progress.is_done():
+            stream.write('\n')
+        stream.flush()
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'churas'
+
+import time
+import datetime
+import threading
+import logging
+
+from ncmirtools.kiosk.progress import get_clock
+
+logger = logging.getLogger(__name__)
+
+RATE_SUFFIXES = {'K': 1024,
+                 'M': 1024 * 1024,
+                 'G': 1024 * 1024 * 1024}
+
+
+def parse_rate(rate):
+    """Parses rate in bytes per second with optional K, M or G
+       suffix (powers of 1024) ie 500K or 10M
+    :param rate: rate as str
+    :raises ValueError: if `rate` cannot be parsed or is negative
+    :returns: rate in bytes per second as int, 0 means no limit
+    """
+    val = str(rate).strip().upper()
+    if val.endswith('B'):
+        val = val[:-1]
+    multiplier = 1
+    if len(val) > 0 and val[-1] in RATE_SUFFIXES:
+        multiplier = RATE_SUFFIXES[val[-1]]
+        val = val[:-1]
+    try:
+        res = int(float(val) * multiplier)
+    except ValueError:
+        raise ValueError('Invalid rate: ' + str(rate))
+    if res < 0:
+        raise ValueError('Rate cannot be negative: ' + str(rate))
+    return res
+
+
+def _parse_time_of_day(val):
+    """Parses HH:MM into minutes since midnight
+    :raises ValueError: if `val` is not a valid time of day
+    """
+    try:
+        hours, minutes = val.strip().split(':')
+        hours = int(hours)
+        minutes = int(minutes)
+    except ValueError:
+        raise ValueError('Invalid time of day: ' + str(val))
+    if hours < 0 or hours > 24 or minutes < 0 or minutes > 59 or \
+            (hours == 24 and minutes != 0):
+        raise ValueError('Invalid time of day: ' + str(val))
+    return hours * 60 + minutes
+
+
+def parse_schedule(schedule):
+    """Parses rate limit schedule of comma separated
+       HH:MM-HH:MM=rate entries ie
+       08:00-18:00=2M,18:00-08:00=0
+       Windows can span midnight and rate is parsed by
+       `parse_rate()`
+    :param schedule: schedule as str
+    :raises ValueError: if `schedule` cannot be parsed
+    :returns: list of tuples (start minute, end minute, rate)
+    """
+    entries = []
+    for entry in schedule.split(','):
+        if entry.strip() == '':
+            continue
+        if '=' not in entry or '-' not in entry.split('=')[0]:
+            raise ValueError('Invalid schedule entry, expected '
+                             'HH:MM-HH:MM=rate: ' + entry.strip())
+        window, rate = entry.split('=', 1)
+        start, end = window.split('-', 1)
+        entries.append((_parse_time_of_day(start),
+                        _parse_time_of_day(end),
+                        parse_rate(rate)))
+    return entries
+
+
+class TokenBucket(object):
+    """Thread safe token bucket where tokens are bytes. Callers
+       that take more tokens then are available go into debt and
+       sleep until it is paid back, so concurrent callers share
+       the rate
+    """
+    def __init__(self, rate, burst=None, clock=None, sleep=time.sleep):
+        """Constructor
+        :param rate: tokens added per second, None or 0 for no limit
+        :param burst: maximum tokens that can accumulate, if None
+                      `rate` is used ie one second worth
+        :param clock: function returning seconds as float, if None
+                      `get_clock()` is used
+        :param sleep: function used to wait
+        """
+        if clock is None:
+            clock = get_clock()
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._rate = rate
+        self._burst = burst
+        self._tokens = self.get_burst()
+        self._last = clock()
+
+    def get_rate(self):
+        """Gets rate in tokens per second
+        """
+        return self._rate
+
+    def get_burst(self):
+        """Gets maximum number of tokens that can accumulate
+        """
+        if self._burst is not None:
+            return self._burst
+        if self._rate is None:
+            return 0
+        return self._rate
+
+    def set_rate(self, rate):
+        """Changes rate, tokens accumulated so far at old rate are kept
+        """
+        with self._lock:
+            if rate == self._rate:
+                return
+            self._refill()
+            self._rate = rate
+            self._tokens = min(self._tokens, self.get_burst())
+
+    def _refill(self):
+        """Adds tokens accumulated since last call. Caller must hold lock
+        """
+        now = self._clock()
+        elapsed = max(now - self._last, 0)
+        self._last = now
+        if self._rate is None or self._rate <= 0:
+            return
+        self._tokens = min(self._tokens + elapsed * self._rate,
+                           self.get_burst())
+
+    def consume(self, tokens):
+        """Takes `tokens` from bucket waiting if needed
+        :returns: seconds spent waiting
+        """
+        with self._lock:
+            if self._rate is None or self._rate <= 0:
+                return 0
+            self._refill()
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0
+            wait = -self._tokens / float(self._rate)
+        self._sleep(wait)
+        return wait
+
+
+class RateLimiter(object):
+    """Limits bytes per second using a `TokenBucket` whose rate is
+       taken from a time of day schedule, falling back to a default
+       rate outside the scheduled windows. A single instance can be
+       shared by threads to limit their combined rate
+    """
+    def __init__(self, rate=None, schedule=None, burst=None,
+                 clock=None, sleep=time.sleep,
+                 now=datetime.datetime.now):
+        """Constructor
+        :param rate: default rate in bytes per second, None or 0
+                     for no limit
+        :param schedule: list of tuples (start minute, end minute, rate)
+                         as returned by `parse_schedule()`. First window
+                         containing current time of day is used
+        :param burst: bytes that can be sent at once, if None one
+                      second worth of current rate
+        :param clock: see `TokenBucket`
+        :param sleep: see `TokenBucket`
+        :param now: function returning current `datetime.datetime`
+        """
+        self._rate = rate
+        if schedule is None:
+            self._schedule = []
+        else:
+            self._schedule = schedule
+        self._now = now
+        self._bucket = TokenBucket(self.get_current_rate(), burst=burst,
+                                   clock=clock, sleep=sleep)
+
+    def get_rate(self):
+        """Gets default rate in bytes per second
+        """
+        return self._rate
+
+    def get_schedule(self):
+        """Gets schedule
+        """
+        return self._schedule
+
+    def get_current_rate(self):
+        """Gets rate in bytes per second for current time of day
+        :returns: rate, None or 0 means no limit
+        """
+        current = self._now()
+        minute = current.hour * 60 + current.minute
+        for start, end, rate in self._schedule:
+            if start <= end:
+                if start <= minute < end:
+                    return rate
+            elif minute >= start or minute < end:
+                return rate
+        return self._rate
+
+    def consume(self, nbytes):
+        """Waits as needed so bytes consumed do not exceed current rate
+        :param nbytes: number of bytes about to be sent
+        :returns: seconds spent waiting
+        """
+        self._bucket.set_rate(self.get_current_rate())
+        return self._bucket.consume(nbytes)
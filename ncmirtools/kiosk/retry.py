@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'churas'
+
+import time
+import errno
+import random
+import logging
+
+from ncmirtools.kiosk.progress import get_clock
+from ncmirtools.kiosk.transfer import Transfer
+from ncmirtools.kiosk.transfer import TransferResult
+from ncmirtools.kiosk.transfer import InvalidDestinationDirError
+from ncmirtools.kiosk.transfer import SSHConnectionError
+from ncmirtools.kiosk.transfer import CommandFailedError
+from ncmirtools import metrics
+
+
+logger = logging.getLogger(__name__)
+
+_RETRIES = metrics.counter('ncmirtools_transfer_retries_total',
+                           'Transfers retried after a failure')
+
+
+class RetryPolicy(object):
+    """Decides if and when a failed operation is retried. Delay
+       between attempts grows exponentially and is randomized by
+       jitter so many clients do not retry in lockstep
+    """
+    DEFAULT_MAX_ATTEMPTS = 3
+    DEFAULT_INITIAL_DELAY = 2.0
+    DEFAULT_MAX_DELAY = 60.0
+    DEFAULT_MULTIPLIER = 2.0
+    DEFAULT_JITTER = 0.5
+
+    # EnvironmentError errnos retrying will not fix
+    FATAL_ERRNOS = set([errno.ENOENT, errno.EACCES, errno.EPERM,
+                        errno.ENOSPC, errno.EISDIR, errno.ENOTDIR])
+
+    def __init__(self, max_attempts=None, initial_delay=None,
+                 max_delay=None, multiplier=None, jitter=None,
+                 sleep=time.sleep, random_func=random.random):
+        """Constructor
+        :param max_attempts: total attempts including first, 1 disables
+                             retries. If None `DEFAULT_MAX_ATTEMPTS`
+        :param initial_delay: seconds to wait before second attempt.
+                              If None `DEFAULT_INITIAL_DELAY`
+        :param max_delay: maximum seconds to wait between attempts.
+                          If None `DEFAULT_MAX_DELAY`
+        :param multiplier: delay is multiplied by this after each
+                           attempt. If None `DEFAULT_MULTIPLIER`
+        :param jitter: fraction, between 0 and 1, delay is randomly
+                       increased or decreased by. If None
+                       `DEFAULT_JITTER`
+        :param sleep: function used to wait
+        :param random_func: function returning float in [0, 1)
+        """
+        self._max_attempts = RetryPolicy._get_value(max_attempts,
+                                                    RetryPolicy.
+                                                    DEFAULT_MAX_ATTEMPTS)
+        self._initial_delay = RetryPolicy._get_value(initial_delay,
+                                                     RetryPolicy.
+                                                     DEFAULT_INITIAL_DELAY)
+        self._max_delay = RetryPolicy._get_value(max_delay,
+                                                 RetryPolicy.
+                                                 DEFAULT_MAX_DELAY)
+        self._multiplier = RetryPolicy._get_value(multiplier,
+                                                  RetryPolicy.
+                                                  DEFAULT_MULTIPLIER)
+        self._jitter = RetryPolicy._get_value(jitter,
+                                              RetryPolicy.DEFAULT_JITTER)
+        self._sleep = sleep
+        self._random = random_func
+
+    @staticmethod
+    def _get_value(val, default):
+        """Gets `val` or `default` if `val` is None
+        """
+        if val is None:
+            return default
+        return val
+
+    def get_max_attempts(self):
+        """Gets total attempts including first
+        """
+        return self._max_attempts
+
+    def get_initial_delay(self):
+        """Gets seconds to wait before second attempt
+        """
+        return self._initial_delay
+
+    def get_max_delay(self):
+        """Gets maximum seconds to wait between attempts
+        """
+        return self._max_delay
+
+    def get_multiplier(self):
+        """Gets factor delay grows by after each attempt
+        """
+        return self._multiplier
+
+    def get_jitter(self):
+        """Gets fraction delay is randomized by
+        """
+        return self._jitter
+
+    def get_delay(self, attempt):
+        """Gets seconds to wait after failed `attempt`
+        :param attempt: number of attempt that failed starting at 1
+        :returns: delay in seconds
+        """
+        delay = min(self._initial_delay *
+                    (self._multiplier ** (attempt - 1)), self._max_delay)
+        delay *= 1.0 + self._jitter * (2.0 * self._random() - 1.0)
+        return max(delay, 0)
+
+    @staticmethod
+    def get_retryable_exceptions():
+        """Gets network and ssh errors that are usually transient.
+           paramiko is imported here, not when module is loaded
+        :returns: tuple of exception classes
+        """
+        import paramiko
+        return EnvironmentError, EOFError, paramiko.SSHException
+
+    @staticmethod
+    def get_fatal_exceptions():
+        """Gets errors retrying will not fix
+        :returns: tuple of exception classes
+        """
+        import paramiko
+        return (paramiko.AuthenticationException,
+                paramiko.BadHostKeyException,
+                InvalidDestinationDirError,
+                SSHConnectionError)
+
+    def is_retryable(self, exception):
+        """Denotes if operation that failed with `exception` should
+           be retried
+        :param exception: exception raised or None if operation
+                          failed without one. None is treated as
+                          fatal since the cause is unknown
+        :returns: True if retryable, False if fatal
+        """
+        if exception is None:
+            return False
+        if isinstance(exception, CommandFailedError):
+            return exception.retryable is True
+        if isinstance(exception, RetryPolicy.get_fatal_exceptions()):
+            return False
+        if isinstance(exception, EnvironmentError) and \
+                exception.errno in RetryPolicy.FATAL_ERRNOS:
+            return False
+        return isinstance(exception,
+                          RetryPolicy.get_retryable_exceptions())
+
+    def wait(self, attempt):
+        """Sleeps for `get_delay()` of `attempt`
+        :returns: seconds slept
+        """
+        delay = self.get_delay(attempt)
+        logger.info('Attempt ' + str(attempt) + ' of ' +
+                    str(self._max_attempts) + ' failed, retrying in ' +
+                    '%.2f' % delay + ' seconds')
+        self._sleep(delay)
+        return delay
+
+    def call(self, func, *args, **kwargs):
+        """Calls `func` with `args` and `kwargs` retrying it upon
+           retryable exceptions
+        :returns: value returned by `func`
+        :raises: last exception if it is fatal or attempts are used up
+        """
+        attempt = 1
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self._max_attempts or \
+                        self.is_retryable(e) is False:
+                    raise
+                logger.warning('Caught retryable exception: ' +
+                               str(e.__class__.__name__) + ' : ' + str(e))
+            self.wait(attempt)
+            attempt += 1
+
+
+class RetryingTransfer(Transfer):
+    """Wraps a `Transfer` retrying `connect()` and `transfer_file()`
+       according to a `RetryPolicy`. Between transfer attempts the
+       wrapped transfer is disconnected and connected again. Other
+       methods are passed through to the wrapped transfer
+    """
+    def __init__(self, transfer, retry_policy=None):
+        """Constructor
+        :param transfer: `Transfer` to wrap
+        :param retry_policy: `RetryPolicy`, if None one with default
+                             values is used
+        """
+        super(RetryingTransfer, self).__init__()
+        self._transfer = transfer
+        if retry_policy is None:
+            self._retry_policy = RetryPolicy()
+        else:
+            self._retry_policy = retry_policy
+        self._last_attempts = 0
+
+    def get_transfer(self):
+        """Gets wrapped `Transfer`
+        """
+        return self._transfer
+
+    def get_retry_policy(self):
+        """Gets `RetryPolicy`
+        """
+        return self._retry_policy
+
+    def get_last_attempts(self):
+        """Gets number of attempts made by last `transfer_file()`
+        """
+        return self._last_attempts
+
+    def connect(self):
+        """Connects wrapped transfer retrying upon retryable errors
+        """
+        self._retry_policy.call(self._transfer.connect)
+
+    def disconnect(self):
+        """Disconnects wrapped transfer
+        """
+        self._transfer.disconnect()
+
+    def transfer_file(self, filepath):
+        """Transfers `filepath` with wrapped transfer retrying if it
+           fails with a retryable error
+        :returns: `TransferResult` (status, duration, bytes transferred)
+                  from last attempt, with duration covering all attempts
+        """
+        clock = get_clock()
+        start_time = clock()
+        attempt = 1
+        while True:
+            self._last_attempts = attempt
+            status, duration, bytes_transferred = self._transfer.\
+                transfer_file(filepath)
+            if status is None or status == Transfer.SKIPPED:
+                break
+            exception = self._get_last_exception()
+            if attempt >= self._retry_policy.get_max_attempts() or \
+                    self._retry_policy.is_retryable(exception) is False:
+                break
+            logger.warning('Transfer of ' + str(filepath) + ' failed: ' +
+                           str(status))
+            self._retry_policy.wait(attempt)
+            attempt += 1
+            _RETRIES.inc()
+            try:
+                self._transfer.disconnect()
+                self._retry_policy.call(self._transfer.connect)
+            except Exception as e:
+                logger.exception('Unable to reconnect')
+                status = ('Caught an exception: ' +
+                          str(e.__class__.__name__) + ' : ' + str(e))
+                break
+        return TransferResult(status, clock() - start_time,
+                              bytes_transferred)
+
+    def _get_last_exception(self):
+        """Gets exception from last transfer of wrapped transfer or
+           None if not available
+        """
+        try:
+            return self._transfer.get_last_exception()
+        except AttributeError:
+            return None
+
+    def get_last_exception(self):
+        """Gets exception raised by last attempt of wrapped transfer
+        """
+        return self._get_last_exception()
+
+    def set_progress_callback(self, callback):
+        """Sets progress callback on wrapped transfer
+        """
+        self._transfer.set_progress_callback(callback)
+
+    def get_progress_callback(self):
+        """Gets progress callback of wrapped transfer
+        """
+        return self._transfer.get_progress_callback()
+
+    def get_checksum_algorithm(self):
+        """Gets checksum algorithm of wrapped transfer
+        """
+        return self._transfer.get_checksum_algorithm()
+
+    def get_last_checksum(self):
+        """Gets last checksum of wrapped transfer
+        """
+        return self._transfer.get_last_checksum()
+
+    def get_compression(self):
+        """Gets compression of wrapped transfer
+        """
+        return self._transfer.get_compression()
+
+    def get_last_raw_bytes(self):
+        """Gets last raw bytes of wrapped transfer
+        """
+        return self._transfer.get_last_raw_bytes()
+
+    def get_last_remote_path(self):
+        """Gets last remote path of wrapped transfer
+        """
+        return self._transfer.get_last_remote_path()
+
+    def __getattr__(self, name):
+        """Passes other attributes, such as
+           get_destination_directory(), to wrapped transfer
+        """
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._transfer, name)
+
+
+class RetryPolicyFromConfigFactory(object):
+    """Creates `RetryPolicy` from a section of configuration
+    """
+    MAX_ATTEMPTS = 'retry_max_attempts'
+    INITIAL_DELAY = 'retry_initial_delay'
+    MAX_DELAY = 'retry_max_delay'
+    JITTER = 'retry_jitter'
+
+    def __init__(self, config, section):
+        """Constructor
+           Reads these optional values from `section` of
+           `configparser.ConfigParser` passed in:
+
+           retry_max_attempts = <total attempts, 1 disables retries>
+           retry_initial_delay = <seconds before second attempt>
+           retry_max_delay = <maximum seconds between attempts>
+           retry_jitter = <fraction between 0 and 1 delay is
+                           randomized by>
+
+        :param config: configparser.ConfigParser object
+        :param section: name of section
+        """
+        self._config = config
+        self._section = section
+
+    def get_retrypolicy(self):
+        """Gets `RetryPolicy` from configuration
+        :returns: tuple (RetryPolicy, None) upon success or
+                  (None, 'error message as str') upon failure
+        """
+        try:
+            max_attempts = self._get_option(RetryPolicyFromConfigFactory.
+                                            MAX_ATTEMPTS, int)
+            initial = self._get_option(RetryPolicyFromConfigFactory.
+                                       INITIAL_DELAY, float)
+            max_delay = self._get_option(RetryPolicyFromConfigFactory.
+                                         MAX_DELAY, float)
+            jitter = self._get_option(RetryPolicyFromConfigFactory.JITTER,
+                                      float)
+        except ValueError as e:
+            return None, 'Invalid retry option: ' + str(e)
+
+        if max_attempts is not None and max_attempts < 1:
+            return None, (RetryPolicyFromConfigFactory.MAX_ATTEMPTS +
+                          ' must be 1 or larger')
+        if jitter is not None and (jitter < 0 or jitter > 1):
+            return None, (RetryPolicyFromConfigFactory.JITTER +
+                          ' must be between 0 and 1')
+
+        return RetryPolicy(max_attempts=max_attempts,
+                           initial_delay=initial,
+                           max_delay=max_delay,
+                           jitter=jitter), None
+
+    def _get_option(self, option, conv):
+        """Gets `option` from section converted by `conv`
+        :returns: value or None if not set
+        """
+        if self._config is None or \
+                self._config.has_option(self._section, option) is False:
+            return None
+        return conv(self._config.get(self._section, option))
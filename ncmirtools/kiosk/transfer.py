@@ -3,14 +3,49 @@
 __author__ = 'churas'
 
 import os
-import time
+import zlib
+import errno
+import shutil
+import subprocess
+import hashlib
 import logging
-import paramiko
+import threading
+from collections import namedtuple
+
+from ncmirtools.kiosk.progress import TransferProgress
+from ncmirtools.kiosk.progress import format_summary
+from ncmirtools.kiosk.progress import get_clock
+from ncmirtools.kiosk.ratelimit import RateLimiter
+from ncmirtools.kiosk.ratelimit import parse_rate
+from ncmirtools.kiosk.ratelimit import parse_schedule
+from ncmirtools import metrics
+from ncmirtools.config import with_log_context
+
+try:
+    import queue
+except ImportError:  # pragma: no cover
+    import Queue as queue
+
+try:
+    from shlex import quote
+except ImportError:  # pragma: no cover
+    from pipes import quote
 
 
 logger = logging.getLogger(__name__)
 
 
+def _replace(src, dest):
+    """Renames `src` to `dest` atomically replacing `dest` if it
+       exists. Uses `os.replace` if available since `os.rename`
+       does not replace existing files on Windows
+    """
+    if hasattr(os, 'replace'):
+        os.replace(src, dest)
+    else:  # pragma: no cover
+        os.rename(src, dest)
+
+
 class InvalidDestinationDirError(Exception):
     """Error raised when destination directory is invalid
     """
@@ -23,11 +58,304 @@ class SSHConnectionError(Exception):
     pass
 
 
+class CommandFailedError(Exception):
+    """Recorded as last exception of `SshCommandTransfer` when the
+       command it runs exits with a non zero code
+    """
+    def __init__(self, message, returncode=None, retryable=False):
+        """Constructor
+        :param returncode: exit code of command
+        :param retryable: True if `returncode` denotes a transient
+                          error, such as a dropped connection
+        """
+        super(CommandFailedError, self).__init__(message)
+        self.returncode = returncode
+        self.retryable = retryable
+
+
+# paramiko key classes tried in order when loading a private key
+PRIVATE_KEY_CLASSES = ['RSAKey', 'ECDSAKey', 'Ed25519Key', 'DSSKey']
+
+_private_key_cache = {}
+_private_key_cache_lock = threading.Lock()
+
+
+def load_private_key(path, passphrase=None):
+    """Loads RSA, ECDSA, Ed25519 or DSS private key from `path`.
+       Parsed keys are cached per path and modification time, so
+       decrypting the key is only done once per process unless the
+       file changes
+    :param path: path to private key file
+    :param passphrase: passphrase to decrypt key or None
+    :raises IOError: if `path` cannot be read
+    :raises paramiko.SSHException: if key cannot be parsed
+    :returns: paramiko.PKey
+    """
+    if passphrase is None:
+        secret = None
+    else:
+        secret = hashlib.sha256(passphrase.encode('utf-8')).hexdigest()
+    cache_key = (os.path.abspath(path), os.stat(path).st_mtime, secret)
+    with _private_key_cache_lock:
+        pkey = _private_key_cache.get(cache_key)
+    if pkey is not None:
+        logger.debug('Using cached private key ' + path)
+        return pkey
+
+    pkey = _parse_private_key(path, passphrase)
+    with _private_key_cache_lock:
+        _private_key_cache[cache_key] = pkey
+    return pkey
+
+
+def clear_private_key_cache():
+    """Removes all keys cached by `load_private_key()`
+    """
+    with _private_key_cache_lock:
+        _private_key_cache.clear()
+
+
+def _parse_private_key(path, passphrase):
+    """Tries each class in `PRIVATE_KEY_CLASSES` supported by
+       installed paramiko to parse private key at `path`
+    :raises paramiko.SSHException: if no class can parse key
+    :returns: paramiko.PKey
+    """
+    import paramiko
+    errors = []
+    for name in PRIVATE_KEY_CLASSES:
+        key_class = getattr(paramiko, name, None)
+        if key_class is None:
+            continue
+        try:
+            return key_class.from_private_key_file(path, passphrase)
+        except paramiko.PasswordRequiredException:
+            raise
+        except (paramiko.SSHException, ValueError) as e:
+            errors.append(name + ': ' + str(e))
+    raise paramiko.SSHException('Unable to load private key ' + path +
+                                ' ' + ', '.join(errors))
+
+
+def new_hash(algorithm):
+    """Creates hash object for `algorithm`
+    :param algorithm: name of any algorithm supported by hashlib.new()
+                      or, if xxhash module is installed, one of its
+                      algorithms ie xxh64, xxh3_64, xxh3_128
+    :raises ValueError: if `algorithm` is not supported
+    :returns: object with update() and hexdigest() methods
+    """
+    if algorithm.startswith('xxh'):
+        try:
+            import xxhash
+        except ImportError:
+            raise ValueError('xxhash module is required for ' + algorithm)
+        if not hasattr(xxhash, algorithm):
+            raise ValueError('Unsupported xxhash algorithm: ' + algorithm)
+        return getattr(xxhash, algorithm)()
+    return hashlib.new(algorithm)
+
+
+def compute_checksum(filepath, algorithm='sha256',
+                     buffer_size=1024 * 1024):
+    """Computes checksum of `filepath` reading it `buffer_size`
+       bytes at a time
+    :param filepath: path to file
+    :param algorithm: name of algorithm passed to `new_hash()`
+    :returns: hex digest of file as str
+    """
+    h = new_hash(algorithm)
+    with open(filepath, 'rb') as f:
+        while True:
+            data = f.read(buffer_size)
+            if not data:
+                break
+            h.update(data)
+    return h.hexdigest()
+
+
+COMPRESSION_SUFFIXES = {'gzip': '.gz',
+                        'zstd': '.zst'}
+
+
+def new_compressor(compression, level=None, threads=None):
+    """Creates streaming compressor
+    :param compression: gzip or zstd. zstd requires the zstandard
+                        module
+    :param level: compression level or None for default
+    :param threads: number of threads used to compress, only
+                    supported by zstd, None or 0 means single
+                    threaded
+    :raises ValueError: if `compression` is not supported
+    :returns: object with compress(data) and flush() methods
+    """
+    if compression == 'gzip':
+        if level is None:
+            level = 6
+        return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError('zstandard module is required for zstd '
+                             'compression')
+        if level is None:
+            level = 3
+        if threads is None:
+            threads = 0
+        return zstandard.ZstdCompressor(level=level,
+                                        threads=threads).compressobj()
+    raise ValueError('Unsupported compression: ' + str(compression))
+
+
+class _BlockReader(object):
+    """Reads local file in blocks updating a hash with the data
+       read and optionally compressing and rate limiting it
+    """
+    def __init__(self, f, block_size, hasher=None, compressor=None,
+                 rate_limiter=None):
+        """Constructor
+        :param f: file object opened in binary mode
+        :param block_size: bytes to read from `f` per read
+        :param hasher: if not None, updated with data read from `f`
+        :param compressor: if not None, data read is passed through
+                           this object's compress() method
+        :param rate_limiter: if not None, `consume()` is called with
+                             size of each block returned by `read()`
+        """
+        self._f = f
+        self._block_size = block_size
+        self._hasher = hasher
+        self._compressor = compressor
+        self._rate_limiter = rate_limiter
+        self._raw_bytes = 0
+        self._wire_bytes = 0
+        self._eof = False
+
+    def get_raw_bytes(self):
+        """Gets number of bytes read from file
+        """
+        return self._raw_bytes
+
+    def get_wire_bytes(self):
+        """Gets number of bytes returned by `read()`
+        """
+        return self._wire_bytes
+
+    def read(self):
+        """Gets next block of data to send
+        :returns: bytes or empty bytes when there is no more data
+        """
+        while self._eof is False:
+            data = self._f.read(self._block_size)
+            if not data:
+                self._eof = True
+                if self._compressor is None:
+                    break
+                out = self._compressor.flush()
+            else:
+                self._raw_bytes += len(data)
+                if self._hasher is not None:
+                    self._hasher.update(data)
+                if self._compressor is None:
+                    out = data
+                else:
+                    out = self._compressor.compress(data)
+            if out:
+                self._wire_bytes += len(out)
+                if self._rate_limiter is not None:
+                    self._rate_limiter.consume(len(out))
+                return out
+        return b''
+
+
+_CONNECT_SECONDS = metrics.histogram('ncmirtools_transfer_connect_seconds',
+                                     'Time to connect to remote server')
+_TRANSFER_SECONDS = metrics.histogram('ncmirtools_transfer_seconds',
+                                      'Time to transfer a file')
+_TRANSFER_RATE = metrics.histogram('ncmirtools_transfer_bytes_per_second',
+                                   'Rate files were transferred at',
+                                   buckets=metrics.DEFAULT_RATE_BUCKETS)
+_TRANSFER_BYTES = metrics.counter('ncmirtools_transfer_bytes_total',
+                                  'Bytes sent to remote server')
+_TRANSFERS = metrics.counter('ncmirtools_transfers_total',
+                             'Files transferred')
+_TRANSFERS_SKIPPED = metrics.counter('ncmirtools_transfers_skipped_total',
+                                     'Files skipped since an identical '
+                                     'file is on remote server')
+_TRANSFER_FAILURES = metrics.counter('ncmirtools_transfer_failures_total',
+                                     'Failed file transfers')
+
+
+def _record_transfer(result):
+    """Updates transfer metrics with `result`
+    :param result: `TransferResult`
+    :returns: `result`
+    """
+    if result.is_skipped():
+        _TRANSFERS_SKIPPED.inc()
+    elif result.status is not None:
+        _TRANSFER_FAILURES.inc()
+    else:
+        _TRANSFERS.inc()
+        _TRANSFER_SECONDS.observe(result.duration)
+        _TRANSFER_BYTES.inc(result.bytes_transferred)
+        if result.duration > 0:
+            _TRANSFER_RATE.observe(float(result.bytes_transferred) /
+                                   result.duration)
+    return result
+
+
+class TransferResult(namedtuple('TransferResult', ['status', 'duration',
+                                                   'bytes_transferred'])):
+    """Result of `Transfer.transfer_file()`. Is a tuple so it can be
+       unpacked as (status, duration, bytes transferred). Bytes
+       transferred is the number of bytes sent over the wire by that
+       call, so it is less then the file size when an interrupted
+       transfer is resumed and differs from it when compression is set
+    """
+    __slots__ = ()
+
+    def is_success(self):
+        """Denotes if file was sent or skipped because an identical
+           copy exists on remote server
+        """
+        return self.status is None or self.status == Transfer.SKIPPED
+
+    def is_skipped(self):
+        """Denotes if file was skipped
+        """
+        return self.status == Transfer.SKIPPED
+
+
 class Transfer(object):
     """Base object to transfer file to remote server
     """
+    SKIPPED = 'skipped'
+
     def __init__(self):
-        pass
+        self._progress_callback = None
+        self._last_exception = None
+
+    def get_last_exception(self):
+        """Gets exception that caused last call to `transfer_file()`
+           to fail, used to decide if it can be retried
+        :returns: exception or None if there was none
+        """
+        return self._last_exception
+
+    def set_progress_callback(self, callback):
+        """Sets function called with a
+           `ncmirtools.kiosk.progress.TransferProgress` object
+           periodically during `transfer_file()`
+        :param callback: function or None to disable
+        """
+        self._progress_callback = callback
+
+    def get_progress_callback(self):
+        """Gets progress callback set via `set_progress_callback()`
+        """
+        return self._progress_callback
 
     def connect(self):
         """Connects to remote server
@@ -43,15 +371,53 @@ class Transfer(object):
         """Transfers file specified by `filepath` to remote
            server
         :param filepath: path to file to transfer
-        :returns tuple (status, time, bytestransferred)
+        :returns `TransferResult` tuple (status, time, bytestransferred)
                  where
-                 status is None upon success or a string
+                 status is None upon success, `Transfer.SKIPPED`
+                        if file was not sent because an identical
+                        copy exists on remote server or a string
                         upon error.
-                 time is number of seconds it took to transfer
+                 time is number of seconds, as float, it took
+                      to transfer
                  bytestransferred is bytes sent
         """
         logger.warning('Subclasses need to implementthis method')
-        return 'Not implemented', -1, -1
+        return TransferResult('Not implemented', -1, -1)
+
+    def get_checksum_algorithm(self):
+        """Gets algorithm used to compute checksum of data as it is
+           transferred
+        :returns: name of algorithm or None if checksums are not computed
+        """
+        return None
+
+    def get_last_checksum(self):
+        """Gets checksum of file sent by last successful call to
+           `transfer_file()`
+        :returns: hex digest as str or None if not computed
+        """
+        return None
+
+    def get_compression(self):
+        """Gets compression applied to data as it is transferred
+        :returns: name of compression ie gzip or None
+        """
+        return None
+
+    def get_last_raw_bytes(self):
+        """Gets number of bytes read from file by last successful call
+           to `transfer_file()`. Differs from bytes transferred when
+           compression is set
+        :returns: number of bytes or None if unknown
+        """
+        return None
+
+    def get_last_remote_path(self):
+        """Gets path on remote server of file sent by last call to
+           `transfer_file()`
+        :returns: path as str or None if unknown
+        """
+        return None
 
 
 class SftpTransferFromConfigFactory(object):
@@ -65,6 +431,26 @@ class SftpTransferFromConfigFactory(object):
     KEY = 'private_key'
     DEST_DIR = 'destination_dir'
     CON_TIMEOUT = 'connect_timeout'
+    CHUNK_SIZE = 'chunk_size'
+    PARALLEL_STREAMS = 'parallel_streams'
+    LARGE_FILE_THRESHOLD = 'large_file_threshold'
+    RESUME = 'resume'
+    RESUME_VERIFY_BYTES = 'resume_verify_bytes'
+    WINDOW_SIZE = 'window_size'
+    MAX_PACKET_SIZE = 'max_packet_size'
+    BUFFER_SIZE = 'buffer_size'
+    PIPELINED = 'pipelined'
+    SKIP_IF_IDENTICAL = 'skip_if_identical'
+    COMPARE_CHECKSUM = 'compare_checksum'
+    CHECKSUM_COMMAND = 'checksum_command'
+    CHECKSUM_ALGORITHM = 'checksum_algorithm'
+    COMPRESSION = 'compression'
+    COMPRESSION_LEVEL = 'compression_level'
+    COMPRESSION_THREADS = 'compression_threads'
+    RATE_LIMIT = 'rate_limit'
+    RATE_LIMIT_SCHEDULE = 'rate_limit_schedule'
+    RATE_LIMIT_BURST = 'rate_limit_burst'
+    ALLOW_AGENT = 'allow_agent'
 
     def __init__(self, config):
         """Constructor
@@ -75,8 +461,44 @@ class SftpTransferFromConfigFactory(object):
            host = <remote host>*
            username = <user name ie bob>
            port = <port to use ie 22>
-           private_key = <private key if used>
+           private_key = <RSA, ECDSA or Ed25519 private key if used>
            destination_dir = <destination directory on remote host>*
+           chunk_size = <bytes per range in large file mode>
+           parallel_streams = <concurrent channels in large file mode>
+           large_file_threshold = <files this size or larger in bytes
+                                   are sent in ranges over parallel_streams
+                                   channels>
+           resume = <true to resume interrupted transfers, ignored
+                     for files sent in large file mode>
+           resume_verify_bytes = <bytes at end of partial remote
+                                  file compared with local file
+                                  before resuming, 0 to disable>
+           window_size = <ssh channel window size in bytes>
+           max_packet_size = <ssh channel max packet size in bytes>
+           buffer_size = <bytes read from local file per write>
+           pipelined = <true to not wait for each write to be
+                        acknowledged>
+           skip_if_identical = <true to skip upload if remote file
+                                has same size and modification time>
+           compare_checksum = <true to also require remote checksum,
+                               computed via checksum_command, to match>
+           checksum_command = <remote command that outputs sha256 of
+                               file passed as argument ie sha256sum>
+           checksum_algorithm = <algorithm ie sha256 or xxh64 used
+                                 to checksum data as it is sent>
+           compression = <gzip or zstd to compress data as it is sent,
+                          remote file gets .gz or .zst suffix>
+           compression_level = <compression level>
+           compression_threads = <threads used by zstd compression>
+           rate_limit = <bytes per second with optional K, M or G
+                         suffix ie 10M, 0 for no limit>
+           rate_limit_schedule = <comma separated HH:MM-HH:MM=rate
+                                  windows that override rate_limit
+                                  ie 08:00-18:00=2M,18:00-08:00=0>
+           rate_limit_burst = <bytes that can be sent at full speed
+                               before rate limit applies>
+           allow_agent = <false to not use keys from ssh agent,
+                          default true>
 
            NOTE: lines above with * are required
         :param config: configparser.ConfigParser object used
@@ -124,8 +546,8 @@ class SftpTransferFromConfigFactory(object):
 
         if con.has_option(SftpTransferFromConfigFactory.SECTION,
                           SftpTransferFromConfigFactory.PORT) is True:
-            port = int(con.get(SftpTransferFromConfigFactory.SECTION,
-                               SftpTransferFromConfigFactory.PORT))
+            port = con.getint(SftpTransferFromConfigFactory.SECTION,
+                              SftpTransferFromConfigFactory.PORT)
         else:
             port = None
 
@@ -138,14 +560,157 @@ class SftpTransferFromConfigFactory(object):
 
         if con.has_option(SftpTransferFromConfigFactory.SECTION,
                           SftpTransferFromConfigFactory.CON_TIMEOUT) is True:
-            con_time = int(con.get(SftpTransferFromConfigFactory.SECTION,
-                                   SftpTransferFromConfigFactory.CON_TIMEOUT))
+            con_time = con.getint(SftpTransferFromConfigFactory.SECTION,
+                                  SftpTransferFromConfigFactory.CON_TIMEOUT)
         else:
             con_time = None
 
-        return SftpTransfer(host, destdir, username=user,
-                            port=port, privatekeyfile=pkey,
-                            connect_timeout=con_time), None
+        chunk_size = self._get_int_option(SftpTransferFromConfigFactory.
+                                          CHUNK_SIZE)
+        streams = self._get_int_option(SftpTransferFromConfigFactory.
+                                       PARALLEL_STREAMS)
+        threshold = self._get_int_option(SftpTransferFromConfigFactory.
+                                         LARGE_FILE_THRESHOLD)
+        if con.has_option(SftpTransferFromConfigFactory.SECTION,
+                          SftpTransferFromConfigFactory.RESUME) is True:
+            resume = con.getboolean(SftpTransferFromConfigFactory.SECTION,
+                                    SftpTransferFromConfigFactory.RESUME)
+        else:
+            resume = None
+
+        verify_bytes = self._get_int_option(SftpTransferFromConfigFactory.
+                                            RESUME_VERIFY_BYTES)
+
+        window_size = self._get_int_option(SftpTransferFromConfigFactory.
+                                           WINDOW_SIZE)
+        packet_size = self._get_int_option(SftpTransferFromConfigFactory.
+                                           MAX_PACKET_SIZE)
+        buffer_size = self._get_int_option(SftpTransferFromConfigFactory.
+                                           BUFFER_SIZE)
+
+        if con.has_option(SftpTransferFromConfigFactory.SECTION,
+                          SftpTransferFromConfigFactory.PIPELINED) is True:
+            pipelined = con.getboolean(SftpTransferFromConfigFactory.
+                                       SECTION,
+                                       SftpTransferFromConfigFactory.
+                                       PIPELINED)
+        else:
+            pipelined = None
+
+        skip = self._get_boolean_option(SftpTransferFromConfigFactory.
+                                        SKIP_IF_IDENTICAL)
+        compare = self._get_boolean_option(SftpTransferFromConfigFactory.
+                                           COMPARE_CHECKSUM)
+        if con.has_option(SftpTransferFromConfigFactory.SECTION,
+                          SftpTransferFromConfigFactory.
+                          CHECKSUM_COMMAND) is True:
+            checksum_cmd = con.get(SftpTransferFromConfigFactory.SECTION,
+                                   SftpTransferFromConfigFactory.
+                                   CHECKSUM_COMMAND)
+        else:
+            checksum_cmd = None
+
+        if con.has_option(SftpTransferFromConfigFactory.SECTION,
+                          SftpTransferFromConfigFactory.
+                          CHECKSUM_ALGORITHM) is True:
+            algorithm = con.get(SftpTransferFromConfigFactory.SECTION,
+                                SftpTransferFromConfigFactory.
+                                CHECKSUM_ALGORITHM)
+        else:
+            algorithm = None
+
+        if con.has_option(SftpTransferFromConfigFactory.SECTION,
+                          SftpTransferFromConfigFactory.COMPRESSION) is True:
+            compression = con.get(SftpTransferFromConfigFactory.SECTION,
+                                  SftpTransferFromConfigFactory.COMPRESSION)
+        else:
+            compression = None
+
+        level = self._get_int_option(SftpTransferFromConfigFactory.
+                                     COMPRESSION_LEVEL)
+        threads = self._get_int_option(SftpTransferFromConfigFactory.
+                                       COMPRESSION_THREADS)
+
+        try:
+            rate_limit = self._get_rate_option(SftpTransferFromConfigFactory.
+                                               RATE_LIMIT)
+            burst = self._get_rate_option(SftpTransferFromConfigFactory.
+                                          RATE_LIMIT_BURST)
+        except ValueError as e:
+            return None, str(e)
+
+        if con.has_option(SftpTransferFromConfigFactory.SECTION,
+                          SftpTransferFromConfigFactory.
+                          RATE_LIMIT_SCHEDULE) is True:
+            schedule = con.get(SftpTransferFromConfigFactory.SECTION,
+                               SftpTransferFromConfigFactory.
+                               RATE_LIMIT_SCHEDULE)
+        else:
+            schedule = None
+
+        try:
+            return SftpTransfer(host, destdir, username=user,
+                                port=port, privatekeyfile=pkey,
+                                connect_timeout=con_time,
+                                chunk_size=chunk_size,
+                                parallel_streams=streams,
+                                large_file_threshold=threshold,
+                                resume=resume,
+                                resume_verify_bytes=verify_bytes,
+                                window_size=window_size,
+                                max_packet_size=packet_size,
+                                buffer_size=buffer_size,
+                                pipelined=pipelined,
+                                skip_if_identical=skip,
+                                compare_checksum=compare,
+                                checksum_command=checksum_cmd,
+                                checksum_algorithm=algorithm,
+                                compression=compression,
+                                compression_level=level,
+                                compression_threads=threads,
+                                rate_limit=rate_limit,
+                                rate_limit_schedule=schedule,
+                                rate_limit_burst=burst,
+                                allow_agent=self._get_boolean_option(
+                                    SftpTransferFromConfigFactory.
+                                    ALLOW_AGENT)), None
+        except ValueError as e:
+            return None, str(e)
+
+    def _get_rate_option(self, option):
+        """Gets `option` from [sftptransfer] section as a rate
+           parsed by `parse_rate()`
+        :param option: name of option
+        :raises ValueError: if value is not a valid rate
+        :returns: value of option as int or None if not set
+        """
+        if self._config.has_option(SftpTransferFromConfigFactory.SECTION,
+                                   option) is False:
+            return None
+        return parse_rate(self._config.get(SftpTransferFromConfigFactory.
+                                           SECTION, option))
+
+    def _get_int_option(self, option):
+        """Gets `option` from [sftptransfer] section as an int
+        :param option: name of option
+        :returns: value of option as int or None if not set
+        """
+        if self._config.has_option(SftpTransferFromConfigFactory.SECTION,
+                                   option) is False:
+            return None
+        return self._config.getint(SftpTransferFromConfigFactory.SECTION,
+                                   option)
+
+    def _get_boolean_option(self, option):
+        """Gets `option` from [sftptransfer] section as a boolean
+        :param option: name of option
+        :returns: value of option as bool or None if not set
+        """
+        if self._config.has_option(SftpTransferFromConfigFactory.SECTION,
+                                   option) is False:
+            return None
+        return self._config.getboolean(SftpTransferFromConfigFactory.SECTION,
+                                       option)
 
 
 class SftpTransfer(Transfer):
@@ -153,15 +718,111 @@ class SftpTransfer(Transfer):
     """
     DEFAULT_PORT = 22
     DEFAULT_CONTIMEOUT = 60
+    DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+    DEFAULT_PARALLEL_STREAMS = 1
+    DEFAULT_LARGE_FILE_THRESHOLD = 1024 * 1024 * 1024
+    DEFAULT_RESUME_VERIFY_BYTES = 1024 * 1024
+    TMP_SUFFIX = '.tmp'
+    PARTIAL_SUFFIX = '.partial'
+    BUFFER_SIZE = 32768
+    DEFAULT_CHECKSUM_COMMAND = 'sha256sum'
 
     def __init__(self, host, destdir, username=None,
                  port=22, privatekeyfile=None, connect_timeout=60,
                  missing_host_key_policy=None,
-                 passphrase=None):
+                 passphrase=None, chunk_size=None,
+                 parallel_streams=None,
+                 large_file_threshold=None,
+                 resume=None,
+                 resume_verify_bytes=None,
+                 window_size=None,
+                 max_packet_size=None,
+                 buffer_size=None,
+                 pipelined=None,
+                 skip_if_identical=None,
+                 compare_checksum=None,
+                 checksum_command=None,
+                 checksum_algorithm=None,
+                 compression=None,
+                 compression_level=None,
+                 compression_threads=None,
+                 rate_limit=None,
+                 rate_limit_schedule=None,
+                 rate_limit_burst=None,
+                 allow_agent=None):
         """Constructor
         :param config: configparser.ConfigParser object set with
                        with values set as described in constructor
                        documentation
+        :param chunk_size: size in bytes of each range written
+                           in large file mode
+        :param parallel_streams: number of sftp channels used to
+                                 write ranges concurrently in large
+                                 file mode. A value of 1 disables
+                                 large file mode
+        :param large_file_threshold: files with size in bytes at or
+                                     above this value are sent in
+                                     large file mode
+        :param resume: If True files are uploaded to a remote file
+                       with `PARTIAL_SUFFIX` appended which is renamed
+                       upon completion. If a partial file exists from
+                       an earlier attempt only the missing bytes are sent.
+                       Resume is not used for files sent in large file
+                       mode since ranges are written out of order
+        :param resume_verify_bytes: number of bytes at end of an
+                                    existing partial file whose checksum
+                                    must match the local file for the
+                                    transfer to be resumed. 0 disables
+                                    this check
+        :param window_size: ssh channel window size in bytes for sftp
+                            channels. If None paramiko default is used
+        :param max_packet_size: ssh channel max packet size in bytes for
+                                sftp channels. If None paramiko default
+                                is used
+        :param buffer_size: bytes read from local file for each remote
+                            write. If this and `pipelined` are None
+                            paramiko's SFTPClient.put() is used
+        :param pipelined: If True remote writes are pipelined and not
+                          acknowledged individually by server
+        :param skip_if_identical: If True files are not sent if the
+                                  remote file has the same size and
+                                  modification time. Modification time
+                                  of uploaded files is set to match the
+                                  local file
+        :param compare_checksum: If True, and `skip_if_identical` is
+                                 True, the sha256 of the remote file
+                                 obtained by running `checksum_command`
+                                 must also match the local file
+        :param checksum_command: remote command that outputs sha256 of
+                                 the file passed to it as first token
+                                 of output. Default `sha256sum`
+        :param checksum_algorithm: If set, data is read from local file
+                                   and a checksum is computed with this
+                                   algorithm as it is sent. See
+                                   `new_hash()` for supported values and
+                                   `get_last_checksum()` for the result
+        :param compression: If set to gzip or zstd data is compressed
+                            as it is sent and the remote file has
+                            suffix from `COMPRESSION_SUFFIXES` appended.
+                            Resume is not used with compression
+        :param compression_level: compression level, None for default
+        :param compression_threads: threads used to compress, only
+                                    supported with zstd
+        :param rate_limit: maximum bytes per second sent, shared by
+                           all channels. None or 0 for no limit
+        :param rate_limit_schedule: str of comma separated
+                                    HH:MM-HH:MM=rate windows, see
+                                    `parse_schedule()`, whose rate is
+                                    used instead of `rate_limit` during
+                                    those times of day
+        :param rate_limit_burst: bytes that can be sent before rate
+                                 limit applies, None for one second
+                                 worth
+        :param allow_agent: If True, the default, keys from a running
+                            ssh agent are tried when authenticating
+        :raises ValueError: if `checksum_algorithm` or `compression`
+                            is not supported or `rate_limit_schedule`
+                            is invalid
         """
         super(SftpTransfer, self).__init__()
         self._host = host
@@ -173,22 +834,98 @@ class SftpTransfer(Transfer):
             self._port = port
 
         if privatekeyfile is not None:
-            self._pkey = paramiko.RSAKey.from_private_key_file(privatekeyfile,
-                                                               passphrase)
+            self._pkey = load_private_key(privatekeyfile, passphrase)
         else:
             self._pkey = None
 
+        if allow_agent is None:
+            self._allow_agent = True
+        else:
+            self._allow_agent = allow_agent
+
         if connect_timeout is None:
             self._connect_timeout = SftpTransfer.DEFAULT_CONTIMEOUT
         else:
             self._connect_timeout = connect_timeout
 
-        self._missing_host_key_policy = paramiko.AutoAddPolicy()
         self._altssh = None
         self._ssh = None
         self._sftp = None
         self._passphrase = passphrase
 
+        if chunk_size is None:
+            self._chunk_size = SftpTransfer.DEFAULT_CHUNK_SIZE
+        else:
+            self._chunk_size = chunk_size
+
+        if parallel_streams is None:
+            self._parallel_streams = SftpTransfer.DEFAULT_PARALLEL_STREAMS
+        else:
+            self._parallel_streams = parallel_streams
+
+        if large_file_threshold is None:
+            self._large_file_threshold = (SftpTransfer.
+                                          DEFAULT_LARGE_FILE_THRESHOLD)
+        else:
+            self._large_file_threshold = large_file_threshold
+
+        if resume is None:
+            self._resume = False
+        else:
+            self._resume = resume
+
+        if resume_verify_bytes is None:
+            self._resume_verify_bytes = (SftpTransfer.
+                                         DEFAULT_RESUME_VERIFY_BYTES)
+        else:
+            self._resume_verify_bytes = resume_verify_bytes
+
+        self._window_size = window_size
+        self._max_packet_size = max_packet_size
+        self._buffer_size = buffer_size
+        self._pipelined = pipelined
+
+        if skip_if_identical is None:
+            self._skip_if_identical = False
+        else:
+            self._skip_if_identical = skip_if_identical
+
+        if compare_checksum is None:
+            self._compare_checksum = False
+        else:
+            self._compare_checksum = compare_checksum
+
+        if checksum_command is None:
+            self._checksum_command = SftpTransfer.DEFAULT_CHECKSUM_COMMAND
+        else:
+            self._checksum_command = checksum_command
+
+        if checksum_algorithm is not None:
+            # fail early on unsupported algorithm
+            new_hash(checksum_algorithm)
+        self._checksum_algorithm = checksum_algorithm
+        self._last_checksum = None
+
+        if compression is not None:
+            # fail early on unsupported compression
+            new_compressor(compression, level=compression_level,
+                           threads=compression_threads)
+        self._compression = compression
+        self._compression_level = compression_level
+        self._compression_threads = compression_threads
+        self._last_raw_bytes = None
+        self._last_remote_path = None
+        self._progress = None
+
+        if rate_limit_schedule is not None:
+            rate_limit_schedule = parse_schedule(rate_limit_schedule)
+        if rate_limit or rate_limit_schedule:
+            self._rate_limiter = RateLimiter(rate=rate_limit,
+                                             schedule=rate_limit_schedule,
+                                             burst=rate_limit_burst)
+        else:
+            self._rate_limiter = None
+
     def get_host(self):
         """Gets host
         """
@@ -224,6 +961,115 @@ class SftpTransfer(Transfer):
         """
         return self._passphrase
 
+    def get_chunk_size(self):
+        """Gets size in bytes of ranges sent in large file mode
+        """
+        return self._chunk_size
+
+    def get_parallel_streams(self):
+        """Gets number of channels used in large file mode
+        """
+        return self._parallel_streams
+
+    def get_large_file_threshold(self):
+        """Gets size in bytes at which large file mode is used
+        """
+        return self._large_file_threshold
+
+    def get_resume(self):
+        """Gets whether interrupted transfers are resumed
+        """
+        return self._resume
+
+    def get_resume_verify_bytes(self):
+        """Gets number of bytes verified before resuming a transfer
+        """
+        return self._resume_verify_bytes
+
+    def get_window_size(self):
+        """Gets ssh channel window size or None for paramiko default
+        """
+        return self._window_size
+
+    def get_max_packet_size(self):
+        """Gets ssh channel max packet size or None for paramiko default
+        """
+        return self._max_packet_size
+
+    def get_buffer_size(self):
+        """Gets bytes read from local file per remote write
+        """
+        if self._buffer_size is None:
+            return SftpTransfer.BUFFER_SIZE
+        return self._buffer_size
+
+    def get_pipelined(self):
+        """Gets whether remote writes are pipelined
+        """
+        if self._pipelined is None:
+            return True
+        return self._pipelined
+
+    def get_skip_if_identical(self):
+        """Gets whether files identical to remote copy are skipped
+        """
+        return self._skip_if_identical
+
+    def get_compare_checksum(self):
+        """Gets whether checksums are compared to detect identical files
+        """
+        return self._compare_checksum
+
+    def get_checksum_command(self):
+        """Gets remote command used to compute checksum
+        """
+        return self._checksum_command
+
+    def get_checksum_algorithm(self):
+        """Gets algorithm used to checksum data as it is sent
+        """
+        return self._checksum_algorithm
+
+    def get_last_checksum(self):
+        """Gets checksum of file sent by last successful call to
+           `transfer_file()` or None if checksum algorithm is not set
+        """
+        return self._last_checksum
+
+    def get_compression(self):
+        """Gets compression applied to data as it is sent or None
+        """
+        return self._compression
+
+    def get_compression_level(self):
+        """Gets compression level or None for default
+        """
+        return self._compression_level
+
+    def get_compression_threads(self):
+        """Gets threads used to compress or None
+        """
+        return self._compression_threads
+
+    def get_last_raw_bytes(self):
+        """Gets bytes read from file by last successful call to
+           `transfer_file()`. When a transfer is resumed this excludes
+           bytes already on the remote server
+        """
+        return self._last_raw_bytes
+
+    def get_last_remote_path(self):
+        """Gets remote path of file sent by last call to
+           `transfer_file()`
+        """
+        return self._last_remote_path
+
+    def get_rate_limiter(self):
+        """Gets `RateLimiter` shared by all transfers or None if
+           no rate limit is set
+        """
+        return self._rate_limiter
+
     def set_alternate_connection(self, altssh):
         """Sets alternate ssh connection
         :param altssh: Object that is paramiko.SSHClient or one that
@@ -231,27 +1077,54 @@ class SftpTransfer(Transfer):
         """
         self._altssh = altssh
 
+    def get_allow_agent(self):
+        """Gets whether ssh agent keys are used to authenticate
+        """
+        return self._allow_agent
+
+    def is_connected(self):
+        """Denotes if ssh connection is open and active
+        :returns: True if connected otherwise False
+        """
+        if self._ssh is None:
+            return False
+        try:
+            transport = self._ssh.get_transport()
+        except AttributeError:
+            return False
+        return transport is not None and transport.is_active()
+
     def connect(self):
-        """Connects to remote server as defined by"""
+        """Connects to remote server, an already active connection
+           is reused"""
         if self._altssh is not None:
             logger.info('Alternate ssh connection set, using instead')
             self._ssh = self._altssh
             return
-        start_time = int(time.time())
+        if self.is_connected() is True:
+            logger.debug('Reusing active ssh connection to ' +
+                         str(self._host))
+            return
+        if self._ssh is not None:
+            self.disconnect()
+        clock = get_clock()
+        start_time = clock()
         logger.info('Connecting via ssh to ' + str(self._host))
+        import paramiko
         self._ssh = paramiko.SSHClient()
-        if self._missing_host_key_policy is not None:
-            self._ssh.set_missing_host_key_policy(self.
-                                                  _missing_host_key_policy)
+        self._ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
 
         self._ssh.connect(hostname=self._host,
                           username=self._username,
                           pkey=self._pkey,
                           port=self._port,
                           passphrase=self._passphrase,
-                          timeout=self._connect_timeout)
+                          timeout=self._connect_timeout,
+                          allow_agent=self._allow_agent)
+        duration = clock() - start_time
+        _CONNECT_SECONDS.observe(duration)
         logger.info('Connection completed, took ' +
-                    str(int(time.time()) - start_time) + ' seconds.')
+                    '%.3f' % duration + ' seconds.')
 
     def disconnect(self):
         """Disconnects
@@ -280,30 +1153,1032 @@ class SftpTransfer(Transfer):
                 raise SSHConnectionError('ssh connection never set.'
                                          ' connect() must be called '
                                          'first')
-            self._sftp = self._ssh.open_sftp()
+            self._sftp = self._open_sftp()
 
         if self._destdir is None:
             raise InvalidDestinationDirError('Destination directory '
                                              'cannot be None')
 
         dest_file = self._destdir + '/' + os.path.basename(filepath)
+        if self._compression is not None:
+            dest_file += COMPRESSION_SUFFIXES[self._compression]
         logger.info('Uploading ' + str(filepath) + ' to ' + dest_file)
 
         transfer_err_msg = None
-        start_time = int(time.time())
+        self._last_exception = None
+        clock = get_clock()
+        start_time = clock()
         bytes_transferred = 0
+        raw_bytes = 0
+        self._last_checksum = None
+        self._last_raw_bytes = None
+        self._last_remote_path = dest_file
+        if self._skip_if_identical is True and \
+                self._is_identical_on_remote_or_false(filepath,
+                                                      dest_file) is True:
+            logger.info(dest_file + ' is identical to ' + filepath +
+                        ', skipping transfer')
+            return _record_transfer(TransferResult(Transfer.SKIPPED,
+                                                   clock() - start_time, 0))
+
+        if self._checksum_algorithm is not None:
+            hasher = new_hash(self._checksum_algorithm)
+        else:
+            hasher = None
+
+        self._progress = None
+        if self._progress_callback is not None:
+            if self._compression is None:
+                total_bytes = os.path.getsize(filepath)
+            else:
+                total_bytes = None
+            self._progress = TransferProgress(filepath, total_bytes,
+                                              callback=self.
+                                              _progress_callback,
+                                              clock=clock)
         try:
-            s = self._sftp.put(filepath, dest_file, confirm=True)
-            bytes_transferred = s.st_size
+            if self._use_large_file_mode(filepath):
+                if self._resume is True:
+                    logger.warning('Resume is not supported in large file '
+                                   'mode, sending all of ' + filepath)
+                raw_bytes, bytes_transferred = self._put_in_ranges(filepath,
+                                                                   dest_file,
+                                                                   hasher)
+            elif self._resume is True and self._compression is None:
+                raw_bytes, bytes_transferred = self._put_resumable(filepath,
+                                                                   dest_file,
+                                                                   hasher)
+            elif self._buffer_size is not None or \
+                    self._pipelined is not None or hasher is not None or \
+                    self._compression is not None or \
+                    self._rate_limiter is not None:
+                raw_bytes, bytes_transferred = self._put_buffered(filepath,
+                                                                  dest_file,
+                                                                  hasher)
+            else:
+                callback = None
+                if self._progress is not None:
+                    callback = self._progress.set_bytes_sent
+                s = self._sftp.put(filepath, dest_file, callback=callback,
+                                   confirm=True)
+                bytes_transferred = s.st_size
+                raw_bytes = bytes_transferred
+            self._last_raw_bytes = raw_bytes
+            if self._progress is not None:
+                self._progress.finish()
+            if hasher is not None:
+                self._last_checksum = hasher.hexdigest()
+                logger.info(self._checksum_algorithm + ' of ' + filepath +
+                            ' is ' + self._last_checksum)
+            if self._skip_if_identical is True:
+                local_stat = os.stat(filepath)
+                self._sftp.utime(dest_file, (local_stat.st_atime,
+                                             local_stat.st_mtime))
         except Exception as e:
+            self._last_exception = e
             logger.exception('Caught exception performing sftp put')
             transfer_err_msg = ('Caught an exception: ' +
                                 str(e.__class__.__name__) + ' : ' + str(e))
 
-        duration = int(time.time()) - start_time
+        duration = clock() - start_time
+        self._progress = None
 
         logger.info('Transfer error message: ' + str(transfer_err_msg) +
-                    ', elapsed time in secs ' + str(duration) +
-                    ', bytes transferred ' +
-                    str(bytes_transferred))
-        return transfer_err_msg, duration, bytes_transferred
+                    ', ' + format_summary(bytes_transferred, duration) +
+                    ', raw bytes ' + str(raw_bytes))
+        return _record_transfer(TransferResult(transfer_err_msg, duration,
+                                               bytes_transferred))
+
+    def _is_identical_on_remote_or_false(self, filepath, dest_file):
+        """Calls `_is_identical_on_remote()` returning False if it
+           raises an exception, so the transfer is attempted and any
+           error is reported as its status
+        """
+        try:
+            return self._is_identical_on_remote(filepath, dest_file)
+        except Exception as e:
+            logger.warning('Unable to compare ' + filepath + ' with ' +
+                           dest_file + ', transferring : ' +
+                           str(e.__class__.__name__) + ' : ' + str(e))
+            return False
+
+    def _is_identical_on_remote(self, filepath, dest_file):
+        """Compares size and modification time, and if compare checksum
+           is set, sha256 of `filepath` with `dest_file` on remote server.
+           If compression is set this always returns False since remote
+           file size cannot be compared
+        :returns: True if files match otherwise False
+        """
+        if self._compression is not None:
+            logger.debug('Compression is enabled, cannot compare files')
+            return False
+
+        try:
+            remote_stat = self._sftp.stat(dest_file)
+        except IOError:
+            logger.debug(dest_file + ' does not exist on remote server')
+            return False
+
+        local_stat = os.stat(filepath)
+        if remote_stat.st_size != local_stat.st_size:
+            return False
+        if int(remote_stat.st_mtime) != int(local_stat.st_mtime):
+            return False
+
+        if self._compare_checksum is False:
+            return True
+
+        remote_sum = self._get_remote_checksum(dest_file)
+        if remote_sum is None:
+            return False
+        return remote_sum == compute_checksum(filepath)
+
+    def _get_remote_checksum(self, remote_path):
+        """Runs checksum command on remote server via an exec channel
+        :returns: checksum as lower case str or None if command failed
+        """
+        cmd = self._checksum_command + ' ' + quote(remote_path)
+        logger.debug('Running ' + cmd + ' on remote server')
+        try:
+            stdin, stdout, stderr = self._ssh.exec_command(cmd)
+            stdin.close()
+            out = stdout.read()
+            exit_code = stdout.channel.recv_exit_status()
+        except Exception:
+            logger.exception('Caught exception running ' + cmd)
+            return None
+        if exit_code != 0:
+            logger.warning(cmd + ' exited with ' + str(exit_code))
+            return None
+        tokens = out.decode('utf-8', 'replace').split()
+        if len(tokens) == 0:
+            return None
+        return tokens[0].lower()
+
+    def _open_sftp(self):
+        """Opens a new sftp channel on the ssh connection using
+           window size and max packet size if set
+        :returns: paramiko.SFTPClient
+        """
+        if self._window_size is None and self._max_packet_size is None:
+            return self._ssh.open_sftp()
+        import paramiko
+        return paramiko.SFTPClient.from_transport(self._ssh.get_transport(),
+                                                  window_size=self.
+                                                  _window_size,
+                                                  max_packet_size=self.
+                                                  _max_packet_size)
+
+    def _open_remote_file(self, sftp, remote_path, mode):
+        """Opens `remote_path` via `sftp` and enables pipelining
+           if configured
+        """
+        remote = sftp.open(remote_path, mode, self.get_buffer_size())
+        if self.get_pipelined() is True:
+            try:
+                remote.set_pipelined(True)
+            except AttributeError:
+                logger.debug('Remote file does not support pipelining')
+        return remote
+
+    def _get_block_reader(self, f, block_size, hasher=None):
+        """Creates `_BlockReader` for local file object `f` that
+           compresses data if compression is set and is limited by
+           rate limiter if set
+        """
+        compressor = None
+        if self._compression is not None:
+            compressor = new_compressor(self._compression,
+                                        level=self._compression_level,
+                                        threads=self._compression_threads)
+        return _BlockReader(f, block_size, hasher=hasher,
+                            compressor=compressor,
+                            rate_limiter=self._rate_limiter)
+
+    def _copy_to_remote(self, reader, remote):
+        """Copies blocks from `_BlockReader` `reader` to `remote`
+        :returns: number of bytes written to `remote`
+        """
+        while True:
+            data = reader.read()
+            if not data:
+                break
+            remote.write(data)
+            if self._progress is not None:
+                self._progress.add(len(data))
+        return reader.get_wire_bytes()
+
+    def _check_remote_size(self, remote_path, expected_size):
+        """Verifies `remote_path` is `expected_size` bytes
+        :raises IOError: if size differs
+        """
+        remote_size = self._sftp.stat(remote_path).st_size
+        if remote_size != expected_size:
+            raise IOError('Size of ' + remote_path + ' is ' +
+                          str(remote_size) + ' bytes, but expected ' +
+                          str(expected_size) + ' bytes')
+
+    def _put_buffered(self, filepath, dest_file, hasher=None):
+        """Sends `filepath` to `dest_file` using buffer size reads
+           and pipelined writes if enabled
+        :param hasher: if not None, updated with data as it is sent
+        :returns: tuple (bytes read from `filepath`, bytes sent)
+        """
+        with open(filepath, 'rb') as f:
+            reader = self._get_block_reader(f, self.get_buffer_size(),
+                                            hasher=hasher)
+            with self._open_remote_file(self._sftp, dest_file,
+                                        'wb') as remote:
+                bytes_sent = self._copy_to_remote(reader, remote)
+        self._check_remote_size(dest_file, bytes_sent)
+        return reader.get_raw_bytes(), bytes_sent
+
+    def _use_large_file_mode(self, filepath):
+        """Denotes if `filepath` should be sent in ranges over
+           multiple channels
+        :returns: True if parallel streams is greater then 1 and
+                  `filepath` is at least large file threshold bytes
+        """
+        if self._parallel_streams is None or self._parallel_streams <= 1:
+            return False
+        if not os.path.isfile(filepath):
+            return False
+        return os.path.getsize(filepath) >= self._large_file_threshold
+
+    def _rename(self, sftp, src, dest):
+        """Renames `src` to `dest` on remote server replacing `dest`
+           if it exists. posix-rename@openssh.com extension is used
+           when available since it is atomic.
+        """
+        try:
+            sftp.posix_rename(src, dest)
+            return
+        except (AttributeError, IOError):
+            logger.debug('posix_rename failed, falling back to '
+                         'remove and rename')
+        try:
+            sftp.remove(dest)
+        except IOError:
+            pass
+        sftp.rename(src, dest)
+
+    def _get_resume_offset(self, filepath, partial_file):
+        """Examines `partial_file` on remote server to determine
+           how many bytes of `filepath` were already sent.
+           The partial file must be no larger then `filepath` and,
+           unless resume verify bytes is 0, the sha256 of its last
+           resume verify bytes must match the same range in `filepath`
+        :returns: offset in bytes to resume from, 0 means start over
+        """
+        try:
+            remote_size = self._sftp.stat(partial_file).st_size
+        except IOError:
+            logger.debug('No partial file ' + partial_file + ' found')
+            return 0
+
+        local_size = os.path.getsize(filepath)
+        if remote_size > local_size:
+            logger.warning('Partial file ' + partial_file + ' is larger '
+                           'then ' + filepath + ' starting over')
+            return 0
+
+        verify_bytes = min(self._resume_verify_bytes, remote_size)
+        if verify_bytes > 0:
+            start = remote_size - verify_bytes
+            with self._sftp.open(partial_file, 'rb') as remote:
+                remote.seek(start)
+                remote_hash = hashlib.sha256(remote.read(verify_bytes))
+            with open(filepath, 'rb') as f:
+                f.seek(start)
+                local_hash = hashlib.sha256(f.read(verify_bytes))
+            if remote_hash.digest() != local_hash.digest():
+                logger.warning('Last ' + str(verify_bytes) + ' bytes of ' +
+                               partial_file + ' do not match ' + filepath +
+                               ' starting over')
+                return 0
+
+        return remote_size
+
+    def _put_resumable(self, filepath, dest_file, hasher=None):
+        """Sends `filepath` to `dest_file` by way of a remote file
+           with `PARTIAL_SUFFIX` appended. If that file exists from
+           an earlier attempt, and is verified by
+           `_get_resume_offset()`, only the bytes missing from it
+           are sent. Once complete the partial file is renamed to
+           `dest_file`. Not used when compression is set.
+        :param hasher: if not None, updated with entire contents of
+                       `filepath`. Bytes already on remote server are
+                       read locally to do this
+        :returns: tuple (bytes read from `filepath`, bytes sent) for
+                  this call which excludes bytes already in the
+                  partial file
+        """
+        partial_file = dest_file + SftpTransfer.PARTIAL_SUFFIX
+        offset = self._get_resume_offset(filepath, partial_file)
+        if offset > 0:
+            logger.info('Resuming transfer of ' + filepath + ' at byte ' +
+                        str(offset))
+            mode = 'r+b'
+        else:
+            mode = 'wb'
+
+        with open(filepath, 'rb') as f:
+            if hasher is not None:
+                remaining = offset
+                while remaining > 0:
+                    data = f.read(min(remaining, self.get_buffer_size()))
+                    hasher.update(data)
+                    remaining -= len(data)
+            f.seek(offset)
+            if self._progress is not None:
+                self._progress.set_total_bytes(os.path.getsize(filepath) -
+                                               offset)
+            reader = _BlockReader(f, self.get_buffer_size(), hasher=hasher,
+                                  rate_limiter=self._rate_limiter)
+            with self._open_remote_file(self._sftp, partial_file,
+                                        mode) as remote:
+                remote.seek(offset)
+                bytes_sent = self._copy_to_remote(reader, remote)
+
+        self._check_remote_size(partial_file, offset + bytes_sent)
+        self._rename(self._sftp, partial_file, dest_file)
+        return bytes_sent, bytes_sent
+
+    def _put_in_ranges(self, filepath, dest_file, hasher=None):
+        """Sends `filepath` to `dest_file` by splitting it into
+           ranges of chunk size bytes that are written concurrently
+           at their offsets, by parallel streams channels, to a
+           temporary file which is renamed to `dest_file` once
+           every range has been written. The local file is read,
+           and compressed if compression is set, sequentially by the
+           calling thread. Rate limit is also applied by that thread so
+           it covers all channels. Since ranges complete out of order
+           the temporary file cannot be used to resume an interrupted
+           transfer and is always written from the start. It is
+           removed if any range could not be written.
+        :param hasher: if not None, updated with data as it is read
+        :raises IOError: if any range could not be written
+        :returns: tuple (bytes read from `filepath`, bytes sent)
+        """
+        tmp_file = dest_file + SftpTransfer.TMP_SUFFIX
+        logger.info('Sending ' + filepath + ' in ranges of ' +
+                    str(self._chunk_size) + ' bytes over ' +
+                    str(self._parallel_streams) + ' channels')
+        self._sftp.open(tmp_file, 'wb').close()
+
+        ranges = queue.Queue(maxsize=self._parallel_streams * 2)
+        errors = []
+        workers = []
+        for i in range(self._parallel_streams):
+            t = threading.Thread(target=with_log_context(
+                                 self._range_writer),
+                                 args=(tmp_file, ranges, errors))
+            t.daemon = True
+            t.start()
+            workers.append(t)
+
+        try:
+            try:
+                with open(filepath, 'rb') as f:
+                    reader = self._get_block_reader(f, self._chunk_size,
+                                                    hasher=hasher)
+                    offset = 0
+                    while len(errors) == 0:
+                        data = reader.read()
+                        if not data:
+                            break
+                        ranges.put((offset, data))
+                        offset += len(data)
+            finally:
+                for t in workers:
+                    ranges.put(None)
+                for t in workers:
+                    t.join()
+
+            if len(errors) > 0:
+                raise errors[0]
+            self._check_remote_size(tmp_file, reader.get_wire_bytes())
+        except Exception:
+            self._remove_remote_file(tmp_file)
+            raise
+        self._rename(self._sftp, tmp_file, dest_file)
+        return reader.get_raw_bytes(), reader.get_wire_bytes()
+
+    def _remove_remote_file(self, remote_path):
+        """Removes `remote_path` from remote server ignoring and
+           logging any errors, used to clean up after a failed transfer
+        """
+        try:
+            self._sftp.remove(remote_path)
+        except Exception as e:
+            logger.warning('Unable to remove ' + remote_path + ' : ' +
+                           str(e.__class__.__name__) + ' : ' + str(e))
+
+    def _range_writer(self, tmp_file, ranges, errors):
+        """Worker that writes (offset, data) tuples from `ranges`
+           queue to `tmp_file` over its own sftp channel until a
+           None is received. Any exception is appended to `errors`
+           and remaining ranges are drained.
+        """
+        sftp = None
+        remote = None
+        try:
+            while True:
+                item = ranges.get()
+                if item is None:
+                    break
+                if len(errors) > 0:
+                    continue
+                try:
+                    if remote is None:
+                        sftp = self._open_sftp()
+                        remote = self._open_remote_file(sftp, tmp_file,
+                                                        'r+b')
+                    offset, data = item
+                    remote.seek(offset)
+                    remote.write(data)
+                    if self._progress is not None:
+                        self._progress.add(len(data))
+                except Exception as e:
+                    logger.exception('Caught exception writing range')
+                    errors.append(e)
+            # pipelined write errors are reported when file is closed
+            if remote is not None:
+                try:
+                    remote.close()
+                except Exception as e:
+                    logger.exception('Caught exception closing range file')
+                    errors.append(e)
+        finally:
+            if sftp is not None:
+                try:
+                    sftp.close()
+                except Exception:
+                    logger.error('Caught exception closing range writer')
+
+
+class SshCommandTransfer(Transfer):
+    """Base for transfers that run an external command, such as
+       rsync or scp, that uses the system ssh client and its native
+       ciphers. Subclasses implement `_get_command()`
+    """
+    DEFAULT_PORT = 22
+    DEFAULT_CONTIMEOUT = 60
+    DEFAULT_COMMAND = None
+
+    # exit codes worth retrying, ssh exits with 255 when the
+    # connection fails or drops
+    RETRYABLE_RETURNCODES = (255,)
+
+    def __init__(self, host, destdir, username=None, port=None,
+                 privatekeyfile=None, connect_timeout=None,
+                 cipher=None, command=None):
+        """Constructor
+        :param host: remote host
+        :param destdir: directory on remote host
+        :param username: user name, if None ssh default is used
+        :param port: ssh port, if None `DEFAULT_PORT` is used
+        :param privatekeyfile: path to private key passed to ssh
+        :param connect_timeout: seconds to wait for ssh connection
+        :param cipher: ssh cipher ie aes128-gcm@openssh.com, if None
+                       ssh default is used
+        :param command: path to program, if None `DEFAULT_COMMAND`
+                        is used
+        """
+        super(SshCommandTransfer, self).__init__()
+        self._host = host
+        self._destdir = destdir
+        self._username = username
+        if port is None:
+            self._port = SshCommandTransfer.DEFAULT_PORT
+        else:
+            self._port = port
+        self._pkey = privatekeyfile
+        if connect_timeout is None:
+            self._connect_timeout = SshCommandTransfer.DEFAULT_CONTIMEOUT
+        else:
+            self._connect_timeout = connect_timeout
+        self._cipher = cipher
+        if command is None:
+            self._command = self.DEFAULT_COMMAND
+        else:
+            self._command = command
+        self._last_remote_path = None
+        self._last_returncode = None
+
+    def get_host(self):
+        """Gets host
+        """
+        return self._host
+
+    def get_destination_directory(self):
+        """Gets destination directory
+        """
+        return self._destdir
+
+    def get_username(self):
+        """Gets username
+        """
+        return self._username
+
+    def get_port(self):
+        """Gets port
+        """
+        return self._port
+
+    def get_private_key(self):
+        """Gets path to private key
+        """
+        return self._pkey
+
+    def get_connect_timeout(self):
+        """Gets connect timeout
+        """
+        return self._connect_timeout
+
+    def get_cipher(self):
+        """Gets ssh cipher
+        """
+        return self._cipher
+
+    def get_command(self):
+        """Gets program run to transfer files
+        """
+        return self._command
+
+    def get_last_remote_path(self):
+        """Gets remote path of file sent by last call to
+           `transfer_file()`
+        """
+        return self._last_remote_path
+
+    def get_last_returncode(self):
+        """Gets exit code of command run by last call to
+           `transfer_file()` or None if it was not run
+        """
+        return self._last_returncode
+
+    def _get_ssh_options(self, port_flag='-p'):
+        """Gets ssh options for key, port, cipher and timeout
+        :param port_flag: flag used to set port, scp uses -P
+        :returns: list of arguments
+        """
+        opts = ['-o', 'BatchMode=yes',
+                '-o', 'ConnectTimeout=' + str(self._connect_timeout),
+                port_flag, str(self._port)]
+        if self._pkey is not None:
+            opts.extend(['-i', self._pkey])
+        if self._cipher is not None:
+            opts.extend(['-c', self._cipher])
+        return opts
+
+    def _get_remote_target(self, dest_file):
+        """Gets [user@]host:dest_file
+        """
+        target = self._host + ':' + dest_file
+        if self._username is not None:
+            target = self._username + '@' + target
+        return target
+
+    def _get_command(self, filepath, dest_file):
+        """Gets command to run as a list of arguments. Subclasses
+           should override this method
+        :returns: list of arguments or None if not implemented
+        """
+        logger.warning('Subclasses need to implement this method')
+        return None
+
+    def _get_bytes_transferred(self, filepath, out):
+        """Gets bytes sent, default is size of `filepath`
+        :param out: standard output of command
+        """
+        return os.path.getsize(filepath)
+
+    def transfer_file(self, filepath):
+        """Transfers `filepath` to destination directory by running
+           command from `_get_command()`
+        :returns: tuple (status, duration, bytes transferred) as
+                  described in `Transfer.transfer_file()`
+        """
+        if self._destdir is None:
+            raise InvalidDestinationDirError('Destination directory '
+                                             'cannot be None')
+        dest_file = self._destdir + '/' + os.path.basename(filepath)
+        cmd = self._get_command(filepath, dest_file)
+        if cmd is None:
+            return TransferResult('Not implemented', -1, -1)
+        self._last_remote_path = dest_file
+        logger.info('Running ' + ' '.join([quote(c) for c in cmd]))
+
+        clock = get_clock()
+        start_time = clock()
+        transfer_err_msg = None
+        self._last_exception = None
+        self._last_returncode = None
+        bytes_transferred = 0
+        try:
+            p = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE)
+            out, err = p.communicate()
+            out = out.decode('utf-8', 'replace')
+            self._last_returncode = p.returncode
+            if p.returncode != 0:
+                transfer_err_msg = (os.path.basename(cmd[0]) +
+                                    ' exited with code ' +
+                                    str(p.returncode) + ' : ' +
+                                    err.decode('utf-8', 'replace').strip())
+                retryable = p.returncode in self.RETRYABLE_RETURNCODES
+                self._last_exception = CommandFailedError(
+                    transfer_err_msg, returncode=p.returncode,
+                    retryable=retryable)
+            else:
+                bytes_transferred = self._get_bytes_transferred(filepath,
+                                                                out)
+        except Exception as e:
+            self._last_exception = e
+            logger.exception('Caught exception running ' + cmd[0])
+            transfer_err_msg = ('Caught an exception: ' +
+                                str(e.__class__.__name__) + ' : ' + str(e))
+
+        duration = clock() - start_time
+        logger.info('Transfer error message: ' + str(transfer_err_msg) +
+                    ', ' + format_summary(bytes_transferred, duration))
+        return _record_transfer(TransferResult(transfer_err_msg, duration,
+                                               bytes_transferred))
+
+
+class RsyncTransfer(SshCommandTransfer):
+    """Transfers file to remote server with rsync over ssh. Only
+       changed blocks of a file that already exists remotely are sent
+    """
+    DEFAULT_COMMAND = 'rsync'
+
+    # 10 socket I/O, 12 protocol data stream, 23 partial transfer,
+    # 30 timeout in data send/receive, 35 timeout waiting for daemon
+    # connection and 255 ssh connection failure
+    RETRYABLE_RETURNCODES = (10, 12, 23, 30, 35, 255)
+
+    def _get_command(self, filepath, dest_file):
+        """Gets rsync command. Modification time is preserved and
+           partial files are kept so an interrupted transfer can be
+           continued by the delta algorithm. --protect-args stops the
+           remote shell splitting or expanding `dest_file`, which rsync
+           older then 3.2.4 does otherwise
+        """
+        ssh = ' '.join([quote(c) for c in ['ssh'] + self._get_ssh_options()])
+        return [self._command, '--times', '--partial', '--stats',
+                '--protect-args', '-e', ssh, filepath,
+                self._get_remote_target(dest_file)]
+
+    def _get_bytes_transferred(self, filepath, out):
+        """Parses 'Total bytes sent:' from rsync --stats output,
+           falling back to size of `filepath`
+        """
+        for line in out.splitlines():
+            if line.startswith('Total bytes sent:'):
+                try:
+                    return int(line.split(':', 1)[1].strip().
+                               replace(',', ''))
+                except ValueError:
+                    logger.debug('Unable to parse: ' + line)
+        return os.path.getsize(filepath)
+
+
+class ScpTransfer(SshCommandTransfer):
+    """Transfers file to remote server with scp
+    """
+    DEFAULT_COMMAND = 'scp'
+
+    def _get_command(self, filepath, dest_file):
+        """Gets scp command, modification time is preserved.
+           `dest_file` is quoted since scp passes it through the
+           remote shell
+        """
+        return ([self._command, '-B', '-p', '-q'] +
+                self._get_ssh_options(port_flag='-P') +
+                [filepath, self._get_remote_target(quote(dest_file))])
+
+
+class LocalCopyTransfer(Transfer):
+    """Copies file into a directory on a local or network mounted
+       file system, such as a kiosk share, avoiding ssh entirely.
+       Data is copied in the kernel with `os.copy_file_range` or
+       `os.sendfile` when available, to a temporary file that is
+       preallocated and renamed once complete
+    """
+    TMP_SUFFIX = '.tmp'
+    DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+    COPY_FILE_RANGE = 'copy_file_range'
+    SENDFILE = 'sendfile'
+    READ_WRITE = 'read_write'
+
+    # errors denoting copy method is not supported for these files
+    UNSUPPORTED_ERRNOS = set([getattr(errno, name) for name in
+                              ['ENOSYS', 'EXDEV', 'EINVAL', 'EOPNOTSUPP',
+                               'ENOTSUP', 'ENOTSOCK', 'EBADF']
+                              if hasattr(errno, name)])
+
+    def __init__(self, destdir, chunk_size=None, preallocate=None,
+                 fsync=None):
+        """Constructor
+        :param destdir: destination directory
+        :param chunk_size: bytes copied per system call, if None
+                           `DEFAULT_CHUNK_SIZE` is used
+        :param preallocate: If True, the default, space for the file
+                            is allocated with `os.posix_fallocate`
+                            before copying
+        :param fsync: If True, the default, data is flushed to disk
+                      before temporary file is renamed
+        """
+        super(LocalCopyTransfer, self).__init__()
+        self._destdir = destdir
+        if chunk_size is None:
+            self._chunk_size = LocalCopyTransfer.DEFAULT_CHUNK_SIZE
+        else:
+            self._chunk_size = chunk_size
+        if preallocate is None:
+            self._preallocate = True
+        else:
+            self._preallocate = preallocate
+        if fsync is None:
+            self._fsync = True
+        else:
+            self._fsync = fsync
+        self._last_remote_path = None
+        self._last_copy_method = None
+
+    def get_destination_directory(self):
+        """Gets destination directory
+        """
+        return self._destdir
+
+    def get_chunk_size(self):
+        """Gets bytes copied per system call
+        """
+        return self._chunk_size
+
+    def get_preallocate(self):
+        """Gets whether destination file is preallocated
+        """
+        return self._preallocate
+
+    def get_fsync(self):
+        """Gets whether data is flushed to disk before rename
+        """
+        return self._fsync
+
+    def get_last_remote_path(self):
+        """Gets path of file copied by last call to `transfer_file()`
+        """
+        return self._last_remote_path
+
+    def get_last_copy_method(self):
+        """Gets method, `COPY_FILE_RANGE`, `SENDFILE` or `READ_WRITE`,
+           last used to copy data or None
+        """
+        return self._last_copy_method
+
+    def transfer_file(self, filepath):
+        """Copies `filepath` into destination directory
+        :returns: tuple (status, duration, bytes transferred) as
+                  described in `Transfer.transfer_file()`
+        """
+        if self._destdir is None:
+            raise InvalidDestinationDirError('Destination directory '
+                                             'cannot be None')
+        dest_file = os.path.join(self._destdir, os.path.basename(filepath))
+        tmp_file = dest_file + LocalCopyTransfer.TMP_SUFFIX
+        self._last_remote_path = dest_file
+        self._last_copy_method = None
+        logger.info('Copying ' + str(filepath) + ' to ' + dest_file)
+
+        clock = get_clock()
+        start_time = clock()
+        transfer_err_msg = None
+        self._last_exception = None
+        bytes_transferred = 0
+        try:
+            size = os.path.getsize(filepath)
+            progress = None
+            if self._progress_callback is not None:
+                progress = TransferProgress(filepath, size,
+                                            callback=self._progress_callback,
+                                            clock=clock)
+            bytes_transferred = self._copy_file(filepath, tmp_file, size,
+                                                progress)
+            if bytes_transferred != size:
+                raise IOError('Copied ' + str(bytes_transferred) +
+                              ' bytes of ' + filepath + ', but expected ' +
+                              str(size) + ' bytes')
+            shutil.copystat(filepath, tmp_file)
+            _replace(tmp_file, dest_file)
+            if progress is not None:
+                progress.finish()
+        except Exception as e:
+            self._last_exception = e
+            logger.exception('Caught exception copying file')
+            transfer_err_msg = ('Caught an exception: ' +
+                                str(e.__class__.__name__) + ' : ' + str(e))
+            if os.path.isfile(tmp_file):
+                os.remove(tmp_file)
+
+        duration = clock() - start_time
+        logger.info('Transfer error message: ' + str(transfer_err_msg) +
+                    ', ' + format_summary(bytes_transferred, duration) +
+                    ' via ' + str(self._last_copy_method))
+        return _record_transfer(TransferResult(transfer_err_msg, duration,
+                                               bytes_transferred))
+
+    def _copy_file(self, filepath, tmp_file, size, progress=None):
+        """Copies `size` bytes of `filepath` to `tmp_file`
+        :returns: number of bytes copied
+        """
+        binary = getattr(os, 'O_BINARY', 0)
+        src = os.open(filepath, os.O_RDONLY | binary)
+        try:
+            dst = os.open(tmp_file, (os.O_WRONLY | os.O_CREAT |
+                                     os.O_TRUNC | binary), 0o644)
+            try:
+                if self._preallocate is True:
+                    self._preallocate_file(dst, size)
+                copied = self._copy_fd(src, dst, size, progress)
+                if self._fsync is True:
+                    os.fsync(dst)
+                return copied
+            finally:
+                os.close(dst)
+        finally:
+            os.close(src)
+
+    def _preallocate_file(self, fd, size):
+        """Allocates `size` bytes for file `fd` with
+           `os.posix_fallocate` if supported by os and file system
+        """
+        if size <= 0 or not hasattr(os, 'posix_fallocate'):
+            return
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except OSError as e:
+            logger.debug('Unable to preallocate ' + str(size) +
+                         ' bytes: ' + str(e))
+
+    def _get_copy_methods(self):
+        """Gets copy methods supported by this version of python
+           in order of preference
+        """
+        methods = []
+        if hasattr(os, 'copy_file_range'):
+            methods.append(LocalCopyTransfer.COPY_FILE_RANGE)
+        if hasattr(os, 'sendfile'):
+            methods.append(LocalCopyTransfer.SENDFILE)
+        methods.append(LocalCopyTransfer.READ_WRITE)
+        return methods
+
+    def _copy_chunk(self, method, src, dst, offset, count):
+        """Copies up to `count` bytes at `offset` in `src` to the same
+           offset in `dst` using `method`
+        :returns: bytes copied, 0 at end of file
+        """
+        if method == LocalCopyTransfer.COPY_FILE_RANGE:
+            return os.copy_file_range(src, dst, count, offset, offset)
+        os.lseek(dst, offset, os.SEEK_SET)
+        if method == LocalCopyTransfer.SENDFILE:
+            return os.sendfile(dst, src, offset, count)
+        os.lseek(src, offset, os.SEEK_SET)
+        data = os.read(src, count)
+        view = memoryview(data)
+        while len(view) > 0:
+            view = view[os.write(dst, view):]
+        return len(data)
+
+    def _copy_fd(self, src, dst, size, progress=None):
+        """Copies `size` bytes from file descriptor `src` to `dst`
+           in chunk size pieces, falling back to the next method from
+           `_get_copy_methods()` if one is not supported
+        :returns: number of bytes copied
+        """
+        methods = list(self._get_copy_methods())
+        offset = 0
+        while offset < size:
+            method = methods[0]
+            count = min(self._chunk_size, size - offset)
+            try:
+                copied = self._copy_chunk(method, src, dst, offset, count)
+            except OSError as e:
+                if e.errno not in LocalCopyTransfer.UNSUPPORTED_ERRNOS or \
+                        method == LocalCopyTransfer.READ_WRITE:
+                    raise
+                logger.debug(method + ' failed (' + str(e) + ') trying ' +
+                             methods[1])
+                methods.pop(0)
+                continue
+            self._last_copy_method = method
+            if copied == 0:
+                break
+            offset += copied
+            if progress is not None:
+                progress.add(copied)
+        return offset
+
+
+class TransferFromConfigFactory(SftpTransferFromConfigFactory):
+    """Creates `Transfer` for backend set in [sftptransfer] section
+       of configuration
+    """
+    BACKEND = 'backend'
+    SSH_CIPHER = 'ssh_cipher'
+    COMMAND = 'command'
+    SFTP_BACKEND = 'sftp'
+    RSYNC_BACKEND = 'rsync'
+    SCP_BACKEND = 'scp'
+    LOCAL_BACKEND = 'local'
+    BACKENDS = [SFTP_BACKEND, RSYNC_BACKEND, SCP_BACKEND, LOCAL_BACKEND]
+
+    def __init__(self, config):
+        """Constructor
+           Takes same configuration as `SftpTransferFromConfigFactory`
+           with these additional options:
+
+           [sftptransfer]
+           backend = <sftp, rsync, scp or local, default sftp.
+                      local copies to destination_dir on a mounted
+                      file system and does not need host>
+           ssh_cipher = <cipher used by ssh for rsync and scp backends
+                         ie aes128-gcm@openssh.com>
+           command = <path to rsync or scp program>
+
+           With local backend chunk_size sets bytes copied per system
+           call.
+
+        :param config: configparser.ConfigParser object
+        """
+        super(TransferFromConfigFactory, self).__init__(config)
+
+    def get_transfer(self):
+        """Gets `Transfer` object for backend set in configuration
+        :returns: tuple (Transfer, None) upon success or
+                  (None, 'error message as str') upon failure
+        """
+        con = self._config
+        if con is None or \
+                con.has_section(TransferFromConfigFactory.SECTION) is False:
+            return self.get_sftptransfer()
+
+        backend = TransferFromConfigFactory.SFTP_BACKEND
+        if con.has_option(TransferFromConfigFactory.SECTION,
+                          TransferFromConfigFactory.BACKEND) is True:
+            backend = con.get(TransferFromConfigFactory.SECTION,
+                              TransferFromConfigFactory.BACKEND).lower()
+
+        if backend not in TransferFromConfigFactory.BACKENDS:
+            return None, ('Unsupported ' + TransferFromConfigFactory.BACKEND +
+                          ': ' + backend + ' must be one of ' +
+                          ', '.join(TransferFromConfigFactory.BACKENDS))
+
+        if backend == TransferFromConfigFactory.SFTP_BACKEND:
+            return self.get_sftptransfer()
+
+        if con.has_option(TransferFromConfigFactory.SECTION,
+                          TransferFromConfigFactory.DEST_DIR) is False:
+            return None, ('No ' + TransferFromConfigFactory.DEST_DIR +
+                          ' option found in configuration.')
+        destdir = con.get(TransferFromConfigFactory.SECTION,
+                          TransferFromConfigFactory.DEST_DIR)
+
+        if backend == TransferFromConfigFactory.LOCAL_BACKEND:
+            return LocalCopyTransfer(destdir,
+                                     chunk_size=self._get_int_option(
+                                         TransferFromConfigFactory.
+                                         CHUNK_SIZE)), None
+
+        if con.has_option(TransferFromConfigFactory.SECTION,
+                          TransferFromConfigFactory.HOST) is False:
+            return None, ('No ' + TransferFromConfigFactory.HOST +
+                          ' option found in configuration.')
+
+        kwargs = {'username': self._get_option(TransferFromConfigFactory.
+                                               USER),
+                  'port': self._get_int_option(TransferFromConfigFactory.
+                                               PORT),
+                  'privatekeyfile': self._get_option(TransferFromConfigFactory.
+                                                     KEY),
+                  'connect_timeout': self._get_int_option(
+                      TransferFromConfigFactory.CON_TIMEOUT),
+                  'cipher': self._get_option(TransferFromConfigFactory.
+                                             SSH_CIPHER),
+                  'command': self._get_option(TransferFromConfigFactory.
+                                              COMMAND)}
+        host = con.get(TransferFromConfigFactory.SECTION,
+                       TransferFromConfigFactory.HOST)
+        if backend == TransferFromConfigFactory.RSYNC_BACKEND:
+            return RsyncTransfer(host, destdir, **kwargs), None
+        return ScpTransfer(host, destdir, **kwargs), None
+
+    def _get_option(self, option):
+        """Gets `option` from [sftptransfer] section
+        :returns: value as str or None if not set
+        """
+        if self._config.has_option(TransferFromConfigFactory.SECTION,
+                                   option) is False:
+            return None
+        return self._config.get(TransferFromConfigFactory.SECTION, option)
@@ -4,14 +4,25 @@
 import os
 import logging
 import re
-import pg8000
 import math
+from collections import namedtuple
 from textwrap import TextWrapper
 
 from ncmirtools.config import NcmirToolsConfig
+from ncmirtools import metrics
 
 logger = logging.getLogger(__name__)
 
+_LOOKUP_SECONDS = metrics.histogram('ncmirtools_lookup_seconds',
+                                    'Time to find directories for an id')
+_LOOKUP_ENTRIES = metrics.counter('ncmirtools_lookup_entries_examined_total',
+                                  'Directory entries examined finding '
+                                  'directories for an id')
+_DB_CONNECT_SECONDS = metrics.histogram('ncmirtools_db_connect_seconds',
+                                        'Time to connect to database')
+_DB_QUERY_SECONDS = metrics.histogram('ncmirtools_db_query_seconds',
+                                      'Time to run database query')
+
 
 class DirectorySearchPathError(Exception):
     """Raised when there is an error parsing Directory Search path
@@ -83,6 +94,7 @@ class DirectoryForId(object):
         logger.debug('volpath=' + self._volpath + ' projpath=' +
                      self._projpath + 'mpidpath=' + str(self._mpidpath))
 
+    @_LOOKUP_SECONDS.timed
     def get_directory_for_microscopy_product_id(self, mpid):
         """Gets directory for microscopy product id `mpid`
         :param mpid: microscopy product id ie 5269524
@@ -124,6 +136,7 @@ class DirectoryForId(object):
 
         return final_matches
 
+    @_LOOKUP_SECONDS.timed
     def get_directory_for_project_id(self, projectid):
         """Gets directory for projectid id `projectid`
         :param projectid: microscopy product id ie 2080
@@ -190,7 +203,9 @@ class DirectoryForId(object):
             return matching_dirs
 
         try:
-            for entry in os.listdir(basedir):
+            entries = os.listdir(basedir)
+            _LOOKUP_ENTRIES.inc(len(entries))
+            for entry in entries:
                 if exactmatch is False:
                     if entry.startswith(prefix):
                         fpath = os.path.join(basedir, entry)
@@ -247,16 +262,18 @@ class Database(object):
         hostval = self._config.get(NcmirToolsConfig.POSTGRES_SECTION,
                                    NcmirToolsConfig.POSTGRES_HOST)
 
-        portval = self._config.get(NcmirToolsConfig.POSTGRES_SECTION,
-                                   NcmirToolsConfig.POSTGRES_PORT)
+        portval = self._config.getint(NcmirToolsConfig.POSTGRES_SECTION,
+                                      NcmirToolsConfig.POSTGRES_PORT)
 
         dbval = self._config.get(NcmirToolsConfig.POSTGRES_SECTION,
                                  NcmirToolsConfig.POSTGRES_DB)
         logger.debug('Getting database connection to pg8000')
-        conn = pg8000.connect(host=hostval, user=userval,
-                              password=passval,
-                              port=int(portval),
-                              database=dbval)
+        import pg8000
+        with _DB_CONNECT_SECONDS.time():
+            conn = pg8000.connect(host=hostval, user=userval,
+                                  password=passval,
+                                  port=portval,
+                                  database=dbval)
         return conn
 
 
@@ -284,6 +301,43 @@ class ProjectSearchViaDatabase(object):
         """
         self._database.set_alternate_connection(conn)
 
+    FETCH_SIZE = 1000
+
+    def _execute_search(self, cursor, keyword):
+        """Runs query for projects matching `keyword` on `cursor`
+        """
+        with _DB_QUERY_SECONDS.time():
+            if keyword is None:
+                logger.debug('keyword is None getting all projects')
+                cursor.execute("SELECT Project_id,project_name FROM Project")
+            else:
+                cursor.execute("SELECT Project_id,project_name FROM Project "
+                               "WHERE project_name ILIKE '%%" + keyword +
+                               "%%' OR "
+                               " project_desc ILIKE '%%" + keyword + "%%'")
+
+    def iter_matching_projects(self, keyword):
+        """Generator that finds projects matching keyword fetching
+           `FETCH_SIZE` rows at a time so any number of projects can
+           be processed in constant memory
+        :param keyword: Keyword to use to search for projects
+        :returns: `ProjectRecord` tuples (project id, project name)
+        """
+        conn = self._database.get_connection()
+        cursor = conn.cursor()
+        try:
+            self._execute_search(cursor, keyword)
+            while True:
+                rows = cursor.fetchmany(ProjectSearchViaDatabase.FETCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    yield ProjectRecord(row[0], row[1])
+        finally:
+            cursor.close()
+            conn.commit()
+            conn.close()
+
     def get_matching_projects(self, keyword):
         """Finds projects matching keyword
         :param keyword: Keyword to use to search for projects
@@ -294,14 +348,7 @@ class ProjectSearchViaDatabase(object):
         cursor = conn.cursor()
         res = []
         try:
-            if keyword is None:
-                logger.debug('keyword is None getting all projects')
-                cursor.execute("SELECT Project_id,project_name FROM Project")
-            else:
-                cursor.execute("SELECT Project_id,project_name FROM Project "
-                               "WHERE project_name ILIKE '%%" + keyword +
-                               "%%' OR "
-                               " project_desc ILIKE '%%" + keyword + "%%'")
+            self._execute_search(cursor, keyword)
             for tuple in cursor.fetchall():
                 res.append(str(tuple[0]) + '    ' + str(tuple[1]))
         finally:
@@ -312,6 +359,21 @@ class ProjectSearchViaDatabase(object):
         return res
 
 
+class ProjectRecord(namedtuple('ProjectRecord', ['project_id',
+                                                 'project_name'])):
+    """Project returned by
+       `ProjectSearchViaDatabase.iter_matching_projects()`. A tuple
+       so it is cheap to create and hold in bulk
+    """
+    __slots__ = ()
+
+    def as_string(self):
+        """Gets project as string in same format as
+           `ProjectSearchViaDatabase.get_matching_projects()`
+        """
+        return str(self.project_id) + '    ' + str(self.project_name)
+
+
 class MicroscopyProduct(object):
     """Represents a CIL/CCDB Microscopy Product
     """
@@ -321,6 +383,28 @@ class MicroscopyProduct(object):
     INDENT = '   '
     MAX_WIDTH = 70
 
+    __slots__ = ['_mpid', '_image_basename', '_notes']
+
+    _wrapper = None
+
+    @staticmethod
+    def format_as_string(mpid, image_basename, notes):
+        """Formats microscopy product as described in `get_as_string()`
+        """
+        wrap = MicroscopyProduct._wrapper
+        if wrap is None:
+            wrap = TextWrapper(initial_indent=MicroscopyProduct.INDENT,
+                               subsequent_indent=MicroscopyProduct.INDENT,
+                               width=MicroscopyProduct.MAX_WIDTH)
+            MicroscopyProduct._wrapper = wrap
+        return ('\n' + MicroscopyProduct.ID_KEYWORD + ' ' +
+                str(mpid) + '\n\n' +
+                MicroscopyProduct.IMAGE_BASENAME_KEYWORD + '\n\n' +
+                wrap.fill(str(image_basename)) +
+                '\n\n' +
+                MicroscopyProduct.NOTES_KEYWORD + '\n\n' +
+                wrap.fill(str(notes)) + '\n\n')
+
     def __init__(self, mpid=None, image_basename=None,
                  notes=None):
         """Constructor
@@ -365,22 +449,50 @@ class MicroscopyProduct(object):
 
         :returns: string describing this Microscopy Product
         """
-        wrap = TextWrapper(initial_indent=MicroscopyProduct.INDENT,
-                           subsequent_indent=MicroscopyProduct.INDENT,
-                           width=MicroscopyProduct.MAX_WIDTH)
-        return ('\n' + MicroscopyProduct.ID_KEYWORD + ' ' +
-                str(self.get_mpid()) + '\n\n' +
-                MicroscopyProduct.IMAGE_BASENAME_KEYWORD + '\n\n' +
-                wrap.fill(str(self.get_image_basename())) +
-                '\n\n' +
-                MicroscopyProduct.NOTES_KEYWORD + '\n\n' +
-                wrap.fill(str(self.get_notes())) + '\n\n')
+        return MicroscopyProduct.format_as_string(self.get_mpid(),
+                                                  self.get_image_basename(),
+                                                  self.get_notes())
+
+
+class MicroscopyProductRecord(namedtuple('MicroscopyProductRecord',
+                                         ['mpid', 'image_basename',
+                                          'notes'])):
+    """Microscopy Product returned by
+       `MicroscopyProductLookupViaDatabase.iter_microscopyproducts()`.
+       A tuple so it is cheap to create and hold in bulk, with the
+       same getters as `MicroscopyProduct`. Text is only wrapped
+       when `get_as_string()` is called
+    """
+    __slots__ = ()
+
+    def get_mpid(self):
+        """Gets id for microscopy product
+        """
+        return self.mpid
+
+    def get_image_basename(self):
+        """Gets image basename for microscopy product
+        """
+        return self.image_basename
+
+    def get_notes(self):
+        """Gets notes for microscopy product
+        """
+        return self.notes
+
+    def get_as_string(self):
+        """Same as `MicroscopyProduct.get_as_string()`
+        """
+        return MicroscopyProduct.format_as_string(self.mpid,
+                                                  self.image_basename,
+                                                  self.notes)
 
 
 class MicroscopyProductLookupViaDatabase(object):
     """Searches for Projects via Database
     """
     MAX_MPID = int(math.pow(2, 31))
+    FETCH_SIZE = 1000
 
     def __init__(self, config):
         """Constructor
@@ -404,22 +516,12 @@ class MicroscopyProductLookupViaDatabase(object):
 
     def get_microscopyproduct_for_id(self, mpid):
         """Finds projects matching keyword
-        :param mpid: microscopy product id which must be an int less
-                     then 2^32
+        :param mpid: microscopy product id which must be an int
+                     between 0 and 2^31-1
         :returns: `MicroscopyProduct` object if found or None if
                   not found or if there was an error with the query
         """
-        if mpid is None:
-            logger.error('Microscopy Product id is none')
-            return None
-
-        if type(mpid) is not int:
-            logger.error('Invalid Microscopy Product Id, must be an integer')
-            return None
-
-        if mpid >= MicroscopyProductLookupViaDatabase.MAX_MPID:
-            logger.error('Microscopy Product Id cannot be larger then '
-                         '2^32-1')
+        if self._is_valid_mpid(mpid) is False:
             return None
 
         conn = None
@@ -429,9 +531,10 @@ class MicroscopyProductLookupViaDatabase(object):
             cursor = conn.cursor()
             logger.debug('Querying for Microscopy Product with '
                          'mpid: ' + str(mpid))
-            cursor.execute("SELECT image_basename,notes FROM "
-                           "Microscopy_products "
-                           "WHERE mpid='" + str(mpid) + "'")
+            with _DB_QUERY_SECONDS.time():
+                cursor.execute("SELECT image_basename,notes FROM "
+                               "Microscopy_products "
+                               "WHERE mpid='" + str(mpid) + "'")
             if cursor.rowcount <= 0:
                 logger.info('No Microsopy '
                             'Product found for id ' +
@@ -452,3 +555,62 @@ class MicroscopyProductLookupViaDatabase(object):
             if conn is not None:
                 conn.commit()
                 conn.close()
+
+    def _is_valid_mpid(self, mpid):
+        """Denotes if `mpid` is an int that can be queried, logging
+           the reason if it is not
+        """
+        if mpid is None:
+            logger.error('Microscopy Product id is none')
+            return False
+        if type(mpid) is not int:
+            logger.error('Invalid Microscopy Product Id ' + str(mpid) +
+                         ', must be an integer')
+            return False
+        if mpid < 0 or mpid >= MicroscopyProductLookupViaDatabase.MAX_MPID:
+            logger.error('Invalid Microscopy Product Id ' + str(mpid) +
+                         ', must be between 0 and 2^31-1')
+            return False
+        return True
+
+    def iter_microscopyproducts(self, mpids):
+        """Generator that finds microscopy products for many ids
+           querying `FETCH_SIZE` ids at a time over one connection.
+           Invalid ids are logged and skipped
+        :param mpids: iterable of microscopy product ids as ints
+        :returns: `MicroscopyProductRecord` tuples for ids found in
+                  no particular order
+        """
+        conn = self._database.get_connection()
+        cursor = conn.cursor()
+        try:
+            chunk = []
+            for mpid in mpids:
+                if self._is_valid_mpid(mpid) is False:
+                    continue
+                chunk.append(str(mpid))
+                if len(chunk) >= MicroscopyProductLookupViaDatabase.\
+                        FETCH_SIZE:
+                    for rec in self._query_microscopyproducts(cursor, chunk):
+                        yield rec
+                    chunk = []
+            if chunk:
+                for rec in self._query_microscopyproducts(cursor, chunk):
+                    yield rec
+        finally:
+            cursor.close()
+            conn.commit()
+            conn.close()
+
+    def _query_microscopyproducts(self, cursor, mpids):
+        """Queries microscopy products for list of validated id strings
+        :returns: list of `MicroscopyProductRecord`
+        """
+        with _DB_QUERY_SECONDS.time():
+            cursor.execute("SELECT mpid,image_basename,notes FROM "
+                           "Microscopy_products "
+                           "WHERE mpid IN (" + ','.join(mpids) + ")")
+            rows = cursor.fetchall()
+        return [MicroscopyProductRecord(str(row[0]), str(row[1]),
+                                        str(row[2]))
+                for row in rows]
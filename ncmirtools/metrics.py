@@ -0,0 +1,828 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'churas'
+
+import os
+import re
+import json
+import time
+import bisect
+import logging
+import threading
+import functools
+
+from ncmirtools.kiosk.progress import get_clock
+from ncmirtools.kiosk.progress import MEGABYTE
+
+logger = logging.getLogger(__name__)
+
+# seconds, from fast database queries up to transfers of large files
+DEFAULT_TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                        2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+# bytes per second
+DEFAULT_RATE_BUCKETS = tuple([x * MEGABYTE for x in
+                              (0.1, 0.5, 1, 5, 10, 25, 50, 100, 250,
+                               500, 1000)])
+
+_NAME_RE = re.compile('^[a-zA-Z_:][a-zA-Z0-9_:]*$')
+
+
+def _check_name(name):
+    """Raises ValueError if `name` is not a valid Prometheus metric name
+    """
+    if name is None or _NAME_RE.match(name) is None:
+        raise ValueError('Invalid metric name: ' + str(name))
+
+
+class Counter(object):
+    """Value that only goes up, such as files examined or bytes sent
+    """
+    TYPE = 'counter'
+
+    def __init__(self, name, help_text=None, registry=None):
+        """Constructor
+        :param name: metric name, letters, digits, _ and :
+        :param help_text: description of metric
+        :param registry: `MetricsRegistry` notified of updates or None
+        :raises ValueError: if `name` is invalid
+        """
+        _check_name(name)
+        self._name = name
+        self._help = help_text
+        self._registry = registry
+        self._lock = threading.Lock()
+        self._value = 0
+
+    def get_name(self):
+        """Gets name
+        """
+        return self._name
+
+    def get_help(self):
+        """Gets help text
+        """
+        return self._help
+
+    def get_value(self):
+        """Gets current value
+        """
+        return self._value
+
+    def inc(self, amount=1):
+        """Increments counter by `amount`
+        :raises ValueError: if `amount` is negative
+        """
+        if amount < 0:
+            raise ValueError('Counter can only be incremented')
+        with self._lock:
+            self._value += amount
+        if self._registry is not None:
+            self._registry.notify(self, amount)
+
+    def reset(self):
+        """Sets value to 0
+        """
+        with self._lock:
+            self._value = 0
+
+    def get_snapshot(self):
+        """Gets dict of type, help text and value
+        """
+        return {'type': Counter.TYPE, 'help': self._help,
+                'value': self._value}
+
+
+class Timer(object):
+    """Measures time with monotonic clock from `get_clock()` and
+       observes it in a `Histogram` when stopped. Can be used as
+       context manager
+    """
+    def __init__(self, histogram):
+        """Constructor
+        :param histogram: `Histogram` duration in seconds is observed in
+        """
+        self._histogram = histogram
+        self._clock = get_clock()
+        self._start_time = None
+        self._duration = None
+
+    def start(self):
+        """Starts timer
+        :returns: self
+        """
+        self._duration = None
+        self._start_time = self._clock()
+        return self
+
+    def stop(self):
+        """Stops timer and observes duration in histogram
+        :returns: duration in seconds
+        """
+        self._duration = self._clock() - self._start_time
+        self._histogram.observe(self._duration)
+        return self._duration
+
+    def get_duration(self):
+        """Gets duration in seconds of last `start()` `stop()` or None
+        """
+        return self._duration
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+        return False
+
+
+class Histogram(object):
+    """Counts observed values, such as durations or transfer rates,
+       in cumulative buckets and keeps their count, sum, minimum and
+       maximum
+    """
+    TYPE = 'histogram'
+
+    def __init__(self, name, help_text=None, buckets=None, registry=None):
+        """Constructor
+        :param name: metric name, letters, digits, _ and :
+        :param help_text: description of metric
+        :param buckets: sorted upper bounds of buckets, if None
+                        `DEFAULT_TIME_BUCKETS`. A bucket for
+                        infinity is always added
+        :param registry: `MetricsRegistry` notified of updates or None
+        :raises ValueError: if `name` is invalid or `buckets` are not
+                            sorted
+        """
+        _check_name(name)
+        if buckets is None:
+            buckets = DEFAULT_TIME_BUCKETS
+        buckets = [float(b) for b in buckets]
+        if buckets != sorted(buckets):
+            raise ValueError('Histogram buckets must be sorted')
+        if not buckets or buckets[-1] != float('inf'):
+            buckets.append(float('inf'))
+        self._name = name
+        self._help = help_text
+        self._registry = registry
+        self._buckets = buckets
+        self._lock = threading.Lock()
+        self._counts = [0] * len(buckets)
+        self._count = 0
+        self._sum = 0.0
+        self._min = None
+        self._max = None
+
+    def get_name(self):
+        """Gets name
+        """
+        return self._name
+
+    def get_help(self):
+        """Gets help text
+        """
+        return self._help
+
+    def get_count(self):
+        """Gets number of observed values
+        """
+        return self._count
+
+    def get_sum(self):
+        """Gets sum of observed values
+        """
+        return self._sum
+
+    def get_min(self):
+        """Gets smallest observed value or None
+        """
+        return self._min
+
+    def get_max(self):
+        """Gets largest observed value or None
+        """
+        return self._max
+
+    def get_buckets(self):
+        """Gets cumulative counts
+        :returns: list of tuples (upper bound, number of values less
+                  than or equal to upper bound)
+        """
+        with self._lock:
+            counts = list(self._counts)
+        res = []
+        total = 0
+        for bound, count in zip(self._buckets, counts):
+            total += count
+            res.append((bound, total))
+        return res
+
+    def observe(self, value):
+        """Adds `value`
+        """
+        with self._lock:
+            self._counts[bisect.bisect_left(self._buckets, value)] += 1
+            self._count += 1
+            self._sum += value
+            if self._min is None or value < self._min:
+                self._min = value
+            if self._max is None or value > self._max:
+                self._max = value
+        if self._registry is not None:
+            self._registry.notify(self, value)
+
+    def time(self):
+        """Gets `Timer` that observes duration in this histogram
+           ie with histogram.time():
+        """
+        return Timer(self)
+
+    def timed(self, func):
+        """Decorator that observes duration of calls to `func`
+        """
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.time():
+                return func(*args, **kwargs)
+        return wrapper
+
+    def reset(self):
+        """Clears observed values
+        """
+        with self._lock:
+            self._counts = [0] * len(self._buckets)
+            self._count = 0
+            self._sum = 0.0
+            self._min = None
+            self._max = None
+
+    def get_snapshot(self):
+        """Gets dict of type, help text, count, sum, min, max and
+           buckets as list of [upper bound, cumulative count] with
+           infinity as '+Inf' so it can be written as JSON
+        """
+        return {'type': Histogram.TYPE, 'help': self._help,
+                'count': self._count, 'sum': self._sum,
+                'min': self._min, 'max': self._max,
+                'buckets': [[_format_bound(b), c]
+                            for b, c in self.get_buckets()]}
+
+
+def _format_bound(bound):
+    """Formats bucket upper bound as Prometheus does
+    """
+    if bound == float('inf'):
+        return '+Inf'
+    return repr(bound)
+
+
+class MetricsRegistry(object):
+    """Holds metrics by name. Listeners are called with
+       (metric, value) on every update so exporters such as
+       `StatsDExporter` can send values as they happen
+    """
+    def __init__(self):
+        """Constructor
+        """
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._listeners = []
+
+    def _get_or_create(self, name, klass, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = klass(name, registry=self, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, klass):
+                raise ValueError(name + ' is already registered as ' +
+                                 metric.TYPE)
+            return metric
+
+    def counter(self, name, help_text=None):
+        """Gets `Counter` named `name`, creating it if needed
+        :raises ValueError: if `name` is invalid or used by
+                            another type of metric
+        """
+        return self._get_or_create(name, Counter, help_text=help_text)
+
+    def histogram(self, name, help_text=None, buckets=None):
+        """Gets `Histogram` named `name`, creating it if needed
+        :raises ValueError: if `name` is invalid or used by
+                            another type of metric
+        """
+        return self._get_or_create(name, Histogram, help_text=help_text,
+                                   buckets=buckets)
+
+    def get_metric(self, name):
+        """Gets metric named `name` or None
+        """
+        return self._metrics.get(name)
+
+    def get_metrics(self):
+        """Gets list of metrics sorted by name
+        """
+        with self._lock:
+            return [self._metrics[n] for n in sorted(self._metrics.keys())]
+
+    def get_snapshot(self):
+        """Gets dict of metric name to snapshot of metric
+        """
+        return dict([(m.get_name(), m.get_snapshot())
+                     for m in self.get_metrics()])
+
+    def reset(self):
+        """Resets value of every metric. Metrics stay registered
+           so references held by modules remain valid
+        """
+        for metric in self.get_metrics():
+            metric.reset()
+
+    def add_listener(self, listener):
+        """Adds function called with (metric, value) on every update
+        """
+        with self._lock:
+            self._listeners = self._listeners + [listener]
+
+    def remove_listener(self, listener):
+        """Removes listener added with `add_listener()`
+        """
+        with self._lock:
+            self._listeners = [x for x in self._listeners
+                               if x is not listener]
+
+    def notify(self, metric, value):
+        """Calls listeners with `metric` and `value`. Exceptions
+           raised by listeners are logged and ignored
+        """
+        for listener in self._listeners:
+            try:
+                listener(metric, value)
+            except Exception:
+                logger.exception('Caught exception from metrics listener')
+
+
+_registry = MetricsRegistry()
+
+
+def get_registry():
+    """Gets registry used by ncmirtools modules
+    """
+    return _registry
+
+
+def counter(name, help_text=None):
+    """Gets `Counter` named `name` from `get_registry()`
+    """
+    return _registry.counter(name, help_text=help_text)
+
+
+def histogram(name, help_text=None, buckets=None):
+    """Gets `Histogram` named `name` from `get_registry()`
+    """
+    return _registry.histogram(name, help_text=help_text, buckets=buckets)
+
+
+def get_program_path(path, program):
+    """Inserts `program` before extension of `path` so programs
+       sharing a configuration write separate files
+       ie /foo/ncmirtools.prom becomes /foo/ncmirtools_mpidir.prom
+    :returns: `path` with program inserted or `path` if `program`
+              is None
+    """
+    if program is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return root + '_' + program + ext
+
+
+def _write_file_atomically(path, data):
+    """Writes `data` to temporary file next to `path` and renames it
+       to `path` so readers never see a partially written file
+    """
+    tmp_file = path + '.' + str(os.getpid()) + '.tmp'
+    with open(tmp_file, 'w') as f:
+        f.write(data)
+    replace = getattr(os, 'replace', os.rename)
+    replace(tmp_file, path)
+
+
+class MetricsExporter(object):
+    """Base class for exporters
+    """
+    def attach(self, registry):
+        """Called before metrics are updated
+        """
+        pass
+
+    def export(self, registry):
+        """Called to write current values of metrics in `registry`
+        """
+        pass
+
+    def close(self):
+        """Releases resources
+        """
+        pass
+
+
+def _format_labels(labels):
+    """Formats list of tuples (name, value) as Prometheus labels
+       ie {program="mpidir",le="0.1"} or empty string if there are none
+    """
+    if not labels:
+        return ''
+    parts = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+        parts.append(name + '="' + value.replace('\n', '\\n') + '"')
+    return '{' + ','.join(parts) + '}'
+
+
+class PrometheusTextfileExporter(MetricsExporter):
+    """Writes metrics in Prometheus text format to a file, meant for
+       the textfile collector of node_exporter
+    """
+    def __init__(self, path, program=None):
+        """Constructor
+        :param path: file to write, should end with .prom
+        :param program: if set, added as program label to every sample
+                        so files written by different programs can be
+                        collected together
+        """
+        self._path = path
+        self._program = program
+
+    def get_path(self):
+        """Gets path
+        """
+        return self._path
+
+    def get_program(self):
+        """Gets program
+        """
+        return self._program
+
+    @staticmethod
+    def format_metrics(registry, program=None):
+        """Formats metrics in `registry` in Prometheus text format
+        :param program: if set, added as program label to every sample
+        :returns: str
+        """
+        labels = []
+        if program is not None:
+            labels.append(('program', program))
+        lines = []
+        for metric in registry.get_metrics():
+            name = metric.get_name()
+            if metric.get_help() is not None:
+                help_text = metric.get_help().replace('\\', '\\\\')
+                lines.append('# HELP ' + name + ' ' +
+                             help_text.replace('\n', '\\n'))
+            lines.append('# TYPE ' + name + ' ' + metric.TYPE)
+            if metric.TYPE == Counter.TYPE:
+                lines.append(name + _format_labels(labels) + ' ' +
+                             repr(metric.get_value()))
+                continue
+            for bound, count in metric.get_buckets():
+                lines.append(name + '_bucket' +
+                             _format_labels(labels +
+                                            [('le', _format_bound(bound))]) +
+                             ' ' + str(count))
+            lines.append(name + '_sum' + _format_labels(labels) + ' ' +
+                         repr(metric.get_sum()))
+            lines.append(name + '_count' + _format_labels(labels) + ' ' +
+                         str(metric.get_count()))
+        return '\n'.join(lines) + '\n'
+
+    def export(self, registry):
+        """Writes metrics to path set in constructor
+        """
+        _write_file_atomically(self._path,
+                               PrometheusTextfileExporter.
+                               format_metrics(registry,
+                                              program=self._program))
+
+
+class JsonExporter(MetricsExporter):
+    """Writes metrics as JSON object with host, program, timestamp
+       and metrics keys
+    """
+    def __init__(self, path, program=None):
+        """Constructor
+        :param path: file to write
+        :param program: value of program key
+        """
+        self._path = path
+        self._program = program
+
+    def get_path(self):
+        """Gets path
+        """
+        return self._path
+
+    def get_program(self):
+        """Gets program
+        """
+        return self._program
+
+    def export(self, registry):
+        """Writes metrics to path set in constructor
+        """
+        import socket
+        data = {'host': socket.gethostname(),
+                'program': self._program,
+                'timestamp': time.time(),
+                'metrics': registry.get_snapshot()}
+        _write_file_atomically(self._path,
+                               json.dumps(data, indent=2,
+                                          sort_keys=True) + '\n')
+
+
+class StatsDExporter(MetricsExporter):
+    """Sends every counter increment and histogram observation to a
+       StatsD server over UDP as it happens. Histograms whose name
+       ends with _seconds are sent as timers in milliseconds, others
+       as histograms. Send errors are logged and ignored
+    """
+    DEFAULT_PORT = 8125
+
+    def __init__(self, host, port=None, prefix=None):
+        """Constructor
+        :param host: StatsD server
+        :param port: StatsD port, if None `DEFAULT_PORT`
+        :param prefix: prepended with a . to metric names
+        """
+        self._host = host
+        if port is None:
+            port = StatsDExporter.DEFAULT_PORT
+        self._port = port
+        self._prefix = prefix
+        self._sock = None
+        self._registry = None
+
+    def get_host(self):
+        """Gets host
+        """
+        return self._host
+
+    def get_port(self):
+        """Gets port
+        """
+        return self._port
+
+    def get_prefix(self):
+        """Gets prefix
+        """
+        return self._prefix
+
+    @staticmethod
+    def format_update(metric, value, prefix=None):
+        """Formats update as StatsD line ie foo:1|c
+        """
+        name = metric.get_name()
+        if prefix:
+            name = prefix + '.' + name
+        if metric.TYPE == Counter.TYPE:
+            return name + ':' + str(value) + '|c'
+        if name.endswith('_seconds'):
+            return name + ':' + '%.3f' % (value * 1000.0) + '|ms'
+        return name + ':' + repr(value) + '|h'
+
+    def attach(self, registry):
+        """Starts sending updates of metrics in `registry`
+        """
+        import socket
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._registry = registry
+        registry.add_listener(self.send_update)
+
+    def send_update(self, metric, value):
+        """Sends update of `metric` by `value`
+        """
+        if self._sock is None:
+            return
+        line = StatsDExporter.format_update(metric, value,
+                                            prefix=self._prefix)
+        try:
+            self._sock.sendto(line.encode('utf-8'), (self._host, self._port))
+        except EnvironmentError as e:
+            logger.debug('Unable to send metric to ' + str(self._host) +
+                         ': ' + str(e))
+
+    def close(self):
+        """Stops sending updates and closes socket
+        """
+        if self._registry is not None:
+            self._registry.remove_listener(self.send_update)
+            self._registry = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+class MetricsExporterFromConfigFactory(object):
+    """Creates exporters from [metrics] section of configuration
+    """
+    SECTION = 'metrics'
+    PROMETHEUS_TEXTFILE = 'prometheus_textfile'
+    JSON_FILE = 'json_file'
+    STATSD_HOST = 'statsd_host'
+    STATSD_PORT = 'statsd_port'
+    STATSD_PREFIX = 'statsd_prefix'
+    EXPORT_INTERVAL = 'export_interval'
+    DEFAULT_EXPORT_INTERVAL = 60
+
+    def __init__(self, con, program=None):
+        """Constructor
+           Reads these optional values, an exporter is created for
+           each one set:
+
+           [metrics]
+           prometheus_textfile = <file metrics are written to in
+                                  Prometheus text format ie
+                                  /var/lib/node_exporter/ncmirtools.prom>
+           json_file = <file metrics are written to as JSON>
+           statsd_host = <StatsD server metrics are sent to over UDP>
+           statsd_port = <StatsD port, default 8125>
+           statsd_prefix = <prepended to metric names sent to StatsD>
+           export_interval = <seconds between exports by long running
+                              programs, default 60>
+
+        :param con: configparser.ConfigParser object
+        :param program: name of program, if set it is inserted before
+                        extension of files, see `get_program_path()`,
+                        and added to metrics as program label, key or
+                        StatsD prefix so programs sharing a
+                        configuration do not overwrite each other
+        """
+        self._con = con
+        self._program = program
+
+    def _get(self, option):
+        sec = MetricsExporterFromConfigFactory.SECTION
+        if self._con is None or self._con.has_option(sec, option) is False:
+            return None
+        return self._con.get(sec, option)
+
+    def get_exporters(self):
+        """Gets exporters set in configuration
+        :returns: tuple (list of `MetricsExporter`, None) upon success
+                  or (None, 'error message as str') upon failure
+        """
+        exporters = []
+        program = self._program
+        path = self._get(MetricsExporterFromConfigFactory.PROMETHEUS_TEXTFILE)
+        if path is not None:
+            exporters.append(PrometheusTextfileExporter(
+                get_program_path(path, program), program=program))
+        path = self._get(MetricsExporterFromConfigFactory.JSON_FILE)
+        if path is not None:
+            exporters.append(JsonExporter(get_program_path(path, program),
+                                          program=program))
+        host = self._get(MetricsExporterFromConfigFactory.STATSD_HOST)
+        if host is not None:
+            port = self._get(MetricsExporterFromConfigFactory.STATSD_PORT)
+            if port is not None:
+                try:
+                    port = int(port)
+                except ValueError:
+                    return None, (MetricsExporterFromConfigFactory.
+                                  STATSD_PORT + ' must be an integer: ' +
+                                  port)
+            prefix = [x for x in (self._get(MetricsExporterFromConfigFactory.
+                                            STATSD_PREFIX), program) if x]
+            exporters.append(StatsDExporter(host, port=port,
+                                            prefix='.'.join(prefix) or None))
+        return exporters, None
+
+    def get_export_interval(self):
+        """Gets seconds between exports by long running programs
+        :returns: tuple (interval, None) upon success or
+                  (None, 'error message as str') upon failure
+        """
+        interval = self._get(MetricsExporterFromConfigFactory.EXPORT_INTERVAL)
+        if interval is None:
+            return (MetricsExporterFromConfigFactory.
+                    DEFAULT_EXPORT_INTERVAL, None)
+        try:
+            interval = float(interval)
+        except ValueError:
+            interval = -1
+        if interval <= 0:
+            return None, (MetricsExporterFromConfigFactory.EXPORT_INTERVAL +
+                          ' must be a number greater then 0')
+        return interval, None
+
+
+def get_config_or_none(homedir=None):
+    """Gets configuration for programs that do not otherwise
+       need one so they can still export metrics
+    :param homedir: home directory, if None default of
+                    `NcmirToolsConfig` is used
+    :returns: configparser.ConfigParser object or None if no
+              configuration file exists
+    """
+    from ncmirtools.config import NcmirToolsConfig
+    from ncmirtools.config import ConfigMissingError
+    config = NcmirToolsConfig()
+    if homedir is not None:
+        config.set_home_directory(os.path.expanduser(homedir))
+    try:
+        return config.get_config()
+    except ConfigMissingError:
+        return None
+    except Exception:
+        logger.exception('Unable to load configuration, metrics will '
+                         'not be exported')
+        return None
+
+
+def start_exporters(con, registry=None, program=None):
+    """Creates exporters set in configuration and attaches them to
+       `registry`. Errors are logged since metrics should never stop
+       data from being transferred
+    :param con: configparser.ConfigParser object
+    :param registry: `MetricsRegistry`, if None `get_registry()`
+    :param program: name of program, see
+                    `MetricsExporterFromConfigFactory`
+    :returns: list of `MetricsExporter`, empty if none are configured
+    """
+    if registry is None:
+        registry = _registry
+    fac = MetricsExporterFromConfigFactory(con, program=program)
+    exporters, errmsg = fac.get_exporters()
+    if exporters is None:
+        logger.error('Metrics will not be exported: ' + errmsg)
+        return []
+    started = []
+    for exporter in exporters:
+        try:
+            exporter.attach(registry)
+            started.append(exporter)
+        except Exception:
+            logger.exception('Unable to start metrics exporter')
+    return started
+
+
+def export_metrics(exporters, registry=None):
+    """Exports metrics in `registry` with every exporter in
+       `exporters`. Errors are logged
+    :param registry: `MetricsRegistry`, if None `get_registry()`
+    """
+    if registry is None:
+        registry = _registry
+    for exporter in exporters:
+        try:
+            exporter.export(registry)
+        except Exception:
+            logger.exception('Unable to export metrics')
+
+
+def stop_exporters(exporters, registry=None):
+    """Exports metrics in `registry` with every exporter in
+       `exporters` then closes them. Errors are logged
+    :param registry: `MetricsRegistry`, if None `get_registry()`
+    """
+    try:
+        export_metrics(exporters, registry=registry)
+    finally:
+        for exporter in exporters:
+            exporter.close()
+
+
+class MetricsExportThread(threading.Thread):
+    """Daemon thread that calls `export_metrics()` every interval
+       seconds until `stop()` is called, for long running programs
+       whose metrics would otherwise only be written when they exit
+    """
+    def __init__(self, exporters, interval, registry=None):
+        """Constructor
+        :param exporters: list of `MetricsExporter`
+        :param interval: seconds between exports
+        :param registry: `MetricsRegistry`, if None `get_registry()`
+        """
+        super(MetricsExportThread, self).__init__()
+        self.daemon = True
+        self._exporters = exporters
+        self._interval = interval
+        self._registry = registry
+        self._stop_event = threading.Event()
+
+    def get_interval(self):
+        """Gets seconds between exports
+        """
+        return self._interval
+
+    def run(self):
+        """Exports metrics every interval seconds until stopped
+        """
+        while not self._stop_event.wait(self._interval):
+            export_metrics(self._exporters, registry=self._registry)
+
+    def stop(self):
+        """Stops thread and waits for it to exit
+        """
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
@@ -10,6 +10,9 @@ from ncmirtools.lookup import MicroscopyProductLookupViaDatabase
 from ncmirtools.config import NcmirToolsConfig
 from ncmirtools.config import ConfigMissingError
 from ncmirtools import config
+from ncmirtools import daemon
+from ncmirtools import metrics
+from ncmirtools import output
 
 
 # create logger
@@ -44,32 +47,51 @@ def _parse_arguments(desc, args):
                                           NcmirToolsConfig.UCONFIG_FILE +
                                           ' is loaded (default ~)',
                         default='~')
+    output.add_format_argument(parser)
     parser.add_argument('--version', action='version',
                         version=('%(prog)s ' + ncmirtools.__version__))
 
     return parser.parse_args(args, namespace=parsed_arguments)
 
 
-def _run_search_database(mpid, homedir):
+def _run_search_database(mpid, homedir, out_stream=None,
+                         err_stream=None, fmt=None):
     """Performs search for directory
     :param prefixdir: Directory search path
     :param mpid: microscopy product id to use to find directory
+    :param out_stream: stream results are written to, if None
+                       `sys.stdout`
+    :param err_stream: stream errors are written to, if None `sys.stderr`
+    :param fmt: one of `output.FORMATS`, if None `output.TEXT_FORMAT`
     :returns: exit code for program
     """
+    if out_stream is None:
+        out_stream = sys.stdout
+    if err_stream is None:
+        err_stream = sys.stderr
     try:
         config = NcmirToolsConfig()
         config.set_home_directory(os.path.expanduser(homedir))
 
         search = MicroscopyProductLookupViaDatabase(config.get_config())
         res = search.get_microscopyproduct_for_id(mpid)
+        if fmt is not None and fmt != output.TEXT_FORMAT:
+            with output.RecordWriter(out_stream, fmt,
+                                     ['mpid', 'image_basename',
+                                      'notes']) as writer:
+                if res is not None:
+                    writer.write((res.get_mpid(),
+                                  res.get_image_basename(),
+                                  res.get_notes()))
+        elif res is not None:
+            out_stream.write(res.get_as_string())
         if res is not None:
-            sys.stdout.write(res.get_as_string())
             return 0
 
-        sys.stderr.write(NO_MICROSCOPY_PRODUCT_FOUND_MSG + os.linesep)
+        err_stream.write(NO_MICROSCOPY_PRODUCT_FOUND_MSG + os.linesep)
         return 1
     except ConfigMissingError:
-        sys.stderr.write('\nERROR: Configuration file missing.\n'
+        err_stream.write('\nERROR: Configuration file missing.\n'
                          ' Please run mpidinfo.py --help for '
                          'information on how\n to create a configuration '
                          'file\n\n')
@@ -159,7 +181,20 @@ def main(arglist):
     theargs.version = ncmirtools.__version__
     config.setup_logging(logger, loglevel=theargs.loglevel)
     try:
-        return _run_search_database(theargs.mpid, theargs.homedir)
+        homedir = os.path.expanduser(theargs.homedir)
+        res = daemon.forward_to_daemon('mpidinfo',
+                                       {'mpid': theargs.mpid,
+                                        'homedir': homedir,
+                                        'format': theargs.format})
+        if res is not None:
+            return res
+        exporters = metrics.start_exporters(metrics.get_config_or_none(
+            theargs.homedir), program='mpidinfo')
+        try:
+            return _run_search_database(theargs.mpid, theargs.homedir,
+                                        fmt=theargs.format)
+        finally:
+            metrics.stop_exporters(exporters)
     finally:
         logging.shutdown()
 
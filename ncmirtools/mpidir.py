@@ -8,6 +8,9 @@ import logging
 
 from ncmirtools.lookup import DirectoryForId
 from ncmirtools import config
+from ncmirtools import daemon
+from ncmirtools import metrics
+from ncmirtools import output
 
 # create logger
 logger = logging.getLogger('ncmirtools.mpidir')
@@ -46,27 +49,43 @@ def _parse_arguments(desc, args):
                              'set on the command line. (default ' +
                              DirectoryForId.PROJECT_DIR)
 
+    output.add_format_argument(parser)
     parser.add_argument('--version', action='version',
                         version=('%(prog)s ' + ncmirtools.__version__))
 
     return parser.parse_args(args, namespace=parsed_arguments)
 
 
-def _run_lookup(prefixdir, mpid):
+def _run_lookup(prefixdir, mpid,
+                out_stream=None, err_stream=None, fmt=None):
     """Performs search for directory
     :param prefixdir: Directory search path
     :param mpid: microcsopy product id to use to find directory
+    :param out_stream: stream results are written to, if None
+                       `sys.stdout`
+    :param err_stream: stream errors are written to, if None `sys.stderr`
+    :param fmt: one of `output.FORMATS`, if None `output.TEXT_FORMAT`
     :returns: exit code for program
     """
+    if out_stream is None:
+        out_stream = sys.stdout
+    if err_stream is None:
+        err_stream = sys.stderr
     try:
         dmp = DirectoryForId(prefixdir)
         mp_dirs = dmp.get_directory_for_microscopy_product_id(mpid)
-        if len(mp_dirs) > 0:
+        if fmt is not None and fmt != output.TEXT_FORMAT:
+            with output.RecordWriter(out_stream, fmt,
+                                     ['mpid', 'path']) as writer:
+                for entry in mp_dirs:
+                    writer.write((mpid, entry))
+        else:
             for entry in mp_dirs:
-                sys.stdout.write(entry + os.linesep)
+                out_stream.write(entry + os.linesep)
+        if len(mp_dirs) > 0:
             return 0
 
-        sys.stderr.write(DIR_NOT_FOUND_MSG + os.linesep)
+        err_stream.write(DIR_NOT_FOUND_MSG + os.linesep)
         return 1
     except Exception:
         logger.exception("Error caught exception")
@@ -102,7 +121,21 @@ def main(arglist):
     theargs.version = ncmirtools.__version__
     config.setup_logging(logger, loglevel=theargs.loglevel)
     try:
-        return _run_lookup(theargs.prefixdir, theargs.mpid)
+        # daemon does not share our working directory
+        res = daemon.forward_to_daemon('mpidir',
+                                       {'mpid': theargs.mpid,
+                                        'prefixdir':
+                                            os.path.abspath(theargs.prefixdir),
+                                        'format': theargs.format})
+        if res is not None:
+            return res
+        exporters = metrics.start_exporters(metrics.get_config_or_none(),
+                                            program='mpidir')
+        try:
+            return _run_lookup(theargs.prefixdir, theargs.mpid,
+                               fmt=theargs.format)
+        finally:
+            metrics.stop_exporters(exporters)
     finally:
         logging.shutdown()
 
@@ -1,5 +1,6 @@
 #! /usr/bin/env python
 
+import os
 import sys
 import argparse
 import logging
@@ -7,6 +8,7 @@ import ncmirtools
 
 from ncmirtools import config
 from ncmirtools import ciluploader
+from ncmirtools import daemon
 
 
 # create logger
@@ -30,6 +32,7 @@ def _parse_arguments(desc, args):
 
     subparsers = parser.add_subparsers(dest='command')
     ciluploader.get_argument_parser(subparsers)
+    daemon.get_argument_parser(subparsers)
 
     parser.add_argument("--log", dest="loglevel", choices=['DEBUG',
                         'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
@@ -41,6 +44,22 @@ def _parse_arguments(desc, args):
     return parser.parse_args(args, namespace=parsed_arguments)
 
 
+def _forward_cilupload(theargs):
+    """Runs cilupload in daemon if one is running. Paths are made
+       absolute since daemon does not share our working directory
+    :returns: exit code or None if no daemon is running
+    """
+    args = {'data': [os.path.abspath(d) for d in theargs.data],
+            'homedir': os.path.abspath(os.path.expanduser(theargs.homedir)),
+            'force': theargs.force,
+            'resume': theargs.resume,
+            'clear_failed': theargs.clear_failed,
+            'max_workers': theargs.max_workers,
+            'upload_workers': theargs.upload_workers,
+            'format': theargs.format}
+    return daemon.forward_to_daemon('cilupload', args)
+
+
 def main(arglist):
     desc = """
 
@@ -55,8 +74,14 @@ def main(arglist):
     try:
         logger.debug('Command is: ' + str(theargs.command))
         if theargs.command == 'cilupload':
+            res = _forward_cilupload(theargs)
+            if res is not None:
+                return res
             logger.debug('Running ciluploader.run ' + str(theargs.command))
             return ciluploader.run(theargs)
+        if theargs.command == 'serve':
+            logger.debug('Running daemon.run ' + str(theargs.command))
+            return daemon.run(theargs)
     finally:
         logging.shutdown()
     return 99
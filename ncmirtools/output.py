@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'churas'
+
+import json
+
+
+FORMAT_ARG = '--format'
+
+TEXT_FORMAT = 'text'
+JSON_FORMAT = 'json'
+JSONL_FORMAT = 'jsonl'
+TSV_FORMAT = 'tsv'
+
+FORMATS = [TEXT_FORMAT, JSON_FORMAT, JSONL_FORMAT, TSV_FORMAT]
+
+_TSV_ESCAPES = [('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'), ('\r', '\\r')]
+
+
+def add_format_argument(parser):
+    """Adds `FORMAT_ARG` flag to argparse `parser`
+    :param parser: argparse parser
+    """
+    parser.add_argument(FORMAT_ARG, dest='format', choices=FORMATS,
+                        default=TEXT_FORMAT,
+                        help='Output format. ' + TEXT_FORMAT + ' is '
+                             'meant for people, ' + JSON_FORMAT + ' writes '
+                             'a list of objects, ' + JSONL_FORMAT + ' writes '
+                             'one object per line and ' + TSV_FORMAT +
+                             ' writes a header line followed by one tab '
+                             'separated line per result '
+                             '(default ' + TEXT_FORMAT + ')')
+
+
+def get_format(theargs):
+    """Gets output format from parsed arguments
+    :param theargs: parsed arguments
+    :returns: value of format attribute or `TEXT_FORMAT` if not set
+    """
+    fmt = getattr(theargs, 'format', None)
+    if fmt is None:
+        return TEXT_FORMAT
+    return fmt
+
+
+class RecordWriter(object):
+    """Writes records, tuples of values in same order as `fields`
+       passed to constructor, to a stream as they are produced so
+       output of any size can be written in constant memory.
+       Field names are encoded once and values are written without
+       building intermediate dicts
+    """
+    def __init__(self, out_stream, fmt, fields):
+        """Constructor
+        :param out_stream: stream to write to
+        :param fmt: one of `JSON_FORMAT`, `JSONL_FORMAT` or `TSV_FORMAT`
+        :param fields: list of field names
+        :raises ValueError: if `fmt` is not supported
+        """
+        if fmt not in (JSON_FORMAT, JSONL_FORMAT, TSV_FORMAT):
+            raise ValueError('Unsupported output format: ' + str(fmt))
+        self._out = out_stream
+        self._fmt = fmt
+        self._fields = list(fields)
+        self._keys = [json.dumps(f) + ': ' for f in self._fields]
+        self._encode = json.JSONEncoder(ensure_ascii=False).encode
+        self._count = 0
+        self._closed = False
+        if fmt == TSV_FORMAT:
+            self._out.write('\t'.join([RecordWriter._tsv_value(f)
+                                       for f in self._fields]) + '\n')
+
+    def get_fields(self):
+        """Gets list of field names
+        """
+        return self._fields
+
+    def get_count(self):
+        """Gets number of records written
+        """
+        return self._count
+
+    @staticmethod
+    def _tsv_value(value):
+        """Converts `value` to str with tabs, newlines and backslashes
+           escaped. None becomes empty string
+        """
+        if value is None:
+            return ''
+        if value is True:
+            return 'true'
+        if value is False:
+            return 'false'
+        val = str(value)
+        for char, escape in _TSV_ESCAPES:
+            if char in val:
+                val = val.replace(char, escape)
+        return val
+
+    def _json_object(self, record):
+        """Encodes `record` as JSON object
+        """
+        encode = self._encode
+        return '{' + ', '.join([key + encode(value) for key, value in
+                                zip(self._keys, record)]) + '}'
+
+    def write(self, record):
+        """Writes `record`
+        :param record: tuple of values in same order as fields
+        """
+        if self._fmt == TSV_FORMAT:
+            line = '\t'.join([RecordWriter._tsv_value(v) for v in record])
+            self._out.write(line + '\n')
+        elif self._fmt == JSONL_FORMAT:
+            self._out.write(self._json_object(record) + '\n')
+        else:
+            if self._count == 0:
+                self._out.write('[' + self._json_object(record))
+            else:
+                self._out.write(',\n' + self._json_object(record))
+        self._count += 1
+
+    def write_all(self, records):
+        """Writes every record in iterable `records`
+        :returns: number of records written
+        """
+        before = self._count
+        for record in records:
+            self.write(record)
+        return self._count - before
+
+    def close(self):
+        """Finishes output, for `JSON_FORMAT` closes list. Does not
+           close stream
+        """
+        if self._closed is True:
+            return
+        self._closed = True
+        if self._fmt == JSON_FORMAT:
+            if self._count == 0:
+                self._out.write('[]\n')
+            else:
+                self._out.write(']\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Calls `close()` unless an exception was raised, in which
+           case a `JSON_FORMAT` list is left open so partial output
+           is not mistaken for a complete result
+        """
+        if exc_type is not None:
+            self._closed = True
+            return False
+        self.close()
+        return False
@@ -10,6 +10,9 @@ from ncmirtools.lookup import ProjectSearchViaDatabase
 from ncmirtools.config import NcmirToolsConfig
 from ncmirtools.config import ConfigMissingError
 from ncmirtools import config
+from ncmirtools import daemon
+from ncmirtools import metrics
+from ncmirtools import output
 
 
 # create logger
@@ -43,33 +46,54 @@ def _parse_arguments(desc, args):
                                           NcmirToolsConfig.UCONFIG_FILE +
                                           ' is loaded (default ~)',
                         default='~')
+    output.add_format_argument(parser)
     parser.add_argument('--version', action='version',
                         version=('%(prog)s ' + ncmirtools.__version__))
 
     return parser.parse_args(args, namespace=parsed_arguments)
 
 
-def _run_search_database(keyword, homedir):
+def _run_search_database(keyword, homedir, out_stream=None,
+                         err_stream=None, fmt=None):
     """Performs search for directory
     :param prefixdir: Directory search path
     :param mpid: microcsopy product id to use to find directory
+    :param out_stream: stream results are written to, if None
+                       `sys.stdout`
+    :param err_stream: stream errors are written to, if None `sys.stderr`
+    :param fmt: one of `output.FORMATS`, if None `output.TEXT_FORMAT`
     :returns: exit code for program
     """
+    if out_stream is None:
+        out_stream = sys.stdout
+    if err_stream is None:
+        err_stream = sys.stderr
     try:
         config = NcmirToolsConfig()
         config.set_home_directory(os.path.expanduser(homedir))
 
         search = ProjectSearchViaDatabase(config.get_config())
+        if fmt is not None and fmt != output.TEXT_FORMAT:
+            with output.RecordWriter(out_stream, fmt,
+                                     ['project_id',
+                                      'project_name']) as writer:
+                count = writer.write_all(search.
+                                         iter_matching_projects(keyword))
+            if count > 0:
+                return 0
+            err_stream.write(NO_PROJECTS_FOUND_MSG + os.linesep)
+            return 1
+
         res = search.get_matching_projects(keyword)
         if len(res) > 0:
             for entry in res:
-                sys.stdout.write(entry + os.linesep)
+                out_stream.write(entry + os.linesep)
             return 0
 
-        sys.stderr.write(NO_PROJECTS_FOUND_MSG + os.linesep)
+        err_stream.write(NO_PROJECTS_FOUND_MSG + os.linesep)
         return 1
     except ConfigMissingError:
-        sys.stderr.write('\nERROR: Configuration file missing.\n'
+        err_stream.write('\nERROR: Configuration file missing.\n'
                          ' Please run projectsearch.py --help for '
                          'information on how\n to create a configuration '
                          'file\n\n')
@@ -143,7 +167,20 @@ def main(arglist):
     theargs.version = ncmirtools.__version__
     config.setup_logging(logger, loglevel=theargs.loglevel)
     try:
-        return _run_search_database(theargs.keyword, theargs.homedir)
+        homedir = os.path.expanduser(theargs.homedir)
+        res = daemon.forward_to_daemon('projectsearch',
+                                       {'keyword': theargs.keyword,
+                                        'homedir': homedir,
+                                        'format': theargs.format})
+        if res is not None:
+            return res
+        exporters = metrics.start_exporters(metrics.get_config_or_none(
+            theargs.homedir), program='projectsearch')
+        try:
+            return _run_search_database(theargs.keyword, theargs.homedir,
+                                        fmt=theargs.format)
+        finally:
+            metrics.stop_exporters(exporters)
     finally:
         logging.shutdown()
 
@@ -77,6 +77,9 @@ setup(
                  'ncmirtools'},
     include_package_data=True,
     install_requires=requirements,
+    extras_require={
+        'async': ['aiohttp']
+    },
     zip_safe=False,
     keywords='ncmirtools',
     classifiers=[
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+"""
+Runs every benchmark suite and compares results to the stored
+baseline.
+
+Usage:
+
+python -m tests.benchmarks [--save] [--tolerance X] [--filter NAME]
+
+Timings depend on the machine so run with --save on your own machine
+to create a baseline before making changes. Comparison is skipped if
+the baseline was saved with a different python or platform.
+"""
+
+import sys
+
+from tests.benchmarks import harness
+from tests.benchmarks import bench_lookup
+from tests.benchmarks import bench_datafinder
+from tests.benchmarks import bench_sftp
+from tests.benchmarks import bench_ciluploader
+
+
+SUITES = [bench_lookup, bench_datafinder, bench_sftp, bench_ciluploader]
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(harness.main('ncmirtools benchmarks', SUITES, sys.argv))
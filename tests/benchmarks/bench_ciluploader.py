@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+bench_ciluploader
+----------------------------------
+
+Times CILUploader uploading small files with LocalCopyTransfer and
+registering them with a local stub of the CIL REST service, one
+file at a time and as a batch.
+
+Usage:
+
+python -m tests.benchmarks.bench_ciluploader [--save] [--tolerance X]
+"""
+
+import os
+import sys
+
+from ncmirtools.ciluploader import CILUploader
+from ncmirtools.kiosk.transfer import LocalCopyTransfer
+from tests.benchmarks import harness
+from tests.benchmarks.stub_rest import StubRESTServer
+
+
+NUM_FILES = 50
+
+
+def create_benchmarks(temp_dir):
+    dest = os.path.join(temp_dir, 'dest')
+    os.makedirs(dest)
+    paths = []
+    for i in range(NUM_FILES):
+        path = os.path.join(temp_dir, 'image_' + str(i) + '.dm4')
+        with open(path, 'wb') as f:
+            f.write(os.urandom(4096))
+        paths.append(path)
+
+    server = StubRESTServer()
+    server.start()
+    uploader = CILUploader(LocalCopyTransfer(dest), resturl=server.get_url(),
+                           restuser='bob', restpassword='haha')
+
+    def upload_one():
+        assert uploader.upload_and_register_data(
+            paths[0], force=True).get_success_status() is True
+
+    def upload_many():
+        batch = uploader.upload_and_register_many(paths, force=True)
+        assert batch.get_success_status() is True
+
+    def cleanup():
+        uploader.close()
+        server.stop()
+
+    return [('ciluploader.single', upload_one),
+            ('ciluploader.many.' + str(NUM_FILES), upload_many)], cleanup
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(harness.main('CILUploader benchmark', [sys.modules[__name__]],
+                          sys.argv))
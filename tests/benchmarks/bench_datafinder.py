@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+bench_datafinder
+----------------------------------
+
+Times SecondYoungest.get_next_file() on synthetic acquisition trees
+of increasing size. A quarter of the files have a different suffix
+and one excluded directory is added to each tree.
+
+Usage:
+
+python -m tests.benchmarks.bench_datafinder [--save] [--tolerance X]
+"""
+
+import os
+import sys
+
+from ncmirtools.kiosk.datafinder import SecondYoungest
+from tests.benchmarks import harness
+
+
+# (directories, files per directory)
+SIZES = [(10, 100), (50, 100), (100, 200)]
+
+
+def make_tree(root, dirs, files):
+    """Creates `dirs` directories with `files` files each under
+       `root`, giving each file a distinct modification time
+    """
+    mtime = 1000000000
+    for d in range(dirs):
+        ddir = os.path.join(root, 'session_' + str(d))
+        os.makedirs(ddir)
+        for f in range(files):
+            suffix = '.txt' if f % 4 == 0 else '.dm4'
+            path = os.path.join(ddir, 'image_' + str(f) + suffix)
+            open(path, 'w').close()
+            os.utime(path, (mtime, mtime))
+            mtime += 1
+    excluded = os.path.join(root, 'exclude')
+    os.makedirs(excluded)
+    for f in range(files):
+        open(os.path.join(excluded, 'x_' + str(f) + '.dm4'), 'w').close()
+
+
+def create_benchmarks(temp_dir):
+    benchmarks = []
+    for dirs, files in SIZES:
+        label = '%dx%d' % (dirs, files)
+        root = os.path.join(temp_dir, label)
+        make_tree(root, dirs, files)
+        finder = SecondYoungest(root, '.dm4', ['exclude'])
+
+        def next_file(finder=finder):
+            assert finder.get_next_file() is not None
+
+        benchmarks.append(('datafinder.secondyoungest.' + label, next_file))
+    return benchmarks, None
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(harness.main('SecondYoungest benchmark', [sys.modules[__name__]],
+                          sys.argv))
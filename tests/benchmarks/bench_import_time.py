@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+bench_import_time
+----------------------------------
+
+Reports how long importing each command line script takes, as
+measured by python -X importtime in a fresh interpreter, and
+exits with 1 if the best of several runs exceeds the budget for
+that script or if a heavy module was imported.
+
+Usage:
+
+python -m tests.benchmarks.bench_import_time [--runs N] [--scale X]
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+
+
+# budget in milliseconds for cumulative import time of each script
+BUDGETS_MS = {'ncmirtools.mpidir': 30,
+              'ncmirtools.projectdir': 30,
+              'ncmirtools.projectsearch': 30,
+              'ncmirtools.mpidinfo': 30,
+              'ncmirtools.imagetokiosk': 50,
+              'ncmirtools.ncmirtool': 75}
+
+# modules that should only be imported by code paths that use them
+HEAVY_MODULES = ['paramiko', 'requests', 'pg8000', 'sqlite3']
+
+
+def _parse_arguments(args):
+    parser = argparse.ArgumentParser(description='Import time benchmark')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='Number of runs per script, best is '
+                             'reported (default 5)')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='Multiplies budgets, use on slow machines '
+                             '(default 1.0)')
+    return parser.parse_args(args)
+
+
+def measure_import(module):
+    """Imports `module` in new interpreter with -X importtime
+    :returns: tuple (cumulative import time of `module` in
+                     milliseconds, list of `HEAVY_MODULES` imported)
+    """
+    root = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    code = ('import sys\nimport ' + module + '\n' +
+            'print(",".join([m for m in ' + repr(HEAVY_MODULES) +
+            ' if m in sys.modules]))\n')
+    proc = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', code],
+                            cwd=root, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    out, err = proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError('Unable to import ' + module + ': ' + err)
+    cumulative = None
+    for line in err.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == module:
+            cumulative = int(fields[1].strip()) / 1000.0
+    heavy = [m for m in out.strip().split(',') if m]
+    return cumulative, heavy
+
+
+def main(arglist):
+    theargs = _parse_arguments(arglist[1:])
+    failed = False
+    print('%-26s %10s %10s  %s' % ('script', 'best ms', 'budget ms',
+                                   'heavy modules'))
+    for module in sorted(BUDGETS_MS.keys()):
+        budget = BUDGETS_MS[module] * theargs.scale
+        best = None
+        heavy = []
+        for i in range(theargs.runs):
+            cumulative, heavy = measure_import(module)
+            if best is None or cumulative < best:
+                best = cumulative
+        status = ''
+        if best > budget or heavy:
+            status = '  OVER BUDGET'
+            failed = True
+        print('%-26s %10.1f %10.1f  %s%s' % (module, best, budget,
+                                             ','.join(heavy) or '-',
+                                             status))
+    if failed:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main(sys.argv))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+bench_lookup
+----------------------------------
+
+Times DirectoryForId lookups of microscopy product and project
+directories on synthetic volume/project/microscopy product trees of
+increasing size.
+
+Usage:
+
+python -m tests.benchmarks.bench_lookup [--save] [--tolerance X]
+"""
+
+import os
+import re
+import sys
+
+from ncmirtools.lookup import DirectoryForId
+from tests.benchmarks import harness
+
+
+# (volumes, projects per volume, microscopy products per project)
+SIZES = [(2, 10, 10), (4, 25, 20), (8, 50, 25)]
+
+
+def make_tree(root, volumes, projects, mps):
+    """Creates directory tree matching `DirectoryForId.PROJECT_DIR`
+       under `root`
+    :returns: search path to pass to `DirectoryForId`
+    """
+    mpid = 0
+    for v in range(volumes):
+        acq = os.path.join(root, 'ccdbprod', 'ccdbprod' + str(v), 'home',
+                           'CCDB_DATA_USER.portal', 'CCDB_DATA_USER',
+                           'acquisition')
+        for p in range(projects):
+            pdir = os.path.join(acq, 'project_' + str(v * projects + p))
+            for m in range(mps):
+                os.makedirs(os.path.join(pdir, 'microscopy_' + str(mpid)))
+                mpid += 1
+    return os.path.join(root, re.sub('^/', '', DirectoryForId.PROJECT_DIR))
+
+
+def create_benchmarks(temp_dir):
+    benchmarks = []
+    for volumes, projects, mps in SIZES:
+        label = '%dx%dx%d' % (volumes, projects, mps)
+        root = os.path.join(temp_dir, label)
+        dfi = DirectoryForId(make_tree(root, volumes, projects, mps))
+        last_mpid = str(volumes * projects * mps - 1)
+        last_project = str(volumes * projects - 1)
+
+        def lookup_mp(dfi=dfi, mpid=last_mpid):
+            assert len(dfi.get_directory_for_microscopy_product_id(mpid)) == 1
+
+        def lookup_project(dfi=dfi, projectid=last_project):
+            assert len(dfi.get_directory_for_project_id(projectid)) == 1
+
+        benchmarks.append(('lookup.mpid.' + label, lookup_mp))
+        benchmarks.append(('lookup.projectid.' + label, lookup_project))
+    return benchmarks, None
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(harness.main('DirectoryForId benchmark', [sys.modules[__name__]],
+                          sys.argv))
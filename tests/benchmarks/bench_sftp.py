@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+bench_sftp
+----------------------------------
+
+Times SftpTransfer.transfer_file() of a 16MB file to a loopback
+SFTP server with default and pipelined settings. Connecting is
+done before timing so only the transfer is measured.
+
+Usage:
+
+python -m tests.benchmarks.bench_sftp [--save] [--tolerance X]
+"""
+
+import os
+import sys
+import logging
+
+import paramiko
+
+from ncmirtools.kiosk.transfer import SftpTransfer
+from tests.benchmarks import harness
+from tests.benchmarks.loopback_sftp import LoopbackSftpServer
+
+
+FILE_SIZE_MB = 16
+
+SETTINGS = [('default', {}),
+            ('pipelined256k', {'buffer_size': 262144, 'pipelined': True})]
+
+
+def create_benchmarks(temp_dir):
+    # server side transports log resets when clients disconnect
+    logging.getLogger('paramiko').setLevel(logging.CRITICAL)
+    remote_root = os.path.join(temp_dir, 'remote')
+    os.makedirs(remote_root)
+    keyfile = os.path.join(temp_dir, 'key')
+    paramiko.RSAKey.generate(2048).write_private_key_file(keyfile)
+    srcfile = os.path.join(temp_dir, 'data.bin')
+    with open(srcfile, 'wb') as f:
+        for i in range(FILE_SIZE_MB):
+            f.write(os.urandom(1024 * 1024))
+
+    server = LoopbackSftpServer(remote_root)
+    server.start()
+    transfers = []
+    benchmarks = []
+    for name, kwargs in SETTINGS:
+        t = SftpTransfer('127.0.0.1', '/', username='bench',
+                         port=server.get_port(), privatekeyfile=keyfile,
+                         **kwargs)
+        t.connect()
+        transfers.append(t)
+
+        def transfer(t=t):
+            assert t.transfer_file(srcfile).is_success()
+
+        benchmarks.append(('sftp.transfer.' + str(FILE_SIZE_MB) + 'mb.' +
+                           name, transfer))
+
+    def cleanup():
+        for t in transfers:
+            t.disconnect()
+        server.stop()
+
+    return benchmarks, cleanup
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(harness.main('SftpTransfer benchmark', [sys.modules[__name__]],
+                          sys.argv))
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+bench_sftp_tuning
+----------------------------------
+
+Reports SftpTransfer throughput in MB/s against a loopback SFTP
+server for different window size, max packet size, buffer size
+and pipelining settings.
+
+Usage:
+
+python -m tests.benchmarks.bench_sftp_tuning [--size MB] [--latency MS]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+import logging
+
+import paramiko
+
+from ncmirtools.kiosk.transfer import SftpTransfer
+from tests.benchmarks.loopback_sftp import LoopbackSftpServer
+from tests.benchmarks.loopback_sftp import LatencyProxy
+
+
+SETTINGS = [
+    ('paramiko defaults', {}),
+    ('unpipelined 32K', {'buffer_size': 32768, 'pipelined': False}),
+    ('pipelined 32K', {'buffer_size': 32768, 'pipelined': True}),
+    ('pipelined 256K', {'buffer_size': 262144, 'pipelined': True}),
+    ('pipelined 256K, 8M window', {'buffer_size': 262144,
+                                   'pipelined': True,
+                                   'window_size': 8 * 1024 * 1024}),
+    ('pipelined 256K, 8M window, 32K packet',
+     {'buffer_size': 262144, 'pipelined': True,
+      'window_size': 8 * 1024 * 1024, 'max_packet_size': 32768}),
+    ('4 streams of 8M ranges', {'parallel_streams': 4,
+                                'chunk_size': 8 * 1024 * 1024,
+                                'large_file_threshold': 0})
+]
+
+
+def _parse_arguments(args):
+    parser = argparse.ArgumentParser(description='SftpTransfer benchmark')
+    parser.add_argument('--size', type=int, default=64,
+                        help='Size of file to transfer in MB (default 64)')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='Artificial one way latency in milliseconds '
+                             '(default 0)')
+    return parser.parse_args(args)
+
+
+def run_setting(port, keyfile, srcfile, kwargs):
+    """Transfers `srcfile` with SftpTransfer created with `kwargs`
+    :returns: tuple (status, duration in seconds of transfer_file() call,
+                     bytes transferred)
+    """
+    t = SftpTransfer('127.0.0.1', '/', username='bench', port=port,
+                     privatekeyfile=keyfile, **kwargs)
+    t.connect()
+    try:
+        start_time = time.time()
+        status, duration, b_sent = t.transfer_file(srcfile)
+        return status, time.time() - start_time, b_sent
+    finally:
+        t.disconnect()
+
+
+def main(arglist):
+    theargs = _parse_arguments(arglist[1:])
+    logging.basicConfig(level=logging.ERROR)
+    # server side transports log resets when clients disconnect
+    logging.getLogger('paramiko').setLevel(logging.CRITICAL)
+    temp_dir = tempfile.mkdtemp()
+    server = None
+    proxy = None
+    try:
+        remote_root = os.path.join(temp_dir, 'remote')
+        os.makedirs(remote_root)
+        keyfile = os.path.join(temp_dir, 'key')
+        paramiko.RSAKey.generate(2048).write_private_key_file(keyfile)
+        srcfile = os.path.join(temp_dir, 'data.bin')
+        with open(srcfile, 'wb') as f:
+            for i in range(theargs.size):
+                f.write(os.urandom(1024 * 1024))
+
+        server = LoopbackSftpServer(remote_root)
+        server.start()
+        port = server.get_port()
+        if theargs.latency > 0:
+            proxy = LatencyProxy(port, theargs.latency / 1000.0)
+            proxy.start()
+            port = proxy.get_port()
+
+        sys.stdout.write('File size: ' + str(theargs.size) + ' MB, one way '
+                         'latency: ' + str(theargs.latency) + ' ms\n\n')
+        for name, kwargs in SETTINGS:
+            status, duration, b_sent = run_setting(port, keyfile, srcfile,
+                                                   kwargs)
+            if status is not None:
+                sys.stdout.write('%-45s FAILED: %s\n' % (name, status))
+                continue
+            rate = (float(b_sent) / (1024 * 1024)) / max(duration, 1e-6)
+            sys.stdout.write('%-45s %8.2f MB/s\n' % (name, rate))
+        return 0
+    finally:
+        if proxy is not None:
+            proxy.stop()
+        if server is not None:
+            server.stop()
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main(sys.argv))
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+"""
+harness
+----------------------------------
+
+Minimal benchmark harness used by the bench_*.py suites. Each
+benchmark is timed several times and the best time is kept, which
+is the value least affected by other activity on the machine.
+Results can be saved as a JSON baseline and later runs are compared
+against it so regressions are caught.
+
+Timings depend on the machine, so developers should regenerate the
+baseline with --save on their own machine before making changes and
+compare against that. The machine a baseline was saved on is stored
+with it, and comparison is skipped with a warning if the python
+version, implementation, platform or processor differ, unless
+--ignore_machine is set.
+
+Suites are modules with a create_benchmarks(temp_dir) function
+returning a tuple (list of (name, function), cleanup function or
+None). Fixtures are built in create_benchmarks() so only the
+function call is timed.
+"""
+
+import os
+import sys
+import json
+import shutil
+import platform
+import tempfile
+import argparse
+
+from ncmirtools.kiosk.progress import get_clock
+
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'baseline.json')
+
+DEFAULT_REPEAT = 5
+DEFAULT_TOLERANCE = 1.5
+
+# differences smaller than this many seconds are treated as noise
+MIN_DIFFERENCE = 0.001
+
+
+def measure(func, repeat=DEFAULT_REPEAT):
+    """Calls `func` `repeat` times
+    :returns: best duration in seconds of a call
+    """
+    clock = get_clock()
+    best = None
+    for i in range(repeat):
+        start_time = clock()
+        func()
+        duration = clock() - start_time
+        if best is None or duration < best:
+            best = duration
+    return best
+
+
+def load_baseline(path=BASELINE_FILE):
+    """Loads baseline
+    :returns: dict of benchmark name to seconds, empty if `path`
+              does not exist
+    """
+    if not os.path.isfile(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f).get('benchmarks', {})
+
+
+def get_machine():
+    """Gets description of this machine stored with baseline
+    :returns: dict with python, implementation, platform and
+              processor keys
+    """
+    return {'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'processor': platform.machine()}
+
+
+def load_baseline_machine(path=BASELINE_FILE):
+    """Loads description of machine baseline was saved on
+    :returns: dict from `get_machine()` or None if `path` does not
+              exist or has no machine
+    """
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f).get('machine')
+
+
+def get_machine_differences(machine, current=None):
+    """Finds values of `machine` that differ from `current`. Only
+       major and minor python versions are compared
+    :param machine: dict from `get_machine()`
+    :param current: dict from `get_machine()`, if None this machine
+    :returns: list of tuples (key, value in `machine`, value in
+              `current`) sorted by key
+    """
+    if current is None:
+        current = get_machine()
+    diffs = []
+    for key in sorted(current.keys()):
+        value = machine.get(key)
+        if key == 'python' and value is not None:
+            same = (value.split('.')[:2] ==
+                    current[key].split('.')[:2])
+        else:
+            same = value == current[key]
+        if not same:
+            diffs.append((key, value, current[key]))
+    return diffs
+
+
+def save_baseline(results, path=BASELINE_FILE):
+    """Merges `results` into baseline at `path`
+    :param results: dict of benchmark name to seconds
+    """
+    data = {'benchmarks': {}}
+    if os.path.isfile(path):
+        with open(path, 'r') as f:
+            data = json.load(f)
+    data['benchmarks'].update(results)
+    data['machine'] = get_machine()
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE,
+            min_difference=MIN_DIFFERENCE):
+    """Finds benchmarks slower than baseline
+    :param results: dict of benchmark name to seconds
+    :param baseline: dict of benchmark name to seconds
+    :param tolerance: ratio to baseline above which a benchmark
+                      is a regression
+    :param min_difference: seconds a benchmark must be slower than
+                           baseline to be a regression so very fast
+                           benchmarks do not fail on timer noise
+    :returns: list of tuples (name, seconds, baseline seconds)
+    """
+    regressions = []
+    for name in sorted(results.keys()):
+        base = baseline.get(name)
+        if base is None or base <= 0:
+            continue
+        if (results[name] > base * tolerance and
+                results[name] - base > min_difference):
+            regressions.append((name, results[name], base))
+    return regressions
+
+
+def _parse_arguments(desc, args):
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument('--save', action='store_true',
+                        help='Store results as new baseline')
+    parser.add_argument('--baseline', default=BASELINE_FILE,
+                        help='Baseline JSON file (default ' +
+                             BASELINE_FILE + ')')
+    parser.add_argument('--tolerance', type=float,
+                        default=DEFAULT_TOLERANCE,
+                        help='Ratio to baseline above which a benchmark '
+                             'fails (default ' + str(DEFAULT_TOLERANCE) +
+                             ')')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help='Runs per benchmark, best is kept '
+                             '(default ' + str(DEFAULT_REPEAT) + ')')
+    parser.add_argument('--filter', default=None,
+                        help='Only run benchmarks whose name contains '
+                             'this value')
+    parser.add_argument('--ignore_machine', action='store_true',
+                        help='Compare to baseline even if it was saved '
+                             'on a different machine')
+    return parser.parse_args(args)
+
+
+def run_suites(suites, repeat=DEFAULT_REPEAT, name_filter=None,
+               out_stream=None):
+    """Runs benchmarks of every module in `suites`
+    :returns: dict of benchmark name to seconds
+    """
+    if out_stream is None:
+        out_stream = sys.stdout
+    results = {}
+    for suite in suites:
+        temp_dir = tempfile.mkdtemp()
+        cleanup = None
+        try:
+            benchmarks, cleanup = suite.create_benchmarks(temp_dir)
+            for name, func in benchmarks:
+                if name_filter is not None and name_filter not in name:
+                    continue
+                results[name] = measure(func, repeat=repeat)
+                out_stream.write('%-50s %12.6f s\n' % (name, results[name]))
+                out_stream.flush()
+        finally:
+            if cleanup is not None:
+                cleanup()
+            shutil.rmtree(temp_dir)
+    return results
+
+
+def main(desc, suites, arglist):
+    """Runs `suites`, compares results to baseline and optionally
+       saves them
+    :returns: 1 if any benchmark regressed otherwise 0
+    """
+    theargs = _parse_arguments(desc, arglist[1:])
+    results = run_suites(suites, repeat=theargs.repeat,
+                         name_filter=theargs.filter)
+    if theargs.save is True:
+        save_baseline(results, path=theargs.baseline)
+        sys.stdout.write('\nSaved baseline to ' + theargs.baseline + '\n')
+        return 0
+    machine = load_baseline_machine(theargs.baseline)
+    if machine is not None and theargs.ignore_machine is False:
+        diffs = get_machine_differences(machine)
+        if diffs:
+            sys.stdout.write('\nWARNING: Baseline was saved on a different '
+                             'machine, skipping comparison:\n')
+            for key, value, current in diffs:
+                sys.stdout.write('  ' + key + ': ' + str(value) +
+                                 ', this machine: ' + str(current) + '\n')
+            sys.stdout.write('Run with --save to store a baseline for this '
+                             'machine or --ignore_machine to compare '
+                             'anyway\n')
+            return 0
+    baseline = load_baseline(theargs.baseline)
+    missing = sorted([n for n in results if n not in baseline])
+    if missing:
+        sys.stdout.write('\nNo baseline for: ' + ', '.join(missing) + '\n')
+    regressions = compare(results, baseline, tolerance=theargs.tolerance)
+    if not regressions:
+        sys.stdout.write('\nNo regressions (tolerance ' +
+                         str(theargs.tolerance) + 'x)\n')
+        return 0
+    sys.stdout.write('\nRegressions (tolerance ' + str(theargs.tolerance) +
+                     'x):\n')
+    for name, seconds, base in regressions:
+        sys.stdout.write('%-50s %12.6f s, baseline %.6f s (%.2fx)\n' %
+                         (name, seconds, base, seconds / base))
+    return 1
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+
+"""
+loopback_sftp
+----------------------------------
+
+Loopback SFTP server, backed by a local directory, used by the
+benchmarks. An optional `LatencyProxy` can be placed in front of
+the server to simulate round trip time of a wide area link.
+"""
+
+import os
+import time
+import socket
+import threading
+import collections
+
+import paramiko
+from paramiko import ServerInterface
+from paramiko import SFTPServerInterface
+from paramiko import SFTPServer
+from paramiko import SFTPAttributes
+from paramiko import SFTPHandle
+from paramiko.sftp import SFTP_OK
+from paramiko.common import AUTH_SUCCESSFUL
+from paramiko.common import OPEN_SUCCEEDED
+
+
+class _AcceptAllServer(ServerInterface):
+    """Accepts any user with any public key
+    """
+    def check_auth_publickey(self, username, key):
+        return AUTH_SUCCESSFUL
+
+    def check_auth_password(self, username, password):
+        return AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return 'publickey,password'
+
+    def check_channel_request(self, kind, chanid):
+        return OPEN_SUCCEEDED
+
+
+class _LocalSFTPHandle(SFTPHandle):
+    """Handle for a file opened via `_LocalSFTPServer`
+    """
+    def stat(self):
+        return SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+    def chattr(self, attr):
+        return SFTP_OK
+
+
+class _LocalSFTPServer(SFTPServerInterface):
+    """Serves files under `root` which is passed in via
+       the `root` keyword argument
+    """
+    def __init__(self, server, root=None, *args, **kwargs):
+        super(_LocalSFTPServer, self).__init__(server, *args, **kwargs)
+        self._root = root
+
+    def _realpath(self, path):
+        return os.path.join(self._root, self.canonicalize(path).lstrip('/'))
+
+    def open(self, path, flags, attr):
+        path = self._realpath(path)
+        try:
+            fd = os.open(path, flags | getattr(os, 'O_BINARY', 0), 0o644)
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        if flags & os.O_WRONLY:
+            fmode = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR:
+            fmode = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else:
+            fmode = 'rb'
+        handle = _LocalSFTPHandle(flags)
+        f = os.fdopen(fd, fmode)
+        handle.readfile = f
+        handle.writefile = f
+        return handle
+
+    def stat(self, path):
+        try:
+            return SFTPAttributes.from_stat(os.stat(self._realpath(path)))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+    def lstat(self, path):
+        try:
+            return SFTPAttributes.from_stat(os.lstat(self._realpath(path)))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+    def list_folder(self, path):
+        path = self._realpath(path)
+        try:
+            res = []
+            for fname in os.listdir(path):
+                attr = SFTPAttributes.from_stat(os.stat(os.path.join(path,
+                                                                     fname)))
+                attr.filename = fname
+                res.append(attr)
+            return res
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+    def remove(self, path):
+        try:
+            os.remove(self._realpath(path))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        try:
+            os.rename(self._realpath(oldpath), self._realpath(newpath))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def posix_rename(self, oldpath, newpath):
+        return self.rename(oldpath, newpath)
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(self._realpath(path))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def chattr(self, path, attr):
+        return SFTP_OK
+
+
+class LoopbackSftpServer(object):
+    """SFTP server listening on 127.0.0.1 that serves files
+       under `root`. Remote paths are relative to `root` so
+       a destination directory of / writes into `root`
+    """
+    def __init__(self, root):
+        """Constructor
+        :param root: local directory served by this server
+        """
+        self._root = root
+        self._host_key = paramiko.RSAKey.generate(2048)
+        self._sock = None
+        self._thread = None
+        self._transports = []
+
+    def get_port(self):
+        """Gets port server is listening on
+        """
+        return self._sock.getsockname()[1]
+
+    def start(self):
+        """Starts server in a background thread
+        """
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(('127.0.0.1', 0))
+        self._sock.listen(16)
+        self._thread = threading.Thread(target=self._accept_loop)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, addr = self._sock.accept()
+            except (OSError, socket.error):
+                return
+            t = paramiko.Transport(conn)
+            t.add_server_key(self._host_key)
+            t.set_subsystem_handler('sftp', SFTPServer, _LocalSFTPServer,
+                                    root=self._root)
+            t.start_server(server=_AcceptAllServer())
+            self._transports.append(t)
+
+    def stop(self):
+        """Stops server
+        """
+        for t in self._transports:
+            t.close()
+        if self._sock is not None:
+            self._sock.close()
+
+
+class LatencyProxy(object):
+    """TCP proxy that delays data in each direction by `delay`
+       seconds without limiting throughput, so the round trip
+       time seen by client is 2 * `delay`
+    """
+    def __init__(self, target_port, delay):
+        """Constructor
+        :param target_port: port on 127.0.0.1 to forward to
+        :param delay: one way delay in seconds
+        """
+        self._target_port = target_port
+        self._delay = delay
+        self._sock = None
+
+    def get_port(self):
+        """Gets port proxy is listening on
+        """
+        return self._sock.getsockname()[1]
+
+    def start(self):
+        """Starts proxy in a background thread
+        """
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(('127.0.0.1', 0))
+        self._sock.listen(16)
+        t = threading.Thread(target=self._accept_loop)
+        t.daemon = True
+        t.start()
+
+    def stop(self):
+        """Stops proxy
+        """
+        if self._sock is not None:
+            self._sock.close()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                client, addr = self._sock.accept()
+            except (OSError, socket.error):
+                return
+            server = socket.create_connection(('127.0.0.1',
+                                               self._target_port))
+            for src, dest in [(client, server), (server, client)]:
+                self._start_pipe(src, dest)
+
+    def _start_pipe(self, src, dest):
+        """Forwards data from `src` to `dest` delayed by `delay`
+        """
+        pending = collections.deque()
+        cond = threading.Condition()
+
+        def reader():
+            while True:
+                try:
+                    data = src.recv(65536)
+                except (OSError, socket.error):
+                    data = b''
+                with cond:
+                    pending.append((time.time() + self._delay, data))
+                    cond.notify()
+                if not data:
+                    return
+
+        def writer():
+            while True:
+                with cond:
+                    while len(pending) == 0:
+                        cond.wait()
+                    due, data = pending.popleft()
+                wait = due - time.time()
+                if wait > 0:
+                    time.sleep(wait)
+                try:
+                    if not data:
+                        dest.shutdown(socket.SHUT_WR)
+                        return
+                    dest.sendall(data)
+                except (OSError, socket.error):
+                    return
+
+        for target in [reader, writer]:
+            t = threading.Thread(target=target)
+            t.daemon = True
+            t.start()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+"""
+stub_rest
+----------------------------------
+
+Local stand in for the CIL REST service used by the benchmarks.
+Registers any entry and returns the file name as ID. Speaks HTTP/1.1
+so pooled keep-alive connections are reused like with the real
+service.
+"""
+
+import os
+import json
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler
+    from http.server import HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:  # pragma: no cover
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from BaseHTTPServer import HTTPServer
+    from SocketServer import ThreadingMixIn
+
+
+class _StubRESTHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        entry = json.loads(self.rfile.read(length).decode('utf-8'))
+        body = json.dumps({'success': True,
+                           'ID': os.path.basename(entry['File_path'])})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode('utf-8'))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StubRESTServer(object):
+    """Stub CIL REST service listening on 127.0.0.1
+    """
+    def __init__(self):
+        """Constructor
+        """
+        self._server = None
+
+    def get_url(self):
+        """Gets url to pass to `CILUploader`
+        """
+        return 'http://127.0.0.1:' + str(self._server.server_port)
+
+    def start(self):
+        """Starts server in a background thread
+        """
+        self._server = _ThreadingHTTPServer(('127.0.0.1', 0),
+                                            _StubRESTHandler)
+        t = threading.Thread(target=self._server.serve_forever)
+        t.daemon = True
+        t.start()
+
+    def stop(self):
+        """Stops server
+        """
+        self._server.shutdown()
+        self._server.server_close()
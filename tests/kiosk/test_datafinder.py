@@ -15,6 +15,7 @@ import unittest
 import os
 import configparser
 
+from ncmirtools import metrics
 from ncmirtools.config import NcmirToolsConfig
 from ncmirtools.kiosk import datafinder
 from ncmirtools.kiosk.datafinder import FileFinder
@@ -340,6 +341,28 @@ class TestDataFinder(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_second_youngest_updates_metrics(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            reg = metrics.get_registry()
+            scan = reg.get_metric('ncmirtools_datafinder_scan_seconds')
+            examined = reg.get_metric('ncmirtools_datafinder_files_'
+                                      'examined_total')
+            eligible = reg.get_metric('ncmirtools_datafinder_files_'
+                                      'eligible_total')
+            scan_count = scan.get_count()
+            examined_count = examined.get_value()
+            eligible_count = eligible.get_value()
+            for name in ['a.dm4', 'b.dm4', 'c.txt']:
+                open(os.path.join(temp_dir, name), 'a').close()
+            filefinder = SecondYoungest(temp_dir, '.dm4', None)
+            self.assertTrue(filefinder.get_next_file() is not None)
+            self.assertEqual(scan.get_count(), scan_count + 1)
+            self.assertEqual(examined.get_value(), examined_count + 3)
+            self.assertEqual(eligible.get_value(), eligible_count + 2)
+        finally:
+            shutil.rmtree(temp_dir)
+
 
 if __name__ == '__main__':
     sys.exit(unittest.main())
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_progress
+----------------------------------
+
+Tests for `progress` module.
+"""
+
+import io
+import unittest
+
+from ncmirtools.kiosk.progress import TransferProgress
+from ncmirtools.kiosk.progress import ProgressLinePrinter
+from ncmirtools.kiosk.progress import MEGABYTE
+from ncmirtools.kiosk.progress import get_clock
+from ncmirtools.kiosk.progress import format_rate
+from ncmirtools.kiosk.progress import format_seconds
+from ncmirtools.kiosk.progress import format_progress
+from ncmirtools.kiosk.progress import format_summary
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestProgress(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_get_clock(self):
+        clock = get_clock()
+        first = clock()
+        self.assertTrue(isinstance(first, float))
+        self.assertTrue(clock() >= first)
+
+    def test_format_functions(self):
+        self.assertEqual(format_rate(None), '? MB/s')
+        self.assertEqual(format_rate(MEGABYTE * 1.5), '1.50 MB/s')
+        self.assertEqual(format_seconds(None), '?')
+        self.assertEqual(format_seconds(65.4), '0:01:05')
+        self.assertEqual(format_seconds(3600 * 2 + 1), '2:00:01')
+        self.assertEqual(format_summary(MEGABYTE, 0.5),
+                         'Sent 1048576 bytes in 0.500 seconds (2.00 MB/s)')
+        self.assertEqual(format_summary(0, 0),
+                         'Sent 0 bytes in 0.000 seconds (? MB/s)')
+
+    def test_transfer_progress_rates(self):
+        clock = FakeClock()
+        calls = []
+        p = TransferProgress('/foo', 4 * MEGABYTE,
+                             callback=calls.append, interval=1,
+                             clock=clock)
+        self.assertEqual(p.get_filepath(), '/foo')
+        self.assertEqual(p.get_total_bytes(), 4 * MEGABYTE)
+        self.assertEqual(p.get_bytes_sent(), 0)
+        self.assertEqual(p.get_average_rate(), None)
+        self.assertEqual(p.get_instant_rate(), None)
+        self.assertEqual(p.get_eta(), None)
+        self.assertEqual(p.is_done(), False)
+
+        # updates within interval do not invoke callback
+        clock.now += 0.25
+        p.add(MEGABYTE // 4)
+        self.assertEqual(calls, [])
+        self.assertEqual(p.get_average_rate(), MEGABYTE)
+
+        clock.now += 0.75
+        p.add(MEGABYTE * 3 // 4)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(p.get_instant_rate(), MEGABYTE)
+        self.assertEqual(p.get_eta(), 3)
+
+        # faster second interval, paramiko style cumulative update
+        clock.now += 1
+        p.set_bytes_sent(3 * MEGABYTE, 4 * MEGABYTE)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(p.get_instant_rate(), 2 * MEGABYTE)
+        self.assertEqual(p.get_average_rate(), 1.5 * MEGABYTE)
+        self.assertEqual(p.get_elapsed(), 2)
+        self.assertEqual(format_progress(p),
+                         '3.00 of 4.00 MB (75%) 2.00 MB/s, avg 1.50 MB/s, '
+                         'ETA 0:00:01')
+
+        clock.now += 0.5
+        p.set_bytes_sent(4 * MEGABYTE)
+        self.assertEqual(len(calls), 2)
+        p.finish()
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(p.is_done(), True)
+        self.assertEqual(p.get_eta(), 0)
+
+    def test_transfer_progress_unknown_total_and_bad_callback(self):
+        clock = FakeClock()
+
+        def bad_callback(progress):
+            raise Exception('foo')
+
+        p = TransferProgress('/foo', None, callback=bad_callback,
+                             clock=clock)
+        clock.now += 1
+        p.add(MEGABYTE)
+        self.assertEqual(p.get_eta(), None)
+        self.assertEqual(format_progress(p),
+                         '1.00 MB 1.00 MB/s, avg 1.00 MB/s, ETA ?')
+        p.set_total_bytes(2 * MEGABYTE)
+        self.assertEqual(p.get_eta(), 1)
+
+    def test_progress_line_printer(self):
+        clock = FakeClock()
+        out = io.StringIO()
+        p = TransferProgress('/foo', 2 * MEGABYTE,
+                             callback=ProgressLinePrinter(out),
+                             clock=clock)
+        clock.now += 1
+        p.add(MEGABYTE)
+        clock.now += 1
+        p.add(MEGABYTE)
+        p.finish()
+        self.assertEqual(out.getvalue(),
+                         '\r1.00 of 2.00 MB (50%) 1.00 MB/s, avg 1.00 MB/s, '
+                         'ETA 0:00:01'
+                         '\r2.00 of 2.00 MB (100%) 1.00 MB/s, avg 1.00 MB/s, '
+                         'ETA 0:00:00'
+                         '\r2.00 of 2.00 MB (100%) 1.00 MB/s, avg 1.00 MB/s, '
+                         'ETA 0:00:00\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_ratelimit
+----------------------------------
+
+Tests for `ratelimit` module.
+"""
+
+import datetime
+import threading
+import unittest
+
+from ncmirtools.kiosk.ratelimit import TokenBucket
+from ncmirtools.kiosk.ratelimit import RateLimiter
+from ncmirtools.kiosk.ratelimit import parse_rate
+from ncmirtools.kiosk.ratelimit import parse_schedule
+
+
+class FakeClock(object):
+    """Clock whose sleep advances time instead of waiting
+    """
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+        self._lock = threading.Lock()
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, secs):
+        with self._lock:
+            self.sleeps.append(secs)
+            self.now += secs
+
+
+class TestRateLimit(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('0'), 0)
+        self.assertEqual(parse_rate('100'), 100)
+        self.assertEqual(parse_rate('2K'), 2048)
+        self.assertEqual(parse_rate(' 1.5m '), 1572864)
+        self.assertEqual(parse_rate('1GB'), 1073741824)
+        for val in ['', 'foo', '10X', '-1']:
+            try:
+                parse_rate(val)
+                self.fail('Expected ValueError for ' + val)
+            except ValueError:
+                pass
+
+    def test_parse_schedule(self):
+        self.assertEqual(parse_schedule(''), [])
+        self.assertEqual(parse_schedule('08:00-18:30=2M, 18:30-08:00=0'),
+                         [(480, 1110, 2097152), (1110, 480, 0)])
+        for val in ['08:00=1M', '08:00-18:00', '8-18=1M',
+                    '25:00-18:00=1M', '08:00-18:61=1M']:
+            try:
+                parse_schedule(val)
+                self.fail('Expected ValueError for ' + val)
+            except ValueError:
+                pass
+
+    def test_token_bucket_no_limit(self):
+        clock = FakeClock()
+        for rate in [None, 0]:
+            bucket = TokenBucket(rate, clock=clock.clock,
+                                 sleep=clock.sleep)
+            self.assertEqual(bucket.get_burst(), 0)
+            self.assertEqual(bucket.consume(10000000), 0)
+        self.assertEqual(clock.sleeps, [])
+
+    def test_token_bucket_limits_rate(self):
+        clock = FakeClock()
+        bucket = TokenBucket(100, clock=clock.clock, sleep=clock.sleep)
+        self.assertEqual(bucket.get_rate(), 100)
+        self.assertEqual(bucket.get_burst(), 100)
+
+        # initial burst is free
+        self.assertEqual(bucket.consume(100), 0)
+        # then 250 bytes at 100 bytes/sec takes 2.5 seconds
+        self.assertEqual(bucket.consume(250), 2.5)
+        self.assertEqual(clock.now, 2.5)
+        # time passing refills bucket up to burst only
+        clock.now += 10
+        self.assertEqual(bucket.consume(100), 0)
+        self.assertEqual(bucket.consume(50), 0.5)
+
+    def test_token_bucket_set_rate(self):
+        clock = FakeClock()
+        bucket = TokenBucket(100, burst=50, clock=clock.clock,
+                             sleep=clock.sleep)
+        self.assertEqual(bucket.get_burst(), 50)
+        bucket.consume(50)
+        bucket.set_rate(10)
+        self.assertEqual(bucket.get_rate(), 10)
+        self.assertEqual(bucket.consume(20), 2.0)
+        bucket.set_rate(None)
+        self.assertEqual(bucket.consume(1000), 0)
+
+    def test_token_bucket_shared_by_threads(self):
+        sleeps = []
+        bucket = TokenBucket(1000, burst=1, clock=lambda: 0.0,
+                             sleep=sleeps.append)
+        threads = []
+        for i in range(4):
+            t = threading.Thread(target=bucket.consume, args=(1000,))
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+        # each caller waits for debt of callers before it
+        self.assertEqual(sorted(sleeps), [0.999, 1.999, 2.999, 3.999])
+
+    def test_ratelimiter_get_current_rate(self):
+        current = [datetime.datetime(2018, 1, 1, 12, 0)]
+        schedule = parse_schedule('08:00-18:00=1K,22:00-06:00=0')
+        limiter = RateLimiter(rate=5, schedule=schedule,
+                              now=lambda: current[0])
+        self.assertEqual(limiter.get_rate(), 5)
+        self.assertEqual(limiter.get_schedule(), schedule)
+        self.assertEqual(limiter.get_current_rate(), 1024)
+        current[0] = datetime.datetime(2018, 1, 1, 18, 0)
+        self.assertEqual(limiter.get_current_rate(), 5)
+        current[0] = datetime.datetime(2018, 1, 1, 23, 0)
+        self.assertEqual(limiter.get_current_rate(), 0)
+        current[0] = datetime.datetime(2018, 1, 1, 5, 59)
+        self.assertEqual(limiter.get_current_rate(), 0)
+        current[0] = datetime.datetime(2018, 1, 1, 7, 0)
+        self.assertEqual(limiter.get_current_rate(), 5)
+
+        limiter = RateLimiter()
+        self.assertEqual(limiter.get_schedule(), [])
+        self.assertEqual(limiter.get_current_rate(), None)
+        self.assertEqual(limiter.consume(100), 0)
+
+    def test_ratelimiter_follows_schedule(self):
+        clock = FakeClock()
+        current = [datetime.datetime(2018, 1, 1, 12, 0)]
+        limiter = RateLimiter(schedule=parse_schedule('08:00-18:00=100'),
+                              clock=clock.clock, sleep=clock.sleep,
+                              now=lambda: current[0])
+        limiter.consume(100)
+        self.assertEqual(limiter.consume(200), 2.0)
+        current[0] = datetime.datetime(2018, 1, 1, 20, 0)
+        self.assertEqual(limiter.consume(1000000), 0)
+        self.assertEqual(clock.sleeps, [2.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
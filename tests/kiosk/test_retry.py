@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_retry
+----------------------------------
+
+Tests for `retry` module.
+"""
+
+import errno
+import socket
+import unittest
+import configparser
+import paramiko
+import mock
+from mock import Mock
+
+from ncmirtools.kiosk.retry import RetryPolicy
+from ncmirtools.kiosk.retry import RetryingTransfer
+from ncmirtools.kiosk.retry import RetryPolicyFromConfigFactory
+from ncmirtools.kiosk.transfer import Transfer
+from ncmirtools.kiosk.transfer import InvalidDestinationDirError
+from ncmirtools.kiosk.transfer import CommandFailedError
+
+
+class FailingTransfer(Transfer):
+    """Transfer whose `transfer_file()` fails with each exception
+       in list passed to constructor before succeeding
+    """
+    def __init__(self, exceptions):
+        super(FailingTransfer, self).__init__()
+        self._exceptions = list(exceptions)
+        self.connect_count = 0
+        self.disconnect_count = 0
+
+    def connect(self):
+        self.connect_count += 1
+
+    def disconnect(self):
+        self.disconnect_count += 1
+
+    def transfer_file(self, filepath):
+        self._last_exception = None
+        if len(self._exceptions) > 0:
+            self._last_exception = self._exceptions.pop(0)
+            return 'failed: ' + str(self._last_exception), 1, 0
+        return None, 1, 100
+
+    def get_destination_directory(self):
+        return '/dest'
+
+
+class TestRetry(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def _get_policy(self, max_attempts=3, sleeps=None):
+        if sleeps is None:
+            sleeps = []
+        return RetryPolicy(max_attempts=max_attempts, initial_delay=1,
+                           max_delay=5, jitter=0, sleep=sleeps.append)
+
+    def test_retrypolicy_defaults(self):
+        p = RetryPolicy()
+        self.assertEqual(p.get_max_attempts(),
+                         RetryPolicy.DEFAULT_MAX_ATTEMPTS)
+        self.assertEqual(p.get_initial_delay(),
+                         RetryPolicy.DEFAULT_INITIAL_DELAY)
+        self.assertEqual(p.get_max_delay(), RetryPolicy.DEFAULT_MAX_DELAY)
+        self.assertEqual(p.get_multiplier(), RetryPolicy.DEFAULT_MULTIPLIER)
+        self.assertEqual(p.get_jitter(), RetryPolicy.DEFAULT_JITTER)
+
+    def test_get_delay(self):
+        p = self._get_policy()
+        self.assertEqual([p.get_delay(a) for a in range(1, 6)],
+                         [1, 2, 4, 5, 5])
+
+        p = RetryPolicy(initial_delay=10, jitter=0.5,
+                        random_func=Mock(return_value=0.0))
+        self.assertEqual(p.get_delay(1), 5)
+        p = RetryPolicy(initial_delay=10, jitter=0.5,
+                        random_func=Mock(return_value=0.75))
+        self.assertEqual(p.get_delay(1), 12.5)
+
+    def test_is_retryable(self):
+        p = RetryPolicy()
+        self.assertFalse(p.is_retryable(None))
+        self.assertTrue(p.is_retryable(CommandFailedError('x', 255,
+                                                          retryable=True)))
+        self.assertFalse(p.is_retryable(CommandFailedError('x', 1)))
+        self.assertTrue(p.is_retryable(socket.timeout('timed out')))
+        self.assertTrue(p.is_retryable(EOFError()))
+        self.assertTrue(p.is_retryable(paramiko.SSHException('reset')))
+        self.assertTrue(p.is_retryable(IOError(errno.ECONNRESET, 'reset')))
+        self.assertFalse(p.is_retryable(IOError(errno.ENOENT, 'missing')))
+        self.assertFalse(p.is_retryable(IOError(errno.EACCES, 'denied')))
+        self.assertFalse(p.is_retryable(
+            paramiko.AuthenticationException('bad')))
+        self.assertFalse(p.is_retryable(InvalidDestinationDirError('x')))
+        self.assertFalse(p.is_retryable(ValueError('x')))
+
+    def test_call(self):
+        sleeps = []
+        p = self._get_policy(sleeps=sleeps)
+        func = Mock(side_effect=[EOFError(), socket.error('x'), 5])
+        self.assertEqual(p.call(func, 1, a=2), 5)
+        func.assert_called_with(1, a=2)
+        self.assertEqual(sleeps, [1, 2])
+
+        # fatal is raised immediately
+        func = Mock(side_effect=paramiko.AuthenticationException('bad'))
+        self.assertRaises(paramiko.AuthenticationException, p.call, func)
+        self.assertEqual(func.call_count, 1)
+
+        # attempts used up
+        func = Mock(side_effect=EOFError())
+        self.assertRaises(EOFError, p.call, func)
+        self.assertEqual(func.call_count, 3)
+
+    def test_retryingtransfer_success_after_retries(self):
+        sleeps = []
+        t = FailingTransfer([EOFError(), socket.timeout()])
+        rt = RetryingTransfer(t, retry_policy=self._get_policy(
+            sleeps=sleeps))
+        self.assertEqual(rt.get_transfer(), t)
+        rt.connect()
+        status, duration, bytes_transferred = rt.transfer_file('/foo')
+        rt.disconnect()
+        self.assertEqual(status, None)
+        self.assertEqual(bytes_transferred, 100)
+        self.assertEqual(rt.get_last_attempts(), 3)
+        self.assertEqual(sleeps, [1, 2])
+        self.assertEqual(t.connect_count, 3)
+        self.assertEqual(t.disconnect_count, 3)
+
+    def test_retryingtransfer_fatal_and_exhausted(self):
+        sleeps = []
+        t = FailingTransfer([IOError(errno.ENOENT, 'missing')])
+        rt = RetryingTransfer(t, retry_policy=self._get_policy(
+            sleeps=sleeps))
+        status, duration, bytes_transferred = rt.transfer_file('/foo')
+        self.assertTrue(status.startswith('failed'))
+        self.assertEqual(rt.get_last_attempts(), 1)
+        self.assertEqual(rt.get_last_exception().errno, errno.ENOENT)
+        self.assertEqual(sleeps, [])
+
+        t = FailingTransfer([EOFError(), EOFError(), EOFError()])
+        rt = RetryingTransfer(t, retry_policy=self._get_policy(
+            max_attempts=2, sleeps=sleeps))
+        status, duration, bytes_transferred = rt.transfer_file('/foo')
+        self.assertTrue(status.startswith('failed'))
+        self.assertEqual(rt.get_last_attempts(), 2)
+
+    def test_retryingtransfer_skipped_and_reconnect_fails(self):
+        t = Transfer()
+        t.transfer_file = Mock(return_value=(Transfer.SKIPPED, 0, 0))
+        rt = RetryingTransfer(t)
+        self.assertEqual(rt.get_retry_policy().get_max_attempts(),
+                         RetryPolicy.DEFAULT_MAX_ATTEMPTS)
+        self.assertEqual(rt.transfer_file('/foo')[0], Transfer.SKIPPED)
+        self.assertEqual(rt.get_last_attempts(), 1)
+
+        t = FailingTransfer([EOFError()])
+        t.connect = Mock(side_effect=paramiko.AuthenticationException('no'))
+        rt = RetryingTransfer(t, retry_policy=self._get_policy())
+        status, duration, bytes_transferred = rt.transfer_file('/foo')
+        self.assertEqual(status, 'Caught an exception: '
+                                 'AuthenticationException : no')
+
+    def test_retryingtransfer_passes_through(self):
+        t = FailingTransfer([])
+        rt = RetryingTransfer(t)
+        self.assertEqual(rt.get_destination_directory(), '/dest')
+        self.assertEqual(rt.get_last_checksum(), None)
+        self.assertEqual(rt.get_checksum_algorithm(), None)
+        self.assertEqual(rt.get_compression(), None)
+        self.assertEqual(rt.get_last_raw_bytes(), None)
+        self.assertEqual(rt.get_last_remote_path(), None)
+        callback = Mock()
+        rt.set_progress_callback(callback)
+        self.assertEqual(t.get_progress_callback(), callback)
+        self.assertEqual(rt.get_progress_callback(), callback)
+        try:
+            rt.doesnotexist()
+            self.fail('Expected AttributeError')
+        except AttributeError:
+            pass
+
+        # failures of wrapped objects without get_last_exception
+        # have unknown cause and are not retried
+        mt = Mock(spec=['transfer_file', 'connect', 'disconnect'])
+        mt.transfer_file = Mock(side_effect=[('bad', 0, 0),
+                                             (None, 0, 5)])
+        rt = RetryingTransfer(mt, retry_policy=self._get_policy())
+        self.assertEqual(rt.transfer_file('/foo'), ('bad', mock.ANY, 0))
+        self.assertEqual(rt.get_last_attempts(), 1)
+
+    def test_retrypolicyfromconfigfactory(self):
+        con = configparser.ConfigParser()
+        con.add_section('foo')
+        fac = RetryPolicyFromConfigFactory(con, 'foo')
+        p, errmsg = fac.get_retrypolicy()
+        self.assertEqual(errmsg, None)
+        self.assertEqual(p.get_max_attempts(),
+                         RetryPolicy.DEFAULT_MAX_ATTEMPTS)
+
+        con.set('foo', RetryPolicyFromConfigFactory.MAX_ATTEMPTS, '5')
+        con.set('foo', RetryPolicyFromConfigFactory.INITIAL_DELAY, '0.5')
+        con.set('foo', RetryPolicyFromConfigFactory.MAX_DELAY, '30')
+        con.set('foo', RetryPolicyFromConfigFactory.JITTER, '0.1')
+        p, errmsg = fac.get_retrypolicy()
+        self.assertEqual(p.get_max_attempts(), 5)
+        self.assertEqual(p.get_initial_delay(), 0.5)
+        self.assertEqual(p.get_max_delay(), 30)
+        self.assertEqual(p.get_jitter(), 0.1)
+
+        con.set('foo', RetryPolicyFromConfigFactory.JITTER, '2')
+        p, errmsg = fac.get_retrypolicy()
+        self.assertEqual(p, None)
+        self.assertEqual(errmsg, 'retry_jitter must be between 0 and 1')
+
+        con.set('foo', RetryPolicyFromConfigFactory.MAX_ATTEMPTS, '0')
+        p, errmsg = fac.get_retrypolicy()
+        self.assertEqual(errmsg, 'retry_max_attempts must be 1 or larger')
+
+        con.set('foo', RetryPolicyFromConfigFactory.MAX_ATTEMPTS, 'x')
+        p, errmsg = fac.get_retrypolicy()
+        self.assertTrue(errmsg.startswith('Invalid retry option: '))
+
+        fac = RetryPolicyFromConfigFactory(None, 'foo')
+        p, errmsg = fac.get_retrypolicy()
+        self.assertEqual(p.get_max_attempts(),
+                         RetryPolicy.DEFAULT_MAX_ATTEMPTS)
+
+
+if __name__ == '__main__':
+    unittest.main()
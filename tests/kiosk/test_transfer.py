@@ -12,17 +12,87 @@ import shutil
 import tempfile
 import sys
 import unittest
+import io
 import os
+import errno
+import gzip
 import configparser
+import paramiko
+import mock
 from mock import Mock
 
+from ncmirtools import metrics
+from ncmirtools.kiosk import transfer
 from ncmirtools.imagetokiosk import Parameters
 from ncmirtools.kiosk.transfer import InvalidDestinationDirError
 from ncmirtools.kiosk.transfer import SSHConnectionError
 
 from ncmirtools.kiosk.transfer import Transfer
+from ncmirtools.kiosk.transfer import TransferResult
 from ncmirtools.kiosk.transfer import SftpTransfer
 from ncmirtools.kiosk.transfer import SftpTransferFromConfigFactory
+from ncmirtools.kiosk.transfer import compute_checksum
+from ncmirtools.kiosk.transfer import new_hash
+from ncmirtools.kiosk.transfer import new_compressor
+from ncmirtools.kiosk.transfer import SshCommandTransfer
+from ncmirtools.kiosk.transfer import RsyncTransfer
+from ncmirtools.kiosk.transfer import ScpTransfer
+from ncmirtools.kiosk.transfer import LocalCopyTransfer
+from ncmirtools.kiosk.transfer import TransferFromConfigFactory
+from ncmirtools.kiosk.transfer import load_private_key
+from ncmirtools.kiosk.transfer import clear_private_key_cache
+
+
+class LocalSFTPClient(object):
+    """Stand in for paramiko.SFTPClient that operates on
+       local file system paths
+    """
+    def __init__(self):
+        self.closed = False
+
+    def open(self, path, mode='r', bufsize=-1):
+        return open(path, mode)
+
+    def put(self, localpath, remotepath, callback=None, confirm=True):
+        shutil.copyfile(localpath, remotepath)
+        size = os.path.getsize(remotepath)
+        if callback is not None:
+            callback(size, size)
+        return os.stat(remotepath)
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def posix_rename(self, src, dest):
+        os.rename(src, dest)
+
+    def rename(self, src, dest):
+        os.rename(src, dest)
+
+    def remove(self, path):
+        os.remove(path)
+
+    def utime(self, path, times):
+        os.utime(path, times)
+
+    def close(self):
+        self.closed = True
+
+
+class LocalSSHClient(object):
+    """Stand in for paramiko.SSHClient that hands out
+       `LocalSFTPClient` objects
+    """
+    def __init__(self):
+        self.sftp_clients = []
+
+    def open_sftp(self):
+        client = LocalSFTPClient()
+        self.sftp_clients.append(client)
+        return client
+
+    def close(self):
+        pass
 
 
 class TestTransfer(unittest.TestCase):
@@ -62,6 +132,18 @@ U+27XptJXHsIBqoIbIbx+/TVejFlv8Lp46SdtvgKPXY2pZhtn+3icQ==
     def tearDown(self):
         pass
 
+    def test_transfer_result(self):
+        res = TransferResult(None, 1.5, 10)
+        self.assertEqual(res, (None, 1.5, 10))
+        self.assertEqual(res.duration, 1.5)
+        self.assertEqual(res.bytes_transferred, 10)
+        self.assertEqual(res.is_success(), True)
+        self.assertEqual(res.is_skipped(), False)
+        res = TransferResult(Transfer.SKIPPED, 0, 0)
+        self.assertEqual(res.is_success(), True)
+        self.assertEqual(res.is_skipped(), True)
+        self.assertFalse(hasattr(res, '__dict__'))
+
     def test_transfer_base_class(self):
         t = Transfer()
         t.connect()
@@ -70,6 +152,27 @@ U+27XptJXHsIBqoIbIbx+/TVejFlv8Lp46SdtvgKPXY2pZhtn+3icQ==
         self.assertEqual(msg, 'Not implemented')
         self.assertEqual(duration, -1)
         self.assertEqual(bytes_transferred, -1)
+        self.assertEqual(t.get_checksum_algorithm(), None)
+        self.assertEqual(t.get_last_checksum(), None)
+        res = t.transfer_file('foo')
+        self.assertTrue(isinstance(res, TransferResult))
+        self.assertEqual(res.status, 'Not implemented')
+        self.assertEqual(res.is_success(), False)
+        self.assertEqual(t.get_compression(), None)
+        self.assertEqual(t.get_last_raw_bytes(), None)
+        self.assertEqual(t.get_last_remote_path(), None)
+        self.assertEqual(t.get_last_exception(), None)
+
+    def test_sshcommandtransfer_base_class(self):
+        t = SshCommandTransfer('host', '/dest')
+        self.assertEqual(t.get_command(), None)
+        with mock.patch('subprocess.Popen') as mock_popen:
+            res = t.transfer_file('/foo/file')
+            self.assertEqual(mock_popen.call_count, 0)
+        self.assertEqual(res, ('Not implemented', -1, -1))
+        self.assertEqual(res.is_success(), False)
+        self.assertEqual(t.get_last_remote_path(), None)
+        self.assertEqual(t.get_last_returncode(), None)
 
     def test_sftptransferfromconfigfactory_get_sftptransfer(self):
         # no config
@@ -151,6 +254,114 @@ U+27XptJXHsIBqoIbIbx+/TVejFlv8Lp46SdtvgKPXY2pZhtn+3icQ==
         finally:
             shutil.rmtree(temp_dir)
 
+    def _write_ed25519_key(self, path):
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import ed25519
+        key = ed25519.Ed25519PrivateKey.generate()
+        with open(path, 'wb') as f:
+            f.write(key.private_bytes(serialization.Encoding.PEM,
+                                      serialization.PrivateFormat.OpenSSH,
+                                      serialization.NoEncryption()))
+
+    def test_load_private_key(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            clear_private_key_cache()
+            rsafile = os.path.join(temp_dir, 'rsa')
+            with open(rsafile, 'w') as f:
+                f.write(self._get_dummy_private_key())
+            ecdsafile = os.path.join(temp_dir, 'ecdsa')
+            paramiko.ECDSAKey.generate().write_private_key_file(ecdsafile)
+            edfile = os.path.join(temp_dir, 'ed25519')
+            self._write_ed25519_key(edfile)
+            encfile = os.path.join(temp_dir, 'enc')
+            paramiko.ECDSAKey.generate().write_private_key_file(
+                encfile, password='secret')
+
+            self.assertEqual(load_private_key(rsafile).get_name(),
+                             'ssh-rsa')
+            self.assertEqual(load_private_key(ecdsafile).get_name(),
+                             'ecdsa-sha2-nistp256')
+            self.assertEqual(load_private_key(edfile).get_name(),
+                             'ssh-ed25519')
+            self.assertEqual(load_private_key(encfile,
+                                              passphrase='secret').
+                             get_name(), 'ecdsa-sha2-nistp256')
+            try:
+                load_private_key(encfile)
+                self.fail('Expected PasswordRequiredException')
+            except paramiko.PasswordRequiredException:
+                pass
+
+            # second load comes from cache
+            first = load_private_key(edfile)
+            self.assertTrue(load_private_key(edfile) is first)
+
+            # new modification time reloads key
+            os.utime(edfile, (1000, 1000))
+            self.assertFalse(load_private_key(edfile) is first)
+
+            clear_private_key_cache()
+            with mock.patch('paramiko.RSAKey.from_private_key_file') as m:
+                load_private_key(rsafile)
+                load_private_key(rsafile)
+                self.assertEqual(m.call_count, 1)
+
+            badfile = os.path.join(temp_dir, 'bad')
+            with open(badfile, 'w') as f:
+                f.write('not a key')
+            try:
+                load_private_key(badfile)
+                self.fail('Expected SSHException')
+            except paramiko.SSHException as e:
+                self.assertTrue('Unable to load private key' in str(e))
+
+            self.assertRaises(EnvironmentError, load_private_key,
+                              os.path.join(temp_dir, 'nope'))
+
+            t = SftpTransfer('127', '/foo', privatekeyfile=edfile)
+            self.assertEqual(t.get_private_key().get_name(), 'ssh-ed25519')
+        finally:
+            clear_private_key_cache()
+            shutil.rmtree(temp_dir)
+
+    def test_connect_reuses_active_connection(self):
+        transport = Mock()
+        transport.is_active = Mock(return_value=True)
+        client = Mock()
+        client.get_transport = Mock(return_value=transport)
+        t = SftpTransfer('foo.com', '/foo', username='bob')
+        self.assertEqual(t.get_allow_agent(), True)
+        self.assertEqual(t.is_connected(), False)
+        with mock.patch('paramiko.SSHClient',
+                        Mock(return_value=client)) as sshclient:
+            t.connect()
+            self.assertEqual(t.is_connected(), True)
+            t.connect()
+            self.assertEqual(sshclient.call_count, 1)
+            client.connect.assert_called_with(hostname='foo.com',
+                                              username='bob', pkey=None,
+                                              port=22, passphrase=None,
+                                              timeout=60,
+                                              allow_agent=True)
+
+            # dead connection is closed and replaced
+            transport.is_active = Mock(return_value=False)
+            t.connect()
+            self.assertEqual(sshclient.call_count, 2)
+            self.assertEqual(client.close.call_count, 1)
+
+        t = SftpTransfer('foo.com', '/foo', allow_agent=False)
+        self.assertEqual(t.get_allow_agent(), False)
+        with mock.patch('paramiko.SSHClient', Mock(return_value=client)):
+            t.connect()
+            self.assertEqual(client.connect.call_args[1]['allow_agent'],
+                             False)
+
+        # objects without get_transport are never connected
+        t._ssh = 'foo'
+        self.assertEqual(t.is_connected(), False)
+
     def test_connect_invalid_connection(self):
         sftp = SftpTransfer('127.0.0.1', '/foo', port=80)
         try:
@@ -238,6 +449,1075 @@ U+27XptJXHsIBqoIbIbx+/TVejFlv8Lp46SdtvgKPXY2pZhtn+3icQ==
         self.assertEqual(b_trans, 1500)
         t.disconnect()
 
+    def test_sftptransferfromconfigfactory_large_file_options(self):
+        con = configparser.ConfigParser()
+        con.add_section(SftpTransferFromConfigFactory.SECTION)
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.HOST, 'somehost')
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.DEST_DIR, '/foo')
+        fac = SftpTransferFromConfigFactory(con)
+        sftp, errmsg = fac.get_sftptransfer()
+        self.assertEqual(sftp.get_chunk_size(),
+                         SftpTransfer.DEFAULT_CHUNK_SIZE)
+        self.assertEqual(sftp.get_parallel_streams(),
+                         SftpTransfer.DEFAULT_PARALLEL_STREAMS)
+        self.assertEqual(sftp.get_large_file_threshold(),
+                         SftpTransfer.DEFAULT_LARGE_FILE_THRESHOLD)
+
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.CHUNK_SIZE, '1024')
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.PARALLEL_STREAMS, '4')
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.LARGE_FILE_THRESHOLD, '2048')
+        sftp, errmsg = fac.get_sftptransfer()
+        self.assertEqual(errmsg, None)
+        self.assertEqual(sftp.get_chunk_size(), 1024)
+        self.assertEqual(sftp.get_parallel_streams(), 4)
+        self.assertEqual(sftp.get_large_file_threshold(), 2048)
+
+    def test_transfer_large_file_in_ranges(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            srcfile = os.path.join(temp_dir, 'src.dm4')
+            data = os.urandom(10000)
+            with open(srcfile, 'wb') as f:
+                f.write(data)
+            destdir = os.path.join(temp_dir, 'dest')
+            os.makedirs(destdir)
+            t = SftpTransfer('127', destdir, chunk_size=999,
+                             parallel_streams=3,
+                             large_file_threshold=5000)
+            ssh = LocalSSHClient()
+            t.set_alternate_connection(ssh)
+            t.connect()
+            msg, dur, b_trans = t.transfer_file(srcfile)
+            t.disconnect()
+            self.assertEqual(msg, None)
+            self.assertEqual(b_trans, 10000)
+            destfile = os.path.join(destdir, 'src.dm4')
+            with open(destfile, 'rb') as f:
+                self.assertEqual(f.read(), data)
+            self.assertFalse(os.path.isfile(destfile +
+                                            SftpTransfer.TMP_SUFFIX))
+            # one channel for transfer_file and at most one per stream
+            self.assertTrue(len(ssh.sftp_clients) <= 4)
+            for client in ssh.sftp_clients:
+                self.assertTrue(client.closed)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_transfer_file_below_threshold_uses_put(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            srcfile = os.path.join(temp_dir, 'src.dm4')
+            with open(srcfile, 'wb') as f:
+                f.write(b'hello')
+            t = SftpTransfer('127', '/remotedir', parallel_streams=3,
+                             large_file_threshold=5000)
+            t._sftp = Parameters()
+            mockstat = Parameters()
+            mockstat.st_size = 5
+            t._sftp.put = Mock(return_value=mockstat)
+            msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertEqual(msg, None)
+            self.assertEqual(b_trans, 5)
+            t._sftp.put.assert_called_with(srcfile, '/remotedir/src.dm4',
+                                           callback=None, confirm=True)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_transfer_large_file_range_write_fails(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            srcfile = os.path.join(temp_dir, 'src.dm4')
+            with open(srcfile, 'wb') as f:
+                f.write(os.urandom(5000))
+            destdir = os.path.join(temp_dir, 'dest')
+            os.makedirs(destdir)
+            t = SftpTransfer('127', destdir, chunk_size=100,
+                             parallel_streams=2,
+                             large_file_threshold=10)
+            ssh = LocalSSHClient()
+            t.set_alternate_connection(ssh)
+            t.connect()
+            t._sftp = LocalSFTPClient()
+            ssh.open_sftp = Mock(side_effect=IOError('no channel'))
+            msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertTrue('no channel' in msg)
+            self.assertEqual(b_trans, 0)
+            self.assertTrue(isinstance(t.get_last_exception(), IOError))
+            self.assertFalse(os.path.isfile(os.path.join(destdir,
+                                                         'src.dm4')))
+            self.assertEqual(os.listdir(destdir), [])
+
+            # failure to remove temporary file is only logged
+            t._sftp.remove = Mock(side_effect=IOError('gone'))
+            msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertTrue('no channel' in msg)
+            t._sftp.remove.assert_called_once_with(
+                os.path.join(destdir, 'src.dm4') + SftpTransfer.TMP_SUFFIX)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_sftptransferfromconfigfactory_resume_options(self):
+        con = configparser.ConfigParser()
+        con.add_section(SftpTransferFromConfigFactory.SECTION)
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.HOST, 'somehost')
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.DEST_DIR, '/foo')
+        fac = SftpTransferFromConfigFactory(con)
+        sftp, errmsg = fac.get_sftptransfer()
+        self.assertEqual(sftp.get_resume(), False)
+        self.assertEqual(sftp.get_resume_verify_bytes(),
+                         SftpTransfer.DEFAULT_RESUME_VERIFY_BYTES)
+
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.RESUME, 'true')
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.RESUME_VERIFY_BYTES, '10')
+        sftp, errmsg = fac.get_sftptransfer()
+        self.assertEqual(sftp.get_resume(), True)
+        self.assertEqual(sftp.get_resume_verify_bytes(), 10)
+
+    def _get_resumable_transfer(self, temp_dir, data):
+        srcfile = os.path.join(temp_dir, 'src.dm4')
+        with open(srcfile, 'wb') as f:
+            f.write(data)
+        destdir = os.path.join(temp_dir, 'dest')
+        os.makedirs(destdir)
+        t = SftpTransfer('127', destdir, resume=True,
+                         resume_verify_bytes=100)
+        t.set_alternate_connection(LocalSSHClient())
+        t.connect()
+        return t, srcfile, os.path.join(destdir, 'src.dm4')
+
+    def test_transfer_resumable_no_partial_file(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            data = os.urandom(100000)
+            t, srcfile, destfile = self._get_resumable_transfer(temp_dir,
+                                                                data)
+            msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertEqual(msg, None)
+            self.assertEqual(b_trans, 100000)
+            with open(destfile, 'rb') as f:
+                self.assertEqual(f.read(), data)
+            self.assertFalse(os.path.isfile(destfile +
+                                            SftpTransfer.PARTIAL_SUFFIX))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_transfer_resumable_with_partial_file(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            data = os.urandom(100000)
+            t, srcfile, destfile = self._get_resumable_transfer(temp_dir,
+                                                                data)
+            with open(destfile + SftpTransfer.PARTIAL_SUFFIX, 'wb') as f:
+                f.write(data[0:60000])
+            msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertEqual(msg, None)
+            self.assertEqual(b_trans, 40000)
+            with open(destfile, 'rb') as f:
+                self.assertEqual(f.read(), data)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_transfer_resumable_ignored_in_large_file_mode(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            srcfile = os.path.join(temp_dir, 'src.dm4')
+            data = os.urandom(10000)
+            with open(srcfile, 'wb') as f:
+                f.write(data)
+            destdir = os.path.join(temp_dir, 'dest')
+            os.makedirs(destdir)
+            destfile = os.path.join(destdir, 'src.dm4')
+            with open(destfile + SftpTransfer.PARTIAL_SUFFIX, 'wb') as f:
+                f.write(data[0:6000])
+            t = SftpTransfer('127', destdir, chunk_size=999,
+                             parallel_streams=3,
+                             large_file_threshold=5000, resume=True)
+            t.set_alternate_connection(LocalSSHClient())
+            t.connect()
+            msg, dur, b_trans = t.transfer_file(srcfile)
+            t.disconnect()
+            self.assertEqual(msg, None)
+            self.assertEqual(b_trans, 10000)
+            with open(destfile, 'rb') as f:
+                self.assertEqual(f.read(), data)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_transfer_resumable_partial_file_mismatch(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            data = os.urandom(100000)
+            t, srcfile, destfile = self._get_resumable_transfer(temp_dir,
+                                                                data)
+            with open(destfile + SftpTransfer.PARTIAL_SUFFIX, 'wb') as f:
+                f.write(data[0:59000] + b'x' * 1000)
+            msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertEqual(msg, None)
+            self.assertEqual(b_trans, 100000)
+            with open(destfile, 'rb') as f:
+                self.assertEqual(f.read(), data)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_transfer_resumable_partial_file_too_large(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            data = os.urandom(1000)
+            t, srcfile, destfile = self._get_resumable_transfer(temp_dir,
+                                                                data)
+            with open(destfile + SftpTransfer.PARTIAL_SUFFIX, 'wb') as f:
+                f.write(data + data)
+            msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertEqual(msg, None)
+            self.assertEqual(b_trans, 1000)
+            with open(destfile, 'rb') as f:
+                self.assertEqual(f.read(), data)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_sftptransferfromconfigfactory_tunable_options(self):
+        con = configparser.ConfigParser()
+        con.add_section(SftpTransferFromConfigFactory.SECTION)
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.HOST, 'somehost')
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.DEST_DIR, '/foo')
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.WINDOW_SIZE, '1000')
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.MAX_PACKET_SIZE, '2000')
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.BUFFER_SIZE, '3000')
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.PIPELINED, 'no')
+        fac = SftpTransferFromConfigFactory(con)
+        sftp, errmsg = fac.get_sftptransfer()
+        self.assertEqual(errmsg, None)
+        self.assertEqual(sftp.get_window_size(), 1000)
+        self.assertEqual(sftp.get_max_packet_size(), 2000)
+        self.assertEqual(sftp.get_buffer_size(), 3000)
+        self.assertEqual(sftp.get_pipelined(), False)
+
+    def test_open_sftp_with_window_size(self):
+        t = SftpTransfer('127', '/foo', window_size=1000,
+                         max_packet_size=2000)
+        t._ssh = Parameters()
+        t._ssh.get_transport = Mock(return_value='transport')
+        with mock.patch('paramiko.SFTPClient.from_transport',
+                        return_value='sftp') as m:
+            self.assertEqual(t._open_sftp(), 'sftp')
+            m.assert_called_with('transport', window_size=1000,
+                                 max_packet_size=2000)
+
+    def test_transfer_buffered(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            srcfile = os.path.join(temp_dir, 'src.dm4')
+            data = os.urandom(10000)
+            with open(srcfile, 'wb') as f:
+                f.write(data)
+            destdir = os.path.join(temp_dir, 'dest')
+            os.makedirs(destdir)
+            t = SftpTransfer('127', destdir, buffer_size=999,
+                             pipelined=True)
+            t.set_alternate_connection(LocalSSHClient())
+            t.connect()
+            msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertEqual(msg, None)
+            self.assertEqual(b_trans, 10000)
+            with open(os.path.join(destdir, 'src.dm4'), 'rb') as f:
+                self.assertEqual(f.read(), data)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_compute_checksum(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            srcfile = os.path.join(temp_dir, 'src.dm4')
+            with open(srcfile, 'wb') as f:
+                f.write(b'hello')
+            self.assertEqual(compute_checksum(srcfile),
+                             '2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7'
+                             '425e73043362938b9824')
+            self.assertEqual(compute_checksum(srcfile, algorithm='md5',
+                                              buffer_size=2),
+                             '5d41402abc4b2a76b9719d911017c592')
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_sftptransferfromconfigfactory_skip_options(self):
+        con = configparser.ConfigParser()
+        con.add_section(SftpTransferFromConfigFactory.SECTION)
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.HOST, 'somehost')
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.DEST_DIR, '/foo')
+        fac = SftpTransferFromConfigFactory(con)
+        sftp, errmsg = fac.get_sftptransfer()
+        self.assertEqual(sftp.get_skip_if_identical(), False)
+        self.assertEqual(sftp.get_compare_checksum(), False)
+        self.assertEqual(sftp.get_checksum_command(),
+                         SftpTransfer.DEFAULT_CHECKSUM_COMMAND)
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.SKIP_IF_IDENTICAL, 'true')
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.COMPARE_CHECKSUM, 'true')
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.CHECKSUM_COMMAND,
+                'shasum -a 256')
+        sftp, errmsg = fac.get_sftptransfer()
+        self.assertEqual(sftp.get_skip_if_identical(), True)
+        self.assertEqual(sftp.get_compare_checksum(), True)
+        self.assertEqual(sftp.get_checksum_command(), 'shasum -a 256')
+
+    def _get_skip_transfer(self, temp_dir, compare_checksum=False):
+        srcfile = os.path.join(temp_dir, 'src.dm4')
+        with open(srcfile, 'wb') as f:
+            f.write(b'somedata')
+        destdir = os.path.join(temp_dir, 'dest')
+        os.makedirs(destdir)
+        t = SftpTransfer('127', destdir, skip_if_identical=True,
+                         compare_checksum=compare_checksum)
+        t.set_alternate_connection(LocalSSHClient())
+        t.connect()
+        return t, srcfile, os.path.join(destdir, 'src.dm4')
+
+    def _get_mock_exec_output(self, output, exit_code=0):
+        stdout = Parameters()
+        stdout.read = Mock(return_value=output)
+        stdout.channel = Parameters()
+        stdout.channel.recv_exit_status = Mock(return_value=exit_code)
+        return Mock(return_value=(Mock(), stdout, Mock()))
+
+    def test_transfer_skip_if_identical(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            t, srcfile, destfile = self._get_skip_transfer(temp_dir)
+            # first transfer sends file and sets remote mtime
+            os.utime(srcfile, (1000, 2000))
+            msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertEqual(msg, None)
+            self.assertEqual(b_trans, 8)
+            self.assertEqual(int(os.stat(destfile).st_mtime), 2000)
+
+            msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertEqual(msg, Transfer.SKIPPED)
+            self.assertEqual(b_trans, 0)
+
+            # change in modification time causes upload
+            os.utime(srcfile, (1000, 3000))
+            msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertEqual(msg, None)
+            self.assertEqual(b_trans, 8)
+
+            # change in size causes upload
+            with open(destfile, 'wb') as f:
+                f.write(b'x')
+            os.utime(destfile, (1000, 3000))
+            msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertEqual(msg, None)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_transfer_skip_if_identical_stat_raises(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            t, srcfile, destfile = self._get_skip_transfer(temp_dir)
+            err = paramiko.SSHException('Socket is closed')
+            with mock.patch.object(LocalSFTPClient, 'stat',
+                                   side_effect=err) as stat:
+                msg, dur, b_trans = t.transfer_file(srcfile)
+            # comparison failure is treated as not identical
+            self.assertTrue(stat.call_count >= 1)
+            self.assertEqual(msg, None)
+            self.assertEqual(b_trans, 8)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_transfer_skip_if_identical_compare_checksum(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            t, srcfile, destfile = self._get_skip_transfer(
+                temp_dir, compare_checksum=True)
+            shutil.copyfile(srcfile, destfile)
+            os.utime(srcfile, (1000, 2000))
+            os.utime(destfile, (1000, 2000))
+            checksum = compute_checksum(srcfile)
+            t._ssh.exec_command = self._get_mock_exec_output(
+                (checksum + '  ' + destfile + '\n').encode('utf-8'))
+            msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertEqual(msg, Transfer.SKIPPED)
+            t._ssh.exec_command.assert_called_with('sha256sum ' + destfile)
+
+            t._ssh.exec_command = self._get_mock_exec_output(b'abc  x\n')
+            msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertEqual(msg, None)
+            self.assertEqual(b_trans, 8)
+
+            t._ssh.exec_command = self._get_mock_exec_output(b'', 1)
+            msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertEqual(msg, None)
+
+            t._ssh.exec_command = Mock(side_effect=IOError('x'))
+            msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertEqual(msg, None)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_new_hash(self):
+        self.assertEqual(new_hash('md5').hexdigest(),
+                         'd41d8cd98f00b204e9800998ecf8427e')
+        try:
+            new_hash('xxhnotreal')
+            self.fail('Expected ValueError')
+        except ValueError:
+            pass
+        try:
+            new_hash('notreal')
+            self.fail('Expected ValueError')
+        except ValueError:
+            pass
+
+    def test_sftptransfer_invalid_checksum_algorithm(self):
+        try:
+            SftpTransfer('127', '/foo', checksum_algorithm='notreal')
+            self.fail('Expected ValueError')
+        except ValueError:
+            pass
+
+    def test_sftptransferfromconfigfactory_checksum_algorithm(self):
+        con = configparser.ConfigParser()
+        con.add_section(SftpTransferFromConfigFactory.SECTION)
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.HOST, 'somehost')
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.DEST_DIR, '/foo')
+        fac = SftpTransferFromConfigFactory(con)
+        sftp, errmsg = fac.get_sftptransfer()
+        self.assertEqual(sftp.get_checksum_algorithm(), None)
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.CHECKSUM_ALGORITHM, 'md5')
+        sftp, errmsg = fac.get_sftptransfer()
+        self.assertEqual(sftp.get_checksum_algorithm(), 'md5')
+
+    def test_transfer_computes_checksum_in_each_mode(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            srcfile = os.path.join(temp_dir, 'src.dm4')
+            data = os.urandom(10000)
+            with open(srcfile, 'wb') as f:
+                f.write(data)
+            expected = compute_checksum(srcfile)
+            destdir = os.path.join(temp_dir, 'dest')
+            os.makedirs(destdir)
+            destfile = os.path.join(destdir, 'src.dm4')
+            for kwargs in [{},
+                           {'parallel_streams': 2, 'chunk_size': 1000,
+                            'large_file_threshold': 0},
+                           {'resume': True}]:
+                t = SftpTransfer('127', destdir,
+                                 checksum_algorithm='sha256', **kwargs)
+                t.set_alternate_connection(LocalSSHClient())
+                t.connect()
+                msg, dur, b_trans = t.transfer_file(srcfile)
+                self.assertEqual(msg, None)
+                self.assertEqual(t.get_last_checksum(), expected)
+                with open(destfile, 'rb') as f:
+                    self.assertEqual(f.read(), data)
+
+            # resume from partial file still yields checksum of whole file
+            os.remove(destfile)
+            with open(destfile + SftpTransfer.PARTIAL_SUFFIX, 'wb') as f:
+                f.write(data[0:7000])
+            t = SftpTransfer('127', destdir, checksum_algorithm='sha256',
+                             resume=True, buffer_size=999)
+            t.set_alternate_connection(LocalSSHClient())
+            t.connect()
+            msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertEqual(msg, None)
+            self.assertEqual(b_trans, 3000)
+            self.assertEqual(t.get_last_checksum(), expected)
+
+            # failed transfer resets checksum
+            msg, dur, b_trans = t.transfer_file(os.path.join(temp_dir,
+                                                             'nope'))
+            self.assertTrue(msg is not None)
+            self.assertEqual(t.get_last_checksum(), None)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_new_compressor(self):
+        c = new_compressor('gzip', level=1)
+        data = c.compress(b'hello' * 100) + c.flush()
+        self.assertEqual(gzip.GzipFile(fileobj=io.BytesIO(data)).read(),
+                         b'hello' * 100)
+        try:
+            new_compressor('foo')
+            self.fail('Expected ValueError')
+        except ValueError:
+            pass
+
+    def test_sftptransferfromconfigfactory_compression_options(self):
+        con = configparser.ConfigParser()
+        con.add_section(SftpTransferFromConfigFactory.SECTION)
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.HOST, 'somehost')
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.DEST_DIR, '/foo')
+        fac = SftpTransferFromConfigFactory(con)
+        sftp, errmsg = fac.get_sftptransfer()
+        self.assertEqual(sftp.get_compression(), None)
+        self.assertEqual(sftp.get_compression_level(), None)
+        self.assertEqual(sftp.get_compression_threads(), None)
+
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.COMPRESSION, 'gzip')
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.COMPRESSION_LEVEL, '9')
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.COMPRESSION_THREADS, '2')
+        sftp, errmsg = fac.get_sftptransfer()
+        self.assertEqual(errmsg, None)
+        self.assertEqual(sftp.get_compression(), 'gzip')
+        self.assertEqual(sftp.get_compression_level(), 9)
+        self.assertEqual(sftp.get_compression_threads(), 2)
+
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.COMPRESSION, 'bogus')
+        sftp, errmsg = fac.get_sftptransfer()
+        self.assertEqual(sftp, None)
+        self.assertEqual(errmsg, 'Unsupported compression: bogus')
+
+    def test_transfer_with_gzip_compression(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            srcfile = os.path.join(temp_dir, 'src.mrc')
+            data = b'0123456789' * 50000
+            with open(srcfile, 'wb') as f:
+                f.write(data)
+            destdir = os.path.join(temp_dir, 'dest')
+            os.makedirs(destdir)
+            destfile = os.path.join(destdir, 'src.mrc.gz')
+            for kwargs in [{}, {'resume': True},
+                           {'parallel_streams': 2, 'chunk_size': 1000,
+                            'large_file_threshold': 0}]:
+                t = SftpTransfer('127', destdir, compression='gzip',
+                                 checksum_algorithm='md5', **kwargs)
+                t.set_alternate_connection(LocalSSHClient())
+                t.connect()
+                msg, dur, b_trans = t.transfer_file(srcfile)
+                self.assertEqual(msg, None)
+                self.assertEqual(t.get_last_remote_path(), destfile)
+                self.assertEqual(t.get_last_raw_bytes(), len(data))
+                self.assertEqual(b_trans, os.path.getsize(destfile))
+                self.assertTrue(b_trans < len(data))
+                self.assertEqual(t.get_last_checksum(),
+                                 compute_checksum(srcfile, algorithm='md5'))
+                with gzip.open(destfile, 'rb') as f:
+                    self.assertEqual(f.read(), data)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_sftptransferfromconfigfactory_rate_limit_options(self):
+        con = configparser.ConfigParser()
+        con.add_section(SftpTransferFromConfigFactory.SECTION)
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.HOST, 'somehost')
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.DEST_DIR, '/foo')
+        fac = SftpTransferFromConfigFactory(con)
+        sftp, errmsg = fac.get_sftptransfer()
+        self.assertEqual(sftp.get_rate_limiter(), None)
+        self.assertEqual(sftp.get_allow_agent(), True)
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.ALLOW_AGENT, 'false')
+        sftp, errmsg = fac.get_sftptransfer()
+        self.assertEqual(sftp.get_allow_agent(), False)
+
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.RATE_LIMIT, '0')
+        sftp, errmsg = fac.get_sftptransfer()
+        self.assertEqual(sftp.get_rate_limiter(), None)
+
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.RATE_LIMIT, '10M')
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.RATE_LIMIT_SCHEDULE,
+                '08:00-18:00=1M,18:00-08:00=0')
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.RATE_LIMIT_BURST, '64K')
+        sftp, errmsg = fac.get_sftptransfer()
+        self.assertEqual(errmsg, None)
+        limiter = sftp.get_rate_limiter()
+        self.assertEqual(limiter.get_rate(), 10485760)
+        self.assertEqual(limiter.get_schedule(),
+                         [(480, 1080, 1048576), (1080, 480, 0)])
+
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.RATE_LIMIT_SCHEDULE,
+                'daytime=1M')
+        sftp, errmsg = fac.get_sftptransfer()
+        self.assertEqual(sftp, None)
+        self.assertTrue(errmsg.startswith('Invalid schedule entry'))
+
+        con.set(SftpTransferFromConfigFactory.SECTION,
+                SftpTransferFromConfigFactory.RATE_LIMIT, 'fast')
+        sftp, errmsg = fac.get_sftptransfer()
+        self.assertEqual(sftp, None)
+        self.assertEqual(errmsg, 'Invalid rate: fast')
+
+    def test_transfer_with_rate_limit(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            srcfile = os.path.join(temp_dir, 'src.mrc')
+            data = os.urandom(50000)
+            with open(srcfile, 'wb') as f:
+                f.write(data)
+            destdir = os.path.join(temp_dir, 'dest')
+            os.makedirs(destdir)
+            destfile = os.path.join(destdir, 'src.mrc')
+            for kwargs in [{}, {'resume': True},
+                           {'parallel_streams': 3, 'chunk_size': 1000,
+                            'large_file_threshold': 0}]:
+                t = SftpTransfer('127', destdir, rate_limit=1000,
+                                 buffer_size=1000, **kwargs)
+                limiter = Mock()
+                t._rate_limiter = limiter
+                t.set_alternate_connection(LocalSSHClient())
+                t.connect()
+                msg, dur, b_trans = t.transfer_file(srcfile)
+                self.assertEqual(msg, None)
+                self.assertEqual(b_trans, len(data))
+                self.assertEqual(limiter.consume.call_count, 50)
+                limiter.consume.assert_called_with(1000)
+                with open(destfile, 'rb') as f:
+                    self.assertEqual(f.read(), data)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_transfer_with_progress_callback(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            srcfile = os.path.join(temp_dir, 'src.mrc')
+            data = os.urandom(5000)
+            with open(srcfile, 'wb') as f:
+                f.write(data)
+            destdir = os.path.join(temp_dir, 'dest')
+            os.makedirs(destdir)
+            for kwargs in [{}, {'buffer_size': 1000}, {'resume': True},
+                           {'parallel_streams': 2, 'chunk_size': 1000,
+                            'large_file_threshold': 0}]:
+                updates = []
+                t = SftpTransfer('127', destdir, **kwargs)
+                self.assertEqual(t.get_progress_callback(), None)
+                t.set_progress_callback(updates.append)
+                t.set_alternate_connection(LocalSSHClient())
+                t.connect()
+                msg, dur, b_trans = t.transfer_file(srcfile)
+                self.assertEqual(msg, None)
+                self.assertTrue(isinstance(dur, float))
+                self.assertEqual(b_trans, 5000)
+                progress = updates[-1]
+                self.assertEqual(progress.is_done(), True)
+                self.assertEqual(progress.get_filepath(), srcfile)
+                self.assertEqual(progress.get_total_bytes(), 5000)
+                self.assertEqual(progress.get_bytes_sent(), 5000)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_transfer_progress_with_compression(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            srcfile = os.path.join(temp_dir, 'src.mrc')
+            with open(srcfile, 'wb') as f:
+                f.write(b'a' * 5000)
+            updates = []
+            t = SftpTransfer('127', temp_dir, compression='gzip')
+            t.set_progress_callback(updates.append)
+            t.set_alternate_connection(LocalSSHClient())
+            t.connect()
+            msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertEqual(msg, None)
+            self.assertEqual(updates[-1].get_total_bytes(), None)
+            self.assertEqual(updates[-1].get_bytes_sent(), b_trans)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def _get_mock_popen(self, returncode=0, out=b'', err=b''):
+        proc = Mock()
+        proc.returncode = returncode
+        proc.communicate = Mock(return_value=(out, err))
+        return Mock(return_value=proc)
+
+    def test_rsynctransfer(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            srcfile = os.path.join(temp_dir, 'a.dm4')
+            with open(srcfile, 'wb') as f:
+                f.write(b'hello')
+            t = RsyncTransfer('foo.com', '/data', username='bob',
+                              port=2222, privatekeyfile='/key',
+                              connect_timeout=5,
+                              cipher='aes128-gcm@openssh.com')
+            self.assertEqual(t.get_host(), 'foo.com')
+            self.assertEqual(t.get_destination_directory(), '/data')
+            self.assertEqual(t.get_username(), 'bob')
+            self.assertEqual(t.get_port(), 2222)
+            self.assertEqual(t.get_private_key(), '/key')
+            self.assertEqual(t.get_connect_timeout(), 5)
+            self.assertEqual(t.get_cipher(), 'aes128-gcm@openssh.com')
+            self.assertEqual(t.get_command(), 'rsync')
+            t.connect()
+            out = (b'Number of files: 1\n'
+                   b'Total bytes sent: 1,234\n'
+                   b'Total bytes received: 35\n')
+            with mock.patch('subprocess.Popen',
+                            self._get_mock_popen(out=out)) as popen:
+                msg, dur, b_trans = t.transfer_file(srcfile)
+            t.disconnect()
+            self.assertEqual(msg, None)
+            self.assertEqual(b_trans, 1234)
+            self.assertEqual(t.get_last_remote_path(), '/data/a.dm4')
+            popen.assert_called_with(['rsync', '--times', '--partial',
+                                      '--stats', '--protect-args', '-e',
+                                      'ssh -o BatchMode=yes -o '
+                                      'ConnectTimeout=5 -p 2222 -i /key '
+                                      '-c aes128-gcm@openssh.com',
+                                      srcfile, 'bob@foo.com:/data/a.dm4'],
+                                     stdout=mock.ANY, stderr=mock.ANY)
+
+            # no stats in output
+            with mock.patch('subprocess.Popen', self._get_mock_popen()):
+                msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertEqual(msg, None)
+            self.assertEqual(b_trans, 5)
+
+            # remote path with space is protected by --protect-args
+            spacet = RsyncTransfer('foo.com', '/my data')
+            with mock.patch('subprocess.Popen',
+                            self._get_mock_popen()) as popen:
+                spacet.transfer_file(srcfile)
+            cmd = popen.call_args[0][0]
+            self.assertTrue('--protect-args' in cmd)
+            self.assertEqual(cmd[-1], 'foo.com:/my data/a.dm4')
+
+            # failure
+            with mock.patch('subprocess.Popen',
+                            self._get_mock_popen(returncode=12,
+                                                 err=b'broken pipe\n')):
+                msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertEqual(msg, 'rsync exited with code 12 : broken pipe')
+            self.assertEqual(b_trans, 0)
+            self.assertEqual(t.get_last_returncode(), 12)
+            self.assertEqual(t.get_last_exception().returncode, 12)
+            self.assertEqual(t.get_last_exception().retryable, True)
+
+            # error retrying will not fix such as permission denied
+            with mock.patch('subprocess.Popen',
+                            self._get_mock_popen(returncode=3,
+                                                 err=b'denied\n')):
+                msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertEqual(t.get_last_returncode(), 3)
+            self.assertEqual(t.get_last_exception().retryable, False)
+
+            # command not found
+            t = RsyncTransfer('foo.com', '/data',
+                              command=os.path.join(temp_dir, 'nope'))
+            msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertTrue(msg.startswith('Caught an exception: '))
+            self.assertTrue(isinstance(t.get_last_exception(), OSError))
+
+            t = RsyncTransfer('foo.com', None)
+            try:
+                t.transfer_file(srcfile)
+                self.fail('Expected InvalidDestinationDirError')
+            except InvalidDestinationDirError:
+                pass
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_scptransfer(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            srcfile = os.path.join(temp_dir, 'a.dm4')
+            with open(srcfile, 'wb') as f:
+                f.write(b'hello')
+            t = ScpTransfer('foo.com', '/data', command='/bin/scp')
+            self.assertEqual(t.get_port(), 22)
+            self.assertEqual(t.get_connect_timeout(), 60)
+            with mock.patch('subprocess.Popen',
+                            self._get_mock_popen()) as popen:
+                msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertEqual(msg, None)
+            self.assertEqual(b_trans, 5)
+            popen.assert_called_with(['/bin/scp', '-B', '-p', '-q',
+                                      '-o', 'BatchMode=yes',
+                                      '-o', 'ConnectTimeout=60',
+                                      '-P', '22', srcfile,
+                                      'foo.com:/data/a.dm4'],
+                                     stdout=mock.ANY, stderr=mock.ANY)
+            self.assertEqual(t.get_last_returncode(), 0)
+            self.assertEqual(t.get_last_exception(), None)
+
+            # scp exits with 1 for most errors, only ssh 255 is retried
+            with mock.patch('subprocess.Popen',
+                            self._get_mock_popen(returncode=1)):
+                t.transfer_file(srcfile)
+            self.assertEqual(t.get_last_exception().retryable, False)
+            with mock.patch('subprocess.Popen',
+                            self._get_mock_popen(returncode=255)):
+                t.transfer_file(srcfile)
+            self.assertEqual(t.get_last_exception().retryable, True)
+
+            # remote path with space is quoted for remote shell
+            t = ScpTransfer('foo.com', '/my data', command='/bin/scp')
+            with mock.patch('subprocess.Popen',
+                            self._get_mock_popen()) as popen:
+                t.transfer_file(srcfile)
+            self.assertEqual(popen.call_args[0][0][-1],
+                             "foo.com:'/my data/a.dm4'")
+            self.assertEqual(t.get_last_remote_path(), '/my data/a.dm4')
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_record_transfer(self):
+        reg = metrics.get_registry()
+        names = ['ncmirtools_transfers_total',
+                 'ncmirtools_transfers_skipped_total',
+                 'ncmirtools_transfer_failures_total',
+                 'ncmirtools_transfer_bytes_total']
+        before = [reg.get_metric(n).get_value() for n in names]
+        rate = reg.get_metric('ncmirtools_transfer_bytes_per_second')
+        rate_count = rate.get_count()
+
+        res = TransferResult(None, 2.0, 100)
+        self.assertTrue(transfer._record_transfer(res) is res)
+        transfer._record_transfer(TransferResult(None, 0, 10))
+        transfer._record_transfer(TransferResult(Transfer.SKIPPED, 1, 0))
+        transfer._record_transfer(TransferResult('error', 1, 5))
+
+        after = [reg.get_metric(n).get_value() for n in names]
+        self.assertEqual([a - b for a, b in zip(after, before)],
+                         [2, 1, 1, 110])
+        self.assertEqual(rate.get_count(), rate_count + 1)
+
+    def test_localcopytransfer(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            srcfile = os.path.join(temp_dir, 'a.dm4')
+            with open(srcfile, 'wb') as f:
+                f.write(b'hello')
+            os.utime(srcfile, (1000, 2000))
+            destdir = os.path.join(temp_dir, 'dest')
+            os.makedirs(destdir)
+            t = LocalCopyTransfer(destdir)
+            self.assertEqual(t.get_destination_directory(), destdir)
+            t.connect()
+            msg, dur, b_trans = t.transfer_file(srcfile)
+            t.disconnect()
+            self.assertEqual(msg, None)
+            self.assertEqual(b_trans, 5)
+            destfile = os.path.join(destdir, 'a.dm4')
+            self.assertEqual(t.get_last_remote_path(), destfile)
+            self.assertEqual(os.listdir(destdir), ['a.dm4'])
+            self.assertEqual(os.stat(destfile).st_mtime, 2000)
+
+            t = LocalCopyTransfer(os.path.join(temp_dir, 'doesnotexist'))
+            msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertTrue(msg.startswith('Caught an exception: '))
+            self.assertEqual(b_trans, 0)
+
+            t = LocalCopyTransfer(None)
+            try:
+                t.transfer_file(srcfile)
+                self.fail('Expected InvalidDestinationDirError')
+            except InvalidDestinationDirError:
+                pass
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_localcopytransfer_copy_methods(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            srcfile = os.path.join(temp_dir, 'a.dm4')
+            data = os.urandom(10000)
+            with open(srcfile, 'wb') as f:
+                f.write(data)
+            destdir = os.path.join(temp_dir, 'dest')
+            os.makedirs(destdir)
+            destfile = os.path.join(destdir, 'a.dm4')
+            t = LocalCopyTransfer(destdir)
+            self.assertEqual(t.get_chunk_size(),
+                             LocalCopyTransfer.DEFAULT_CHUNK_SIZE)
+            self.assertEqual(t.get_preallocate(), True)
+            self.assertEqual(t.get_fsync(), True)
+            self.assertEqual(t.get_last_copy_method(), None)
+            self.assertEqual(t._get_copy_methods()[-1],
+                             LocalCopyTransfer.READ_WRITE)
+
+            for method in [LocalCopyTransfer.COPY_FILE_RANGE,
+                           LocalCopyTransfer.SENDFILE,
+                           LocalCopyTransfer.READ_WRITE]:
+                if method not in t._get_copy_methods():
+                    continue
+                with open(destfile, 'wb') as f:
+                    f.write(b'old')
+                updates = []
+                t = LocalCopyTransfer(destdir, chunk_size=3000,
+                                      preallocate=False, fsync=False)
+                t.set_progress_callback(updates.append)
+                t._get_copy_methods = Mock(return_value=[method])
+                msg, dur, b_trans = t.transfer_file(srcfile)
+                self.assertEqual(msg, None)
+                self.assertEqual(b_trans, 10000)
+                self.assertEqual(t.get_last_copy_method(), method)
+                self.assertEqual(updates[-1].get_bytes_sent(), 10000)
+                self.assertEqual(updates[-1].is_done(), True)
+                with open(destfile, 'rb') as f:
+                    self.assertEqual(f.read(), data)
+                self.assertEqual(os.listdir(destdir), ['a.dm4'])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_localcopytransfer_fallback_and_errors(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            srcfile = os.path.join(temp_dir, 'a.dm4')
+            data = os.urandom(10000)
+            with open(srcfile, 'wb') as f:
+                f.write(data)
+            destdir = os.path.join(temp_dir, 'dest')
+            os.makedirs(destdir)
+            destfile = os.path.join(destdir, 'a.dm4')
+
+            # unsupported method falls back to next one
+            t = LocalCopyTransfer(destdir, chunk_size=4000)
+            t._get_copy_methods = Mock(return_value=[
+                LocalCopyTransfer.SENDFILE, LocalCopyTransfer.READ_WRITE])
+            with mock.patch('os.sendfile', create=True,
+                            side_effect=OSError(errno.EINVAL, 'no')):
+                msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertEqual(msg, None)
+            self.assertEqual(t.get_last_copy_method(),
+                             LocalCopyTransfer.READ_WRITE)
+            with open(destfile, 'rb') as f:
+                self.assertEqual(f.read(), data)
+
+            # other errors fail transfer and remove temp file
+            with mock.patch('os.sendfile', create=True,
+                            side_effect=OSError(errno.ENOSPC, 'full')):
+                msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertTrue('full' in msg)
+            self.assertEqual(t.get_last_exception().errno, errno.ENOSPC)
+            self.assertEqual(os.listdir(destdir), ['a.dm4'])
+
+            # preallocation failure is ignored
+            t = LocalCopyTransfer(destdir)
+            with mock.patch('os.posix_fallocate', create=True,
+                            side_effect=OSError(errno.EOPNOTSUPP, 'no')):
+                msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertEqual(msg, None)
+            self.assertEqual(b_trans, 10000)
+
+            # short copy is an error
+            t._copy_fd = Mock(return_value=5)
+            msg, dur, b_trans = t.transfer_file(srcfile)
+            self.assertTrue('Copied 5 bytes of ' in msg)
+            self.assertEqual(os.listdir(destdir), ['a.dm4'])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_transferfromconfigfactory(self):
+        fac = TransferFromConfigFactory(None)
+        t, errmsg = fac.get_transfer()
+        self.assertEqual(t, None)
+        self.assertTrue('No configuration' in errmsg)
+
+        con = configparser.ConfigParser()
+        con.add_section(TransferFromConfigFactory.SECTION)
+        fac = TransferFromConfigFactory(con)
+        t, errmsg = fac.get_transfer()
+        self.assertEqual(errmsg, 'No host option found in configuration.')
+
+        con.set(TransferFromConfigFactory.SECTION,
+                TransferFromConfigFactory.HOST, 'foo.com')
+        con.set(TransferFromConfigFactory.SECTION,
+                TransferFromConfigFactory.DEST_DIR, '/data')
+        t, errmsg = fac.get_transfer()
+        self.assertTrue(isinstance(t, SftpTransfer))
+
+        con.set(TransferFromConfigFactory.SECTION,
+                TransferFromConfigFactory.BACKEND, 'ftp')
+        t, errmsg = fac.get_transfer()
+        self.assertEqual(t, None)
+        self.assertEqual(errmsg, 'Unsupported backend: ftp must be one of '
+                                 'sftp, rsync, scp, local')
+
+        con.set(TransferFromConfigFactory.SECTION,
+                TransferFromConfigFactory.BACKEND, 'RSYNC')
+        con.set(TransferFromConfigFactory.SECTION,
+                TransferFromConfigFactory.USER, 'bob')
+        con.set(TransferFromConfigFactory.SECTION,
+                TransferFromConfigFactory.PORT, '2222')
+        con.set(TransferFromConfigFactory.SECTION,
+                TransferFromConfigFactory.KEY, '/key')
+        con.set(TransferFromConfigFactory.SECTION,
+                TransferFromConfigFactory.CON_TIMEOUT, '5')
+        con.set(TransferFromConfigFactory.SECTION,
+                TransferFromConfigFactory.SSH_CIPHER, 'aes128-ctr')
+        con.set(TransferFromConfigFactory.SECTION,
+                TransferFromConfigFactory.COMMAND, '/opt/rsync')
+        t, errmsg = fac.get_transfer()
+        self.assertEqual(errmsg, None)
+        self.assertTrue(isinstance(t, RsyncTransfer))
+        self.assertEqual(t.get_host(), 'foo.com')
+        self.assertEqual(t.get_destination_directory(), '/data')
+        self.assertEqual(t.get_username(), 'bob')
+        self.assertEqual(t.get_port(), 2222)
+        self.assertEqual(t.get_private_key(), '/key')
+        self.assertEqual(t.get_connect_timeout(), 5)
+        self.assertEqual(t.get_cipher(), 'aes128-ctr')
+        self.assertEqual(t.get_command(), '/opt/rsync')
+
+        con.set(TransferFromConfigFactory.SECTION,
+                TransferFromConfigFactory.BACKEND, 'scp')
+        t, errmsg = fac.get_transfer()
+        self.assertTrue(isinstance(t, ScpTransfer))
+
+        con.set(TransferFromConfigFactory.SECTION,
+                TransferFromConfigFactory.BACKEND, 'local')
+        con.remove_option(TransferFromConfigFactory.SECTION,
+                          TransferFromConfigFactory.HOST)
+        t, errmsg = fac.get_transfer()
+        self.assertTrue(isinstance(t, LocalCopyTransfer))
+        self.assertEqual(t.get_destination_directory(), '/data')
+        self.assertEqual(t.get_chunk_size(),
+                         LocalCopyTransfer.DEFAULT_CHUNK_SIZE)
+        con.set(TransferFromConfigFactory.SECTION,
+                TransferFromConfigFactory.CHUNK_SIZE, '1024')
+        t, errmsg = fac.get_transfer()
+        self.assertEqual(t.get_chunk_size(), 1024)
+
+        con.set(TransferFromConfigFactory.SECTION,
+                TransferFromConfigFactory.BACKEND, 'scp')
+        t, errmsg = fac.get_transfer()
+        self.assertEqual(errmsg, 'No host option found in configuration.')
+
+        con.remove_option(TransferFromConfigFactory.SECTION,
+                          TransferFromConfigFactory.DEST_DIR)
+        t, errmsg = fac.get_transfer()
+        self.assertEqual(errmsg, 'No destination_dir option found in '
+                                 'configuration.')
+
 
 if __name__ == '__main__':
     sys.exit(unittest.main())
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_asyncciluploader
+----------------------------------
+
+Tests for `asyncciluploader` module.
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+
+from mock import Mock
+
+from ncmirtools.ciluploader import CILUploader
+from ncmirtools.ciljobqueue import CILJobQueue
+from ncmirtools.kiosk.transfer import LocalCopyTransfer
+
+try:
+    import asyncio
+    from ncmirtools.asyncciluploader import AsyncCILUploader
+    from ncmirtools import asyncciluploader
+    from http.server import BaseHTTPRequestHandler
+    from http.server import HTTPServer
+except ImportError:  # pragma: no cover
+    asyncio = None
+    BaseHTTPRequestHandler = object
+
+
+class StubRESTHandler(BaseHTTPRequestHandler):
+    """Stand in for CIL REST service that registers any File_path
+       except those containing 'reject' and returns file name as ID
+    """
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        entry = json.loads(self.rfile.read(length).decode('utf-8'))
+        self.server.entries.append(entry)
+        if 'reject' in entry['File_path']:
+            self.send_response(500)
+            self.end_headers()
+            return
+        body = json.dumps({'success': True,
+                           'ID': os.path.basename(entry['File_path'])})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode('utf-8'))
+
+    def log_message(self, format, *args):
+        pass
+
+
+@unittest.skipIf(asyncio is None, 'requires python 3.5 or newer')
+class TestAsyncCILUploader(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self._dest_dir = os.path.join(self._temp_dir, 'dest')
+        os.makedirs(self._dest_dir)
+        self._server = HTTPServer(('127.0.0.1', 0), StubRESTHandler)
+        self._server.entries = []
+        self._server_thread = threading.Thread(target=self._server.
+                                               serve_forever)
+        self._server_thread.daemon = True
+        self._server_thread.start()
+        self._url = 'http://127.0.0.1:' + str(self._server.server_port)
+        self._loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self._loop.close()
+        self._server.shutdown()
+        self._server.server_close()
+        shutil.rmtree(self._temp_dir)
+
+    def _make_files(self, names):
+        paths = []
+        for name in names:
+            path = os.path.join(self._temp_dir, name)
+            with open(path, 'w') as f:
+                f.write(name)
+            paths.append(path)
+        return paths
+
+    def _get_uploader(self, transfer=None, job_queue=None):
+        if transfer is None:
+            transfer = LocalCopyTransfer(self._dest_dir)
+        return CILUploader(transfer, resturl=self._url, restuser='bob',
+                           restpassword='haha', job_queue=job_queue)
+
+    def test_constructor(self):
+        uploader = self._get_uploader()
+        aup = AsyncCILUploader(uploader)
+        self.assertEqual(aup.get_uploader(), uploader)
+        self.assertEqual(aup.get_concurrency(),
+                         AsyncCILUploader.DEFAULT_CONCURRENCY)
+        self.assertEqual(aup.is_using_aiohttp(),
+                         asyncciluploader.aiohttp is not None)
+        aup = AsyncCILUploader(uploader, concurrency=2, use_aiohttp=False)
+        self.assertEqual(aup.get_concurrency(), 2)
+        self.assertEqual(aup.is_using_aiohttp(), False)
+        if asyncciluploader.aiohttp is None:
+            self.assertRaises(ValueError, AsyncCILUploader, uploader,
+                              use_aiohttp=True)
+
+    def test_upload_and_register_many_invalid_params(self):
+        aup = AsyncCILUploader(CILUploader(None))
+        res = self._loop.run_until_complete(aup.upload_and_register_many(
+            ['/foo']))
+        self.assertEqual(res.get_success_status(), False)
+        self.assertEqual(res.get_results()[0][1].get_error_message(),
+                         'Transfer object was none, cannot complete '
+                         'transfer')
+        self._loop.run_until_complete(aup.close())
+
+    def test_upload_and_register_many_connect_fails(self):
+        transfer = LocalCopyTransfer(self._dest_dir)
+        transfer.connect = Mock(side_effect=IOError('no route'))
+        aup = AsyncCILUploader(self._get_uploader(transfer),
+                               use_aiohttp=False)
+        res = self._loop.run_until_complete(aup.upload_and_register_many(
+            ['/a', '/b']))
+        self.assertEqual(res.get_failure_count(), 2)
+        self.assertTrue('Unable to connect: ' in
+                        res.get_results()[0][1].get_error_message())
+        self.assertEqual(self._server.entries, [])
+        self._loop.run_until_complete(aup.close())
+
+    def test_upload_and_register_many(self):
+        paths = self._make_files(['a.txt', 'b.txt', 'reject.txt', 'c.txt'])
+        paths.append(os.path.join(self._temp_dir, 'missing.txt'))
+
+        async def run():
+            async with AsyncCILUploader(self._get_uploader(),
+                                        concurrency=2) as aup:
+                return await aup.upload_and_register_many(paths)
+
+        res = self._loop.run_until_complete(run())
+        self.assertEqual([p for p, r in res.get_results()], paths)
+        results = [r for p, r in res.get_results()]
+        self.assertEqual(results[0].get_id(), 'a.txt')
+        self.assertEqual(results[1].get_id(), 'b.txt')
+        self.assertEqual(results[2].get_success_status(), False)
+        self.assertEqual(results[2].get_error_message(),
+                         'REST returned error status code: 500')
+        self.assertEqual(results[3].get_id(), 'c.txt')
+        self.assertEqual(results[4].get_success_status(), False)
+        self.assertEqual(res.get_success_count(), 3)
+        self.assertEqual(len(self._server.entries), 4)
+        self.assertTrue(os.path.isfile(os.path.join(self._dest_dir,
+                                                    'c.txt')))
+        self.assertEqual(res.get_bytes_transferred(), 25)
+
+    def test_upload_and_register_many_job_queue_states(self):
+        paths = self._make_files(['a.txt', 'reject.txt'])
+        paths.append(os.path.join(self._temp_dir, 'missing.txt'))
+        jq = CILJobQueue(os.path.join(self._temp_dir, 'jobs.sqlite'))
+
+        async def run():
+            async with AsyncCILUploader(self._get_uploader(job_queue=jq),
+                                        use_aiohttp=False) as aup:
+                return await aup.upload_and_register_many(paths)
+
+        res = self._loop.run_until_complete(run())
+        self.assertEqual(res.get_success_count(), 1)
+        job = jq.get_job(paths[0])
+        self.assertEqual(job.get_state(), CILJobQueue.DONE)
+        self.assertEqual(job.get_id(), 'a.txt')
+        # registration failed so only registration is resumed
+        job = jq.get_job(paths[1])
+        self.assertEqual(job.get_state(), CILJobQueue.FAILED)
+        self.assertEqual(job.is_uploaded(), True)
+        job = jq.get_job(paths[2])
+        self.assertEqual(job.get_state(), CILJobQueue.FAILED)
+        self.assertEqual(job.is_uploaded(), False)
+        jq.close()
+
+    def test_upload_and_register(self):
+        path = self._make_files(['a.txt'])[0]
+        aup = AsyncCILUploader(self._get_uploader(), use_aiohttp=False)
+        res = self._loop.run_until_complete(aup.upload_and_register(path))
+        self._loop.run_until_complete(aup.close())
+        self.assertEqual(res.get_success_status(), True)
+        self.assertEqual(res.get_id(), 'a.txt')
+        self.assertEqual(self._server.entries[0]['File_path'],
+                         os.path.join(self._dest_dir, 'a.txt'))
+
+    def test_upload_and_register_many_cancelled(self):
+        paths = self._make_files(['a.txt', 'b.txt', 'c.txt'])
+        transfer = LocalCopyTransfer(self._dest_dir)
+        started = threading.Event()
+        release = threading.Event()
+        transfer_file = transfer.transfer_file
+
+        def blocking_transfer(path):
+            started.set()
+            release.wait(5)
+            return transfer_file(path)
+
+        transfer.transfer_file = Mock(side_effect=blocking_transfer)
+        transfer.disconnect = Mock()
+        aup = AsyncCILUploader(self._get_uploader(transfer),
+                               concurrency=1, use_aiohttp=False)
+
+        async def run():
+            task = asyncio.ensure_future(aup.upload_and_register_many(paths))
+            while started.is_set() is False:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            release.set()
+            try:
+                await task
+            except asyncio.CancelledError:
+                return True
+            return False
+
+        self.assertEqual(self._loop.run_until_complete(run()), True)
+        self._loop.run_until_complete(aup.close())
+        self.assertEqual(transfer.transfer_file.call_count, 1)
+        transfer.disconnect.assert_called_once_with()
+        self.assertEqual(self._server.entries, [])
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
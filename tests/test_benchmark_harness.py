@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_benchmark_harness
+----------------------------------
+
+Tests for `tests.benchmarks.harness` module.
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from mock import Mock
+
+from tests.benchmarks import harness
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+class TestBenchmarkHarness(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def test_measure(self):
+        func = Mock()
+        self.assertTrue(harness.measure(func, repeat=3) >= 0)
+        self.assertEqual(func.call_count, 3)
+
+    def test_compare(self):
+        baseline = {'a': 1.0, 'b': 1.0, 'c': 0.0001, 'd': 0}
+        results = {'a': 1.4, 'b': 1.6, 'c': 0.0009, 'd': 5.0, 'e': 9.0}
+        self.assertEqual(harness.compare(results, baseline),
+                         [('b', 1.6, 1.0)])
+        self.assertEqual(harness.compare(results, baseline, tolerance=1.3,
+                                         min_difference=0),
+                         [('a', 1.4, 1.0), ('b', 1.6, 1.0),
+                          ('c', 0.0009, 0.0001)])
+
+    def test_save_and_load_baseline(self):
+        path = os.path.join(self._temp_dir, 'baseline.json')
+        self.assertEqual(harness.load_baseline(path), {})
+        harness.save_baseline({'a': 1.0, 'b': 2.0}, path=path)
+        harness.save_baseline({'b': 3.0}, path=path)
+        self.assertEqual(harness.load_baseline(path), {'a': 1.0, 'b': 3.0})
+        with open(path, 'r') as f:
+            self.assertTrue('python' in json.load(f)['machine'])
+
+    def test_save_and_load_baseline_machine(self):
+        path = os.path.join(self._temp_dir, 'baseline.json')
+        self.assertEqual(harness.load_baseline_machine(path), None)
+        harness.save_baseline({'a': 1.0}, path=path)
+        self.assertEqual(harness.load_baseline_machine(path),
+                         harness.get_machine())
+
+    def test_get_machine_differences(self):
+        current = {'python': '3.11.4', 'implementation': 'CPython',
+                   'platform': 'Linux', 'processor': 'x86_64'}
+        machine = dict(current)
+        machine['python'] = '3.11.9'
+        self.assertEqual(harness.get_machine_differences(machine,
+                                                         current=current),
+                         [])
+        machine['python'] = '2.7.18'
+        del machine['processor']
+        self.assertEqual(harness.get_machine_differences(machine,
+                                                         current=current),
+                         [('processor', None, 'x86_64'),
+                          ('python', '2.7.18', '3.11.4')])
+        self.assertEqual(harness.get_machine_differences(
+            harness.get_machine()), [])
+
+    def test_main_skips_compare_on_different_machine(self):
+        path = os.path.join(self._temp_dir, 'baseline.json')
+        with open(path, 'w') as f:
+            json.dump({'benchmarks': {'x.one': 0.0},
+                       'machine': {'python': '1.0.0'}}, f)
+        suite = Mock()
+        suite.create_benchmarks = Mock(return_value=([('x.one', Mock())],
+                                                     None))
+        orig_stdout = sys.stdout
+        try:
+            sys.stdout = StringIO()
+            args = ['benchmarks', '--baseline', path, '--repeat', '1']
+            res = harness.main('desc', [suite], args)
+            out = sys.stdout.getvalue()
+            self.assertEqual(res, 0)
+            self.assertTrue('skipping comparison' in out)
+            self.assertTrue('python: 1.0.0' in out)
+            self.assertTrue('--save' in out)
+
+            sys.stdout = StringIO()
+            res = harness.main('desc', [suite], args + ['--ignore_machine'])
+            self.assertEqual(res, 0)
+            self.assertFalse('skipping comparison' in sys.stdout.getvalue())
+        finally:
+            sys.stdout = orig_stdout
+
+    def test_run_suites(self):
+        cleanup = Mock()
+        func = Mock()
+        suite = Mock()
+        suite.create_benchmarks = Mock(return_value=([('x.one', func),
+                                                      ('y.two', Mock())],
+                                                     cleanup))
+        out = StringIO()
+        res = harness.run_suites([suite], repeat=2, name_filter='x.',
+                                 out_stream=out)
+        self.assertEqual(list(res.keys()), ['x.one'])
+        self.assertEqual(func.call_count, 2)
+        self.assertTrue(out.getvalue().startswith('x.one'))
+        cleanup.assert_called_once_with()
+        temp_dir = suite.create_benchmarks.call_args[0][0]
+        self.assertFalse(os.path.exists(temp_dir))
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
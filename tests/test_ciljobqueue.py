@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_ciljobqueue
+----------------------------------
+
+Tests for `ciljobqueue` module.
+"""
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from ncmirtools.ciljobqueue import CILJobQueue
+from ncmirtools.ciluploader import CILUploaderResult
+
+
+class TestCILJobQueue(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self._dbfile = os.path.join(self._temp_dir, 'jobs.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def test_constructor_and_wal(self):
+        jq = CILJobQueue(self._dbfile)
+        self.assertEqual(jq.get_path(), self._dbfile)
+        self.assertFalse(os.path.exists(self._dbfile))
+        self.assertEqual(jq.get_jobs(), [])
+        conn = sqlite3.connect(self._dbfile)
+        mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+        conn.close()
+        self.assertEqual(mode, 'wal')
+        jq.close()
+
+    def test_add_and_get_jobs(self):
+        jq = CILJobQueue(self._dbfile)
+        jq.add(['/b', '/a'])
+        jobs = jq.get_jobs()
+        self.assertEqual([j.get_path() for j in jobs], ['/b', '/a'])
+        self.assertEqual(jobs[0].get_state(), CILJobQueue.PENDING)
+        self.assertEqual(jobs[0].get_destination_path(), None)
+        self.assertEqual(jobs[0].is_uploaded(), False)
+        self.assertTrue(jobs[0].get_updated() > 0)
+
+        jq.set_state('/b', CILJobQueue.DONE)
+        jq.add(['/b'])
+        self.assertEqual(jq.get_job('/b').get_state(), CILJobQueue.PENDING)
+        self.assertEqual([j.get_path() for j in jq.get_jobs()], ['/a', '/b'])
+        self.assertEqual(jq.get_job('/c'), None)
+
+        # relative paths are stored as absolute
+        jq.add(['rel'])
+        self.assertEqual(jq.get_job('rel').get_path(),
+                         os.path.abspath('rel'))
+        jq.close()
+
+    def test_set_state(self):
+        jq = CILJobQueue(self._dbfile)
+        self.assertRaises(ValueError, jq.set_state, '/a', 'bogus')
+
+        # adds job if missing
+        jq.set_state('/a', CILJobQueue.UPLOADING)
+        self.assertEqual(jq.get_job('/a').get_state(),
+                         CILJobQueue.UPLOADING)
+
+        res = CILUploaderResult(True, bytes_transferred=10, duration=1.5,
+                                dest_path='/dest/a', checksum='abc',
+                                checksum_algorithm='md5',
+                                compression='gzip', raw_bytes=20)
+        jq.set_state('/a', CILJobQueue.UPLOADED, res)
+        jq.set_state('/a', CILJobQueue.REGISTERING)
+        job = jq.get_job('/a')
+        self.assertEqual(job.get_state(), CILJobQueue.REGISTERING)
+        self.assertEqual(job.is_uploaded(), True)
+        self.assertEqual(job.get_destination_path(), '/dest/a')
+        self.assertEqual(job.get_bytes_transferred(), 10)
+        self.assertEqual(job.get_duration(), 1.5)
+        self.assertEqual(job.get_checksum(), 'abc')
+        self.assertEqual(job.get_checksum_algorithm(), 'md5')
+        self.assertEqual(job.get_compression(), 'gzip')
+        self.assertEqual(job.get_raw_bytes(), 20)
+        self.assertEqual(job.get_id(), None)
+
+        res.set_id(5)
+        jq.set_state('/a', CILJobQueue.DONE, res)
+        job = jq.get_job('/a')
+        self.assertEqual(job.get_id(), '5')
+        self.assertEqual(job.is_uploaded(), False)
+        jq.close()
+
+    def test_get_unfinished_jobs_and_remove_done_jobs(self):
+        jq = CILJobQueue(self._dbfile)
+        for state in CILJobQueue.STATES:
+            jq.set_state('/' + state, state)
+        self.assertEqual([j.get_state() for j in jq.get_unfinished_jobs()],
+                         [CILJobQueue.PENDING, CILJobQueue.UPLOADING,
+                          CILJobQueue.UPLOADED, CILJobQueue.REGISTERING,
+                          CILJobQueue.FAILED])
+        self.assertEqual(len(jq.get_jobs([CILJobQueue.DONE])), 1)
+        jq.close()
+
+        # state survives reopening
+        jq = CILJobQueue(self._dbfile)
+        self.assertEqual(len(jq.get_jobs()), 6)
+        self.assertEqual(jq.remove_done_jobs(), 1)
+        self.assertEqual(len(jq.get_jobs()), 5)
+        jq.close()
+
+    def test_remove_failed_jobs(self):
+        jq = CILJobQueue(self._dbfile)
+        for state in CILJobQueue.STATES:
+            jq.set_state('/' + state, state)
+        self.assertEqual(jq.remove_failed_jobs(), 1)
+        self.assertEqual(jq.get_jobs([CILJobQueue.FAILED]), [])
+        self.assertEqual(len(jq.get_unfinished_jobs()), 4)
+        self.assertEqual(jq.remove_failed_jobs(), 0)
+        jq.close()
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_cilregistry
+----------------------------------
+
+Tests for `cilregistry` module.
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+from ncmirtools.cilregistry import CILRegistry
+from ncmirtools.kiosk.transfer import compute_checksum
+
+
+class TestCILRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self._dbfile = os.path.join(self._temp_dir, 'registry.sqlite')
+        self._datafile = os.path.join(self._temp_dir, 'data.tif')
+        with open(self._datafile, 'w') as f:
+            f.write('hello')
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def test_constructor(self):
+        reg = CILRegistry(self._dbfile)
+        self.assertEqual(reg.get_path(), self._dbfile)
+        self.assertEqual(reg.get_checksum_algorithm(),
+                         CILRegistry.DEFAULT_CHECKSUM_ALGORITHM)
+        self.assertFalse(os.path.exists(self._dbfile))
+        reg = CILRegistry(self._dbfile, checksum_algorithm='md5')
+        self.assertEqual(reg.get_checksum_algorithm(), 'md5')
+        reg.close()
+
+    def test_lookup_missing_file_and_not_registered(self):
+        reg = CILRegistry(self._dbfile)
+        self.assertEqual(reg.lookup(os.path.join(self._temp_dir,
+                                                 'nope')), None)
+        self.assertEqual(reg.lookup(self._datafile), None)
+        reg.close()
+
+    def test_add_and_lookup(self):
+        reg = CILRegistry(self._dbfile)
+        reg.add(self._datafile, 13, dest_path='/dest/data.tif')
+        self.assertEqual(reg.lookup(self._datafile), ('13', '/dest/data.tif'))
+
+        # relative path resolves to same entry
+        curdir = os.getcwd()
+        try:
+            os.chdir(self._temp_dir)
+            self.assertEqual(reg.lookup('data.tif'),
+                             ('13', '/dest/data.tif'))
+        finally:
+            os.chdir(curdir)
+        reg.close()
+
+        # persists across instances
+        reg = CILRegistry(self._dbfile)
+        self.assertEqual(reg.lookup(self._datafile), ('13', '/dest/data.tif'))
+        reg.close()
+
+    def test_add_with_checksum(self):
+        reg = CILRegistry(self._dbfile)
+        checksum = compute_checksum(self._datafile, 'md5')
+        reg.add(self._datafile, 'CIL_1', checksum=checksum,
+                checksum_algorithm='md5')
+        self.assertEqual(reg.lookup(self._datafile), ('CIL_1', None))
+
+        reg.add(self._datafile, 'CIL_2', checksum='bogus',
+                checksum_algorithm='md5')
+        self.assertEqual(reg.lookup(self._datafile), ('CIL_1', None))
+        reg.close()
+
+    def test_lookup_file_changed(self):
+        reg = CILRegistry(self._dbfile)
+        reg.add(self._datafile, 13)
+        stat = os.stat(self._datafile)
+
+        # same size and mtime, but different content
+        with open(self._datafile, 'w') as f:
+            f.write('world')
+        os.utime(self._datafile, (stat.st_atime, stat.st_mtime))
+        self.assertEqual(reg.lookup(self._datafile), None)
+
+        # different size
+        with open(self._datafile, 'w') as f:
+            f.write('hello there')
+        self.assertEqual(reg.lookup(self._datafile), None)
+        reg.close()
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -12,8 +12,10 @@ import sys
 import tempfile
 import shutil
 import unittest
+import threading
 import argparse
 import configparser
+import json
 
 from mock import Mock
 
@@ -22,6 +24,19 @@ from ncmirtools.config import NcmirToolsConfig
 from ncmirtools.ciluploader import CILUploaderFromConfigFactory
 from ncmirtools.ciluploader import CILUploader
 from ncmirtools.ciluploader import CILUploaderResult
+from ncmirtools.ciluploader import CILUploaderBatchResult
+from ncmirtools.cilregistry import CILRegistry
+from ncmirtools.ciljobqueue import CILJobQueue
+from ncmirtools.kiosk.transfer import Transfer
+from ncmirtools.kiosk.transfer import SftpTransfer
+from ncmirtools.kiosk.retry import RetryPolicy
+from ncmirtools.kiosk.retry import RetryingTransfer
+from ncmirtools.kiosk.retry import RetryPolicyFromConfigFactory
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
 
 
 class Parameters(object):
@@ -48,8 +63,40 @@ class TestCILUploader(unittest.TestCase):
 
         pargs = parser.parse_args(['cilupload', 'hi'])
         self.assertEqual(pargs.command, 'cilupload')
-        self.assertEqual(pargs.data, 'hi')
+        self.assertEqual(pargs.data, ['hi'])
         self.assertEqual(pargs.homedir, '~')
+        self.assertEqual(pargs.progress, False)
+        self.assertEqual(pargs.max_workers,
+                         CILUploader.DEFAULT_MAX_WORKERS)
+        self.assertEqual(pargs.force, False)
+
+        pargs = parser.parse_args(['cilupload', 'a', 'b',
+                                   ciluploader.MAX_WORKERS_ARG, '8'])
+        self.assertEqual(pargs.data, ['a', 'b'])
+        self.assertEqual(pargs.max_workers, 8)
+        self.assertEqual(pargs.upload_workers,
+                         CILUploader.DEFAULT_UPLOAD_WORKERS)
+
+        pargs = parser.parse_args(['cilupload', 'a',
+                                   ciluploader.UPLOAD_WORKERS_ARG, '3'])
+        self.assertEqual(pargs.upload_workers, 3)
+
+        pargs = parser.parse_args(['cilupload', 'a', ciluploader.FORCE_ARG])
+        self.assertEqual(pargs.force, True)
+        self.assertEqual(pargs.resume, False)
+
+        pargs = parser.parse_args(['cilupload', ciluploader.RESUME_ARG])
+        self.assertEqual(pargs.data, [])
+        self.assertEqual(pargs.resume, True)
+        self.assertEqual(pargs.clear_failed, False)
+
+        pargs = parser.parse_args(['cilupload',
+                                   ciluploader.CLEAR_FAILED_ARG])
+        self.assertEqual(pargs.clear_failed, True)
+
+        pargs = parser.parse_args(['cilupload', 'hi',
+                                   ciluploader.PROGRESS_ARG])
+        self.assertEqual(pargs.progress, True)
 
     def test_get_run_help_string(self):
         p = Parameters()
@@ -225,11 +272,106 @@ class TestCILUploader(unittest.TestCase):
         mockresp.text = '{"success":false}'
         res = uploader.upload_and_register_data('/foo',
                                                 session=mock_sess)
-        self.assertEqual(res.get_success_status(), True)
+        self.assertEqual(res.get_success_status(), False)
         self.assertEqual(res.get_error_message(),
                          'REST response: {"success":false}')
         self.assertEqual(res.get_id(), None)
 
+    def test_ciluploader_upload_and_register_data_transfer_skipped(self):
+        mock_trans = Parameters()
+        mock_trans.connect = Mock()
+        mock_trans.transfer_file = Mock(return_value=(Transfer.SKIPPED,
+                                                      0, 0))
+        mock_trans.get_destination_directory = Mock(return_value='/dest')
+        mock_trans.disconnect = Mock()
+
+        mockresp = Parameters()
+        mockresp.text = '{"success":true,"ID":13}'
+        mockresp.status_code = 200
+        mock_sess = Parameters()
+        mock_sess.post = Mock(return_value=mockresp)
+
+        uploader = CILUploader(mock_trans, resturl='https://foo.com',
+                               restuser='bob', restpassword='haha')
+        res = uploader.upload_and_register_data('/foo',
+                                                session=mock_sess)
+        self.assertEqual(res.get_success_status(), True)
+        self.assertEqual(res.get_id(), 13)
+        self.assertEqual(res.get_bytes_transferred(), 0)
+        self.assertEqual(res.get_destination_path(), '/dest/foo')
+
+    def test_ciluploader_upload_and_register_data_with_checksum(self):
+        mock_trans = Parameters()
+        mock_trans.connect = Mock()
+        mock_trans.transfer_file = Mock(return_value=(None, 10, 100))
+        mock_trans.get_destination_directory = Mock(return_value='/dest')
+        mock_trans.get_last_checksum = Mock(return_value='abc')
+        mock_trans.get_checksum_algorithm = Mock(return_value='sha256')
+        mock_trans.get_last_remote_path = Mock(return_value=None)
+        mock_trans.get_compression = Mock(return_value=None)
+        mock_trans.disconnect = Mock()
+
+        mockresp = Parameters()
+        mockresp.text = '{"success":true,"ID":13}'
+        mockresp.status_code = 200
+        mock_sess = Parameters()
+        mock_sess.post = Mock(return_value=mockresp)
+
+        uploader = CILUploader(mock_trans, resturl='https://foo.com',
+                               restuser='bob', restpassword='haha')
+        res = uploader.upload_and_register_data('/foo',
+                                                session=mock_sess)
+        self.assertEqual(res.get_success_status(), True)
+        self.assertEqual(res.get_checksum(), 'abc')
+        self.assertEqual(res.get_checksum_algorithm(), 'sha256')
+        self.assertTrue(res.as_string().endswith('Checksum: sha256:abc\n'))
+        self.assertEqual(mock_sess.post.call_args[1]['json'],
+                         {'File_path': '/dest/foo',
+                          'Checksum': 'abc',
+                          'Checksum_type': 'sha256'})
+
+    def test_ciluploader_upload_and_register_data_with_compression(self):
+        mock_trans = Parameters()
+        mock_trans.connect = Mock()
+        mock_trans.transfer_file = Mock(return_value=(None, 10, 100))
+        mock_trans.get_destination_directory = Mock(return_value='/dest')
+        mock_trans.get_last_checksum = Mock(return_value=None)
+        mock_trans.get_last_remote_path = Mock(return_value='/dest/foo.gz')
+        mock_trans.get_compression = Mock(return_value='gzip')
+        mock_trans.get_last_raw_bytes = Mock(return_value=300)
+        mock_trans.disconnect = Mock()
+
+        mockresp = Parameters()
+        mockresp.text = '{"success":true,"ID":13}'
+        mockresp.status_code = 200
+        mock_sess = Parameters()
+        mock_sess.post = Mock(return_value=mockresp)
+
+        uploader = CILUploader(mock_trans, resturl='https://foo.com',
+                               restuser='bob', restpassword='haha')
+        res = uploader.upload_and_register_data('/foo',
+                                                session=mock_sess)
+        self.assertEqual(res.get_success_status(), True)
+        self.assertEqual(res.get_destination_path(), '/dest/foo.gz')
+        self.assertEqual(res.get_compression(), 'gzip')
+        self.assertEqual(res.get_raw_bytes(), 300)
+        self.assertEqual(res.get_bytes_transferred(), 100)
+        self.assertTrue(res.as_string().endswith('Compression: gzip\n'
+                                                 'Uncompressed bytes: 300\n'))
+        self.assertEqual(mock_sess.post.call_args[1]['json'],
+                         {'File_path': '/dest/foo.gz',
+                          'Compression': 'gzip'})
+
+    def test_ciluploader_set_progress_callback(self):
+        uploader = CILUploader(None)
+        uploader.set_progress_callback(Mock())
+
+        mock_trans = Transfer()
+        uploader = CILUploader(mock_trans)
+        callback = Mock()
+        uploader.set_progress_callback(callback)
+        self.assertEqual(mock_trans.get_progress_callback(), callback)
+
     def test_ciluploader_upload_and_register_data_self_make_session(self):
         mock_trans = Parameters()
         mock_trans.connect = Mock()
@@ -246,6 +388,674 @@ class TestCILUploader(unittest.TestCase):
         except Exception:
             pass
 
+    def test_expand_data_paths(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            subdir = os.path.join(temp_dir, 'sub')
+            os.makedirs(subdir)
+            for name in [os.path.join(temp_dir, 'b.tif'),
+                         os.path.join(temp_dir, 'a.tif'),
+                         os.path.join(temp_dir, 'c.txt'),
+                         os.path.join(subdir, 'd.tif')]:
+                open(name, 'w').close()
+            a_file = os.path.join(temp_dir, 'a.tif')
+            b_file = os.path.join(temp_dir, 'b.tif')
+            c_file = os.path.join(temp_dir, 'c.txt')
+            d_file = os.path.join(subdir, 'd.tif')
+            missing = os.path.join(temp_dir, 'missing')
+
+            self.assertEqual(ciluploader.expand_data_paths([]), [])
+            self.assertEqual(ciluploader.expand_data_paths([missing]),
+                             [missing])
+            self.assertEqual(ciluploader.expand_data_paths([b_file]),
+                             [b_file])
+            self.assertEqual(ciluploader.
+                             expand_data_paths([os.path.join(temp_dir,
+                                                             '*.tif')]),
+                             [a_file, b_file])
+            self.assertEqual(ciluploader.expand_data_paths([temp_dir,
+                                                            a_file]),
+                             [a_file, b_file, c_file, d_file])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_ciluploader_upload_and_register_many_invalid_params(self):
+        uploader = CILUploader(None)
+        res = uploader.upload_and_register_many(['/foo'])
+        self.assertEqual(res.get_success_status(), False)
+        self.assertEqual(res.get_results()[0][1].get_error_message(),
+                         'Transfer object was none, cannot complete '
+                         'transfer')
+
+        uploader = CILUploader(Parameters(), resturl='https://foo.com',
+                               restuser='bob', restpassword='haha')
+        res = uploader.upload_and_register_many(None)
+        self.assertEqual(res.get_failure_count(), 1)
+        self.assertEqual(res.get_results()[0][1].get_error_message(),
+                         'Files to transfer is None')
+
+    def test_ciluploader_upload_and_register_many_connect_fails(self):
+        mock_trans = Parameters()
+        mock_trans.connect = Mock(side_effect=IOError('no route'))
+        uploader = CILUploader(mock_trans, resturl='https://foo.com',
+                               restuser='bob', restpassword='haha')
+        mock_sess = Parameters()
+        mock_sess.post = Mock()
+        res = uploader.upload_and_register_many(['/a', '/b'],
+                                                session=mock_sess)
+        self.assertEqual(res.get_failure_count(), 2)
+        self.assertEqual(res.get_results()[1][0], '/b')
+        self.assertTrue('Unable to connect: ' in
+                        res.get_results()[1][1].get_error_message())
+        mock_sess.post.assert_not_called()
+
+    def test_ciluploader_upload_and_register_many(self):
+        mock_trans = Parameters()
+        mock_trans.connect = Mock()
+        mock_trans.disconnect = Mock()
+        mock_trans.transfer_file = Mock(side_effect=[(None, 1, 10),
+                                                     ('error', 1, 0),
+                                                     (None, 2, 20),
+                                                     (None, 3, 30)])
+        mock_trans.get_destination_directory = Mock(return_value='/dest')
+
+        def post(url, json=None, auth=None):
+            resp = Parameters()
+            if json['File_path'] == '/dest/d':
+                resp.status_code = 500
+                resp.text = ''
+            else:
+                resp.status_code = 200
+                resp.text = ('{"success":true,"ID":"' +
+                             json['File_path'] + '"}')
+            return resp
+
+        mock_sess = Parameters()
+        mock_sess.post = Mock(side_effect=post)
+
+        uploader = CILUploader(mock_trans, resturl='https://foo.com',
+                               restuser='bob', restpassword='haha')
+        res = uploader.upload_and_register_many(['/a', '/b', '/c', '/d'],
+                                                max_workers=2,
+                                                session=mock_sess)
+        mock_trans.connect.assert_called_once_with()
+        mock_trans.disconnect.assert_called_once_with()
+        self.assertEqual(mock_sess.post.call_count, 3)
+        self.assertEqual([p for p, r in res.get_results()],
+                         ['/a', '/b', '/c', '/d'])
+        results = [r for p, r in res.get_results()]
+        self.assertEqual(results[0].get_id(), '/dest/a')
+        self.assertEqual(results[0].get_success_status(), True)
+        self.assertEqual(results[1].get_success_status(), False)
+        self.assertEqual(results[1].get_error_message(),
+                         'Error trying to upload: error')
+        self.assertEqual(results[2].get_id(), '/dest/c')
+        self.assertEqual(results[3].get_success_status(), False)
+        self.assertEqual(res.get_success_count(), 2)
+        self.assertEqual(res.get_failure_count(), 2)
+        self.assertEqual(res.get_success_status(), False)
+        self.assertEqual(res.get_bytes_transferred(), 60)
+        self.assertTrue(res.get_duration() >= 0)
+
+    def _get_upload_worker_mock(self, uploading, all_started):
+        mock_trans = Parameters()
+        mock_trans.connect = Mock()
+        mock_trans.disconnect = Mock()
+        mock_trans.set_progress_callback = Mock()
+        mock_trans.get_progress_callback = Mock(return_value=None)
+        mock_trans.get_destination_directory = Mock(return_value='/dest')
+
+        def transfer_file(path):
+            uploading.append(path)
+            if len(uploading) == 2:
+                all_started.set()
+            # each upload waits until two are running at once
+            all_started.wait(5)
+            return None, 1, 10
+
+        mock_trans.transfer_file = Mock(side_effect=transfer_file)
+        return mock_trans
+
+    def test_ciluploader_upload_and_register_many_upload_workers(self):
+        uploading = []
+        all_started = threading.Event()
+        transfers = []
+
+        def transfer_factory():
+            t = self._get_upload_worker_mock(uploading, all_started)
+            transfers.append(t)
+            return t
+
+        mock_trans = transfer_factory()
+        mock_sess = Parameters()
+        resp = Parameters()
+        resp.status_code = 200
+        resp.text = '{"success":true,"ID":1}'
+        mock_sess.post = Mock(return_value=resp)
+        uploader = CILUploader(mock_trans, resturl='https://foo.com',
+                               restuser='bob', restpassword='haha',
+                               transfer_factory=transfer_factory)
+        self.assertEqual(uploader.get_transfer_factory(), transfer_factory)
+        res = uploader.upload_and_register_many(['/a', '/b', '/c'],
+                                                session=mock_sess,
+                                                upload_workers=2)
+        self.assertTrue(all_started.is_set())
+        self.assertEqual(res.get_success_count(), 3)
+        self.assertEqual([p for p, r in res.get_results()],
+                         ['/a', '/b', '/c'])
+        self.assertEqual(len(transfers), 2)
+        self.assertEqual(sorted(uploading), ['/a', '/b', '/c'])
+        for t in transfers:
+            t.connect.assert_called_once_with()
+            t.disconnect.assert_called_once_with()
+        transfers[1].set_progress_callback.assert_called_once_with(None)
+        self.assertEqual(mock_sess.post.call_count, 3)
+
+    def test_ciluploader_upload_workers_one_connect_fails(self):
+        uploading = []
+        all_started = threading.Event()
+        all_started.set()
+        mock_trans = self._get_upload_worker_mock(uploading, all_started)
+        bad_trans = self._get_upload_worker_mock(uploading, all_started)
+        bad_trans.connect = Mock(side_effect=IOError('no route'))
+        mock_sess = Parameters()
+        resp = Parameters()
+        resp.status_code = 200
+        resp.text = '{"success":true,"ID":1}'
+        mock_sess.post = Mock(return_value=resp)
+        uploader = CILUploader(mock_trans, resturl='https://foo.com',
+                               restuser='bob', restpassword='haha',
+                               transfer_factory=Mock(return_value=bad_trans))
+        res = uploader.upload_and_register_many(['/a', '/b'],
+                                                session=mock_sess,
+                                                upload_workers=4)
+        # other worker uploads every file
+        self.assertEqual(res.get_success_count(), 2)
+        self.assertEqual(uploading, ['/a', '/b'])
+        uploader.get_transfer_factory().assert_called_once_with()
+        bad_trans.transfer_file.assert_not_called()
+
+        # without factory files are uploaded one at a time
+        uploader = CILUploader(mock_trans, resturl='https://foo.com',
+                               restuser='bob', restpassword='haha')
+        res = uploader.upload_and_register_many(['/c'], session=mock_sess,
+                                                upload_workers=4)
+        self.assertEqual(res.get_success_count(), 1)
+        self.assertEqual(uploading, ['/a', '/b', '/c'])
+
+        # factory unable to create transfer
+        uploader = CILUploader(mock_trans, resturl='https://foo.com',
+                               restuser='bob', restpassword='haha',
+                               transfer_factory=Mock(return_value=None))
+        res = uploader.upload_and_register_many(['/d', '/e'],
+                                                session=mock_sess,
+                                                upload_workers=4)
+        self.assertEqual(res.get_success_count(), 2)
+        self.assertEqual(uploading, ['/a', '/b', '/c', '/d', '/e'])
+        uploader.get_transfer_factory().assert_called_once_with()
+
+    def _get_pipeline_mocks(self, events, registered):
+        mock_trans = Parameters()
+        mock_trans.connect = Mock()
+        mock_trans.disconnect = Mock()
+        mock_trans.get_destination_directory = Mock(return_value='/dest')
+
+        def transfer_file(path):
+            if path == '/b':
+                # waits for registration of /a which only happens
+                # during this upload if pipelined
+                registered.wait(5)
+            events.append('upload ' + path)
+            return None, 1, 10
+
+        def post(url, json=None, auth=None):
+            events.append('register ' + json['File_path'])
+            registered.set()
+            resp = Parameters()
+            resp.status_code = 200
+            resp.text = '{"success":true,"ID":1}'
+            return resp
+
+        mock_trans.transfer_file = Mock(side_effect=transfer_file)
+        mock_sess = Parameters()
+        mock_sess.post = Mock(side_effect=post)
+        return mock_trans, mock_sess
+
+    def test_ciluploader_upload_and_register_many_pipelined(self):
+        events = []
+        registered = threading.Event()
+        mock_trans, mock_sess = self._get_pipeline_mocks(events, registered)
+        uploader = CILUploader(mock_trans, resturl='https://foo.com',
+                               restuser='bob', restpassword='haha')
+        res = uploader.upload_and_register_many(['/a', '/b'],
+                                                max_workers=1,
+                                                session=mock_sess)
+        self.assertEqual(res.get_success_count(), 2)
+        self.assertEqual(events, ['upload /a', 'register /dest/a',
+                                  'upload /b', 'register /dest/b'])
+
+    def test_ciluploader_upload_and_register_many_not_pipelined(self):
+        events = []
+        registered = threading.Event()
+        registered.set()
+        mock_trans, mock_sess = self._get_pipeline_mocks(events, registered)
+        uploader = CILUploader(mock_trans, resturl='https://foo.com',
+                               restuser='bob', restpassword='haha')
+        res = uploader.upload_and_register_many(['/a', '/b'],
+                                                max_workers=1,
+                                                session=mock_sess,
+                                                pipelined=False)
+        self.assertEqual(res.get_success_count(), 2)
+        self.assertEqual(events, ['upload /a', 'upload /b',
+                                  'register /dest/a', 'register /dest/b'])
+
+    def test_ciluploader_batch_result(self):
+        res = CILUploaderBatchResult()
+        self.assertEqual(res.get_results(), [])
+        self.assertEqual(res.get_success_status(), True)
+        self.assertEqual(res.get_bytes_transferred(), 0)
+
+        res = CILUploaderBatchResult([('/a', CILUploaderResult(True,
+                                       bytes_transferred=5)),
+                                      ('/b', CILUploaderResult(False))],
+                                     duration=2)
+        self.assertEqual(res.summary_as_string(), 'Files: 2\n'
+                                                  'Succeeded: 1\n'
+                                                  'Failed: 1\n'
+                                                  'Bytes transferred: 5\n'
+                                                  'Duration in seconds: 2\n')
+        self.assertTrue(res.as_string().startswith('File: /a\n'
+                                                   'Success: True\n'))
+        self.assertTrue('File: /b\nSuccess: False\n' in res.as_string())
+        self.assertTrue(res.as_string().endswith(res.summary_as_string()))
+
+    def test_ciluploader_result_as_row_and_write_results(self):
+        res = CILUploaderResult(True, id=5, bytes_transferred=10,
+                                dest_path='/d/a')
+        row = res.as_row()
+        self.assertEqual(len(row), len(CILUploaderResult.FIELDS))
+        self.assertEqual(dict(zip(CILUploaderResult.FIELDS, row))['id'], 5)
+
+        out = StringIO()
+        ciluploader._write_results([('/a', res),
+                                    ('/b', CILUploaderResult(False,
+                                                             errmsg='no'))],
+                                   'jsonl', out)
+        lines = [json.loads(x) for x in out.getvalue().splitlines()]
+        self.assertEqual(lines[0]['path'], '/a')
+        self.assertEqual(lines[0]['success'], True)
+        self.assertEqual(lines[0]['dest_path'], '/d/a')
+        self.assertEqual(lines[1]['error'], 'no')
+        self.assertEqual(lines[1]['previously_registered'], False)
+
+    def test_ciluploader_get_session(self):
+        uploader = CILUploader(None, pool_size=3, http_retries=1)
+        session = uploader.get_session()
+        self.assertTrue(uploader.get_session() is session)
+        adapter = session.get_adapter('https://foo.com')
+        self.assertEqual(adapter._pool_maxsize, 3)
+        self.assertEqual(adapter.max_retries.connect, 1)
+        self.assertEqual(adapter.max_retries.read, 0)
+        self.assertEqual(session.headers['Connection'], 'keep-alive')
+
+        uploader.close()
+        self.assertTrue(uploader.get_session() is not session)
+        uploader.close()
+        uploader.close()
+
+        with CILUploader(None, keep_alive=False) as uploader:
+            session = uploader.get_session()
+            self.assertEqual(session.headers['Connection'], 'close')
+            session.close = Mock()
+        session.close.assert_called_once_with()
+
+    def test_ciluploader_register_data_reuses_session(self):
+        mock_trans = Parameters()
+        mock_trans.connect = Mock()
+        mock_trans.transfer_file = Mock(return_value=(None, 10, 100))
+        mock_trans.get_destination_directory = Mock(return_value='/dest')
+        mock_trans.disconnect = Mock()
+
+        mockresp = Parameters()
+        mockresp.text = '{"success":true,"ID":13}'
+        mockresp.status_code = 200
+        mock_sess = Parameters()
+        mock_sess.post = Mock(return_value=mockresp)
+        mock_sess.close = Mock()
+
+        uploader = CILUploader(mock_trans, resturl='https://foo.com',
+                               restuser='bob', restpassword='haha')
+        uploader._create_session = Mock(return_value=mock_sess)
+        with uploader:
+            res = uploader.upload_and_register_data('/foo')
+            self.assertEqual(res.get_id(), 13)
+            res = uploader.upload_and_register_many(['/a', '/b'])
+            self.assertEqual(res.get_success_count(), 2)
+            mock_sess.close.assert_not_called()
+        self.assertEqual(mock_sess.post.call_count, 3)
+        uploader._create_session.assert_called_once_with()
+        mock_sess.close.assert_called_once_with()
+
+    def _get_registry_mocks(self):
+        mock_trans = Parameters()
+        mock_trans.connect = Mock()
+        mock_trans.disconnect = Mock()
+        mock_trans.transfer_file = Mock(return_value=(None, 1, 5))
+        mock_trans.get_destination_directory = Mock(return_value='/dest')
+
+        mockresp = Parameters()
+        mockresp.text = '{"success":true,"ID":13}'
+        mockresp.status_code = 200
+        mock_sess = Parameters()
+        mock_sess.post = Mock(return_value=mockresp)
+        return mock_trans, mock_sess
+
+    def test_ciluploader_upload_and_register_data_with_registry(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            data = os.path.join(temp_dir, 'data.tif')
+            with open(data, 'w') as f:
+                f.write('hello')
+            mock_trans, mock_sess = self._get_registry_mocks()
+            reg = CILRegistry(os.path.join(temp_dir, 'reg.sqlite'))
+            uploader = CILUploader(mock_trans, resturl='https://foo.com',
+                                   restuser='bob', restpassword='haha',
+                                   registry=reg)
+            self.assertEqual(uploader.get_registry(), reg)
+            res = uploader.upload_and_register_data(data,
+                                                    session=mock_sess)
+            self.assertEqual(res.get_id(), 13)
+            self.assertEqual(res.get_previously_registered(), False)
+            self.assertEqual(reg.lookup(data), ('13', '/dest/data.tif'))
+
+            res = uploader.upload_and_register_data(data,
+                                                    session=mock_sess)
+            self.assertEqual(res.get_success_status(), True)
+            self.assertEqual(res.get_id(), '13')
+            self.assertEqual(res.get_destination_path(), '/dest/data.tif')
+            self.assertEqual(res.get_bytes_transferred(), 0)
+            self.assertEqual(res.get_previously_registered(), True)
+            self.assertTrue(res.as_string().endswith('Previously '
+                                                     'registered: True\n'))
+            self.assertEqual(mock_trans.transfer_file.call_count, 1)
+            self.assertEqual(mock_sess.post.call_count, 1)
+
+            res = uploader.upload_and_register_data(data,
+                                                    session=mock_sess,
+                                                    force=True)
+            self.assertEqual(res.get_previously_registered(), False)
+            self.assertEqual(mock_trans.transfer_file.call_count, 2)
+            self.assertEqual(mock_sess.post.call_count, 2)
+
+            # failed registration is not recorded
+            other = os.path.join(temp_dir, 'other.tif')
+            with open(other, 'w') as f:
+                f.write('other')
+            mock_sess.post.return_value.status_code = 500
+            res = uploader.upload_and_register_data(other,
+                                                    session=mock_sess)
+            self.assertEqual(res.get_success_status(), False)
+            self.assertEqual(reg.lookup(other), None)
+            uploader.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_ciluploader_upload_and_register_many_with_registry(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            paths = []
+            for name in ['a', 'b']:
+                paths.append(os.path.join(temp_dir, name))
+                with open(paths[-1], 'w') as f:
+                    f.write(name)
+            mock_trans, mock_sess = self._get_registry_mocks()
+            reg = CILRegistry(os.path.join(temp_dir, 'reg.sqlite'))
+            reg.add(paths[0], 'CIL_A', dest_path='/dest/a')
+            uploader = CILUploader(mock_trans, resturl='https://foo.com',
+                                   restuser='bob', restpassword='haha',
+                                   registry=reg)
+            res = uploader.upload_and_register_many(paths,
+                                                    session=mock_sess)
+            self.assertEqual(res.get_success_count(), 2)
+            self.assertEqual(res.get_results()[0][1].get_id(), 'CIL_A')
+            self.assertEqual(res.get_results()[1][1].get_id(), 13)
+            mock_trans.transfer_file.assert_called_once_with(paths[1])
+            self.assertEqual(reg.lookup(paths[1]), ('13', '/dest/b'))
+
+            # everything registered, no connection is made
+            res = uploader.upload_and_register_many(paths,
+                                                    session=mock_sess)
+            self.assertEqual(res.get_success_count(), 2)
+            mock_trans.connect.assert_called_once_with()
+            self.assertEqual(mock_sess.post.call_count, 1)
+
+            res = uploader.upload_and_register_many(paths,
+                                                    session=mock_sess,
+                                                    force=True)
+            self.assertEqual(mock_trans.transfer_file.call_count, 3)
+            self.assertEqual(mock_sess.post.call_count, 3)
+            self.assertEqual(reg.lookup(paths[0]), ('13', '/dest/a'))
+            uploader.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_ciluploader_job_queue_states(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            mock_trans, mock_sess = self._get_registry_mocks()
+            mock_trans.transfer_file = Mock(side_effect=[(None, 1, 5),
+                                                         ('error', 1, 0),
+                                                         (None, 1, 5)])
+            jq = CILJobQueue(os.path.join(temp_dir, 'jobs.sqlite'))
+            uploader = CILUploader(mock_trans, resturl='https://foo.com',
+                                   restuser='bob', restpassword='haha',
+                                   job_queue=jq)
+            self.assertEqual(uploader.get_job_queue(), jq)
+            res = uploader.upload_and_register_data('/a', session=mock_sess)
+            self.assertEqual(res.get_success_status(), True)
+            job = jq.get_job('/a')
+            self.assertEqual(job.get_state(), CILJobQueue.DONE)
+            self.assertEqual(job.get_id(), '13')
+            self.assertEqual(job.get_destination_path(), '/dest/a')
+
+            res = uploader.upload_and_register_many(['/b', '/c'],
+                                                    session=mock_sess)
+            self.assertEqual(res.get_success_count(), 1)
+            self.assertEqual(jq.get_job('/b').get_state(),
+                             CILJobQueue.FAILED)
+            self.assertEqual(jq.get_job('/b').get_error_message(),
+                             'Error trying to upload: error')
+            self.assertEqual(jq.get_job('/b').is_uploaded(), False)
+            self.assertEqual(jq.get_job('/c').get_state(),
+                             CILJobQueue.DONE)
+
+            # registration failure leaves job uploaded
+            mock_trans.transfer_file = Mock(return_value=(None, 1, 5))
+            mock_sess.post.return_value.status_code = 500
+            uploader.upload_and_register_many(['/d'], session=mock_sess)
+            job = jq.get_job('/d')
+            self.assertEqual(job.get_state(), CILJobQueue.FAILED)
+            self.assertEqual(job.is_uploaded(), True)
+
+            # registration refused by server leaves job failed
+            mock_sess.post.return_value.status_code = 200
+            mock_sess.post.return_value.text = '{"success":false}'
+            res = uploader.upload_and_register_data('/e', session=mock_sess)
+            self.assertEqual(res.get_success_status(), False)
+            job = jq.get_job('/e')
+            self.assertEqual(job.get_state(), CILJobQueue.FAILED)
+            self.assertEqual(job.is_uploaded(), True)
+            self.assertEqual(job.get_error_message(),
+                             'REST response: {"success":false}')
+            uploader.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_ciluploader_upload_and_register_data_post_raises(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            mock_trans, mock_sess = self._get_registry_mocks()
+            mock_sess.post = Mock(side_effect=IOError('conn reset'))
+            jq = CILJobQueue(os.path.join(temp_dir, 'jobs.sqlite'))
+            uploader = CILUploader(mock_trans, resturl='https://foo.com',
+                                   restuser='bob', restpassword='haha',
+                                   job_queue=jq)
+            try:
+                uploader.upload_and_register_data('/a', session=mock_sess)
+                self.fail('Expected IOError')
+            except IOError as e:
+                self.assertEqual(str(e), 'conn reset')
+            job = jq.get_job('/a')
+            self.assertEqual(job.get_state(), CILJobQueue.FAILED)
+            self.assertEqual(job.is_uploaded(), True)
+            self.assertTrue(job.get_error_message().startswith(
+                'Error trying to register: '))
+            self.assertTrue('conn reset' in job.get_error_message())
+            uploader.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_ciluploader_resume_jobs(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            mock_trans, mock_sess = self._get_registry_mocks()
+            uploader = CILUploader(mock_trans, resturl='https://foo.com',
+                                   restuser='bob', restpassword='haha')
+            res = uploader.resume_jobs(session=mock_sess)
+            self.assertEqual(res.get_results()[0][1].get_error_message(),
+                             'No job queue to resume')
+
+            # simulate crashed run
+            jq = CILJobQueue(os.path.join(temp_dir, 'jobs.sqlite'))
+            jq.add(['/pending', '/uploading', '/uploaded',
+                    '/registering', '/done'])
+            jq.set_state('/uploading', CILJobQueue.UPLOADING)
+            up_res = CILUploaderResult(True, bytes_transferred=7,
+                                       duration=1,
+                                       dest_path='/remote/uploaded',
+                                       checksum='abc',
+                                       checksum_algorithm='md5')
+            jq.set_state('/uploaded', CILJobQueue.UPLOADED, up_res)
+            reg_res = CILUploaderResult(True, bytes_transferred=7,
+                                        dest_path='/remote/registering')
+            jq.set_state('/registering', CILJobQueue.REGISTERING, reg_res)
+            jq.set_state('/done', CILJobQueue.DONE)
+
+            uploader = CILUploader(mock_trans, resturl='https://foo.com',
+                                   restuser='bob', restpassword='haha',
+                                   job_queue=jq)
+            res = uploader.resume_jobs(max_workers=2, session=mock_sess)
+            self.assertEqual([p for p, r in res.get_results()],
+                             ['/pending', '/uploading', '/uploaded',
+                              '/registering'])
+            self.assertEqual(res.get_success_count(), 4)
+            self.assertEqual(mock_trans.transfer_file.call_count, 2)
+            mock_trans.transfer_file.assert_any_call('/pending')
+            mock_trans.transfer_file.assert_any_call('/uploading')
+            self.assertEqual(mock_sess.post.call_count, 4)
+            posted = [c[1]['json'] for c in mock_sess.post.call_args_list]
+            self.assertTrue({'File_path': '/remote/uploaded',
+                             'Checksum': 'abc',
+                             'Checksum_type': 'md5'} in posted)
+            self.assertTrue({'File_path': '/remote/registering'} in posted)
+            self.assertEqual(jq.get_unfinished_jobs(), [])
+
+            # nothing left to do
+            res = uploader.resume_jobs(session=mock_sess)
+            self.assertEqual(res.get_results(), [])
+            self.assertEqual(mock_sess.post.call_count, 4)
+            uploader.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_run_with_uploader_removes_done_and_failed_jobs(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            mock_trans, mock_sess = self._get_registry_mocks()
+            mock_trans.transfer_file = Mock(side_effect=[(None, 1, 5),
+                                                         ('error', 1, 0),
+                                                         (None, 1, 5)])
+            mock_trans.set_progress_callback = Mock()
+            jq = CILJobQueue(os.path.join(temp_dir, 'jobs.sqlite'))
+            uploader = CILUploader(mock_trans, resturl='https://foo.com',
+                                   restuser='bob', restpassword='haha',
+                                   job_queue=jq)
+            mock_sess.close = Mock()
+            uploader._session = mock_sess
+            p = Parameters()
+            p.data = ['/a', '/b']
+            p.format = None
+            out = StringIO()
+            self.assertEqual(ciluploader.run_with_uploader(uploader, p,
+                                                           out_stream=out),
+                             2)
+            # failed run leaves done jobs in queue
+            self.assertEqual(jq.get_job('/a').get_state(), CILJobQueue.DONE)
+            self.assertEqual(jq.get_job('/b').get_state(),
+                             CILJobQueue.FAILED)
+
+            # clearing failed jobs leaves nothing to resume
+            p = Parameters()
+            p.data = []
+            p.clear_failed = True
+            self.assertEqual(ciluploader.run_with_uploader(uploader, p,
+                                                           out_stream=out),
+                             0)
+            self.assertEqual(jq.get_job('/b'), None)
+            self.assertEqual(jq.get_unfinished_jobs(), [])
+
+            # successful run removes done jobs
+            p = Parameters()
+            p.data = ['/c']
+            p.format = None
+            self.assertEqual(ciluploader.run_with_uploader(uploader, p,
+                                                           out_stream=out),
+                             0)
+            self.assertEqual(jq.get_jobs(), [])
+            uploader.close()
+
+            uploader = CILUploader(mock_trans, resturl='https://foo.com',
+                                   restuser='bob', restpassword='haha')
+            p = Parameters()
+            p.data = []
+            p.clear_failed = True
+            self.assertEqual(ciluploader.run_with_uploader(uploader, p,
+                                                           out_stream=out),
+                             2)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_ciluploaderfromconfigfactory_get_job_queue_from_config(self):
+        con = configparser.ConfigParser()
+        con.add_section(CILUploaderFromConfigFactory.CONFIG_SECTION)
+        fac = CILUploaderFromConfigFactory(con)
+        self.assertEqual(fac._get_job_queue_from_config().get_path(),
+                         os.path.join(os.path.expanduser('~'),
+                                      CILJobQueue.DEFAULT_FILE))
+        con.set(CILUploaderFromConfigFactory.CONFIG_SECTION,
+                CILUploaderFromConfigFactory.JOB_QUEUE_FILE, '/foo/jobs.db')
+        self.assertEqual(fac._get_job_queue_from_config().get_path(),
+                         '/foo/jobs.db')
+        con.set(CILUploaderFromConfigFactory.CONFIG_SECTION,
+                CILUploaderFromConfigFactory.JOB_QUEUE_FILE, '')
+        self.assertEqual(fac._get_job_queue_from_config(), None)
+
+    def test_ciluploaderfromconfigfactory_get_registry_from_config(self):
+        con = configparser.ConfigParser()
+        con.add_section(CILUploaderFromConfigFactory.CONFIG_SECTION)
+        fac = CILUploaderFromConfigFactory(con)
+        reg = fac._get_registry_from_config()
+        self.assertEqual(reg.get_path(),
+                         os.path.join(os.path.expanduser('~'),
+                                      CILRegistry.DEFAULT_FILE))
+        con.set(CILUploaderFromConfigFactory.CONFIG_SECTION,
+                CILUploaderFromConfigFactory.REGISTRY_FILE, '/foo/reg.db')
+        self.assertEqual(fac._get_registry_from_config().get_path(),
+                         '/foo/reg.db')
+        con.set(CILUploaderFromConfigFactory.CONFIG_SECTION,
+                CILUploaderFromConfigFactory.REGISTRY_FILE, '')
+        self.assertEqual(fac._get_registry_from_config(), None)
+
     def test_ciluploaderfromconfigfactory_get_sftptransfer_from_config(self):
         temp_dir = tempfile.mkdtemp()
         try:
@@ -316,6 +1126,39 @@ class TestCILUploader(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_ciluploaderfromconfigfactory_get_sftptransfer_tunables(self):
+        con = configparser.ConfigParser()
+        con.add_section(CILUploaderFromConfigFactory.CONFIG_SECTION)
+        con.set(CILUploaderFromConfigFactory.CONFIG_SECTION,
+                CILUploaderFromConfigFactory.HOST, 'thehost')
+        con.set(CILUploaderFromConfigFactory.CONFIG_SECTION,
+                CILUploaderFromConfigFactory.DEST_DIR, 'dest')
+        fac = CILUploaderFromConfigFactory(con)
+        trans, err = fac._get_sftptransfer_from_config()
+        self.assertEqual(trans.get_window_size(), None)
+        self.assertEqual(trans.get_max_packet_size(), None)
+        self.assertEqual(trans.get_buffer_size(), 32768)
+        self.assertEqual(trans.get_pipelined(), True)
+        self.assertEqual(trans.get_allow_agent(), True)
+
+        con.set(CILUploaderFromConfigFactory.CONFIG_SECTION,
+                CILUploaderFromConfigFactory.WINDOW_SIZE, '4194304')
+        con.set(CILUploaderFromConfigFactory.CONFIG_SECTION,
+                CILUploaderFromConfigFactory.MAX_PACKET_SIZE, '65536')
+        con.set(CILUploaderFromConfigFactory.CONFIG_SECTION,
+                CILUploaderFromConfigFactory.BUFFER_SIZE, '262144')
+        con.set(CILUploaderFromConfigFactory.CONFIG_SECTION,
+                CILUploaderFromConfigFactory.PIPELINED, 'false')
+        con.set(CILUploaderFromConfigFactory.CONFIG_SECTION,
+                CILUploaderFromConfigFactory.ALLOW_AGENT, 'false')
+        trans, err = fac._get_sftptransfer_from_config()
+        self.assertEqual(err, None)
+        self.assertEqual(trans.get_window_size(), 4194304)
+        self.assertEqual(trans.get_max_packet_size(), 65536)
+        self.assertEqual(trans.get_buffer_size(), 262144)
+        self.assertEqual(trans.get_pipelined(), False)
+        self.assertEqual(trans.get_allow_agent(), False)
+
     def test_ciluploaderfromconfigfactory_get_rest_info_from_config(self):
         temp_dir = tempfile.mkdtemp()
         try:
@@ -399,6 +1242,56 @@ class TestCILUploader(unittest.TestCase):
             fac = CILUploaderFromConfigFactory(con)
             res = fac.get_ciluploader()
             self.assertTrue(isinstance(res, CILUploader))
+            self.assertTrue(isinstance(res.get_transfer(), RetryingTransfer))
+            self.assertTrue(isinstance(res.get_transfer().get_transfer(),
+                                       SftpTransfer))
+            transfer = res.get_transfer_factory()()
+            self.assertTrue(isinstance(transfer, RetryingTransfer))
+            self.assertTrue(transfer is not res.get_transfer())
+            self.assertTrue(isinstance(transfer.get_transfer(),
+                                       SftpTransfer))
+
+            # factory returns None if transfer cannot be created
+            con.remove_option(CILUploaderFromConfigFactory.CONFIG_SECTION,
+                              CILUploaderFromConfigFactory.HOST)
+            self.assertEqual(res.get_transfer_factory()(), None)
+            con.set(CILUploaderFromConfigFactory.CONFIG_SECTION,
+                    CILUploaderFromConfigFactory.HOST, 'thehost')
+            self.assertEqual(res.get_transfer().get_retry_policy().
+                             get_max_attempts(),
+                             RetryPolicy.DEFAULT_MAX_ATTEMPTS)
+
+            con.set(CILUploaderFromConfigFactory.CONFIG_SECTION,
+                    RetryPolicyFromConfigFactory.MAX_ATTEMPTS, '5')
+            res = fac.get_ciluploader()
+            self.assertEqual(res.get_transfer().get_retry_policy().
+                             get_max_attempts(), 5)
+
+            con.set(CILUploaderFromConfigFactory.CONFIG_SECTION,
+                    RetryPolicyFromConfigFactory.MAX_ATTEMPTS, '0')
+            self.assertEqual(fac.get_ciluploader(), None)
+
+            con.remove_option(CILUploaderFromConfigFactory.CONFIG_SECTION,
+                              RetryPolicyFromConfigFactory.MAX_ATTEMPTS)
+            self.assertEqual(res.get_pool_size(),
+                             CILUploader.DEFAULT_POOL_SIZE)
+            self.assertEqual(res.get_keep_alive(), True)
+            self.assertEqual(res.get_http_retries(),
+                             CILUploader.DEFAULT_HTTP_RETRIES)
+            con.set(CILUploaderFromConfigFactory.CONFIG_SECTION,
+                    CILUploaderFromConfigFactory.REST_POOL_SIZE, '20')
+            con.set(CILUploaderFromConfigFactory.CONFIG_SECTION,
+                    CILUploaderFromConfigFactory.REST_KEEP_ALIVE, 'false')
+            con.set(CILUploaderFromConfigFactory.CONFIG_SECTION,
+                    CILUploaderFromConfigFactory.REST_RETRIES, '0')
+            res = fac.get_ciluploader()
+            self.assertEqual(res.get_pool_size(), 20)
+            self.assertEqual(res.get_keep_alive(), False)
+            self.assertEqual(res.get_http_retries(), 0)
+
+            con.set(CILUploaderFromConfigFactory.CONFIG_SECTION,
+                    CILUploaderFromConfigFactory.REST_POOL_SIZE, 'x')
+            self.assertEqual(fac.get_ciluploader(), None)
         finally:
             shutil.rmtree(temp_dir)
 
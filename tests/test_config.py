@@ -14,6 +14,7 @@ import unittest
 import os
 import configparser
 import logging
+import threading
 
 from ncmirtools.config import ConfigMissingError
 from ncmirtools.config import NcmirToolsConfig
@@ -136,6 +137,121 @@ class TestConfig(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_get_config_cached_until_file_changes(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            con = NcmirToolsConfig()
+            con.set_home_directory(temp_dir)
+            con.set_etc_directory(os.path.join(temp_dir, 'etc'))
+            cfile = con.get_config_files()[1]
+            with open(cfile, 'w') as f:
+                f.write('[foo]\nport = 22\n')
+            first = con.get_config()
+            self.assertTrue(isinstance(first,
+                                       config.NcmirToolsConfigParser))
+            self.assertTrue(con.get_config() is first)
+
+            # new object with same files shares cache
+            other = NcmirToolsConfig()
+            other.set_home_directory(temp_dir)
+            other.set_etc_directory(os.path.join(temp_dir, 'etc'))
+            self.assertTrue(other.get_config() is first)
+
+            with open(cfile, 'w') as f:
+                f.write('[foo]\nport = 2222\n')
+            second = con.get_config()
+            self.assertTrue(second is not first)
+            self.assertEqual(second.getint('foo', 'port'), 2222)
+
+            config.clear_config_cache()
+            self.assertTrue(con.get_config() is not second)
+
+            os.unlink(cfile)
+            self.assertRaises(ConfigMissingError, con.get_config)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_ncmirtoolsconfigparser_typed_values(self):
+        con = config.NcmirToolsConfigParser()
+        con.add_section('foo')
+        con.set('foo', 'port', '22')
+        con.set('foo', 'timeout', '1.5')
+        con.set('foo', 'flag', 'yes')
+        con.set('foo', 'dirs', 'a,b,c')
+        self.assertEqual(con.getint('foo', 'port'), 22)
+        self.assertEqual(con.getfloat('foo', 'timeout'), 1.5)
+        self.assertEqual(con.getboolean('foo', 'flag'), True)
+        self.assertEqual(con.getlist('foo', 'dirs'), ['a', 'b', 'c'])
+        self.assertEqual(con.getlist('foo', 'dirs', separator=';'),
+                         ['a,b,c'])
+        self.assertEqual(con.getint('foo', 'nope', fallback=5), 5)
+        self.assertRaises(ValueError, con.getint, 'foo', 'flag')
+
+        # returned lists can be modified without affecting cache
+        con.getlist('foo', 'dirs').append('d')
+        self.assertEqual(con.getlist('foo', 'dirs'), ['a', 'b', 'c'])
+
+        # set clears cached values
+        con.set('foo', 'port', '23')
+        self.assertEqual(con.getint('foo', 'port'), 23)
+
+        # as do all other changes
+        con.remove_option('foo', 'port')
+        self.assertEqual(con.getint('foo', 'port', fallback=1), 1)
+        self.assertRaises(configparser.NoOptionError, con.getint,
+                          'foo', 'port')
+        con.read_string('[foo]\nport = 24\n')
+        self.assertEqual(con.getint('foo', 'port'), 24)
+        con.read_dict({'foo': {'port': '25'}})
+        self.assertEqual(con.getint('foo', 'port'), 25)
+        con['foo'] = {'port': '26', 'flag': 'no'}
+        self.assertEqual(con.getint('foo', 'port'), 26)
+        self.assertEqual(con.getboolean('foo', 'flag'), False)
+        con['foo']['port'] = '27'
+        self.assertEqual(con.getint('foo', 'port'), 27)
+        del con['foo']['port']
+        self.assertRaises(configparser.NoOptionError, con.getint,
+                          'foo', 'port')
+        con.read_string('[foo]\nport = 28\n')
+        self.assertEqual(con.getint('foo', 'port'), 28)
+        del con['foo']
+        self.assertRaises(configparser.NoSectionError, con.getint,
+                          'foo', 'port')
+        con.read_string('[foo]\nport = 29\n')
+        self.assertEqual(con.getint('foo', 'port'), 29)
+        con.remove_section('foo')
+        self.assertRaises(configparser.NoSectionError, con.getint,
+                          'foo', 'port')
+
+    def test_get_list(self):
+        con = configparser.ConfigParser()
+        con.add_section('foo')
+        con.set('foo', 'dirs', 'a,b')
+        self.assertEqual(config.get_list(con, 'foo', 'dirs'), ['a', 'b'])
+        con = config.NcmirToolsConfigParser()
+        con.add_section('foo')
+        con.set('foo', 'dirs', 'a:b')
+        self.assertEqual(config.get_list(con, 'foo', 'dirs',
+                                         separator=':'), ['a', 'b'])
+
+    def test_log_context(self):
+        self.assertEqual(config.get_log_context(), None)
+        config.set_log_context('ctx')
+        try:
+            seen = []
+
+            def record():
+                seen.append(config.get_log_context())
+            t = threading.Thread(target=record)
+            t.start()
+            t.join()
+            t = threading.Thread(target=config.with_log_context(record))
+            t.start()
+            t.join()
+            self.assertEqual(seen, [None, 'ctx'])
+        finally:
+            config.set_log_context(None)
+
 
 if __name__ == '__main__':
     sys.exit(unittest.main())
@@ -0,0 +1,372 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_daemon
+----------------------------------
+
+Tests for `daemon` module.
+"""
+import os
+import re
+import sys
+import json
+import time
+import logging
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+import configparser
+from mock import Mock
+
+from ncmirtools import config
+from ncmirtools import daemon
+from ncmirtools import metrics
+from ncmirtools.daemon import NcmirToolsServer
+from ncmirtools.lookup import DirectoryForId
+from ncmirtools.metrics import MetricsExporterFromConfigFactory
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+class Parameters(object):
+    """Dummy parameters object
+    """
+    pass
+
+
+class TestDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self._socket = os.path.join(self._temp_dir, 'd.sock')
+        self._server = None
+
+    def tearDown(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        shutil.rmtree(self._temp_dir)
+
+    def _start_server(self):
+        self._server = NcmirToolsServer(self._socket)
+        t = threading.Thread(target=self._server.serve_forever)
+        t.daemon = True
+        t.start()
+        return self._server
+
+    def test_get_socket_path(self):
+        self.assertEqual(daemon.get_socket_path('/foo'), '/foo')
+        orig = os.environ.get(daemon.SOCKET_ENV)
+        try:
+            os.environ[daemon.SOCKET_ENV] = '/bar'
+            self.assertEqual(daemon.get_socket_path(), '/bar')
+            del os.environ[daemon.SOCKET_ENV]
+            self.assertEqual(daemon.get_socket_path(),
+                             os.path.join(os.path.expanduser('~'),
+                                          daemon.DEFAULT_SOCKET_FILE))
+        finally:
+            if orig is not None:
+                os.environ[daemon.SOCKET_ENV] = orig
+
+    def test_forward_no_daemon(self):
+        self.assertEqual(daemon.forward_to_daemon('ping', {},
+                                                  socket_path=self._socket),
+                         None)
+        self.assertEqual(daemon.is_daemon_running(self._socket), False)
+
+        # stale socket file with nothing listening
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self._socket)
+        sock.close()
+        self.assertEqual(daemon.forward_to_daemon('ping', {},
+                                                  socket_path=self._socket),
+                         None)
+
+    def test_forward_uses_connect_timeout(self):
+        open(self._socket, 'w').close()
+        orig = daemon.send_request
+        try:
+            daemon.send_request = Mock(return_value={
+                daemon.EXIT_CODE_KEY: 0, daemon.STDOUT_KEY: 'pong\n'})
+            out = StringIO()
+            self.assertEqual(daemon.forward_to_daemon('ping', {},
+                                                      socket_path=self.
+                                                      _socket,
+                                                      out_stream=out), 0)
+            daemon.send_request.assert_called_once_with(
+                'ping', {}, socket_path=self._socket,
+                connect_timeout=daemon.DEFAULT_CONNECT_TIMEOUT)
+            self.assertEqual(out.getvalue(), 'pong\n')
+        finally:
+            daemon.send_request = orig
+
+    def test_forward_connection_lost_after_send(self):
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self._socket)
+        listener.listen(1)
+
+        def accept_and_close():
+            conn, addr = listener.accept()
+            conn.makefile('rb').readline()
+            conn.close()
+        t = threading.Thread(target=accept_and_close)
+        t.daemon = True
+        t.start()
+        out = StringIO()
+        err = StringIO()
+        try:
+            res = daemon.forward_to_daemon('cilupload', {},
+                                           socket_path=self._socket,
+                                           out_stream=out, err_stream=err)
+        finally:
+            t.join()
+            listener.close()
+        self.assertEqual(res, daemon.LOST_DAEMON_EXIT_CODE)
+        self.assertEqual(out.getvalue(), '')
+        self.assertTrue(err.getvalue().startswith('Lost connection to '
+                                                  'daemon at '))
+        self.assertTrue('No response from daemon' in err.getvalue())
+
+    def test_server_removes_stale_socket_and_refuses_second(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self._socket)
+        sock.close()
+        server = self._start_server()
+        self.assertEqual(server.get_socket_path(), self._socket)
+        self.assertEqual(os.stat(self._socket).st_mode & 0o777, 0o600)
+        self.assertTrue(daemon.is_daemon_running(self._socket))
+        self.assertRaises(EnvironmentError, NcmirToolsServer, self._socket)
+        self.assertTrue('cilupload' in server.get_commands())
+
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        self.assertFalse(os.path.exists(self._socket))
+
+    def test_ping_and_errors(self):
+        self._start_server()
+        out = StringIO()
+        err = StringIO()
+        self.assertEqual(daemon.forward_to_daemon('ping', {},
+                                                  socket_path=self._socket,
+                                                  out_stream=out,
+                                                  err_stream=err), 0)
+        self.assertEqual(out.getvalue(), 'pong\n')
+        self.assertEqual(err.getvalue(), '')
+
+        resp = daemon.send_request('bogus', {}, socket_path=self._socket)
+        self.assertEqual(resp[daemon.EXIT_CODE_KEY], 2)
+        self.assertTrue('Unknown command: bogus' in
+                        resp[daemon.STDERR_KEY])
+
+        # several requests over one connection including invalid json
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self._socket)
+        reader = sock.makefile('rb')
+        sock.sendall(b'not json\n{"command": "ping"}\n')
+        resp = json.loads(reader.readline().decode('utf-8'))
+        self.assertEqual(resp[daemon.EXIT_CODE_KEY], 2)
+        self.assertTrue('Invalid request' in resp[daemon.STDERR_KEY])
+        resp = json.loads(reader.readline().decode('utf-8'))
+        self.assertEqual(resp[daemon.EXIT_CODE_KEY], 0)
+        reader.close()
+        sock.close()
+
+    def test_handler_raises_exception(self):
+        server = self._start_server()
+        server.add_handler('boom', Mock(side_effect=Exception('oops')))
+        resp = daemon.send_request('boom', {}, socket_path=self._socket)
+        self.assertEqual(resp[daemon.EXIT_CODE_KEY], 2)
+        self.assertEqual(resp[daemon.STDERR_KEY],
+                         'Error running boom : oops\n')
+
+    def test_handler_errors_logged_are_returned(self):
+        server = self._start_server()
+
+        def log_error(server, args, out_stream, err_stream):
+            logging.getLogger('ncmirtools.foo').error('bad thing')
+            logging.getLogger('ncmirtools.foo').warning('just a warning')
+            return 1
+        server.add_handler('logerror', log_error)
+        resp = daemon.send_request('logerror', {}, socket_path=self._socket)
+        self.assertEqual(resp[daemon.EXIT_CODE_KEY], 1)
+        self.assertEqual(resp[daemon.STDERR_KEY],
+                         'ERROR ncmirtools.foo bad thing\n')
+
+        # handler is removed once request is done
+        self.assertEqual([h for h in logging.getLogger('ncmirtools').handlers
+                          if isinstance(h, daemon._RequestLogHandler)], [])
+
+    def test_handler_errors_logged_by_worker_threads_are_returned(self):
+        server = self._start_server()
+
+        def log_in_thread():
+            logging.getLogger('ncmirtools.foo').error('from worker')
+
+        def log_error(server, args, out_stream, err_stream):
+            # worker thread inherits log context of request
+            t = threading.Thread(target=config.with_log_context(
+                                 log_in_thread))
+            t.start()
+            t.join()
+            # thread started without it does not
+            t = threading.Thread(target=log_in_thread)
+            t.start()
+            t.join()
+            return 1
+        server.add_handler('logerror', log_error)
+        resp = daemon.send_request('logerror', {}, socket_path=self._socket)
+        self.assertEqual(resp[daemon.STDERR_KEY],
+                         'ERROR ncmirtools.foo from worker\n')
+        self.assertEqual(config.get_log_context(), None)
+
+    def test_mpidir_and_projectdir(self):
+        self._start_server()
+        pdir = os.path.join(self._temp_dir,
+                            re.sub('^/', '', DirectoryForId.PROJECT_DIR))
+        mpdir = os.path.join(self._temp_dir, 'ccdbprod', 'ccdbprod1',
+                             'home', 'CCDB_DATA_USER.portal',
+                             'CCDB_DATA_USER', 'acquisition',
+                             'project_2', 'microscopy_12345')
+        os.makedirs(mpdir)
+        resp = daemon.send_request('mpidir', {'mpid': '12345',
+                                              'prefixdir': pdir},
+                                   socket_path=self._socket)
+        self.assertEqual(resp[daemon.EXIT_CODE_KEY], 0)
+        self.assertEqual(resp[daemon.STDOUT_KEY], mpdir + os.linesep)
+
+        resp = daemon.send_request('mpidir', {'mpid': '999',
+                                              'prefixdir': pdir},
+                                   socket_path=self._socket)
+        self.assertEqual(resp[daemon.EXIT_CODE_KEY], 1)
+        self.assertEqual(resp[daemon.STDERR_KEY],
+                         'Directory not found' + os.linesep)
+
+        resp = daemon.send_request('projectdir', {'projectid': '2',
+                                                  'prefixdir': pdir},
+                                   socket_path=self._socket)
+        self.assertEqual(resp[daemon.EXIT_CODE_KEY], 0)
+        self.assertEqual(resp[daemon.STDOUT_KEY],
+                         os.path.dirname(mpdir) + os.linesep)
+
+    def test_projectsearch_no_config(self):
+        self._start_server()
+        resp = daemon.send_request('projectsearch',
+                                   {'keyword': 'yo',
+                                    'homedir': self._temp_dir},
+                                   socket_path=self._socket)
+        self.assertEqual(resp[daemon.EXIT_CODE_KEY], 3)
+        self.assertTrue('Configuration file missing' in
+                        resp[daemon.STDERR_KEY])
+
+    def test_cilupload_reuses_uploader(self):
+        server = self._start_server()
+        resp = daemon.send_request('cilupload',
+                                   {'data': ['/x'],
+                                    'homedir': self._temp_dir},
+                                   socket_path=self._socket)
+        self.assertEqual(resp[daemon.EXIT_CODE_KEY], 1)
+
+        uploader = Mock()
+        res = Mock()
+        res.get_error_message = Mock(return_value=None)
+        res.get_success_status = Mock(return_value=True)
+        res.as_string = Mock(return_value='Success: True')
+        uploader.upload_and_register_data = Mock(return_value=res)
+        server.get_ciluploader = Mock(return_value=(uploader,
+                                                    threading.Lock(), 0))
+        resp = daemon.send_request('cilupload',
+                                   {'data': ['/x'], 'force': True,
+                                    'homedir': self._temp_dir},
+                                   socket_path=self._socket)
+        self.assertEqual(resp[daemon.EXIT_CODE_KEY], 0)
+        self.assertTrue('Success: True' in resp[daemon.STDOUT_KEY])
+        uploader.upload_and_register_data.assert_called_with('/x',
+                                                             force=True)
+        uploader.close.assert_not_called()
+
+    def test_get_ciluploader_recreated_when_config_changes(self):
+        from ncmirtools import ciluploader
+        cfile = os.path.join(self._temp_dir, '.ncmirtools.conf')
+        with open(cfile, 'w') as f:
+            f.write('[ciluploader]\nhost = a\n')
+        server = NcmirToolsServer(self._socket)
+        orig = ciluploader.CILUploaderFromConfigFactory.get_ciluploader
+        try:
+            ciluploader.CILUploaderFromConfigFactory.get_ciluploader = \
+                Mock(side_effect=[Mock(), Mock()])
+            theargs = daemon.Parameters()
+            theargs.homedir = self._temp_dir
+            uploader, lock, exit_code = server.get_ciluploader(theargs)
+            self.assertEqual(exit_code, 0)
+            self.assertEqual(server.get_ciluploader(theargs),
+                             (uploader, lock, 0))
+
+            with open(cfile, 'w') as f:
+                f.write('[ciluploader]\nhost = bigger\n')
+            newuploader, newlock, exit_code = \
+                server.get_ciluploader(theargs)
+            self.assertEqual(exit_code, 0)
+            self.assertTrue(newuploader is not uploader)
+            uploader.close.assert_called_once_with()
+            newuploader.close.assert_not_called()
+        finally:
+            ciluploader.CILUploaderFromConfigFactory.get_ciluploader = orig
+            server.server_close()
+        newuploader.close.assert_called_once_with()
+
+    def test_get_argument_parser(self):
+        import argparse
+        parser = argparse.ArgumentParser()
+        subparsers = parser.add_subparsers(dest='command')
+        daemon.get_argument_parser(subparsers)
+        pargs = parser.parse_args(['serve', '--socket', '/foo'])
+        self.assertEqual(pargs.command, 'serve')
+        self.assertEqual(pargs.socket, '/foo')
+
+    def test_run_daemon_already_running(self):
+        self._start_server()
+        theargs = Parameters()
+        theargs.socket = self._socket
+        self.assertEqual(daemon.run(theargs), 1)
+
+    def test_start_metrics_export(self):
+        con = configparser.ConfigParser()
+        self.assertEqual(daemon._start_metrics_export(con), ([], None))
+
+        sec = MetricsExporterFromConfigFactory.SECTION
+        con.add_section(sec)
+        con.set(sec, MetricsExporterFromConfigFactory.JSON_FILE,
+                os.path.join(self._temp_dir, 'm.json'))
+        con.set(sec, MetricsExporterFromConfigFactory.EXPORT_INTERVAL, 'x')
+        exporters, export_thread = daemon._start_metrics_export(con)
+        self.assertEqual(len(exporters), 1)
+        self.assertEqual(export_thread, None)
+        metrics.stop_exporters(exporters)
+
+        jsonfile = os.path.join(self._temp_dir, 'm_serve.json')
+        os.unlink(jsonfile)
+        con.set(sec, MetricsExporterFromConfigFactory.EXPORT_INTERVAL,
+                '0.01')
+        exporters, export_thread = daemon._start_metrics_export(con)
+        try:
+            self.assertEqual(export_thread.get_interval(), 0.01)
+            for i in range(500):
+                if os.path.isfile(jsonfile):
+                    break
+                time.sleep(0.01)
+            with open(jsonfile, 'r') as f:
+                self.assertEqual(json.load(f)['program'], 'serve')
+        finally:
+            export_thread.stop()
+            metrics.stop_exporters(exporters)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
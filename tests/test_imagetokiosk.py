@@ -9,6 +9,7 @@ Tests for `imagetokiosk` module.
 """
 import os
 import sys
+import json
 import tempfile
 import shutil
 import unittest
@@ -19,8 +20,11 @@ from mock import Mock
 
 
 from ncmirtools import imagetokiosk
+from ncmirtools.metrics import MetricsExporterFromConfigFactory
 from ncmirtools.config import NcmirToolsConfig
 from ncmirtools.kiosk.transfer import SftpTransfer
+from ncmirtools.kiosk.transfer import Transfer
+from ncmirtools.kiosk.progress import ProgressLinePrinter
 
 
 class TestImagetokiosk(unittest.TestCase):
@@ -44,6 +48,12 @@ class TestImagetokiosk(unittest.TestCase):
         self.assertEqual(pargs.mode, 'dryrun')
         self.assertEqual(pargs.loglevel, 'DEBUG')
         self.assertEqual(pargs.homedir, 'home')
+        self.assertEqual(pargs.progress, False)
+
+        pargs = imagetokiosk._parse_arguments('some description',
+                                              ['run',
+                                               imagetokiosk.PROGRESS_ARG])
+        self.assertEqual(pargs.progress, True)
 
     def test_get_last_transferred_file(self):
         temp_dir = tempfile.mkdtemp()
@@ -330,6 +340,85 @@ class TestImagetokiosk(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_upload_image_file_skipped(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            p = imagetokiosk.Parameters()
+            p.mode = imagetokiosk.RUN_MODE
+            logfile = os.path.join(temp_dir, 'logfile.txt')
+            con = configparser.ConfigParser()
+            con.add_section(NcmirToolsConfig.DATASERVER_SECTION)
+            con.set(NcmirToolsConfig.DATASERVER_SECTION,
+                    NcmirToolsConfig.DATASERVER_TRANSFERLOG, logfile)
+
+            fakefile = os.path.join(temp_dir, 'foo.txt')
+            open(fakefile, 'a').close()
+            mt = imagetokiosk.Parameters()
+            mt.connect = Mock()
+            mt.disconnect = Mock()
+            mt.transfer_file = Mock(return_value=(Transfer.SKIPPED, 0, 0))
+            res = imagetokiosk._upload_image_file(p, fakefile, con,
+                                                  alt_transfer=mt)
+            self.assertEqual(res, 0)
+            self.assertEqual(imagetokiosk._get_last_transferred_file(con),
+                             fakefile)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_upload_image_file_records_checksum(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            p = imagetokiosk.Parameters()
+            p.mode = imagetokiosk.RUN_MODE
+            logfile = os.path.join(temp_dir, 'logfile.txt')
+            con = configparser.ConfigParser()
+            con.add_section(NcmirToolsConfig.DATASERVER_SECTION)
+            con.set(NcmirToolsConfig.DATASERVER_SECTION,
+                    NcmirToolsConfig.DATASERVER_TRANSFERLOG, logfile)
+
+            fakefile = os.path.join(temp_dir, 'foo.txt')
+            open(fakefile, 'a').close()
+            mt = imagetokiosk.Parameters()
+            mt.connect = Mock()
+            mt.disconnect = Mock()
+            mt.transfer_file = Mock(return_value=(None, 0, 0))
+            mt.get_last_checksum = Mock(return_value='abc')
+            mt.get_checksum_algorithm = Mock(return_value='sha256')
+            mt.get_compression = Mock(return_value=None)
+            res = imagetokiosk._upload_image_file(p, fakefile, con,
+                                                  alt_transfer=mt)
+            self.assertEqual(res, 0)
+            self.assertEqual(imagetokiosk._get_last_transferred_file(con),
+                             fakefile)
+            with open(logfile, 'r') as f:
+                self.assertEqual(f.read(), fakefile + '\nsha256:abc\n')
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_upload_image_file_with_progress(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            p = imagetokiosk.Parameters()
+            p.mode = imagetokiosk.RUN_MODE
+            p.progress = True
+            logfile = os.path.join(temp_dir, 'logfile.txt')
+            con = configparser.ConfigParser()
+            con.add_section(NcmirToolsConfig.DATASERVER_SECTION)
+            con.set(NcmirToolsConfig.DATASERVER_SECTION,
+                    NcmirToolsConfig.DATASERVER_TRANSFERLOG, logfile)
+
+            fakefile = os.path.join(temp_dir, 'foo.txt')
+            open(fakefile, 'a').close()
+            mt = Transfer()
+            mt.transfer_file = Mock(return_value=(None, 0.5, 100))
+            res = imagetokiosk._upload_image_file(p, fakefile, con,
+                                                  alt_transfer=mt)
+            self.assertEqual(res, 0)
+            self.assertTrue(isinstance(mt.get_progress_callback(),
+                                       ProgressLinePrinter))
+        finally:
+            shutil.rmtree(temp_dir)
+
     def test_check_and_transfer_image_invalid_config(self):
         temp_dir = tempfile.mkdtemp()
         try:
@@ -396,6 +485,51 @@ class TestImagetokiosk(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_check_and_transfer_image_exports_metrics(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            con = configparser.ConfigParser()
+            con.add_section(NcmirToolsConfig.DATASERVER_SECTION)
+
+            con.set(NcmirToolsConfig.DATASERVER_SECTION,
+                    NcmirToolsConfig.DATASERVER_DATADIR, temp_dir)
+            con.set(NcmirToolsConfig.DATASERVER_SECTION,
+                    NcmirToolsConfig.DATASERVER_IMGSUFFIX, '.dm4')
+            sec = MetricsExporterFromConfigFactory.SECTION
+            con.add_section(sec)
+            promfile = os.path.join(temp_dir, 'ncmirtools.prom')
+            con.set(sec, MetricsExporterFromConfigFactory.PROMETHEUS_TEXTFILE,
+                    promfile)
+            jsonfile = os.path.join(temp_dir, 'metrics.json')
+            con.set(sec, MetricsExporterFromConfigFactory.JSON_FILE,
+                    jsonfile)
+            uconfig = os.path.join(temp_dir,
+                                   NcmirToolsConfig.UCONFIG_FILE)
+            f = open(uconfig, 'w')
+            con.write(f)
+            f.flush()
+            f.close()
+            p = imagetokiosk.Parameters()
+            p.program = 'foo'
+            p.homedir = temp_dir
+            p.mode = imagetokiosk.DRYRUN_MODE
+            res = imagetokiosk._check_and_transfer_image(p)
+            self.assertEqual(res, 0)
+            self.assertFalse(os.path.isfile(promfile))
+            promfile = os.path.join(temp_dir,
+                                    'ncmirtools_imagetokiosk.prom')
+            with open(promfile, 'r') as f:
+                self.assertTrue('ncmirtools_datafinder_scan_seconds_count'
+                                '{program="imagetokiosk"}' in f.read())
+            jsonfile = os.path.join(temp_dir, 'metrics_imagetokiosk.json')
+            with open(jsonfile, 'r') as f:
+                data = json.load(f)
+            self.assertEqual(data['program'], 'imagetokiosk')
+            self.assertTrue('ncmirtools_datafinder_scan_seconds' in
+                            data['metrics'])
+        finally:
+            shutil.rmtree(temp_dir)
+
     def test_main_no_file_to_transfer(self):
         temp_dir = tempfile.mkdtemp()
         try:
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_imports
+----------------------------------
+
+Tests command line scripts do not import heavy modules until
+a code path needs them.
+"""
+import sys
+import unittest
+
+from tests.benchmarks.bench_import_time import BUDGETS_MS
+from tests.benchmarks.bench_import_time import measure_import
+
+
+class TestImports(unittest.TestCase):
+
+    def test_scripts_do_not_import_heavy_modules(self):
+        for module in sorted(BUDGETS_MS.keys()):
+            cumulative, heavy = measure_import(module)
+            self.assertTrue(cumulative > 0, module)
+            self.assertEqual(heavy, [], module + ' imported ' +
+                             ','.join(heavy))
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
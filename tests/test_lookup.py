@@ -14,6 +14,7 @@ import sys
 import re
 import unittest
 
+from ncmirtools import metrics
 from ncmirtools.lookup import DirectoryForId
 from ncmirtools.lookup import DirectorySearchPathError
 from ncmirtools.lookup import InvalidMicroscopyProductIdError
@@ -202,6 +203,30 @@ class TestLookup(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_lookup_updates_metrics(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            pdir = re.sub('^/', '', DirectoryForId.PROJECT_DIR)
+            dmp = DirectoryForId(os.path.join(temp_dir, pdir))
+            acq = os.path.join(temp_dir, 'ccdbprod/ccdbprod1/home/'
+                                         'CCDB_DATA_USER.portal/'
+                                         'CCDB_DATA_USER/acquisition')
+            os.makedirs(os.path.join(acq, 'project_1'))
+            os.makedirs(os.path.join(acq, 'project_2'))
+            reg = metrics.get_registry()
+            lookups = reg.get_metric('ncmirtools_lookup_seconds')
+            entries = reg.get_metric('ncmirtools_lookup_entries_'
+                                     'examined_total')
+            lookup_count = lookups.get_count()
+            entry_count = entries.get_value()
+            res = dmp.get_directory_for_project_id(2)
+            self.assertEqual(res, [os.path.join(acq, 'project_2')])
+            self.assertEqual(lookups.get_count(), lookup_count + 1)
+            # ccdbprod1 under ccdbprod and 2 projects under acquisition
+            self.assertEqual(entries.get_value(), entry_count + 3)
+        finally:
+            shutil.rmtree(temp_dir)
+
     def test_get_directory_for_project_id(self):
         temp_dir = tempfile.mkdtemp()
         try:
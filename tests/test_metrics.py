@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_metrics
+----------------------------------
+
+Tests for `metrics` module.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import tempfile
+import unittest
+import configparser
+from mock import Mock
+
+from ncmirtools import metrics
+from ncmirtools.metrics import Counter
+from ncmirtools.metrics import Histogram
+from ncmirtools.metrics import MetricsRegistry
+from ncmirtools.metrics import PrometheusTextfileExporter
+from ncmirtools.metrics import JsonExporter
+from ncmirtools.metrics import StatsDExporter
+from ncmirtools.metrics import MetricsExporterFromConfigFactory
+from ncmirtools.config import NcmirToolsConfig
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def test_counter(self):
+        c = Counter('foo_total', help_text='hi')
+        self.assertEqual(c.get_name(), 'foo_total')
+        self.assertEqual(c.get_help(), 'hi')
+        self.assertEqual(c.get_value(), 0)
+        c.inc()
+        c.inc(5)
+        self.assertEqual(c.get_value(), 6)
+        self.assertRaises(ValueError, c.inc, -1)
+        self.assertEqual(c.get_snapshot(), {'type': 'counter',
+                                            'help': 'hi', 'value': 6})
+        c.reset()
+        self.assertEqual(c.get_value(), 0)
+        self.assertRaises(ValueError, Counter, 'bad name')
+        self.assertRaises(ValueError, Counter, None)
+
+    def test_histogram(self):
+        h = Histogram('foo_seconds', buckets=[1, 5])
+        self.assertEqual(h.get_count(), 0)
+        self.assertEqual(h.get_min(), None)
+        for val in [0.5, 1, 3, 10]:
+            h.observe(val)
+        self.assertEqual(h.get_count(), 4)
+        self.assertEqual(h.get_sum(), 14.5)
+        self.assertEqual(h.get_min(), 0.5)
+        self.assertEqual(h.get_max(), 10)
+        self.assertEqual(h.get_buckets(), [(1.0, 2), (5.0, 3),
+                                           (float('inf'), 4)])
+        snap = h.get_snapshot()
+        self.assertEqual(snap['buckets'], [['1.0', 2], ['5.0', 3],
+                                           ['+Inf', 4]])
+        h.reset()
+        self.assertEqual(h.get_count(), 0)
+        self.assertEqual(h.get_buckets()[-1], (float('inf'), 0))
+        self.assertRaises(ValueError, Histogram, 'foo', buckets=[5, 1])
+
+        h = Histogram('bar_seconds')
+        self.assertEqual(len(h.get_buckets()),
+                         len(metrics.DEFAULT_TIME_BUCKETS) + 1)
+
+    def test_timer(self):
+        h = Histogram('foo_seconds')
+        with h.time() as t:
+            pass
+        self.assertTrue(t.get_duration() >= 0)
+        self.assertEqual(h.get_count(), 1)
+
+        @h.timed
+        def hello(x):
+            return x + 1
+        self.assertEqual(hello(1), 2)
+        self.assertEqual(hello.__name__, 'hello')
+        self.assertEqual(h.get_count(), 2)
+
+        t = h.time().start()
+        self.assertEqual(t.get_duration(), None)
+        self.assertTrue(t.stop() >= 0)
+        self.assertEqual(h.get_count(), 3)
+
+    def test_registry(self):
+        reg = MetricsRegistry()
+        c = reg.counter('b_total', 'help')
+        self.assertTrue(reg.counter('b_total') is c)
+        h = reg.histogram('a_seconds')
+        self.assertTrue(reg.get_metric('a_seconds') is h)
+        self.assertEqual(reg.get_metric('nope'), None)
+        self.assertEqual(reg.get_metrics(), [h, c])
+        self.assertRaises(ValueError, reg.histogram, 'b_total')
+
+        listener = Mock()
+        bad_listener = Mock(side_effect=Exception('oops'))
+        reg.add_listener(bad_listener)
+        reg.add_listener(listener)
+        c.inc(2)
+        h.observe(0.5)
+        listener.assert_any_call(c, 2)
+        listener.assert_any_call(h, 0.5)
+        reg.remove_listener(listener)
+        c.inc()
+        self.assertEqual(listener.call_count, 2)
+
+        snap = reg.get_snapshot()
+        self.assertEqual(snap['b_total']['value'], 3)
+        self.assertEqual(snap['a_seconds']['count'], 1)
+        reg.reset()
+        self.assertTrue(reg.get_metric('b_total') is c)
+        self.assertEqual(c.get_value(), 0)
+
+    def test_default_registry(self):
+        c = metrics.counter('ncmirtools_test_metrics_total')
+        self.assertTrue(metrics.get_registry().
+                        get_metric('ncmirtools_test_metrics_total') is c)
+        h = metrics.histogram('ncmirtools_test_metrics_seconds')
+        self.assertTrue(metrics.get_registry().
+                        get_metric('ncmirtools_test_metrics_seconds') is h)
+
+    def test_prometheus_textfile_exporter(self):
+        reg = MetricsRegistry()
+        reg.counter('foo_total', 'Foo\nthings').inc(3)
+        h = reg.histogram('bar_seconds', buckets=[1])
+        h.observe(0.25)
+        h.observe(2)
+        path = os.path.join(self._temp_dir, 'ncmirtools.prom')
+        exp = PrometheusTextfileExporter(path)
+        self.assertEqual(exp.get_path(), path)
+        exp.export(reg)
+        with open(path, 'r') as f:
+            data = f.read()
+        self.assertEqual(data, '# TYPE bar_seconds histogram\n'
+                               'bar_seconds_bucket{le="1.0"} 1\n'
+                               'bar_seconds_bucket{le="+Inf"} 2\n'
+                               'bar_seconds_sum 2.25\n'
+                               'bar_seconds_count 2\n'
+                               '# HELP foo_total Foo\\nthings\n'
+                               '# TYPE foo_total counter\n'
+                               'foo_total 3\n')
+        self.assertEqual(os.listdir(self._temp_dir), ['ncmirtools.prom'])
+
+        exp = PrometheusTextfileExporter(path, program='mp"id')
+        self.assertEqual(exp.get_program(), 'mp"id')
+        exp.export(reg)
+        with open(path, 'r') as f:
+            data = f.read()
+        self.assertTrue('bar_seconds_bucket{program="mp\\"id",le="1.0"} 1\n'
+                        in data)
+        self.assertTrue('bar_seconds_sum{program="mp\\"id"} 2.25\n' in data)
+        self.assertTrue('foo_total{program="mp\\"id"} 3\n' in data)
+
+    def test_json_exporter(self):
+        reg = MetricsRegistry()
+        reg.counter('foo_total').inc()
+        path = os.path.join(self._temp_dir, 'metrics.json')
+        exp = JsonExporter(path)
+        self.assertEqual(exp.get_path(), path)
+        exp.export(reg)
+        with open(path, 'r') as f:
+            data = json.load(f)
+        self.assertEqual(data['host'], socket.gethostname())
+        self.assertEqual(data['program'], None)
+        self.assertTrue(data['timestamp'] > 0)
+        self.assertEqual(data['metrics']['foo_total']['value'], 1)
+
+        exp = JsonExporter(path, program='mpidir')
+        self.assertEqual(exp.get_program(), 'mpidir')
+        exp.export(reg)
+        with open(path, 'r') as f:
+            self.assertEqual(json.load(f)['program'], 'mpidir')
+
+    def test_get_program_path(self):
+        self.assertEqual(metrics.get_program_path('/a/b.prom', None),
+                         '/a/b.prom')
+        self.assertEqual(metrics.get_program_path('/a/b.prom', 'mpidir'),
+                         '/a/b_mpidir.prom')
+        self.assertEqual(metrics.get_program_path('/a/b', 'serve'),
+                         '/a/b_serve')
+
+    def test_statsd_format_update(self):
+        c = Counter('foo_total')
+        h = Histogram('foo_seconds')
+        r = Histogram('foo_bytes_per_second')
+        self.assertEqual(StatsDExporter.format_update(c, 2), 'foo_total:2|c')
+        self.assertEqual(StatsDExporter.format_update(c, 2, prefix='x'),
+                         'x.foo_total:2|c')
+        self.assertEqual(StatsDExporter.format_update(h, 1.5),
+                         'foo_seconds:1500.000|ms')
+        self.assertEqual(StatsDExporter.format_update(r, 10.0),
+                         'foo_bytes_per_second:10.0|h')
+
+    def test_statsd_exporter(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(('127.0.0.1', 0))
+        server.settimeout(5)
+        try:
+            reg = MetricsRegistry()
+            c = reg.counter('foo_total')
+            exp = StatsDExporter('127.0.0.1', port=server.getsockname()[1],
+                                 prefix='kiosk1')
+            self.assertEqual(exp.get_host(), '127.0.0.1')
+            self.assertEqual(exp.get_prefix(), 'kiosk1')
+            c.inc()
+            exp.send_update(c, 1)
+            exp.attach(reg)
+            c.inc(4)
+            data, addr = server.recvfrom(1024)
+            self.assertEqual(data, b'kiosk1.foo_total:4|c')
+            exp.export(reg)
+            exp.close()
+            exp.close()
+            c.inc()
+            exp.send_update(c, 1)
+        finally:
+            server.close()
+        self.assertEqual(StatsDExporter('foo').get_port(),
+                         StatsDExporter.DEFAULT_PORT)
+
+    def test_exporter_from_config_factory(self):
+        fac = MetricsExporterFromConfigFactory(None)
+        self.assertEqual(fac.get_exporters(), ([], None))
+
+        con = configparser.ConfigParser()
+        con.add_section(MetricsExporterFromConfigFactory.SECTION)
+        fac = MetricsExporterFromConfigFactory(con)
+        self.assertEqual(fac.get_exporters(), ([], None))
+
+        sec = MetricsExporterFromConfigFactory.SECTION
+        con.set(sec, MetricsExporterFromConfigFactory.PROMETHEUS_TEXTFILE,
+                '/a.prom')
+        con.set(sec, MetricsExporterFromConfigFactory.JSON_FILE, '/b.json')
+        con.set(sec, MetricsExporterFromConfigFactory.STATSD_HOST, 'foo')
+        con.set(sec, MetricsExporterFromConfigFactory.STATSD_PORT, 'x')
+        exporters, errmsg = fac.get_exporters()
+        self.assertEqual(exporters, None)
+        self.assertEqual(errmsg, 'statsd_port must be an integer: x')
+
+        con.set(sec, MetricsExporterFromConfigFactory.STATSD_PORT, '9125')
+        con.set(sec, MetricsExporterFromConfigFactory.STATSD_PREFIX, 'k')
+        exporters, errmsg = fac.get_exporters()
+        self.assertEqual(errmsg, None)
+        self.assertEqual(exporters[0].get_path(), '/a.prom')
+        self.assertEqual(exporters[1].get_path(), '/b.json')
+        self.assertEqual(exporters[2].get_host(), 'foo')
+        self.assertEqual(exporters[2].get_port(), 9125)
+        self.assertEqual(exporters[2].get_prefix(), 'k')
+
+        fac = MetricsExporterFromConfigFactory(con, program='mpidir')
+        exporters, errmsg = fac.get_exporters()
+        self.assertEqual(exporters[0].get_path(), '/a_mpidir.prom')
+        self.assertEqual(exporters[0].get_program(), 'mpidir')
+        self.assertEqual(exporters[1].get_path(), '/b_mpidir.json')
+        self.assertEqual(exporters[1].get_program(), 'mpidir')
+        self.assertEqual(exporters[2].get_prefix(), 'k.mpidir')
+        con.remove_option(sec, MetricsExporterFromConfigFactory.STATSD_PREFIX)
+        exporters, errmsg = fac.get_exporters()
+        self.assertEqual(exporters[2].get_prefix(), 'mpidir')
+
+    def test_get_export_interval(self):
+        fac = MetricsExporterFromConfigFactory(None)
+        self.assertEqual(fac.get_export_interval(),
+                         (MetricsExporterFromConfigFactory.
+                          DEFAULT_EXPORT_INTERVAL, None))
+        con = configparser.ConfigParser()
+        sec = MetricsExporterFromConfigFactory.SECTION
+        con.add_section(sec)
+        fac = MetricsExporterFromConfigFactory(con)
+        con.set(sec, MetricsExporterFromConfigFactory.EXPORT_INTERVAL, '2.5')
+        self.assertEqual(fac.get_export_interval(), (2.5, None))
+        for val in ['x', '0']:
+            con.set(sec, MetricsExporterFromConfigFactory.EXPORT_INTERVAL,
+                    val)
+            self.assertEqual(fac.get_export_interval(),
+                             (None, 'export_interval must be a number '
+                                    'greater then 0'))
+
+    def test_metrics_export_thread(self):
+        reg = MetricsRegistry()
+        exp = Mock()
+        t = metrics.MetricsExportThread([exp], 0.01, registry=reg)
+        self.assertEqual(t.get_interval(), 0.01)
+        self.assertTrue(t.daemon)
+        t.start()
+        for i in range(500):
+            if exp.export.call_count >= 2:
+                break
+            time.sleep(0.01)
+        t.stop()
+        self.assertFalse(t.is_alive())
+        self.assertTrue(exp.export.call_count >= 2)
+        exp.export.assert_called_with(reg)
+        # stop before start is fine
+        metrics.MetricsExportThread([exp], 1).stop()
+
+    def test_get_config_or_none(self):
+        self.assertEqual(metrics.get_config_or_none(self._temp_dir), None)
+        con = configparser.ConfigParser()
+        sec = MetricsExporterFromConfigFactory.SECTION
+        con.add_section(sec)
+        con.set(sec, MetricsExporterFromConfigFactory.JSON_FILE, '/b.json')
+        with open(os.path.join(self._temp_dir,
+                               NcmirToolsConfig.UCONFIG_FILE), 'w') as f:
+            con.write(f)
+        res = metrics.get_config_or_none(self._temp_dir)
+        self.assertEqual(res.get(sec,
+                                 MetricsExporterFromConfigFactory.JSON_FILE),
+                         '/b.json')
+
+    def test_start_and_stop_exporters(self):
+        con = configparser.ConfigParser()
+        sec = MetricsExporterFromConfigFactory.SECTION
+        con.add_section(sec)
+        con.set(sec, MetricsExporterFromConfigFactory.STATSD_HOST, 'foo')
+        con.set(sec, MetricsExporterFromConfigFactory.STATSD_PORT, 'x')
+        self.assertEqual(metrics.start_exporters(con), [])
+
+        path = os.path.join(self._temp_dir, 'm.prom')
+        con = configparser.ConfigParser()
+        con.add_section(sec)
+        con.set(sec, MetricsExporterFromConfigFactory.PROMETHEUS_TEXTFILE,
+                path)
+        reg = MetricsRegistry()
+        reg.counter('foo_total').inc()
+        exporters = metrics.start_exporters(con, registry=reg)
+        self.assertEqual(len(exporters), 1)
+
+        broken = Mock()
+        broken.export = Mock(side_effect=IOError('no'))
+        metrics.stop_exporters([broken] + exporters, registry=reg)
+        broken.close.assert_called_once_with()
+        with open(path, 'r') as f:
+            self.assertTrue('foo_total 1\n' in f.read())
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -12,6 +12,8 @@ import sys
 import unittest
 
 from ncmirtools.lookup import MicroscopyProduct
+from ncmirtools.lookup import MicroscopyProductRecord
+from ncmirtools.lookup import ProjectRecord
 
 
 class TestMicroscopyProduct(unittest.TestCase):
@@ -46,6 +48,25 @@ class TestMicroscopyProduct(unittest.TestCase):
         self.assertEqual(mp.get_as_string(), '\nId: 4\n\nImage Basename:'
                                              '\n\n   blah\n\nNotes:\n\n   '
                                              'some notes\n\n')
+        self.assertFalse(hasattr(mp, '__dict__'))
+
+    def test_records(self):
+        rec = MicroscopyProductRecord(4, 'blah', 'some notes')
+        self.assertEqual(rec, (4, 'blah', 'some notes'))
+        self.assertEqual(rec.get_mpid(), 4)
+        self.assertEqual(rec.get_image_basename(), 'blah')
+        self.assertEqual(rec.get_notes(), 'some notes')
+        self.assertEqual(rec.get_as_string(),
+                         MicroscopyProduct(mpid=4, image_basename='blah',
+                                           notes='some notes').
+                         get_as_string())
+        self.assertFalse(hasattr(rec, '__dict__'))
+
+        rec = ProjectRecord(20333, 'some project')
+        project_id, project_name = rec
+        self.assertEqual(project_id, 20333)
+        self.assertEqual(rec.project_name, 'some project')
+        self.assertEqual(rec.as_string(), '20333    some project')
 
 
 if __name__ == '__main__':
@@ -44,6 +44,14 @@ class TestMicroscopyProductLookupViaDatabase(unittest.TestCase):
         res = ps.get_microscopyproduct_for_id(maxval)
         self.assertEqual(res, None)
 
+        # negative value, rejected before connecting as in bulk lookup
+        mockcon = Mock()
+        ps.set_alternate_connection(mockcon)
+        res = ps.get_microscopyproduct_for_id(-1)
+        self.assertEqual(res, None)
+        mockcon.cursor.assert_not_called()
+        self.assertEqual(ps._is_valid_mpid(-1), False)
+
     def test_get_microscopyproduct_for_id_no_matching_id(self):
         ps = MicroscopyProductLookupViaDatabase(configparser.ConfigParser())
 
@@ -106,6 +114,35 @@ class TestMicroscopyProductLookupViaDatabase(unittest.TestCase):
         self.assertEqual(res.get_notes(), 'somenotes')
         self.assertEqual(res.get_mpid(), '123')
 
+    def test_iter_microscopyproducts(self):
+        ps = MicroscopyProductLookupViaDatabase(configparser.ConfigParser())
+
+        mockcon = Mock()
+        mcursor = Mock()
+        mcursor.fetchall = Mock(side_effect=[[(1, 'a', 'n1'),
+                                              (2, 'b', 'n2')],
+                                             [(3, 'c', None)]])
+        mockcon.cursor = Mock(return_value=mcursor)
+        ps.set_alternate_connection(mockcon)
+
+        orig = MicroscopyProductLookupViaDatabase.FETCH_SIZE
+        try:
+            MicroscopyProductLookupViaDatabase.FETCH_SIZE = 2
+            res = list(ps.iter_microscopyproducts([1, 'x', 2, -1, 3,
+                                                   2 ** 31]))
+        finally:
+            MicroscopyProductLookupViaDatabase.FETCH_SIZE = orig
+
+        self.assertEqual(res, [('1', 'a', 'n1'), ('2', 'b', 'n2'),
+                               ('3', 'c', 'None')])
+        self.assertEqual(res[0].get_image_basename(), 'a')
+        self.assertEqual(mcursor.execute.call_count, 2)
+        mcursor.execute.assert_called_with("SELECT mpid,image_basename,"
+                                           "notes FROM Microscopy_products "
+                                           "WHERE mpid IN (3)")
+        mcursor.close.assert_called_once_with()
+        mockcon.close.assert_called_once_with()
+
 
 if __name__ == '__main__':
     sys.exit(unittest.main())
@@ -9,14 +9,21 @@ Tests for `lookup` module.
 """
 import re
 import os
+import json
 import sys
 import tempfile
 import shutil
 import unittest
+from mock import patch
 
 from ncmirtools import mpidir
 from ncmirtools.lookup import DirectoryForId
 
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
 
 class TestMpidir(unittest.TestCase):
 
@@ -38,6 +45,7 @@ class TestMpidir(unittest.TestCase):
         self.assertEqual(pargs.mpid, '1xx')
         self.assertEqual(pargs.loglevel, 'DEBUG')
         self.assertEqual(pargs.prefixdir, 'hi')
+        self.assertEqual(pargs.format, 'text')
 
     def test_run_lookup(self):
 
@@ -63,9 +71,48 @@ class TestMpidir(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_run_lookup_structured_output(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            pdir = os.path.join(temp_dir, re.sub('^/', '',
+                                                 DirectoryForId.PROJECT_DIR))
+            mpdir = os.path.join(temp_dir, 'ccdbprod', 'ccdbprod1',
+                                 'home', 'CCDB_DATA_USER.portal',
+                                 'CCDB_DATA_USER', 'acquisition',
+                                 'project_2', 'microscopy_12345')
+            os.makedirs(mpdir)
+            out = StringIO()
+            self.assertEqual(mpidir._run_lookup(pdir, '12345',
+                                                out_stream=out,
+                                                fmt='json'), 0)
+            self.assertEqual(json.loads(out.getvalue()),
+                             [{'mpid': '12345', 'path': mpdir}])
+
+            out = StringIO()
+            err = StringIO()
+            self.assertEqual(mpidir._run_lookup(pdir, '999',
+                                                out_stream=out,
+                                                err_stream=err,
+                                                fmt='tsv'), 1)
+            self.assertEqual(out.getvalue(), 'mpid\tpath\n')
+            self.assertEqual(err.getvalue(),
+                             mpidir.DIR_NOT_FOUND_MSG + os.linesep)
+        finally:
+            shutil.rmtree(temp_dir)
+
     def test_main(self):
         self.assertEqual(mpidir.main(['hi', 'blah']), 1)
 
+    @patch('ncmirtools.daemon.forward_to_daemon', return_value=0)
+    def test_main_forwards_absolute_prefixdir(self, mock_forward):
+        self.assertEqual(mpidir.main(['hi', '123', '--prefixdir',
+                                      'foo/<MP_ID>']), 0)
+        mock_forward.assert_called_once_with(
+            'mpidir', {'mpid': '123',
+                       'prefixdir': os.path.join(os.getcwd(), 'foo',
+                                                 '<MP_ID>'),
+                       'format': 'text'})
+
 
 if __name__ == '__main__':
     sys.exit(unittest.main())
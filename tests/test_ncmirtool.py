@@ -7,8 +7,10 @@ test_lookup
 
 Tests for `lookup` module.
 """
+import os
 import sys
 import unittest
+from mock import patch
 
 from ncmirtools import ncmirtool
 
@@ -26,12 +28,22 @@ class TestNcmirTool(unittest.TestCase):
                                            ['cilupload', 'hi'])
         self.assertEqual(pargs.command, 'cilupload')
         self.assertEqual(pargs.loglevel, 'WARNING')
-        self.assertEqual(pargs.data, 'hi')
+        self.assertEqual(pargs.data, ['hi'])
 
     def test_main_no_matching_command(self):
         res = ncmirtool.main(['ncmirtool.py', 'cilupload', 'foo'])
         self.assertTrue(res > 0)
 
+    @patch('ncmirtools.daemon.forward_to_daemon', return_value=0)
+    def test_forward_cilupload_absolute_paths(self, mock_forward):
+        pargs = ncmirtool._parse_arguments('desc',
+                                           ['cilupload', 'hi',
+                                            '--homedir', 'home'])
+        self.assertEqual(ncmirtool._forward_cilupload(pargs), 0)
+        args = mock_forward.call_args[0][1]
+        self.assertEqual(args['data'], [os.path.join(os.getcwd(), 'hi')])
+        self.assertEqual(args['homedir'], os.path.join(os.getcwd(), 'home'))
+
 
 if __name__ == '__main__':  # pragma: no cover
     sys.exit(unittest.main())
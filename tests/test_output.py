@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_output
+----------------------------------
+
+Tests for `output` module.
+"""
+import sys
+import json
+import argparse
+import unittest
+
+from ncmirtools import output
+from ncmirtools.output import RecordWriter
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+class Parameters(object):
+    """Dummy parameters object
+    """
+    pass
+
+
+class TestOutput(unittest.TestCase):
+
+    def test_add_format_argument_and_get_format(self):
+        parser = argparse.ArgumentParser()
+        output.add_format_argument(parser)
+        self.assertEqual(parser.parse_args([]).format, output.TEXT_FORMAT)
+        self.assertEqual(parser.parse_args(['--format', 'tsv']).format,
+                         output.TSV_FORMAT)
+        p = Parameters()
+        self.assertEqual(output.get_format(p), output.TEXT_FORMAT)
+        p.format = output.JSONL_FORMAT
+        self.assertEqual(output.get_format(p), output.JSONL_FORMAT)
+
+    def test_invalid_format(self):
+        self.assertRaises(ValueError, RecordWriter, StringIO(),
+                          output.TEXT_FORMAT, ['a'])
+
+    def test_json(self):
+        out = StringIO()
+        with RecordWriter(out, output.JSON_FORMAT, ['a', 'b']) as w:
+            pass
+        self.assertEqual(json.loads(out.getvalue()), [])
+
+        out = StringIO()
+        with RecordWriter(out, output.JSON_FORMAT, ['a', 'b']) as w:
+            w.write((1, 'x"y'))
+            self.assertEqual(w.write_all([(None, True), (2.5, 'z')]), 2)
+            self.assertEqual(w.get_count(), 3)
+        self.assertEqual(json.loads(out.getvalue()),
+                         [{'a': 1, 'b': 'x"y'}, {'a': None, 'b': True},
+                          {'a': 2.5, 'b': 'z'}])
+
+    def test_json_not_closed_on_exception(self):
+        for records in [[], [(1, 'x')]]:
+            out = StringIO()
+            try:
+                with RecordWriter(out, output.JSON_FORMAT, ['a', 'b']) as w:
+                    w.write_all(records)
+                    raise IOError('lost connection')
+            except IOError:
+                pass
+            self.assertRaises(ValueError, json.loads, out.getvalue())
+            w.close()
+            self.assertRaises(ValueError, json.loads, out.getvalue())
+
+    def test_jsonl(self):
+        out = StringIO()
+        w = RecordWriter(out, output.JSONL_FORMAT, ['a', 'b'])
+        w.write((1, 'line\nbreak'))
+        w.write((2, None))
+        w.close()
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[0]), {'a': 1, 'b': 'line\nbreak'})
+        self.assertEqual(json.loads(lines[1]), {'a': 2, 'b': None})
+
+    def test_tsv(self):
+        out = StringIO()
+        with RecordWriter(out, output.TSV_FORMAT, ['a', 'b']) as w:
+            self.assertEqual(w.get_fields(), ['a', 'b'])
+            w.write((1, 'tab\there'))
+            w.write((None, False))
+            w.write(('back\\slash', 'new\r\nline'))
+        self.assertEqual(out.getvalue(),
+                         'a\tb\n'
+                         '1\ttab\\there\n'
+                         '\tfalse\n'
+                         'back\\\\slash\tnew\\r\\nline\n')
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
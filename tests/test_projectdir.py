@@ -13,6 +13,7 @@ import sys
 import tempfile
 import shutil
 import unittest
+from mock import patch
 
 from ncmirtools import projectdir
 from ncmirtools.lookup import DirectoryForId
@@ -67,6 +68,16 @@ class TestProjectdir(unittest.TestCase):
     def test_main(self):
         self.assertEqual(projectdir.main(['foo.py', 'somearg']), 1)
 
+    @patch('ncmirtools.daemon.forward_to_daemon', return_value=0)
+    def test_main_forwards_absolute_prefixdir(self, mock_forward):
+        self.assertEqual(projectdir.main(['foo.py', '123', '--prefixdir',
+                                          'foo/<PROJECT_ID>']), 0)
+        mock_forward.assert_called_once_with(
+            'projectdir', {'projectid': '123',
+                           'prefixdir': os.path.join(os.getcwd(), 'foo',
+                                                     '<PROJECT_ID>'),
+                           'format': 'text'})
+
 
 if __name__ == '__main__':
     sys.exit(unittest.main())
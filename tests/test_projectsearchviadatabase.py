@@ -65,6 +65,31 @@ class TestProjectSearchViaDatabase(unittest.TestCase):
         mockcon.close.assert_called_once_with()
         self.assertEqual(res, ['1    koo', '3    yo', '4    val val'])
 
+    def test_iter_matching_projects(self):
+        ps = ProjectSearchViaDatabase(configparser.ConfigParser())
+
+        mockcon = Mock()
+        mcursor = Mock()
+        mcursor.fetchmany = Mock(side_effect=[[(1, 'koo'), (3, 'yo')],
+                                              [('4', 'val')], []])
+        mockcon.cursor = Mock(return_value=mcursor)
+        ps.set_alternate_connection(mockcon)
+
+        res = ps.iter_matching_projects('ha')
+        mcursor.execute.assert_not_called()
+        res = list(res)
+        self.assertEqual(res, [(1, 'koo'), (3, 'yo'), ('4', 'val')])
+        self.assertEqual(res[0].project_name, 'koo')
+        mcursor.fetchmany.assert_called_with(ProjectSearchViaDatabase.
+                                             FETCH_SIZE)
+        mcursor.execute.assert_called_with("SELECT Project_id,project_name "
+                                           "FROM Project "
+                                           "WHERE project_name ILIKE "
+                                           "'%%ha%%' OR "
+                                           " project_desc ILIKE '%%ha%%'")
+        mcursor.close.assert_called_once_with()
+        mockcon.close.assert_called_once_with()
+
 
 if __name__ == '__main__':
     sys.exit(unittest.main())